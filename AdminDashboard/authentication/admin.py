@@ -1,10 +1,30 @@
 from django.contrib import admin
-from .models import AuthorizedID
+from .models import AuthorizedID, AuthorizedIDOutbox
 
 
 @admin.register(AuthorizedID)
 class AuthorizedIDAdmin(admin.ModelAdmin):
-    list_display = ("student_id", "is_active", "description", "created_at")
+    list_display = (
+        "student_id",
+        "is_active",
+        "description",
+        "created_at",
+        "updated_at",
+    )
     list_filter = ("is_active", "created_at")
     search_fields = ("student_id", "description")
     ordering = ("-created_at",)
+
+
+@admin.register(AuthorizedIDOutbox)
+class AuthorizedIDOutboxAdmin(admin.ModelAdmin):
+    # IDs waiting to be written to Firestore, and why the last attempt failed
+    list_display = (
+        "student_id",
+        "queued_at",
+        "attempts",
+        "next_attempt_at",
+        "last_error",
+    )
+    search_fields = ("student_id",)
+    ordering = ("queued_at",)
@@ -0,0 +1,17 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from dashboard import authsync
+
+from .models import AuthorizedID
+
+
+# Saved or deleted one at a time (views, the admin site): queue the ID for
+# storage with the change. Bulk writes (roster imports, pulled changes) send
+# no signals and write storage themselves.
+@receiver(post_save, sender=AuthorizedID)
+@receiver(post_delete, sender=AuthorizedID)
+def queue_for_storage(sender, instance, **kwargs):
+    authsync.enqueue([instance.student_id])
+    transaction.on_commit(authsync.push_soon)
@@ -6,11 +6,21 @@ urlpatterns = [
     path(
         "api/add-user/", views.add_authorized_user, name="add_authorized_user"
     ),
+    path(
+        "api/import-users/",
+        views.import_authorized_users,
+        name="import_authorized_users",
+    ),
     path(
         "api/list-users/",
         views.get_authorized_users,
         name="get_authorized_users",
     ),
+    path(
+        "api/count-users/",
+        views.count_authorized_users,
+        name="count_authorized_users",
+    ),
     path(
         "api/toggle-status/",
         views.toggle_user_status,
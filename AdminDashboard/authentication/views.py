@@ -3,36 +3,16 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
 import json
-import firebase_admin
-from firebase_admin import credentials, firestore
-import os
-import datetime
+from dashboard import authorization, authsync, roster, storage, userlist
 
-# Initialize Firebase (Singleton pattern to match dashboard view)
-if not firebase_admin._apps:
-    try:
-        current_dir = os.path.dirname(
-            os.path.dirname(os.path.abspath(__file__))
-        )
-        # Adjust path to find serviceAccountKey.json which is in the parent d:\xScout\AdminDashboard
-        json_path = os.path.join(current_dir, "serviceAccountKey.json")
-
-        # Fallback if not found (e.g. if current_dir is inside authentication)
-        if not os.path.exists(json_path):
-            # Try going one level up d:\xScout
-            json_path = os.path.join(
-                current_dir, "..", "serviceAccountKey.json"
-            )
 
-        cred = credentials.Certificate(json_path)
-        firebase_admin.initialize_app(cred)
+def _repository():
+    """Telemetry storage (see dashboard/storage.py), or None if unreachable"""
+    try:
+        return storage.get_repository()
     except Exception as e:
-        print(f"Firebase Init Error in Auth: {e}")
-
-try:
-    db = firestore.client()
-except Exception:
-    db = None
+        print(f"Storage Init Error in Auth: {e}")
+        return None
 
 
 @csrf_exempt
@@ -48,13 +28,21 @@ def verify_student_id(request):
                 status=400,
             )
 
-        # FIRESTORE QUERY
-        # 1. Check Django Local DB (SQL) - Primary Source for Admin Panel
-        from .models import AuthorizedID
-
+        # Both sources are held in memory (dashboard/authorization.py)
         try:
-            student = AuthorizedID.objects.get(student_id=student_id)
-            if student.is_active:
+            local_active, user_data = authorization.lookup(student_id)
+        except authorization.StorageUnavailable:
+            return JsonResponse(
+                {
+                    "success": False,
+                    "message": "Access Denied: ID not found locally and DB connection error",
+                },
+                status=500,
+            )
+
+        # 1. Django Local DB (SQL) - Primary Source for Admin Panel
+        if local_active is not None:
+            if local_active:
                 return JsonResponse(
                     {
                         "success": True,
@@ -70,24 +58,9 @@ def verify_student_id(request):
                     },
                     status=403,
                 )
-        except AuthorizedID.DoesNotExist:
-            pass  # Continue to Firestore check as fallback
-
-        # 2. FIRESTORE QUERY (Fallback)
-        if not db:
-            return JsonResponse(
-                {
-                    "success": False,
-                    "message": "Access Denied: ID not found locally and DB connection error",
-                },
-                status=500,
-            )
-
-        doc_ref = db.collection("authorized_users").document(student_id)
-        doc = doc_ref.get()
 
-        if doc.exists:
-            user_data = doc.to_dict()
+        # 2. Firestore (Fallback)
+        if user_data is not None:
             if user_data.get("is_active", True):
                 return JsonResponse(
                     {
@@ -132,7 +105,7 @@ def add_authorized_user(request):
                 status=400,
             )
 
-        if not db:
+        if _repository() is None:
             return JsonResponse(
                 {"success": False, "message": "Database connection error"},
                 status=500,
@@ -146,12 +119,13 @@ def add_authorized_user(request):
                 {"success": False, "message": "ID already exists"}, status=400
             )
 
-        # Create in Local Database
+        # Create in Local Database (queued for Firestore by signals.py)
         AuthorizedID.objects.create(
             student_id=student_id,
             description=description,
             is_active=True
         )
+        authorization.invalidate(student_id)
 
         return JsonResponse(
             {"success": True, "message": "User added successfully"}
@@ -160,21 +134,84 @@ def add_authorized_user(request):
         return JsonResponse({"success": False, "message": str(e)}, status=500)
 
 
+@csrf_exempt
+@require_POST
+@login_required
+def import_authorized_users(request):
+    # A CSV/JSON roster as a "roster" upload or the raw body; ?sync=1
+    # deactivates IDs it leaves out (see dashboard/roster.py)
+    try:
+        if request.content_type == "multipart/form-data":
+            upload = request.FILES.get("roster")
+            if upload is None:
+                return JsonResponse(
+                    {
+                        "success": False,
+                        "message": "Upload the roster as a 'roster' file",
+                    },
+                    status=400,
+                )
+            content, options = upload.read(), request.POST
+            roster_format = roster.format_for(upload.name, upload.content_type)
+        else:
+            content, options = request.body, request.GET
+            roster_format = roster.format_for(
+                content_type=request.content_type
+            )
+        report = roster.import_roster(
+            content,
+            format=roster_format,
+            sync=options.get("sync") in ("1", "true", "on"),
+            dry_run=options.get("dry_run") in ("1", "true", "on"),
+        )
+        return JsonResponse(
+            {
+                "success": True,
+                "message": roster.describe(report),
+                "report": report,
+            }
+        )
+    except roster.RosterError as e:
+        return JsonResponse({"success": False, "message": str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({"success": False, "message": str(e)}, status=500)
+
+
 @login_required
 def get_authorized_users(request):
+    """
+    One page of local rows, newest first.
+    Supports ?limit=&cursor=&q=&active= (see dashboard/userlist.py).
+    """
     try:
         from .models import AuthorizedID
-        users = AuthorizedID.objects.all().order_by("-created_at")
-        users_list = []
-        for user in users:
-            users_list.append({
-                "student_id": user.student_id,
-                "description": user.description,
-                "is_active": user.is_active,
-                "created_at": user.created_at.isoformat() if user.created_at else ""
-            })
-
-        return JsonResponse({"success": True, "users": users_list})
+
+        params = userlist.parse_params(request.GET)
+        page = userlist.fetch_page(AuthorizedID.objects.all(), **params)
+        return JsonResponse(
+            {"success": True, **page, "sync": authsync.status()}
+        )
+    except ValueError as e:
+        return JsonResponse({"success": False, "message": str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({"success": False, "message": str(e)}, status=500)
+
+
+@login_required
+def count_authorized_users(request):
+    # Accepts the list's q= and active= filters
+    try:
+        from .models import AuthorizedID
+
+        params = userlist.parse_params(request.GET)
+        counts = userlist.counts(
+            AuthorizedID.objects.all(),
+            q=params["q"],
+            active=params["active"],
+        )
+        return JsonResponse({"success": True, **counts})
+    except ValueError as e:
+        return JsonResponse({"success": False, "message": str(e)}, status=400)
     except Exception as e:
         return JsonResponse({"success": False, "message": str(e)}, status=500)
 
@@ -192,6 +229,7 @@ def toggle_user_status(request):
             user = AuthorizedID.objects.get(student_id=student_id)
             user.is_active = not user.is_active
             user.save()
+            authorization.invalidate(student_id)
             return JsonResponse({"success": True, "active": user.is_active})
         except AuthorizedID.DoesNotExist:
             return JsonResponse(
@@ -0,0 +1,331 @@
+"""
+Class-wide risk analytics for GET /api/analytics/.
+
+The dashboard used to count "high risk" students in the browser over the
+whole telemetry payload. score() does it server-side in one vectorised pass
+over columnar NumPy arrays built from the latest state:
+
+- per-environment distributions (mean, std, min, p25/p50/p75/p90, max) of
+  ai and the behavior metrics;
+- z-scores of ai, wpm and pasteEvents against the student's environment;
+  |z| >= XSCOUT_ANALYTICS_OUTLIER_Z on any of them makes an outlier;
+- percentile ranks within the environment (ties share their mid rank);
+- high-risk counts: ai >= XSCOUT_ANALYTICS_HIGH_RISK on the 0-100 scale
+  (scores between 0 and 1 are scaled up, as the dashboard table does).
+
+Students without an 'environment' form one group (''). RiskAnalytics caches
+each environment's result for XSCOUT_ANALYTICS_TTL seconds and concurrent
+misses share one computation. NumPy is imported on first use, not when the
+worker boots.
+"""
+
+import threading
+import time
+
+from .rollups import ALIASES, METRICS
+
+COLUMNS = ("ai",) + METRICS
+Z_METRICS = ("ai", "wpm", "pasteEvents")
+QUANTILES = (
+    ("min", 0.0),
+    ("p25", 0.25),
+    ("p50", 0.5),
+    ("p75", 0.75),
+    ("p90", 0.9),
+    ("max", 1.0),
+)
+MAX_CACHED = 256
+
+
+def _field(dicts, keys):
+    """Value of the first key present in each dict (0 when none is)."""
+    column = [d.get(keys[-1], 0) for d in dicts]
+    for key in reversed(keys[:-1]):
+        column = [d.get(key, value) for d, value in zip(dicts, column)]
+    return column
+
+
+def _array(values):
+    import numpy as np
+
+    try:
+        column = np.fromiter(values, dtype=float, count=len(values))
+    except (TypeError, ValueError):
+        column = np.array(
+            [
+                value if isinstance(value, (int, float)) else 0
+                for value in values
+            ],
+            dtype=float,
+        )
+    return np.nan_to_num(column, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+def columns(rows):
+    """Latest-state rows -> (ids, environments, values) with one values column per COLUMNS."""
+    import numpy as np
+
+    ids = [row.get("id") for row in rows]
+    environments = np.array(
+        [row.get("environment") or "" for row in rows], dtype=str
+    )
+    behaviors = [
+        row.get("behavior") if isinstance(row.get("behavior"), dict) else {}
+        for row in rows
+    ]
+
+    values = np.empty((len(rows), len(COLUMNS)))
+    values[:, 0] = _array([row.get("ai", 0) for row in rows])
+    for j, metric in enumerate(METRICS, start=1):
+        values[:, j] = _array(_field(behaviors, ALIASES[metric]))
+    ai = values[:, 0]
+    fractions = (ai > 0) & (ai < 1)
+    ai[fractions] *= 100
+    return ids, environments, values
+
+
+def score(rows, high_risk=60.0, outlier_z=2.5, students=False):
+    """
+    Distributions, outliers and high-risk counts per environment. With
+    students=True every student's z-scores and percentile ranks are included.
+    """
+    import numpy as np
+
+    ids, environments, values = columns(rows)
+    if not ids:
+        return {
+            "students": 0,
+            "high_risk": 0,
+            "high_risk_ids": [],
+            "environments": [],
+            "outliers": [],
+        }
+
+    names, group = np.unique(environments, return_inverse=True)
+    counts = np.bincount(group)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    width = len(COLUMNS)
+
+    def per_group(weights):
+        return np.stack(
+            [
+                np.bincount(group, weights=weights[:, j], minlength=len(names))
+                for j in range(width)
+            ],
+            1,
+        )
+
+    # Two passes over the columns keep the variance accurate for large values
+    mean = per_group(values) / counts[:, None]
+    deviation = values - mean[group]
+    std = np.sqrt(per_group(deviation**2) / counts[:, None])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.where(std[group] > 0, deviation / std[group], 0.0)
+
+    # Sorting by (group, value) makes every group a contiguous, ordered run
+    quantiles = np.empty((len(QUANTILES), len(names), width))
+    percentile = np.empty_like(values)
+    last = starts + counts - 1
+    for j in range(width):
+        column = values[:, j]
+        order = np.lexsort((column, group))
+        ordered = column[order]
+        for i, (_, q) in enumerate(QUANTILES):
+            position = starts + q * (counts - 1)
+            low = np.floor(position).astype(int)
+            high = np.minimum(low + 1, last)
+            quantiles[i, :, j] = ordered[low] + (
+                ordered[high] - ordered[low]
+            ) * (position - low)
+
+        # Offsetting each group past the previous one's range lets one searchsorted rank every group
+        span = column.max() - column.min() + 1
+        keys = group * span + (column - column.min())
+        sorted_keys = keys[order]
+        below = np.searchsorted(sorted_keys, keys, "left") - starts[group]
+        equal = (
+            np.searchsorted(sorted_keys, keys, "right") - starts[group] - below
+        )
+        percentile[:, j] = 100 * (below + 0.5 * equal) / counts[group]
+
+    risky = values[:, 0] >= high_risk
+    risky_per_group = np.bincount(group, weights=risky, minlength=len(names))
+    z_columns = [COLUMNS.index(metric) for metric in Z_METRICS]
+    flagged = np.abs(z[:, z_columns]) >= outlier_z
+
+    summaries = []
+    for g, name in enumerate(names.tolist()):
+        metrics = {}
+        for j, column in enumerate(COLUMNS):
+            stats = {
+                "mean": round(float(mean[g, j]), 2),
+                "std": round(float(std[g, j]), 2),
+            }
+            stats.update(
+                {
+                    label: round(float(quantiles[i, g, j]), 2)
+                    for i, (label, _) in enumerate(QUANTILES)
+                }
+            )
+            metrics[column] = stats
+        summaries.append(
+            {
+                "environment": name,
+                "students": int(counts[g]),
+                "high_risk": int(risky_per_group[g]),
+                "metrics": metrics,
+            }
+        )
+
+    def describe(index):
+        """Value, z-score and percentile rank per column for the students at `index`."""
+        # Converted to lists up front: per-element numpy access would dominate for 10k students
+        rows = zip(
+            np.round(values[index], 2).tolist(),
+            np.round(z[index], 2).tolist(),
+            np.round(percentile[index], 1).tolist(),
+        )
+        return [
+            {
+                column: {"value": value, "z": z_score, "percentile": rank}
+                for column, value, z_score, rank in zip(COLUMNS, *row)
+            }
+            for row in rows
+        ]
+
+    flagged_index = np.flatnonzero(flagged.any(axis=1))
+    outliers = [
+        {
+            "id": ids[i],
+            "environment": environment,
+            "metrics": metrics,
+            "flags": [
+                metric for metric, hit in zip(Z_METRICS, flagged[i]) if hit
+            ],
+        }
+        for i, environment, metrics in zip(
+            flagged_index.tolist(),
+            environments[flagged_index].tolist(),
+            describe(flagged_index),
+        )
+    ]
+    outliers.sort(
+        key=lambda o: -max(
+            abs(o["metrics"][metric]["z"]) for metric in o["flags"]
+        )
+    )
+
+    result = {
+        "students": len(ids),
+        "high_risk": int(risky.sum()),
+        "high_risk_ids": [ids[i] for i in np.flatnonzero(risky).tolist()],
+        "environments": summaries,
+        "outliers": outliers,
+    }
+    if students:
+        result["scores"] = [
+            dict(id=student_id, environment=environment, **metrics)
+            for student_id, environment, metrics in zip(
+                ids, environments.tolist(), describe(slice(None))
+            )
+        ]
+    return result
+
+
+class RiskAnalytics:
+    """score() results per (environment, students) for `ttl` seconds."""
+
+    def __init__(self, ttl=5.0, high_risk=60.0, outlier_z=2.5):
+        self.ttl = ttl
+        self.high_risk = high_risk
+        self.outlier_z = outlier_z
+        self._results = {}
+        self._lock = threading.Lock()
+        self._compute_lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0}
+        self._last_ms = None
+
+    def _cached(self, key, now):
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None and cached[0] > now:
+                self._counters["hits"] += 1
+                return cached[1]
+        return None
+
+    def get(self, loader, environment=None, students=False):
+        """
+        loader() returns every latest-state row with its 'id'; environment
+        narrows the result to one environment ('' for students without one).
+        """
+        key = (environment, students)
+        result = self._cached(key, time.monotonic())
+        if result is not None:
+            return result
+        with self._compute_lock:
+            # Whoever held the lock may have computed it already
+            result = self._cached(key, time.monotonic())
+            if result is not None:
+                return result
+
+            rows = loader()
+            if environment is not None:
+                rows = [
+                    row
+                    for row in rows
+                    if (row.get("environment") or "") == environment
+                ]
+            started = time.perf_counter()
+            result = score(rows, self.high_risk, self.outlier_z, students)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+
+            now = time.monotonic()
+            with self._lock:
+                self._counters["misses"] += 1
+                self._last_ms = elapsed_ms
+                self._results = {
+                    k: v for k, v in self._results.items() if v[0] > now
+                }
+                if len(self._results) >= MAX_CACHED:
+                    self._results.clear()
+                self._results[key] = (now + self.ttl, result)
+        return result
+
+    def metrics(self):
+        with self._lock:
+            data = dict(self._counters)
+            data["cached"] = len(self._results)
+            data["last_score_ms"] = (
+                round(self._last_ms, 2) if self._last_ms is not None else None
+            )
+        return data
+
+
+_analytics = None
+_analytics_lock = threading.Lock()
+
+
+def get_analytics():
+    """Process-wide RiskAnalytics, created on first use."""
+    global _analytics
+    if _analytics is None:
+        from django.conf import settings
+
+        with _analytics_lock:
+            if _analytics is None:
+                _analytics = RiskAnalytics(
+                    ttl=getattr(settings, "XSCOUT_ANALYTICS_TTL", 5.0),
+                    high_risk=getattr(
+                        settings, "XSCOUT_ANALYTICS_HIGH_RISK", 60.0
+                    ),
+                    outlier_z=getattr(
+                        settings, "XSCOUT_ANALYTICS_OUTLIER_Z", 2.5
+                    ),
+                )
+    return _analytics
+
+
+def metrics():
+    if _analytics is None:
+        return {"hits": 0, "misses": 0}
+    return _analytics.metrics()
@@ -0,0 +1,419 @@
+"""
+Columnar backup archive: latest state plus full history as Parquet.
+
+system_backup's JSON dump is one large document holding only the latest
+state of each student; history subcollections are not in it at all. An
+archive holds both, as zstd-compressed Parquet files in Hive-style
+partitions:
+
+    manifest.json
+    latest/environment=<env>/part-00000.parquet
+    history/environment=<env>/date=<YYYY-MM-DD>/part-00001.parquet
+
+History is partitioned by the student's current environment and the UTC
+date of each entry. A student without an environment goes under
+environment=__HIVE_DEFAULT_PARTITION__ and an entry without a timestamp
+under date=unknown, so pyarrow.dataset.dataset(path, partitioning='hive')
+reads the tree as one table, with the partitions as columns.
+
+Each row keeps its document exactly as stored (history stays keyframes
+and deltas; entries compacted into the cold tier, see dashboard/tiers.py,
+are included as stored in their archive and restore as hot documents) as JSON in a 'data' column, with datetimes tagged so a restore
+writes back the same types. The fields used for sorting and filtering
+('lastSeen', 'ai', 'timestamp', 'ai_score') are also typed columns, so
+the archive can be queried without parsing the JSON.
+
+restore() bulk-loads an archive (directory or .tar) back through
+repository.bulk_write(): Firestore batches of up to 500 writes, or one
+SQLite transaction per batch, several batches in flight at once.
+
+pyarrow is imported on first use, not when the dashboard starts.
+"""
+
+import json
+import os
+import posixpath
+import tarfile
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from . import history, playback
+
+FORMAT = "xscout-archive"
+VERSION = 1
+MANIFEST = "manifest.json"
+COMPRESSION = "zstd"
+# Rows per part file (one row group each)
+ROW_GROUP_SIZE = 50000
+# Rows held across all partitions before the largest one is written out
+MAX_BUFFERED_ROWS = 200000
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+UNKNOWN_DATE = "unknown"
+# Firestore reserves __*__ field names, so the tag never collides with data
+DATETIME_KEY = "__datetime__"
+
+
+def _schemas():
+    import pyarrow as pa
+
+    moment = pa.timestamp("ms", tz="UTC")
+    return {
+        "latest": pa.schema(
+            [
+                ("id", pa.string()),
+                ("last_seen", moment),
+                ("ai", pa.float64()),
+                ("data", pa.string()),
+            ]
+        ),
+        "history": pa.schema(
+            [
+                ("user_id", pa.string()),
+                ("id", pa.string()),
+                ("timestamp", moment),
+                ("encoding", pa.string()),
+                ("ai_score", pa.float64()),
+                ("data", pa.string()),
+            ]
+        ),
+    }
+
+
+class _Encoder(DjangoJSONEncoder):
+    def default(self, o):
+        if isinstance(o, datetime):
+            return {DATETIME_KEY: o.isoformat()}
+        return super().default(o)
+
+
+def dumps(data):
+    return json.dumps(data, cls=_Encoder, separators=(",", ":"))
+
+
+def _object_hook(obj):
+    if len(obj) == 1 and DATETIME_KEY in obj:
+        return datetime.fromisoformat(obj[DATETIME_KEY])
+    return obj
+
+
+_decoder = json.JSONDecoder(object_hook=_object_hook)
+
+
+def loads(text):
+    # The hook runs for every object decoded, so only documents holding a datetime pay for it
+    return _decoder.decode(text) if DATETIME_KEY in text else json.loads(text)
+
+
+def _moment(value):
+    """A UTC datetime for a stored timestamp (datetime, ISO string or epoch ms), or None."""
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    if isinstance(value, (str, int, float)) and not isinstance(value, bool):
+        try:
+            return playback.parse_time(str(value))
+        except (ValueError, OverflowError, OSError):
+            return None
+    return None
+
+
+def _number(value):
+    return (
+        float(value)
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+        else None
+    )
+
+
+def _environment_dir(environment):
+    if environment in (None, ""):
+        return f"environment={NULL_PARTITION}"
+    return f"environment={quote(str(environment), safe='')}"
+
+
+def _date_dir(moment):
+    return f"date={moment.astimezone(timezone.utc).date().isoformat() if moment else UNKNOWN_DATE}"
+
+
+class ArchiveWriter:
+    """Buffers rows per partition and writes them out as Parquet part files."""
+
+    def __init__(
+        self,
+        directory,
+        row_group_size=ROW_GROUP_SIZE,
+        max_buffered_rows=MAX_BUFFERED_ROWS,
+        compression=COMPRESSION,
+    ):
+        self.directory = directory
+        self.row_group_size = row_group_size
+        self.max_buffered_rows = max_buffered_rows
+        self.compression = compression
+        self.counts = {"latest": 0, "history": 0}
+        self.files = []
+        self._schemas = _schemas()
+        # (table, partition path) -> rows
+        self._buffers = {}
+        self._buffered = 0
+
+    def add_latest(self, doc_id, data):
+        row = (
+            doc_id,
+            _moment(data.get("lastSeen")),
+            _number(data.get("ai")),
+            dumps(data),
+        )
+        self._add("latest", _environment_dir(data.get("environment")), row)
+
+    def add_history(self, user_id, environment, doc_id, entry):
+        moment = _moment(entry.get("timestamp"))
+        row = (
+            user_id,
+            doc_id,
+            moment,
+            entry.get("encoding"),
+            _number(entry.get("ai_score", entry.get("ai"))),
+            dumps(entry),
+        )
+        self._add(
+            "history",
+            posixpath.join(_environment_dir(environment), _date_dir(moment)),
+            row,
+        )
+
+    def _add(self, table, partition, row):
+        rows = self._buffers.setdefault((table, partition), [])
+        rows.append(row)
+        self.counts[table] += 1
+        self._buffered += 1
+        if len(rows) >= self.row_group_size:
+            self._flush((table, partition))
+        elif self._buffered > self.max_buffered_rows:
+            self._flush(
+                max(self._buffers, key=lambda key: len(self._buffers[key]))
+            )
+
+    def _flush(self, key):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        rows = self._buffers.pop(key)
+        self._buffered -= len(rows)
+        table, partition = key
+        schema = self._schemas[table]
+        columns = list(zip(*rows))
+        data = pa.table(
+            [
+                pa.array(column, type=field.type)
+                for column, field in zip(columns, schema)
+            ],
+            schema=schema,
+        )
+        # Manifest and tar names always use '/'
+        path = posixpath.join(
+            table, partition, f"part-{len(self.files):05d}.parquet"
+        )
+        os.makedirs(
+            os.path.join(self.directory, table, partition), exist_ok=True
+        )
+        pq.write_table(
+            data,
+            os.path.join(self.directory, path),
+            compression=self.compression,
+        )
+        self.files.append(path)
+
+    def close(self):
+        """Write the remaining rows and the manifest. Returns the manifest."""
+        for key in sorted(self._buffers):
+            self._flush(key)
+        manifest = {
+            "format": FORMAT,
+            "version": VERSION,
+            "created_at": playback.iso_z(datetime.now(timezone.utc)),
+            "compression": self.compression,
+            "students": self.counts["latest"],
+            "history": self.counts["history"],
+            "files": self.files,
+        }
+        with open(os.path.join(self.directory, MANIFEST), "w") as f:
+            json.dump(manifest, f, indent=2)
+        return manifest
+
+
+def _ahead(fn, items, workers):
+    """(item, fn(item)) in order, with up to 2 * workers calls running ahead."""
+    with ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="xscout-archive"
+    ) as executor:
+        pending = deque()
+        for item in items:
+            pending.append((item, executor.submit(fn, item)))
+            if len(pending) > 2 * workers:
+                item, future = pending.popleft()
+                yield item, future.result()
+        while pending:
+            item, future = pending.popleft()
+            yield item, future.result()
+
+
+def write_archive(repository, directory, workers=8, progress=None, **options):
+    """
+    Archive every student's latest state and history into `directory`.
+    Histories are read `workers` students at a time. progress(done, None)
+    is called after each student. Returns the manifest.
+    """
+    from . import tiers
+
+    writer = ArchiveWriter(directory, **options)
+
+    def read_history(doc):
+        hot = [
+            (entry.id, entry.to_dict())
+            for entry in repository.stream_history(doc.id)
+        ]
+        # An entry can be both archived and still hot (a keyframe hot deltas point at, or an interrupted compaction).
+        # Keep one copy: the hot one when it is a keyframe, so deltas in either tier still decode against it.
+        keyframes = {
+            doc_id
+            for doc_id, entry in hot
+            if entry.get("encoding", history.KEYFRAME) == history.KEYFRAME
+        }
+        cold = [
+            (doc_id, entry)
+            for doc_id, entry in tiers.stream_cold(repository, doc.id)
+            if doc_id not in keyframes
+        ]
+        archived = {doc_id for doc_id, _ in cold}
+        return cold + [
+            (doc_id, entry) for doc_id, entry in hot if doc_id not in archived
+        ]
+
+    for done, (doc, entries) in enumerate(
+        _ahead(read_history, repository.stream_latest(), workers), start=1
+    ):
+        data = doc.to_dict()
+        writer.add_latest(doc.id, data)
+        for doc_id, entry in entries:
+            writer.add_history(doc.id, data.get("environment"), doc_id, entry)
+        if progress is not None:
+            progress(done, None)
+    return writer.close()
+
+
+class _Sink:
+    def __init__(self):
+        self.pieces = []
+
+    def write(self, data):
+        self.pieces.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b"".join(self.pieces)
+        self.pieces = []
+        return data
+
+
+def tar_chunks(directory):
+    """An archive directory as an uncompressed tar stream, in bytes chunks (Parquet is already compressed)."""
+    sink = _Sink()
+    with tarfile.open(fileobj=sink, mode="w|") as tar:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            names = [MANIFEST] + json.load(f)["files"]
+        for name in names:
+            tar.add(os.path.join(directory, name), arcname=name)
+            yield sink.take()
+    yield sink.take()
+
+
+def archive_chunks(repository, progress=None):
+    """Build an archive in a temporary directory and stream it as a tar; the directory is removed afterwards."""
+    from django.conf import settings
+
+    with tempfile.TemporaryDirectory(prefix="xscout-archive-") as directory:
+        write_archive(
+            repository,
+            directory,
+            workers=getattr(settings, "XSCOUT_EXPORT_WORKERS", 8),
+            progress=progress,
+        )
+        yield from tar_chunks(directory)
+
+
+def _manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise ValueError(f"{directory} has no {MANIFEST}, not an archive")
+    if manifest.get("format") != FORMAT or manifest.get("version") != VERSION:
+        raise ValueError(
+            f"unsupported archive {manifest.get('format')} v{manifest.get('version')}"
+        )
+    return manifest
+
+
+def _batches(directory, files, columns, batch_size):
+    import pyarrow.parquet as pq
+
+    for name in files:
+        parquet = pq.ParquetFile(os.path.join(directory, name))
+        for batch in parquet.iter_batches(
+            batch_size=batch_size, columns=list(columns)
+        ):
+            yield zip(
+                *(batch.column(column).to_pylist() for column in columns)
+            )
+
+
+def restore(repository, source, batch_size=500, workers=4, progress=None):
+    """
+    Load an archive (directory or .tar) into `repository`. Existing
+    documents with the same ids are overwritten; nothing is deleted.
+    progress(rows done, rows total) is called after each batch. Returns
+    {'students': n, 'history': n}.
+    """
+    if os.path.isdir(source):
+        return _restore(repository, source, batch_size, workers, progress)
+    with tempfile.TemporaryDirectory(prefix="xscout-restore-") as directory:
+        with tarfile.open(source) as tar:
+            tar.extractall(directory, filter="data")
+        return _restore(repository, directory, batch_size, workers, progress)
+
+
+def _restore(repository, directory, batch_size, workers, progress):
+    manifest = _manifest(directory)
+    total = manifest["students"] + manifest["history"]
+    latest = [name for name in manifest["files"] if name.startswith("latest/")]
+    history = [
+        name for name in manifest["files"] if name.startswith("history/")
+    ]
+
+    def batches():
+        for rows in _batches(directory, latest, ("id", "data"), batch_size):
+            yield {"latest": [(doc_id, loads(data)) for doc_id, data in rows]}
+        for rows in _batches(
+            directory, history, ("user_id", "id", "data"), batch_size
+        ):
+            yield {
+                "history": [
+                    (user_id, doc_id, loads(data))
+                    for user_id, doc_id, data in rows
+                ]
+            }
+
+    def write(batch):
+        repository.bulk_write(**batch)
+        return sum(len(rows) for rows in batch.values())
+
+    counts = {"students": 0, "history": 0}
+    for batch, written in _ahead(write, batches(), workers):
+        counts["students" if "latest" in batch else "history"] += written
+        if progress is not None:
+            progress(counts["students"] + counts["history"], total)
+    return counts
@@ -0,0 +1,362 @@
+"""
+In-memory cache of authorized student IDs for verify_student_id.
+
+Every extension connecting used to cost a Firestore document().get() plus
+a SQL query, so a class connecting at the start of an exam meant a herd of
+identical round-trips. Each process now keeps both sources in memory:
+
+- local: AuthorizedID rows (student_id -> is_active), reloaded every
+  XSCOUT_AUTH_CACHE_REFRESH seconds by a daemon thread;
+- remote: the authorized-ID records in storage. Firestore pushes changes
+  through a snapshot listener (repository.watch_authorized()); other
+  backends are reloaded with the local rows.
+
+A lookup is then two dict reads. The maps are warmed when a gunicorn worker
+boots (gunicorn.conf.py) or on first use. An ID in neither map may have been
+added since the last reload, so it is checked once against both sources;
+callers asking for the same ID meanwhile wait for that one check, and an ID
+found nowhere is remembered as unknown for XSCOUT_AUTH_NEGATIVE_TTL seconds.
+Views that add or toggle an ID call invalidate() so this process sees the
+change at once; other processes see it on their next reload (or, for
+Firestore records, as soon as the listener delivers it).
+
+How the two sources combine into a decision stays with each project's
+authentication views.
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class StorageUnavailable(Exception):
+    """The ID is unknown locally and the storage check failed."""
+
+
+class AuthorizationCache:
+    def __init__(
+        self,
+        load_local,
+        get_local,
+        get_repository,
+        refresh_interval=15.0,
+        negative_ttl=5.0,
+        clock=time.monotonic,
+        close_local=None,
+    ):
+        # load_local() -> {student_id: is_active}; get_local(student_id) -> is_active or None; close_local() after
+        # reloads outside requests (the reload thread, warm_up())
+        self.load_local = load_local
+        self.get_local = get_local
+        self.close_local = close_local
+        self.get_repository = get_repository
+        self.refresh_interval = refresh_interval
+        self.negative_ttl = negative_ttl
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        self._local = {}
+        self._remote = {}
+        self._negative = {}  # student_id -> expires
+        self._inflight = {}  # student_id -> Event
+        self._watch = None
+        self._subscribed = False
+        self._watching = False
+        # The listener's first delivery is every record and replaces the map
+        self._first_delivery = False
+        self._loaded_at = None
+        self._thread = None
+        self._stopped = threading.Event()
+        self._counters = {
+            "hits": 0,
+            "negative_hits": 0,
+            "checks": 0,
+            "coalesced": 0,
+            "refreshes": 0,
+            "errors": 0,
+        }
+
+    # -- lookups --
+
+    def lookup(self, student_id):
+        """
+        (local is_active or None, remote record or None) for an ID. Raises
+        StorageUnavailable when the ID had to be checked, isn't a local row
+        and storage couldn't be reached.
+        """
+        with self._lock:
+            local = self._local.get(student_id)
+            remote = self._remote.get(student_id)
+            if local is not None or remote is not None:
+                self._counters["hits"] += 1
+                return local, remote
+            expires = self._negative.get(student_id)
+            if expires is not None and expires > self._clock():
+                self._counters["negative_hits"] += 1
+                return None, None
+            pending = self._inflight.get(student_id)
+            if pending is None:
+                pending = self._inflight[student_id] = threading.Event()
+                leader = True
+            else:
+                self._counters["coalesced"] += 1
+                leader = False
+
+        if not leader:
+            pending.wait(5.0)
+            with self._lock:
+                local = self._local.get(student_id)
+                remote = self._remote.get(student_id)
+            if (
+                local is None
+                and remote is None
+                and student_id not in self._negative
+            ):
+                # The check failed for the caller that made it; so does this one
+                raise StorageUnavailable(student_id)
+            return local, remote
+        try:
+            return self._check(student_id)
+        finally:
+            with self._lock:
+                self._inflight.pop(student_id, None)
+            pending.set()
+
+    def _check(self, student_id):
+        """One round-trip to each source for an ID the maps don't know."""
+        with self._lock:
+            self._counters["checks"] += 1
+        local = self.get_local(student_id)
+        try:
+            remote = self.get_repository().get_authorized(student_id)
+        except Exception as e:
+            with self._lock:
+                self._counters["errors"] += 1
+            logger.warning(
+                "Checking authorized ID %s in storage failed: %s",
+                student_id,
+                e,
+            )
+            if local is None:
+                raise StorageUnavailable(student_id) from e
+            remote = None
+        with self._lock:
+            if local is not None:
+                self._local[student_id] = local
+            if remote is not None:
+                self._remote[student_id] = remote
+            if local is None and remote is None:
+                self._negative[student_id] = self._clock() + self.negative_ttl
+        return local, remote
+
+    def invalidate(self, student_id):
+        """Forget what is known about an ID, after changing it."""
+        with self._lock:
+            self._local.pop(student_id, None)
+            self._remote.pop(student_id, None)
+            self._negative.pop(student_id, None)
+
+    # -- reloads --
+
+    def refresh(self):
+        """Reload the local rows, and the remote records unless a listener keeps them current."""
+        local = self.load_local()
+        remote = None
+        if not self._watching:
+            remote = {
+                doc.id: doc.to_dict()
+                for doc in self.get_repository().stream_authorized()
+            }
+        now = self._clock()
+        with self._lock:
+            self._local = local
+            if remote is not None:
+                self._remote = remote
+            self._negative = {
+                student_id: expires
+                for student_id, expires in self._negative.items()
+                if expires > now
+            }
+            self._loaded_at = now
+            self._counters["refreshes"] += 1
+
+    def _on_remote(self, changes):
+        with self._lock:
+            if self._first_delivery:
+                self._remote = {}
+                self._first_delivery = False
+            for student_id, record in changes.items():
+                if record is None:
+                    self._remote.pop(student_id, None)
+                else:
+                    self._remote[student_id] = record
+                    self._negative.pop(student_id, None)
+
+    def start(self):
+        """Subscribe to remote changes where the backend can push them, and start the reload thread."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="xscout-authorization", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            if not self._subscribed:
+                self._first_delivery = True
+                try:
+                    self._watch = self.get_repository().watch_authorized(
+                        self._on_remote
+                    )
+                    self._watching = self._watch is not None
+                    self._subscribed = True
+                except Exception as e:
+                    logger.warning(
+                        "Watching authorized IDs failed, polling instead: %s",
+                        e,
+                    )
+            if (
+                self._loaded_at is None
+                or self._clock() - self._loaded_at >= self.refresh_interval
+            ):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    # The maps stay as they were; misses still check the sources
+                    with self._lock:
+                        self._counters["errors"] += 1
+                    logger.warning("Reloading authorized IDs failed: %s", e)
+                finally:
+                    self._close_local()
+            if self._stopped.wait(self.refresh_interval):
+                return
+
+    def _close_local(self):
+        if self.close_local is not None:
+            try:
+                self.close_local()
+            except Exception as e:
+                logger.warning("Closing the local connection failed: %s", e)
+
+    def stop(self):
+        self._stopped.set()
+        if self._watch is not None:
+            self._watch.unsubscribe()
+        self._watch = None
+        self._subscribed = self._watching = False
+
+    def metrics(self):
+        with self._lock:
+            return dict(
+                self._counters,
+                local_ids=len(self._local),
+                remote_ids=len(self._remote),
+                negative_ids=len(self._negative),
+                watching=self._watching,
+                age=(
+                    round(self._clock() - self._loaded_at, 1)
+                    if self._loaded_at is not None
+                    else None
+                ),
+            )
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _load_local():
+    from authentication.models import AuthorizedID
+
+    return dict(AuthorizedID.objects.values_list("student_id", "is_active"))
+
+
+def _close_local():
+    from django.db import connection
+
+    # Only called off the request path (a request's connection is Django's to manage): don't hold a connection
+    # between reloads
+    connection.close()
+
+
+def _get_local(student_id):
+    from authentication.models import AuthorizedID
+
+    return (
+        AuthorizedID.objects.filter(student_id=student_id)
+        .values_list("is_active", flat=True)
+        .first()
+    )
+
+
+def get_cache(start=True):
+    """The process-wide AuthorizationCache, its reload thread started on first use."""
+    global _cache
+    if _cache is None:
+        from django.conf import settings
+
+        from . import storage
+
+        with _cache_lock:
+            if _cache is None:
+                _cache = AuthorizationCache(
+                    _load_local,
+                    _get_local,
+                    storage.get_repository,
+                    refresh_interval=getattr(
+                        settings, "XSCOUT_AUTH_CACHE_REFRESH", 15.0
+                    ),
+                    negative_ttl=getattr(
+                        settings, "XSCOUT_AUTH_NEGATIVE_TTL", 5.0
+                    ),
+                    close_local=_close_local,
+                )
+    if start:
+        _cache.start()
+    return _cache
+
+
+def lookup(student_id):
+    return get_cache().lookup(student_id)
+
+
+def invalidate(student_id):
+    get_cache().invalidate(student_id)
+
+
+def reload(student_ids=()):
+    """After a bulk change (dashboard/roster.py): forget these IDs and reload both maps, if this process has a cache."""
+    if _cache is None:
+        return
+    for student_id in student_ids:
+        _cache.invalidate(student_id)
+    try:
+        _cache.refresh()
+    except Exception as e:
+        # The forgotten IDs are checked against the sources on their next lookup
+        logger.warning(
+            "Reloading authorized IDs after a bulk change failed: %s", e
+        )
+
+
+def warm_up():
+    """Load both maps now (gunicorn calls this as each worker boots). Returns the seconds it took."""
+    started = time.perf_counter()
+    cache = get_cache(start=False)
+    try:
+        cache.refresh()
+    finally:
+        cache._close_local()
+    cache.start()
+    return time.perf_counter() - started
+
+
+def metrics():
+    if _cache is None:
+        return None
+    return _cache.metrics()
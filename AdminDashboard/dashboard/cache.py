@@ -0,0 +1,253 @@
+"""
+Read-through cache for the latest-state collection.
+
+Every open dashboard polls GET /api/telemetry/ every few seconds and each
+poll used to re-stream the whole collection. LatestStateCache keeps one
+snapshot of it: polls within `ttl` seconds of the last scan are served from
+memory, concurrent misses share a single scan, and the ingest POST path
+writes each heartbeat through so a worker's own writes show up immediately.
+The TTL bounds how stale writes made by other workers can be.
+
+Picked with XSCOUT_LATEST_STATE_CACHE:
+
+- 'local': per-process dict (the default);
+- 'django': Django's cache framework (XSCOUT_LATEST_STATE_CACHE_ALIAS), so
+  workers sharing a locmem/file/Redis-compatible backend share snapshots.
+  Each document has its own key next to an index of ids.
+- 'off': always scan Firestore.
+
+A collection larger than XSCOUT_LATEST_STATE_CACHE_SIZE documents is not
+cached at all rather than served partially.
+"""
+
+import threading
+import time
+from datetime import datetime, timezone
+
+
+def resolve_server_timestamps(data):
+    """SERVER_TIMESTAMP sentinels -> now, as Firestore will store them."""
+    from google.cloud.firestore_v1.transforms import Sentinel
+
+    now = None
+    resolved = dict(data)
+    for key, value in data.items():
+        if isinstance(value, Sentinel):
+            now = now or datetime.now(timezone.utc)
+            resolved[key] = now
+    return resolved
+
+
+class LocalStore:
+    """Snapshot held in this process."""
+
+    def __init__(self):
+        self._docs = None
+        self._expires = 0.0
+
+    def load(self, now):
+        if self._docs is None or now >= self._expires:
+            return None
+        return self._docs
+
+    def save(self, docs, ttl, now):
+        self._docs = docs
+        self._expires = now + ttl
+
+    def update(self, doc_id, data, ttl, max_entries):
+        """False when there is no live snapshot to update."""
+        if self._docs is None:
+            return False
+        if doc_id not in self._docs and len(self._docs) >= max_entries:
+            self.clear()
+            return False
+        self._docs[doc_id] = data
+        return True
+
+    def delete(self, doc_id):
+        if self._docs is not None:
+            self._docs.pop(doc_id, None)
+
+    def clear(self):
+        self._docs = None
+        self._expires = 0.0
+
+
+class DjangoCacheStore:
+    """
+    Snapshot in a Django cache backend: one key per document plus an index
+    of ids. A write for an id the index does not know drops the index, so
+    the next poll rescans instead of missing the new document.
+    """
+
+    def __init__(self, alias="default", namespace="latest"):
+        self.alias = alias
+        self.prefix = f"xscout:{namespace}:"
+
+    @property
+    def _cache(self):
+        from django.core.cache import caches
+
+        return caches[self.alias]
+
+    def _key(self, doc_id):
+        return f"{self.prefix}doc:{doc_id}"
+
+    def load(self, now):
+        cache = self._cache
+        ids = cache.get(self.prefix + "index")
+        if ids is None:
+            return None
+        found = cache.get_many([self._key(doc_id) for doc_id in ids])
+        if len(found) != len(ids):
+            return None
+        return {doc_id: found[self._key(doc_id)] for doc_id in ids}
+
+    def save(self, docs, ttl, now):
+        cache = self._cache
+        cache.set_many(
+            {self._key(doc_id): data for doc_id, data in docs.items()},
+            timeout=ttl,
+        )
+        cache.set(self.prefix + "index", list(docs), timeout=ttl)
+
+    def update(self, doc_id, data, ttl, max_entries):
+        cache = self._cache
+        ids = cache.get(self.prefix + "index")
+        if ids is None:
+            return False
+        if doc_id not in ids:
+            cache.delete(self.prefix + "index")
+            return False
+        # Outlives the index it belongs to, which expires first
+        cache.set(self._key(doc_id), data, timeout=ttl)
+        return True
+
+    def delete(self, doc_id):
+        cache = self._cache
+        cache.delete_many([self._key(doc_id), self.prefix + "index"])
+
+    def clear(self):
+        self._cache.delete(self.prefix + "index")
+
+
+class LatestStateCache:
+    def __init__(self, store=None, ttl=5.0, max_entries=5000):
+        self.store = store or LocalStore()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "loads": 0,
+            "writes": 0,
+            "evictions": 0,
+            "oversize": 0,
+        }
+        self._last_load_ms = None
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def get_all(self, loader):
+        """
+        Latest state as [{..., 'id': doc_id}, ...]. loader() -> iterable of
+        (doc_id, data) is only called on a miss, and only by one thread at a
+        time; threads that waited on it reuse its result.
+        """
+        docs = self.store.load(time.monotonic())
+        if docs is not None:
+            self._count("hits")
+            return self._rows(docs)
+
+        self._count("misses")
+        with self._load_lock:
+            docs = self.store.load(time.monotonic())
+            if docs is None:
+                started = time.perf_counter()
+                docs = dict(loader())
+                self._last_load_ms = round(
+                    (time.perf_counter() - started) * 1000, 2
+                )
+                self._count("loads")
+                if len(docs) <= self.max_entries:
+                    self.store.save(docs, self.ttl, time.monotonic())
+                else:
+                    self._count("oversize")
+        return self._rows(docs)
+
+    def put(self, doc_id, data):
+        """Write-through for an ingested heartbeat."""
+        with self._load_lock:
+            self.store.update(
+                doc_id,
+                resolve_server_timestamps(data),
+                self.ttl,
+                self.max_entries,
+            )
+        self._count("writes")
+
+    def evict(self, doc_id):
+        with self._load_lock:
+            self.store.delete(doc_id)
+        self._count("evictions")
+
+    def clear(self):
+        with self._load_lock:
+            self.store.clear()
+
+    def metrics(self):
+        with self._lock:
+            data = dict(self._counters)
+        lookups = data["hits"] + data["misses"]
+        data["hit_ratio"] = (
+            round(data["hits"] / lookups, 3) if lookups else None
+        )
+        data["last_load_ms"] = self._last_load_ms
+        data["ttl"] = self.ttl
+        data["store"] = type(self.store).__name__
+        return data
+
+    @staticmethod
+    def _rows(docs):
+        return [dict(data, id=doc_id) for doc_id, data in docs.items()]
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(namespace="latest"):
+    """Process-wide LatestStateCache, or None when XSCOUT_LATEST_STATE_CACHE is 'off'."""
+    from django.conf import settings
+
+    backend = getattr(settings, "XSCOUT_LATEST_STATE_CACHE", "local")
+    if backend == "off":
+        return None
+    with _caches_lock:
+        if namespace not in _caches:
+            if backend == "django":
+                alias = getattr(
+                    settings, "XSCOUT_LATEST_STATE_CACHE_ALIAS", "default"
+                )
+                store = DjangoCacheStore(alias, namespace)
+            else:
+                store = LocalStore()
+            _caches[namespace] = LatestStateCache(
+                store,
+                ttl=getattr(settings, "XSCOUT_LATEST_STATE_CACHE_TTL", 5.0),
+                max_entries=getattr(
+                    settings, "XSCOUT_LATEST_STATE_CACHE_SIZE", 5000
+                ),
+            )
+        return _caches[namespace]
+
+
+def metrics():
+    with _caches_lock:
+        return {
+            namespace: cache.metrics() for namespace, cache in _caches.items()
+        }
@@ -0,0 +1,203 @@
+"""
+Environment membership index behind GET /api/environment/<code>/ and
+GET /api/telemetry/?environment=<code>.
+
+Every open environment grid polls every few seconds, and each poll used to
+run a where('environment', '==', code) query over the whole latest-state
+collection. EnvironmentIndex keeps, per environment, the ids of its
+students and their latest state:
+
+- the ingest POST path records every heartbeat, moving a student to the
+  environment it reports;
+- a grid poll serves the recorded states and re-reads only the members
+  whose state is older than XSCOUT_ENVIRONMENT_INDEX_MAX_AGE seconds, with
+  one bulk get_latest_many() (Firestore get_all) by id. A member that is
+  gone, or that reports another environment, is dropped or moved;
+- the first poll of an environment, and then one poll every
+  XSCOUT_ENVIRONMENT_INDEX_RECONCILE seconds, runs the where() query
+  instead. That seeds the index and picks up students who joined through
+  another worker.
+
+A poll therefore costs reads proportional to the class, not the collection.
+The index lives in one process and is dropped rather than grown past
+XSCOUT_ENVIRONMENT_INDEX_MAX_STUDENTS students.
+"""
+
+import threading
+import time
+
+from .cache import resolve_server_timestamps
+
+MAX_ENVIRONMENTS = 1000
+
+
+class EnvironmentIndex:
+    def __init__(
+        self, max_age=5.0, reconcile_interval=60.0, max_students=50000
+    ):
+        self.max_age = max_age
+        self.reconcile_interval = reconcile_interval
+        self.max_students = max_students
+        self._lock = threading.Lock()
+        # environment -> {id: (recorded_at, state)}, and id -> environment
+        self._members = {}
+        self._environment_of = {}
+        # environment -> when its last where() scan started
+        self._reconciled_at = {}
+        self._counters = {
+            "polls": 0,
+            "served": 0,
+            "refreshed": 0,
+            "reconciles": 0,
+            "moved": 0,
+            "dropped": 0,
+        }
+
+    def record(self, doc_id, data, now=None):
+        """Called by the ingest POST path after a heartbeat is written or queued."""
+        now = time.monotonic() if now is None else now
+        data = resolve_server_timestamps(data)
+        with self._lock:
+            self._place(doc_id, dict(data, id=doc_id), now)
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._place(doc_id, None, None)
+
+    def students(self, env_code, repository, now=None):
+        """Latest state of every student in env_code ([{..., 'id'}, ...] in id order)."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._counters["polls"] += 1
+            reconciled_at = self._reconciled_at.get(env_code)
+            due = (
+                reconciled_at is None
+                or now - reconciled_at >= self.reconcile_interval
+            )
+            if not due:
+                members = self._members.get(env_code, {})
+                stale = [
+                    doc_id
+                    for doc_id, (recorded_at, _) in members.items()
+                    if now - recorded_at >= self.max_age
+                ]
+
+        if due:
+            self._reconcile(env_code, repository, now)
+        elif stale:
+            self._refresh(env_code, stale, repository, now)
+
+        with self._lock:
+            members = self._members.get(env_code, {})
+            self._counters["served"] += len(members)
+            return [members[doc_id][1] for doc_id in sorted(members)]
+
+    def metrics(self):
+        with self._lock:
+            data = dict(self._counters)
+            data["environments"] = len(self._reconciled_at)
+            data["students"] = len(self._environment_of)
+        return data
+
+    def _reconcile(self, env_code, repository, now):
+        """Rebuild env_code's members from a where() scan, keeping what ingest recorded during it."""
+        found = {
+            doc.id: doc.to_dict()
+            for doc in repository.stream_environment(env_code)
+        }
+        with self._lock:
+            if (
+                len(self._reconciled_at) >= MAX_ENVIRONMENTS
+                and env_code not in self._reconciled_at
+            ):
+                self._clear()
+            previous = self._reconciled_at.get(env_code, now)
+            for doc_id, (recorded_at, _) in list(
+                self._members.get(env_code, {}).items()
+            ):
+                if doc_id not in found and recorded_at < previous:
+                    self._place(doc_id, None, None)
+                    self._counters["dropped"] += 1
+            for doc_id, data in found.items():
+                current = self._members.get(env_code, {}).get(doc_id)
+                # A heartbeat recorded since the scan started is at least as new
+                if current is None or current[0] < now:
+                    self._place(doc_id, dict(data, id=doc_id), now)
+            self._counters["reconciles"] += 1
+            # Past max_students the index was dropped mid-scan: scan again next poll rather than serve part of it
+            if all(
+                doc_id in self._members.get(env_code, {}) for doc_id in found
+            ):
+                self._reconciled_at[env_code] = now
+
+    def _refresh(self, env_code, doc_ids, repository, now):
+        """Re-read stale members by id; ones that left the environment or the collection are moved or dropped."""
+        found = repository.get_latest_many(doc_ids)
+        with self._lock:
+            self._counters["refreshed"] += len(doc_ids)
+            for doc_id in doc_ids:
+                current = self._members.get(env_code, {}).get(doc_id)
+                if current is None or current[0] > now:
+                    continue
+                data = found.get(doc_id)
+                if data is None:
+                    self._place(doc_id, None, None)
+                    self._counters["dropped"] += 1
+                    continue
+                if data.get("environment") != env_code:
+                    self._counters["moved"] += 1
+                self._place(doc_id, dict(data, id=doc_id), now)
+
+    def _place(self, doc_id, state, now):
+        """Put doc_id in its state's environment (state None: out of the index)."""
+        old = self._environment_of.pop(doc_id, None)
+        if old is not None:
+            members = self._members.get(old)
+            members.pop(doc_id, None)
+            if not members and old not in self._reconciled_at:
+                del self._members[old]
+        environment = state.get("environment") if state is not None else None
+        if environment is None:
+            return
+        if len(self._environment_of) >= self.max_students:
+            self._clear()
+        self._members.setdefault(environment, {})[doc_id] = (now, state)
+        self._environment_of[doc_id] = environment
+
+    def _clear(self):
+        self._members.clear()
+        self._environment_of.clear()
+        self._reconciled_at.clear()
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(namespace="latest"):
+    """Process-wide EnvironmentIndex, or None when XSCOUT_ENVIRONMENT_INDEX is off."""
+    from django.conf import settings
+
+    if not getattr(settings, "XSCOUT_ENVIRONMENT_INDEX", True):
+        return None
+    with _indexes_lock:
+        if namespace not in _indexes:
+            _indexes[namespace] = EnvironmentIndex(
+                max_age=getattr(
+                    settings, "XSCOUT_ENVIRONMENT_INDEX_MAX_AGE", 5.0
+                ),
+                reconcile_interval=getattr(
+                    settings, "XSCOUT_ENVIRONMENT_INDEX_RECONCILE", 60.0
+                ),
+                max_students=getattr(
+                    settings, "XSCOUT_ENVIRONMENT_INDEX_MAX_STUDENTS", 50000
+                ),
+            )
+        return _indexes[namespace]
+
+
+def metrics():
+    with _indexes_lock:
+        return {
+            namespace: index.metrics() for namespace, index in _indexes.items()
+        }
@@ -0,0 +1,488 @@
+"""
+Winnowing fingerprint index over snapshot history, for plagiarism search
+across sessions and terms.
+
+The Cheating Network Graph (dashboard/similarity.py) compares students'
+current snapshots with each other. This index remembers every snapshot that
+was ingested, so code copied from a student who has since moved on, or from
+last semester, can still be traced:
+
+- fingerprint(): a snapshot's tokens (similarity.tokenize, so formatting is
+  ignored) are hashed in k-grams of XSCOUT_FINGERPRINT_K tokens and winnowed
+  with a window of XSCOUT_FINGERPRINT_WINDOW hashes (Schleimer, Wilkerson
+  and Aiken, SIGMOD 2003): the minimum of every window is kept, so two
+  snapshots sharing a run of k + window - 1 tokens share a fingerprint,
+  while only about 2 / (window + 1) of the k-grams are stored. Hashes are
+  blake2b, the same in every process and across restarts.
+- Postings map a fingerprint to the students who wrote it, each with the
+  history entry (id and time) it first appeared in. Ingest hands snapshots
+  to FingerprintIndex.add() and a daemon thread fingerprints them every
+  XSCOUT_FINGERPRINT_FLUSH_INTERVAL seconds, posting only the fingerprints
+  that are new since the student's previous snapshot: a heartbeat that
+  changed a few lines writes a few postings. Firestore keeps the latest
+  entry that posted a fingerprint rather than the first.
+- sources() reads the postings of a snapshot's fingerprints and ranks the
+  other students by how many they share, so a query costs one posting read
+  per fingerprint however large the corpus is. Fingerprints that more than
+  XSCOUT_FINGERPRINT_MAX_POSTINGS students share are boilerplate (imports,
+  a main() signature, the starter code) and are left out of the score;
+  Firestore stops posting to them, so their documents stay small.
+
+`manage.py index_fingerprints` indexes history written before the index
+existed.
+"""
+
+import atexit
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+
+from . import similarity
+from .playback import decode_cursor, iso_z, parse_time
+
+logger = logging.getLogger(__name__)
+
+K = 5
+WINDOW = 4
+MAX_POSTINGS = 50
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+# Snapshots waiting for the flush thread; more are dropped (and counted) rather than held
+MAX_PENDING = 10000
+# Students whose last fingerprints are kept to post only what changed
+MAX_REMEMBERED = 20000
+# Entries listed per source
+MAX_ENTRIES = 5
+# History entries read back to find the latest one with code
+SNAPSHOT_LOOKBACK = 20
+
+# Stored as signed 64-bit integers (SQLite INTEGER)
+_MASK = (1 << 63) - 1
+
+
+def kgram_hashes(tokens, k=K):
+    """Stable 63-bit hash of every k-token window, in order."""
+    if len(tokens) < k:
+        windows = [tokens] if tokens else []
+    else:
+        windows = zip(*(tokens[i:] for i in range(k)))
+    blake2b = hashlib.blake2b
+    return [
+        int.from_bytes(
+            blake2b(
+                "\x00".join(window).encode("utf-8", "replace"), digest_size=8
+            ).digest(),
+            "big",
+        )
+        & _MASK
+        for window in windows
+    ]
+
+
+def winnow(hashes, window=WINDOW):
+    """The rightmost minimum of every `window` consecutive hashes, as a set."""
+    if len(hashes) <= window:
+        return {min(hashes)} if hashes else set()
+    selected = set()
+    # Positions of increasing hashes; the front is the current window's minimum
+    candidates = deque()
+    for i, value in enumerate(hashes):
+        while candidates and hashes[candidates[-1]] >= value:
+            candidates.pop()
+        candidates.append(i)
+        if candidates[0] <= i - window:
+            candidates.popleft()
+        if i >= window - 1:
+            selected.add(hashes[candidates[0]])
+    return selected
+
+
+def fingerprint(code, k=K, window=WINDOW):
+    return frozenset(
+        winnow(kgram_hashes(similarity.tokenize(code), k), window)
+    )
+
+
+def snapshot_code(entry):
+    """The code of a history entry or heartbeat: root entries carry 'code', AdminDashboard ones a 'snapshot'."""
+    code = entry.get("code")
+    if code is None and isinstance(entry.get("snapshot"), dict):
+        code = entry["snapshot"].get("code")
+    return code if isinstance(code, str) else None
+
+
+def _timestamp(value):
+    if isinstance(value, datetime):
+        return iso_z(value)
+    return value if isinstance(value, str) else None
+
+
+class FingerprintIndex:
+    """
+    Fingerprints of one worker's snapshots: add() queues them, a daemon
+    thread posts them with repository.write_fingerprints(), and sources()
+    answers queries from repository.read_fingerprints().
+    """
+
+    def __init__(
+        self,
+        repository,
+        k=K,
+        window=WINDOW,
+        max_postings=MAX_POSTINGS,
+        flush_interval=5.0,
+        max_pending=MAX_PENDING,
+        remembered=MAX_REMEMBERED,
+        clock=None,
+    ):
+        self.repository = repository
+        self.k = k
+        self.window = window
+        self.max_postings = max_postings
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.remembered = remembered
+        self.clock = clock or (lambda: datetime.now(timezone.utc))
+        self._cond = threading.Condition()
+        # (user_id, entry_id, code, timestamp) not fingerprinted yet
+        self._pending = []
+        # user_id -> (snapshot hash, fingerprints) of the last snapshot posted, least recently posted first
+        self._previous = OrderedDict()
+        self._thread = None
+        self._stopped = False
+        self._flush_ms = None
+        self._counters = {
+            "snapshots": 0,
+            "unchanged": 0,
+            "postings": 0,
+            "flushes": 0,
+            "errors": 0,
+            "dropped": 0,
+            "queries": 0,
+        }
+
+    # -- ingest --
+
+    def add(self, user_id, entry_id, code, timestamp=None):
+        """Queue one history entry's snapshot. Returns False when there was no code or the queue is full."""
+        if not code or not code.strip():
+            return False
+        timestamp = _timestamp(timestamp) or iso_z(self.clock())
+        with self._cond:
+            if len(self._pending) >= self.max_pending:
+                self._counters["dropped"] += 1
+                return False
+            self._pending.append((user_id, entry_id, code, timestamp))
+        self._ensure_started()
+        return True
+
+    def index(self, snapshots):
+        """
+        Fingerprint [(user_id, entry_id, code, timestamp), ...], given in the
+        order they were written, and post what is new for each student.
+        Returns the number of postings written.
+        """
+        postings = []
+        latest = {}
+        unchanged = 0
+        for user_id, entry_id, code, timestamp in snapshots:
+            digest = similarity.snapshot_hash(code)
+            previous = latest.get(user_id) or self._previous.get(user_id)
+            if previous is not None and previous[0] == digest:
+                unchanged += 1
+                continue
+            prints = fingerprint(code, self.k, self.window)
+            new = prints - previous[1] if previous is not None else prints
+            postings.extend(
+                (value, user_id, entry_id, timestamp) for value in new
+            )
+            latest[user_id] = (digest, prints)
+
+        if postings:
+            self.repository.write_fingerprints(
+                postings, max_postings=self.max_postings
+            )
+        # Only once written, so a failed flush posts the same fingerprints again
+        with self._cond:
+            for user_id, state in latest.items():
+                self._previous[user_id] = state
+                self._previous.move_to_end(user_id)
+            while len(self._previous) > self.remembered:
+                self._previous.popitem(last=False)
+            self._counters["snapshots"] += len(snapshots)
+            self._counters["unchanged"] += unchanged
+            self._counters["postings"] += len(postings)
+        return len(postings)
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped = False
+            self._thread = threading.Thread(
+                target=self._run, name="xscout-fingerprints", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._stopped:
+                    self._cond.wait(self.flush_interval)
+                stopped = self._stopped
+            try:
+                self.flush()
+            except Exception:
+                # Snapshots were put back by flush(); the next round retries them
+                pass
+            if stopped:
+                return
+
+    def flush(self):
+        """Fingerprint and post the queued snapshots. Returns the number of postings written."""
+        with self._cond:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return 0
+        started = time.perf_counter()
+        try:
+            written = self.index(pending)
+        except Exception as e:
+            with self._cond:
+                self._pending[:0] = pending[: self.max_pending]
+                self._counters["errors"] += 1
+            logger.warning(
+                "Posting fingerprints of %d snapshots failed: %s",
+                len(pending),
+                e,
+            )
+            raise
+        with self._cond:
+            self._flush_ms = (time.perf_counter() - started) * 1000
+            self._counters["flushes"] += 1
+        return written
+
+    def stop(self, timeout=5.0):
+        """Flush what is left and stop the flush thread."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    # -- queries --
+
+    def sources(self, code, exclude=None, limit=DEFAULT_LIMIT):
+        """
+        The students whose history shares the most fingerprints with `code`,
+        best first. exclude: a user_id to leave out, normally the snapshot's
+        own author. Each source lists the entries the shared fingerprints
+        were posted from, most shared first.
+        """
+        prints = fingerprint(code, self.k, self.window)
+        postings = (
+            self.repository.read_fingerprints(
+                prints, max_postings=self.max_postings
+            )
+            if prints
+            else {}
+        )
+        shared = {}
+        boilerplate = 0
+        for posted in postings.values():
+            if posted is None:
+                boilerplate += 1
+                continue
+            for user_id, (entry_id, timestamp) in posted.items():
+                if user_id == exclude:
+                    continue
+                entries = shared.setdefault(user_id, {})
+                entry = entries.setdefault(entry_id, [0, timestamp])
+                entry[0] += 1
+
+        scored = len(prints) - boilerplate
+        ranked = []
+        for user_id, entries in shared.items():
+            count = sum(entry[0] for entry in entries.values())
+            timestamps = sorted(
+                entry[1] for entry in entries.values() if entry[1]
+            )
+            top = sorted(
+                entries.items(), key=lambda item: (-item[1][0], item[0])
+            )[:MAX_ENTRIES]
+            ranked.append(
+                {
+                    "user_id": user_id,
+                    "shared": count,
+                    # How much of the snapshot (boilerplate aside) this student wrote first
+                    "containment": round(count / scored, 3) if scored else 0.0,
+                    "first_seen": timestamps[0] if timestamps else None,
+                    "last_seen": timestamps[-1] if timestamps else None,
+                    "entries": [
+                        {"id": entry_id, "shared": n, "timestamp": timestamp}
+                        for entry_id, (n, timestamp) in top
+                    ],
+                }
+            )
+        ranked.sort(key=lambda source: (-source["shared"], source["user_id"]))
+        with self._cond:
+            self._counters["queries"] += 1
+        return {
+            "fingerprints": len(prints),
+            "boilerplate": boilerplate,
+            "sources": ranked[:limit],
+        }
+
+    def metrics(self):
+        with self._cond:
+            data = dict(self._counters)
+            data.update(
+                {
+                    "pending": len(self._pending),
+                    "remembered": len(self._previous),
+                    "last_flush_ms": (
+                        round(self._flush_ms, 2)
+                        if self._flush_ms is not None
+                        else None
+                    ),
+                    "flusher_alive": bool(
+                        self._thread and self._thread.is_alive()
+                    ),
+                }
+            )
+        return data
+
+
+def parse_params(params):
+    """Validated query params of the sources API: {'at': datetime | None, 'limit': int}. Raises ValueError."""
+    try:
+        limit = int(params.get("limit") or DEFAULT_LIMIT)
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    return {
+        "at": parse_time(params["at"]) if params.get("at") else None,
+        "limit": min(limit, MAX_LIMIT),
+    }
+
+
+def snapshot_at(repository, user_id, at=None, iso_timestamps=False):
+    """
+    (entry id, code) of the student's last history entry with code at or
+    before `at` (default: the newest), from either tier, or None.
+    """
+    page = repository.history_page(
+        user_id,
+        end=at,
+        limit=SNAPSHOT_LOOKBACK,
+        descending=True,
+        fields=["code", "snapshot"],
+        iso_timestamps=iso_timestamps,
+    )
+    for entry in page["data"]:
+        code = snapshot_code(entry)
+        if code:
+            return entry["id"], code
+    return None
+
+
+def backfill(
+    index,
+    repository,
+    user_ids,
+    page_size=500,
+    iso_timestamps=False,
+    progress=None,
+):
+    """
+    Index every history entry of `user_ids`, oldest first, from both tiers.
+    Returns {'students', 'entries', 'postings', 'seconds'}. progress(user_id,
+    report) is called after each student.
+    """
+    started = time.perf_counter()
+    report = {"students": 0, "entries": 0, "postings": 0, "seconds": 0.0}
+    for user_id in user_ids:
+        cursor = None
+        while True:
+            page = repository.history_page(
+                user_id,
+                limit=page_size,
+                cursor=cursor,
+                fields=["code", "snapshot", "timestamp"],
+                iso_timestamps=iso_timestamps,
+            )
+            snapshots = [
+                (
+                    user_id,
+                    entry["id"],
+                    code,
+                    _timestamp(entry.get("timestamp")),
+                )
+                for entry in page["data"]
+                for code in [snapshot_code(entry)]
+                if code
+            ]
+            report["entries"] += len(page["data"])
+            report["postings"] += index.index(snapshots)
+            if not page["has_more"]:
+                break
+            cursor = decode_cursor(page["next_cursor"])
+        report["students"] += 1
+        if progress is not None:
+            progress(user_id, report)
+    report["seconds"] = round(time.perf_counter() - started, 2)
+    return report
+
+
+def describe(report):
+    return (
+        f"Indexed {report['entries']} history entries of {report['students']} students in "
+        f"{report['seconds']}s: {report['postings']} new postings."
+    )
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Process-wide FingerprintIndex, or None when XSCOUT_FINGERPRINTS is off."""
+    global _index
+    from django.conf import settings
+
+    if not getattr(settings, "XSCOUT_FINGERPRINTS", True):
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                from .storage import get_repository
+
+                _index = FingerprintIndex(
+                    get_repository(),
+                    k=getattr(settings, "XSCOUT_FINGERPRINT_K", K),
+                    window=getattr(
+                        settings, "XSCOUT_FINGERPRINT_WINDOW", WINDOW
+                    ),
+                    max_postings=getattr(
+                        settings,
+                        "XSCOUT_FINGERPRINT_MAX_POSTINGS",
+                        MAX_POSTINGS,
+                    ),
+                    flush_interval=getattr(
+                        settings, "XSCOUT_FINGERPRINT_FLUSH_INTERVAL", 5.0
+                    ),
+                )
+                atexit.register(_index.stop)
+    return _index
+
+
+def metrics():
+    if _index is None:
+        return {"snapshots": 0, "pending": 0}
+    return _index.metrics()
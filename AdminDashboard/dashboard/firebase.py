@@ -0,0 +1,117 @@
+"""
+Process-wide Firebase app and Firestore client.
+
+Importing firebase_admin and google.cloud.firestore (grpc, protobuf, the
+generated API) is the bulk of a cold start, and creating the client opens a
+gRPC channel that must not be shared across a fork. So nothing here is
+imported or created until it is needed:
+
+- get_client() initialises the default app and the client on first use,
+  once per process, under a lock so concurrent first requests don't race;
+- a client created before a fork (e.g. gunicorn --preload) is dropped in
+  the child, which then creates its own;
+- warm_up() creates the client and makes one cheap read so the channel,
+  TLS and token are ready before the first request. It is opt-in
+  (XSCOUT_FIREBASE_WARMUP) and run from the gunicorn post_worker_init
+  hook in gunicorn.conf.py, i.e. after the fork;
+- SERVER_TIMESTAMP is resolved on attribute access, so views can write
+  firebase.SERVER_TIMESTAMP without importing firebase_admin at import time.
+"""
+
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Probed in BASE_DIR (and its parent) before falling back to default credentials
+CREDENTIAL_FILES = (
+    "xscout-68489-firebase-adminsdk-fbsvc-71d744a27c.json",
+    "serviceAccountKey.json",
+)
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _default_app():
+    import firebase_admin
+    from django.conf import settings
+    from firebase_admin import credentials
+
+    if not firebase_admin._apps:
+        base_dir = str(settings.BASE_DIR)
+        candidates = [
+            os.path.join(base_dir, name) for name in CREDENTIAL_FILES
+        ]
+        candidates.append(
+            os.path.join(os.path.dirname(base_dir), "serviceAccountKey.json")
+        )
+        cred_path = next(
+            (path for path in candidates if os.path.exists(path)), None
+        )
+        if cred_path is not None:
+            firebase_admin.initialize_app(credentials.Certificate(cred_path))
+        else:
+            # Default credentials (GOOGLE_APPLICATION_CREDENTIALS, Cloud Run/Render secrets)
+            logger.warning(
+                "No service account file found; using default Google credentials"
+            )
+            firebase_admin.initialize_app()
+    return firebase_admin.get_app()
+
+
+def get_client():
+    """The process's Firestore client, created on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from google.cloud import firestore
+
+                # Built here rather than by firebase_admin.firestore.client(), which caches
+                # the client on the app where a forked child would find the parent's channel
+                app = _default_app()
+                if not app.project_id:
+                    raise ValueError(
+                        "Project ID is required to access Firestore; use service account "
+                        "credentials or set GOOGLE_CLOUD_PROJECT"
+                    )
+                _client = firestore.Client(
+                    credentials=app.credential.get_credential(),
+                    project=app.project_id,
+                )
+    return _client
+
+
+def warm_up(collection=None):
+    """Create the client and open its channel with a one-document read. Returns seconds taken."""
+    from django.conf import settings
+
+    started = time.perf_counter()
+    collection = collection or getattr(
+        settings, "XSCOUT_TELEMETRY_COLLECTION", "reports"
+    )
+    # An id-only projection of at most one document: one read, no payload
+    list(get_client().collection(collection).select([]).limit(1).stream())
+    return time.perf_counter() - started
+
+
+def _forget_client():
+    # gRPC channels don't survive a fork; the child builds its own on first use
+    global _client, _client_lock
+    _client = None
+    _client_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_client)
+
+
+def __getattr__(name):
+    if name == "SERVER_TIMESTAMP":
+        from google.cloud.firestore import SERVER_TIMESTAMP
+
+        return SERVER_TIMESTAMP
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,468 @@
+"""
+Background export and backup jobs behind /api/jobs/.
+
+A CSV export or a full backup of a large tenant takes longer than
+gunicorn's request timeout. Instead of producing it inside the request:
+
+- POST /api/jobs/ {"kind": "export" | "backup", "params": {...}} starts a
+  job and answers right away. Export params are the export_logs query
+  params (see dashboard/export.py), backup takes {"format": "json" |
+  "ndjson" | "parquet"} (parquet: a tar of the columnar archive with
+  history, see dashboard/archive.py);
+- a thread pool (XSCOUT_JOBS_WORKERS) writes the artifact to
+  XSCOUT_JOBS_DIR in chunks, recording progress as it goes;
+- GET /api/jobs/<id>/ reports status, bytes written and, when known, how
+  many students are done out of how many;
+- GET /api/jobs/<id>/download/ serves the artifact with HTTP Range
+  support, so an interrupted download of a large backup resumes where it
+  stopped.
+
+A job's id hashes its kind, its params and the repository's
+data_version(). Submitting the same job again while the data is unchanged
+returns the running or finished job instead of starting another. Once the
+data changes the id changes, and a finished job replaces the older
+artifacts of the same export. Artifacts are deleted after XSCOUT_JOBS_TTL
+seconds.
+
+Job records are JSON files next to the artifacts, so any worker sharing
+XSCOUT_JOBS_DIR (same host or a shared volume) can report status and serve
+downloads. A job whose worker went away stops updating its record and is
+reported as failed after STALE_AFTER seconds; submitting it again restarts
+it.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from django.http import JsonResponse
+
+from . import archive, export, playback, streaming
+
+KINDS = ("export", "backup")
+BACKUP_FORMATS = ("json", "ndjson", "parquet")
+JOB_ID = re.compile(r"^[0-9a-f]{24}$")
+# A running job whose record is older than this lost its worker
+STALE_AFTER = 60.0
+# Seconds between progress writes to the job record
+PROGRESS_INTERVAL = 1.0
+BLOCK_SIZE = 64 * 1024
+
+
+def _now_iso():
+    return playback.iso_z(datetime.now(timezone.utc))
+
+
+def parse_request(body):
+    """(kind, params) from a POST body. Raises ValueError."""
+    if not isinstance(body, dict):
+        raise ValueError("Expected a JSON object")
+    kind = body.get("kind")
+    if kind not in KINDS:
+        raise ValueError(f"kind must be one of {', '.join(KINDS)}")
+    params = body.get("params") or {}
+    if not isinstance(params, dict) or not all(
+        isinstance(value, str) for value in params.values()
+    ):
+        raise ValueError("params must be an object of strings")
+    if kind == "export":
+        export.parse_params(params)
+    elif params.get("format", "json") not in BACKUP_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(BACKUP_FORMATS)}")
+    # Dropped so that equivalent requests share a job
+    return kind, {key: value for key, value in sorted(params.items()) if value}
+
+
+def parse_range(header, size):
+    """
+    (start, end), inclusive, for a single 'bytes=' Range header, or None to
+    send the whole file (no header, several ranges or a malformed one).
+    Raises ValueError when the range starts past the end of the file.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, sep, last = header[6:].strip().partition("-")
+    if (
+        not sep
+        or not (first.isdigit() or first == "")
+        or not (last.isdigit() or last == "")
+    ):
+        return None
+    if first == "":
+        if last == "" or int(last) == 0:
+            raise ValueError(header)
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size:
+        raise ValueError(header)
+    if start > end:
+        return None
+    return start, end
+
+
+def _watched(items, failures):
+    """
+    items, with any exception recorded in `failures` on its way out. The
+    streaming writers turn a failure into a trailing error entry, which is
+    right for a live download but not for an artifact that gets reused.
+    """
+    try:
+        yield from items
+    except Exception as e:
+        failures.append(e)
+        raise
+
+
+def _file_slice(path, start, length):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            block = f.read(min(BLOCK_SIZE, length))
+            if not block:
+                return
+            length -= len(block)
+            yield block
+
+
+class JobManager:
+    def __init__(
+        self,
+        repository,
+        directory,
+        workers=2,
+        ttl=86400.0,
+        iso_timestamps=False,
+    ):
+        self.repository = repository
+        self.directory = directory
+        self.ttl = ttl
+        # Passed to the exporter: the AdminDashboard stores history timestamps as ISO strings
+        self.iso_timestamps = iso_timestamps
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="xscout-job"
+        )
+        self._lock = threading.Lock()
+        self._counters = {
+            "started": 0,
+            "reused": 0,
+            "finished": 0,
+            "failed": 0,
+        }
+        os.makedirs(directory, exist_ok=True)
+
+    # -- records --
+
+    def _path(self, job_id, suffix):
+        if not JOB_ID.match(job_id or ""):
+            raise LookupError(job_id)
+        return os.path.join(self.directory, job_id + suffix)
+
+    def _load(self, job_id):
+        try:
+            with open(self._path(job_id, ".json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _save(self, job):
+        job["updated"] = time.time()
+        path = self._path(job["id"], ".json")
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(job, f)
+        os.replace(tmp, path)
+
+    def _public(self, job):
+        job = dict(job)
+        if (
+            job["status"] in ("queued", "running")
+            and time.time() - job["updated"] > STALE_AFTER
+        ):
+            job["status"] = "failed"
+            job["error"] = "The worker running this job stopped"
+        job.pop("updated")
+        job.pop("params_key")
+        if job["status"] == "done":
+            job["download_url"] = f"/api/jobs/{job['id']}/download/"
+        return job
+
+    # -- API --
+
+    def submit(self, kind, params):
+        """The job for (kind, params) at the current data version, started unless it already exists."""
+        self.sweep()
+        params_key = hashlib.sha256(
+            json.dumps([kind, params, self.iso_timestamps]).encode()
+        ).hexdigest()
+        version = hashlib.sha256(
+            str(self.repository.data_version()).encode()
+        ).hexdigest()
+        job_id = params_key[:12] + version[:12]
+
+        with self._lock:
+            job = self._load(job_id)
+            if job is not None:
+                public = self._public(job)
+                if public["status"] != "failed" and (
+                    public["status"] != "done"
+                    or os.path.exists(self._path(job_id, job["extension"]))
+                ):
+                    self._counters["reused"] += 1
+                    return dict(public, reused=True)
+
+            extension = self._extension(kind, params)
+            job = {
+                "id": job_id,
+                "kind": kind,
+                "params": params,
+                "params_key": params_key[:12],
+                "status": "queued",
+                "created_at": _now_iso(),
+                "finished_at": None,
+                "bytes": 0,
+                "done": 0,
+                "total": None,
+                "error": None,
+                "extension": extension,
+                "filename": f"xscout_{kind}_{datetime.now().strftime('%Y%m%d_%H%M%S')}{extension}",
+            }
+            self._save(job)
+            self._counters["started"] += 1
+            public = self._public(job)
+        self._executor.submit(self._run, job)
+        return dict(public, reused=False)
+
+    def status(self, job_id):
+        """The job's public record; LookupError for an unknown id."""
+        job = self._load(job_id)
+        if job is None:
+            raise LookupError(job_id)
+        return self._public(job)
+
+    def download(self, request, job_id):
+        """The finished artifact, honouring Range and If-Range; LookupError when there is none."""
+        job = self.status(job_id)
+        path = self._path(job_id, job["extension"])
+        if job["status"] != "done" or not os.path.exists(path):
+            raise LookupError(job_id)
+
+        size = os.path.getsize(path)
+        etag = f'"{job_id}"'
+        content_type = self._content_type(job)
+        byte_range = None
+        if request.headers.get("If-Range", etag) == etag:
+            try:
+                byte_range = parse_range(request.headers.get("Range"), size)
+            except ValueError:
+                response = JsonResponse(
+                    {"status": "error", "message": "Range not satisfiable"},
+                    status=416,
+                )
+                response["Content-Range"] = f"bytes */{size}"
+                return response
+
+        if byte_range is None:
+            response = streaming.response(
+                request, _file_slice(path, 0, size), content_type=content_type
+            )
+            response["Content-Length"] = str(size)
+        else:
+            start, end = byte_range
+            response = streaming.response(
+                request,
+                _file_slice(path, start, end - start + 1),
+                status=206,
+                content_type=content_type,
+            )
+            response["Content-Length"] = str(end - start + 1)
+            response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Accept-Ranges"] = "bytes"
+        response["ETag"] = etag
+        response["Content-Disposition"] = (
+            f"attachment; filename=\"{job['filename']}\""
+        )
+        return response
+
+    def sweep(self, now=None):
+        """
+        Delete records and artifacts of jobs that finished (or stalled) more
+        than `ttl` seconds ago, and partial files left by workers that died.
+        """
+        now = time.time() if now is None else now
+        for name in os.listdir(self.directory):
+            job_id, _, suffix = name.partition(".")
+            if suffix == "json":
+                job = self._load(job_id)
+                if job is not None and now - job["updated"] > self.ttl:
+                    self._delete(job_id, job)
+            elif suffix.endswith((".part", ".tmp")):
+                path = os.path.join(self.directory, name)
+                try:
+                    if now - os.path.getmtime(path) > self.ttl:
+                        os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def metrics(self):
+        with self._lock:
+            return dict(self._counters)
+
+    # -- worker side --
+
+    def _extension(self, kind, params):
+        if kind == "export":
+            return ".csv.gz" if params.get("compress") == "gzip" else ".csv"
+        return {"parquet": ".tar"}.get(
+            params.get("format"), "." + params.get("format", "json")
+        )
+
+    def _content_type(self, job):
+        return {
+            ".csv": "text/csv",
+            ".csv.gz": "application/gzip",
+            ".json": "application/json",
+            ".ndjson": streaming.NDJSON_CONTENT_TYPE,
+            ".tar": "application/x-tar",
+        }[job["extension"]]
+
+    def _chunks(self, job, progress, failures):
+        params = job["params"]
+        if job["kind"] == "export":
+            options = export.parse_params(params)
+            compress = options.pop("compress")
+            exporter = export.get_exporter(
+                self.repository,
+                iso_timestamps=self.iso_timestamps,
+                progress=progress,
+            )
+            chunks = export.write_csv(
+                _watched(exporter.pages(**options), failures)
+            )
+            return (
+                export.gzipped(chunks)
+                if compress
+                else (chunk.encode("utf-8") for chunk in chunks)
+            )
+        if params.get("format") == "parquet":
+            # Fails by raising rather than in-band, nothing to watch
+            return archive.archive_chunks(self.repository, progress=progress)
+
+        def docs():
+            for done, doc in enumerate(
+                self.repository.stream_latest(), start=1
+            ):
+                yield doc
+                progress(done, None)
+
+        if params.get("format") == "ndjson":
+            chunks = streaming.ndjson(
+                streaming.documents(_watched(docs(), failures))
+            )
+        else:
+            chunks = streaming.json_object(
+                (
+                    (doc.id, doc.to_dict())
+                    for doc in _watched(docs(), failures)
+                ),
+                indent=2,
+            )
+        return (chunk.encode("utf-8") for chunk in chunks)
+
+    def _run(self, job):
+        path = self._path(job["id"], job["extension"])
+        partial = f"{path}.{os.getpid()}.part"
+        saved_at = [0.0]
+        failures = []
+
+        def progress(done, total):
+            job["done"], job["total"] = done, total
+            if time.monotonic() - saved_at[0] >= PROGRESS_INTERVAL:
+                saved_at[0] = time.monotonic()
+                self._save(job)
+
+        try:
+            job["status"] = "running"
+            self._save(job)
+            with open(partial, "wb") as f:
+                for chunk in self._chunks(job, progress, failures):
+                    if failures:
+                        raise failures[0]
+                    f.write(chunk)
+                    job["bytes"] += len(chunk)
+                    progress(job["done"], job["total"])
+            os.replace(partial, path)
+            job["status"] = "done"
+            counter = "finished"
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+            counter = "failed"
+            if os.path.exists(partial):
+                os.remove(partial)
+        if job["status"] == "done":
+            self._supersede(job)
+        job["finished_at"] = _now_iso()
+        with self._lock:
+            self._counters[counter] += 1
+        self._save(job)
+
+    def _supersede(self, job):
+        """Older data versions of the same export are not served again."""
+        for name in os.listdir(self.directory):
+            other_id, _, suffix = name.partition(".")
+            if (
+                suffix == "json"
+                and other_id != job["id"]
+                and other_id.startswith(job["params_key"])
+            ):
+                other = self._load(other_id)
+                if other is not None and other["status"] == "done":
+                    self._delete(other_id, other)
+
+    def _delete(self, job_id, job):
+        for suffix in (job.get("extension"), ".json"):
+            if suffix:
+                try:
+                    os.remove(self._path(job_id, suffix))
+                except FileNotFoundError:
+                    pass
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_manager(iso_timestamps=False):
+    """Process-wide JobManager over the storage repository, created on first use."""
+    global _manager
+    if _manager is None:
+        from django.conf import settings
+
+        from . import storage
+
+        with _manager_lock:
+            if _manager is None:
+                _manager = JobManager(
+                    storage.get_repository(),
+                    getattr(
+                        settings,
+                        "XSCOUT_JOBS_DIR",
+                        os.path.join(str(settings.BASE_DIR), "jobs"),
+                    ),
+                    workers=getattr(settings, "XSCOUT_JOBS_WORKERS", 2),
+                    ttl=getattr(settings, "XSCOUT_JOBS_TTL", 86400.0),
+                    iso_timestamps=iso_timestamps,
+                )
+    return _manager
+
+
+def metrics():
+    if _manager is None:
+        return {"started": 0, "reused": 0, "finished": 0, "failed": 0}
+    return _manager.metrics()
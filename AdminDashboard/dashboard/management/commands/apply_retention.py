@@ -0,0 +1,89 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard import retention
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete history entries older than XSCOUT_RETENTION_DAYS (or the per-environment age). "
+        "Meant to run on a schedule, see render.yaml."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scheduled",
+            action="store_true",
+            help="Do nothing unless XSCOUT_RETENTION_SCHEDULE is on (for the cron service)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report what would be deleted, delete nothing",
+        )
+        parser.add_argument(
+            "--environment", help="Only students in this environment"
+        )
+        parser.add_argument(
+            "--days",
+            type=float,
+            help="Override XSCOUT_RETENTION_DAYS for this run",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            help="Override XSCOUT_RETENTION_RATE (deletes per second, 0: no limit)",
+        )
+        parser.add_argument(
+            "--budget", type=float, help="Stop after this many seconds"
+        )
+        parser.add_argument(
+            "--json",
+            action="store_true",
+            dest="as_json",
+            help="Print the full report as JSON",
+        )
+
+    def handle(
+        self,
+        *args,
+        scheduled,
+        dry_run,
+        environment,
+        days,
+        rate,
+        budget,
+        as_json,
+        **options,
+    ):
+        if scheduled and not getattr(
+            settings, "XSCOUT_RETENTION_SCHEDULE", False
+        ):
+            self.stdout.write(
+                "Scheduled retention is off (XSCOUT_RETENTION_SCHEDULE), "
+                "nothing deleted."
+            )
+            return
+        try:
+            # History timestamps are the extension's ISO strings here
+            engine = retention.get_engine(iso_timestamps=True)
+        except ValueError as e:
+            raise CommandError(f"XSCOUT_RETENTION_ENVIRONMENTS: {e}")
+        if days is not None:
+            engine.days = days
+        if rate is not None:
+            engine.rate = rate
+        report = engine.run(
+            dry_run=dry_run, environment=environment, budget=budget
+        )
+        if as_json:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(self.style.SUCCESS(retention.describe(report)))
+        for env, totals in sorted(report["environments"].items()):
+            self.stdout.write(
+                f"  {env or '(no environment)'}: {totals['documents']} documents, "
+                f"{totals['bytes'] / 1e6:.1f} MB, before {totals['cutoff']}"
+            )
@@ -0,0 +1,63 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard import fingerprints, storage
+
+
+class Command(BaseCommand):
+    help = (
+        "Add the history written before the fingerprint index existed (or "
+        "while it was off) to it. Postings already stored are kept as they "
+        "are, so it is safe to run again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            action="append",
+            dest="users",
+            metavar="USER_ID",
+            help="Only this student (repeatable), e.g. one whose latest "
+            "state was deleted",
+        )
+        parser.add_argument(
+            "--environment", help="Only students in this environment"
+        )
+        parser.add_argument(
+            "--json",
+            action="store_true",
+            dest="as_json",
+            help="Print the report as JSON",
+        )
+
+    def handle(self, *args, users, environment, as_json, **options):
+        index = fingerprints.get_index()
+        if index is None:
+            raise CommandError(
+                "The fingerprint index is disabled (XSCOUT_FINGERPRINTS)"
+            )
+        repository = storage.get_repository()
+        if users is None:
+            docs = (
+                repository.stream_latest(fields=["environment"])
+                if environment is None
+                else repository.stream_environment(environment)
+            )
+            users = (doc.id for doc in docs)
+
+        def progress(user_id, report):
+            if not as_json and report["students"] % 100 == 0:
+                self.stdout.write(
+                    f"{report['students']} students, "
+                    f"{report['entries']} entries..."
+                )
+
+        # History timestamps are the extension's ISO strings here
+        report = fingerprints.backfill(
+            index, repository, users, iso_timestamps=True, progress=progress
+        )
+        if as_json:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(self.style.SUCCESS(fingerprints.describe(report)))
@@ -0,0 +1,317 @@
+"""
+History retention behind POST /api/purge-logs/ and `manage.py apply_retention`.
+
+History subcollections grow with every heartbeat and nothing used to
+remove them. The engine deletes history entries older than
+XSCOUT_RETENTION_DAYS, or the age set for the student's environment in
+XSCOUT_RETENTION_ENVIRONMENTS ("ENV1=7,ENV2=90"; 0 keeps everything,
+the default). Latest state is left alone.
+
+For each student it pages through the expired entries with a timestamp
+range query (timestamp < cutoff, keyset cursor, XSCOUT_RETENTION_BATCH
+entries per page) and deletes each page in batched writes of up to 500.
+Deletes are throttled to XSCOUT_RETENTION_RATE documents per second so a
+large purge doesn't compete with ingest for write capacity.
+
+History is delta-encoded (see dashboard/history.py): deltas point at a
+keyframe that may be older than the cutoff. Keyframes referenced by the
+first KEYFRAME_LOOKAHEAD retained entries are kept, so playback from the
+cutoff still decodes; they go on a later run, once nothing retained
+points at them.
+
+Archives of compacted sessions (see dashboard/tiers.py) go whole, once
+their last entry is older than the cutoff.
+
+A dry run reads the same pages and reports what would go without deleting.
+Reports count documents and estimated bytes (Firestore's storage-size
+rules), per environment, plus runtime. A run given a time budget (the
+dashboard's purge button gets REQUEST_BUDGET seconds) stops when it runs
+out and reports complete=False; the next run picks up the rest.
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from . import history, playback, tiers
+
+# Retained entries checked for deltas pointing at an expired keyframe
+KEYFRAME_LOOKAHEAD = 100
+# Seconds a purge started from the dashboard may run, well inside gunicorn's timeout
+REQUEST_BUDGET = 20.0
+NO_ENVIRONMENT = ""
+
+
+def parse_environments(text):
+    """ "ENV1=7,ENV2=90" -> {'ENV1': 7.0, 'ENV2': 90.0}. Raises ValueError."""
+    ages = {}
+    for item in (text or "").split(","):
+        if not item.strip():
+            continue
+        environment, sep, days = item.rpartition("=")
+        if not sep or not environment.strip():
+            raise ValueError(
+                f"retention override '{item.strip()}' must look like ENV=days"
+            )
+        ages[environment.strip()] = float(days)
+        if ages[environment.strip()] < 0:
+            raise ValueError(
+                f"retention for '{environment.strip()}' must be >= 0 days"
+            )
+    return ages
+
+
+def _value_size(value):
+    if isinstance(value, str):
+        return len(value.encode("utf-8")) + 1
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(
+            len(str(key).encode("utf-8")) + 1 + _value_size(item)
+            for key, item in value.items()
+        )
+    if isinstance(value, (list, tuple)):
+        return sum(_value_size(item) for item in value)
+    if value is None or isinstance(value, bool):
+        return 1
+    # Numbers, timestamps
+    return 8
+
+
+def document_size(path, data):
+    """Storage size of a Firestore document under `path` (a '/'-separated name), per Firestore's rules."""
+    name = (
+        sum(len(segment.encode("utf-8")) + 1 for segment in path.split("/"))
+        + 16
+    )
+    return name + _value_size(data) + 32
+
+
+class RetentionEngine:
+    def __init__(
+        self,
+        repository,
+        days=0.0,
+        environments=None,
+        batch_size=500,
+        rate=500.0,
+        iso_timestamps=False,
+        collection="reports",
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        self.repository = repository
+        self.days = days
+        self.environments = environments or {}
+        self.batch_size = batch_size
+        # Deleted documents per second, None for no limit
+        self.rate = rate
+        # Passed to scan_history(): the AdminDashboard stores timestamps as ISO strings
+        self.iso_timestamps = iso_timestamps
+        # Only used to estimate document sizes
+        self.collection = collection
+        self._clock = clock
+        self._sleep = sleep
+
+    def cutoff(self, environment, now):
+        """Entries before this are expired, None when the environment keeps everything."""
+        days = self.environments.get(environment or NO_ENVIRONMENT, self.days)
+        return now - timedelta(days=days) if days else None
+
+    def run(self, now=None, dry_run=False, environment=None, budget=None):
+        """
+        Apply retention to every student (or those in `environment`),
+        stopping early after `budget` seconds. Returns the report.
+        """
+        now = now or datetime.now(timezone.utc)
+        started = self._clock()
+        deadline = started + budget if budget is not None else None
+        report = {
+            "dry_run": dry_run,
+            "complete": True,
+            "students": 0,
+            "affected_students": 0,
+            "documents": 0,
+            "bytes": 0,
+            "kept_keyframes": 0,
+            "archives": 0,
+            "batches": 0,
+            "environments": {},
+        }
+        self._deleted = 0
+        docs = (
+            self.repository.stream_latest(fields=["environment"])
+            if environment is None
+            else self.repository.stream_environment(environment)
+        )
+        for doc in docs:
+            if deadline is not None and self._clock() >= deadline:
+                report["complete"] = False
+                break
+            env = doc.to_dict().get("environment") or NO_ENVIRONMENT
+            report["students"] += 1
+            cutoff = self.cutoff(env, now)
+            if cutoff is None:
+                continue
+            totals = report["environments"].setdefault(
+                env,
+                {"cutoff": playback.iso_z(cutoff), "documents": 0, "bytes": 0},
+            )
+            documents, size = self._purge(
+                doc.id, cutoff, dry_run, report, deadline, started
+            )
+            if documents:
+                report["affected_students"] += 1
+                totals["documents"] += documents
+                totals["bytes"] += size
+        report["runtime"] = round(self._clock() - started, 3)
+        _record(report)
+        return report
+
+    def _purge(self, user_id, cutoff, dry_run, report, deadline, started):
+        documents = size = 0
+        pinned = None
+        cursor = None
+        while True:
+            page = self.repository.scan_history(
+                user_id,
+                before=cutoff,
+                limit=self.batch_size,
+                cursor=cursor,
+                iso_timestamps=self.iso_timestamps,
+            )
+            if not page:
+                break
+            if pinned is None:
+                # Only students with something to delete pay for the lookahead
+                pinned = self._pinned(user_id, cutoff)
+            expired = [doc_id for doc_id, _ in page if doc_id not in pinned]
+            report["kept_keyframes"] += len(page) - len(expired)
+            documents += len(expired)
+            size += sum(
+                document_size(
+                    f"{self.collection}/{user_id}/history/{doc_id}", data
+                )
+                for doc_id, data in page
+                if doc_id not in pinned
+            )
+            if expired and not dry_run:
+                self.repository.delete_history(user_id, expired)
+                report["batches"] += 1
+                self._throttle(len(expired), started)
+            if len(page) < self.batch_size:
+                break
+            cursor = (page[-1][1].get("timestamp"), page[-1][0])
+            if deadline is not None and self._clock() >= deadline:
+                report["complete"] = False
+                break
+        archives, archived_size = self._purge_archives(
+            user_id, cutoff, dry_run
+        )
+        report["archives"] += archives
+        documents += archives
+        size += archived_size
+        report["documents"] += documents
+        report["bytes"] += size
+        return documents, size
+
+    def _purge_archives(self, user_id, cutoff, dry_run):
+        until = tiers.sort_key(cutoff)
+        expired = [
+            meta
+            for meta in self.repository.history_archives(user_id)
+            if meta["end"] < until
+        ]
+        if expired and not dry_run:
+            self.repository.delete_history_archives(
+                user_id, [meta["id"] for meta in expired]
+            )
+            tiers.forget(user_id)
+        # document_size() counts the blob once more than the meta's 'bytes'; close enough for an estimate
+        return len(expired), sum(
+            document_size(
+                f"{self.collection}/{user_id}/history_archive/{meta['id']}",
+                meta,
+            )
+            + meta["bytes"]
+            for meta in expired
+        )
+
+    def _pinned(self, user_id, cutoff):
+        """Expired keyframes that the first retained entries still decode against."""
+        retained = self.repository.scan_history(
+            user_id,
+            start=cutoff,
+            limit=KEYFRAME_LOOKAHEAD,
+            fields=["encoding", "keyframe"],
+            iso_timestamps=self.iso_timestamps,
+        )
+        return history.keyframe_refs(retained)
+
+    def _throttle(self, deleted, started):
+        self._deleted += deleted
+        if self.rate:
+            wait = self._deleted / self.rate - (self._clock() - started)
+            if wait > 0:
+                self._sleep(wait)
+
+
+def describe(report):
+    """One-line summary of a run."""
+    archives = (
+        f", {report['archives']} of them session archives"
+        if report["archives"]
+        else ""
+    )
+    message = (
+        f"{'Would purge' if report['dry_run'] else 'Purged'} {report['documents']} history documents"
+        f"{archives} ({report['bytes'] / 1e6:.1f} MB) from {report['affected_students']} of "
+        f"{report['students']} students in {report['runtime']:.1f}s."
+    )
+    if not report["complete"]:
+        message += " Stopped early, run it again to continue."
+    return message
+
+
+_last_report = None
+_report_lock = threading.Lock()
+
+
+def _record(report):
+    global _last_report
+    with _report_lock:
+        _last_report = dict(
+            report, finished_at=playback.iso_z(datetime.now(timezone.utc))
+        )
+
+
+def get_engine(iso_timestamps=False):
+    """A RetentionEngine over the storage repository, configured from settings."""
+    from django.conf import settings
+
+    from . import storage
+
+    return RetentionEngine(
+        storage.get_repository(),
+        days=getattr(settings, "XSCOUT_RETENTION_DAYS", 0.0),
+        environments=parse_environments(
+            getattr(settings, "XSCOUT_RETENTION_ENVIRONMENTS", "")
+        ),
+        batch_size=getattr(settings, "XSCOUT_RETENTION_BATCH", 500),
+        rate=getattr(settings, "XSCOUT_RETENTION_RATE", 500.0),
+        iso_timestamps=iso_timestamps,
+        collection=getattr(settings, "XSCOUT_TELEMETRY_COLLECTION", "reports"),
+    )
+
+
+def metrics():
+    """Summary of the last run in this process, None before the first."""
+    with _report_lock:
+        if _last_report is None:
+            return None
+        return {
+            key: value
+            for key, value in _last_report.items()
+            if key != "environments"
+        }
@@ -0,0 +1,506 @@
+"""
+Behavior rollups: per-student aggregates of wpm, backspaceRate, pasteEvents
+and idleTime, kept at ingest time so trend questions ("class average WPM
+over the last hour") are answered from a handful of buckets instead of by
+scanning history.
+
+- Each heartbeat's behavior block is folded into the student's 1-minute and
+  10-minute bucket: a compact array of the heartbeat count plus min/max/sum
+  per metric (FIELDS).
+- RollupStore gathers buckets in memory and a daemon thread hands them to
+  the storage repository every XSCOUT_ROLLUP_FLUSH_INTERVAL seconds. Stored
+  buckets merge additively (counts and sums add, min/max fold), so every
+  worker writes into the same buckets and none of them needs to see every
+  heartbeat. Queries are up to one flush interval behind.
+- Sessions are derived at query time from a student's 1-minute buckets: a
+  gap of more than XSCOUT_ROLLUP_SESSION_GAP seconds starts a new one.
+  pasteEvents is cumulative since the extension started, so new pastes are
+  the rise of its max from one bucket to the next, and a minute with at
+  least XSCOUT_ROLLUP_PASTE_BURST new pastes is a paste burst.
+- Buckets expire after XSCOUT_ROLLUP_RETENTION_1M / _10M hours.
+"""
+
+import atexit
+import logging
+import math
+import threading
+import time
+from array import array
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from .playback import iso_z
+
+logger = logging.getLogger(__name__)
+
+METRICS = ("wpm", "backspaceRate", "pasteEvents", "idleTime")
+# The root app maps behavior onto METRICS; raw extension payloads use the other names
+ALIASES = {
+    "wpm": ("wpm",),
+    "backspaceRate": ("backspaceRate", "backspaceCount", "backspaces"),
+    "pasteEvents": ("pasteEvents", "pasteCount"),
+    "idleTime": ("idleTime",),
+}
+# One student's bucket, in memory (array of doubles) and in storage (named fields)
+FIELDS = ("count",) + tuple(
+    f"{metric}_{stat}" for metric in METRICS for stat in ("min", "max", "sum")
+)
+RESOLUTIONS = {"1m": 60, "10m": 600}
+DEFAULT_RETENTION = {"1m": 48 * 3600, "10m": 30 * 24 * 3600}
+MAX_WINDOW = 31 * 24 * 3600
+PRUNE_INTERVAL = 3600
+
+_PASTES = 1 + 3 * METRICS.index("pasteEvents")
+
+
+def _offset(metric):
+    return 1 + 3 * METRICS.index(metric)
+
+
+def new_stats():
+    return array("d", [0.0] + [math.inf, -math.inf, 0.0] * len(METRICS))
+
+
+def behavior_values(behavior):
+    """METRICS values of a behavior block (missing or non-numeric -> 0), or None without one."""
+    if not isinstance(behavior, dict):
+        return None
+    values = []
+    for metric in METRICS:
+        value = next(
+            (behavior[key] for key in ALIASES[metric] if key in behavior), 0
+        )
+        if (
+            isinstance(value, bool)
+            or not isinstance(value, (int, float))
+            or not math.isfinite(value)
+        ):
+            value = 0
+        values.append(float(value))
+    return values
+
+
+def add_values(stats, values):
+    stats[0] += 1
+    for i, value in enumerate(values):
+        offset = 1 + 3 * i
+        stats[offset] = min(stats[offset], value)
+        stats[offset + 1] = max(stats[offset + 1], value)
+        stats[offset + 2] += value
+
+
+def merge_stats(stats, other):
+    stats[0] += other[0]
+    for offset in range(1, len(FIELDS), 3):
+        stats[offset] = min(stats[offset], other[offset])
+        stats[offset + 1] = max(stats[offset + 1], other[offset + 1])
+        stats[offset + 2] += other[offset + 2]
+
+
+def new_pastes(buckets):
+    """[(bucket, stats), ...] of one student in bucket order -> [(bucket, new pastes), ...]."""
+    result = []
+    previous = None
+    for bucket, stats in buckets:
+        low, high = stats[_PASTES], stats[_PASTES + 1]
+        # No earlier bucket, or the extension restarted and its counter with it
+        base = low if previous is None or low < previous else previous
+        result.append((bucket, high - base))
+        previous = high
+    return result
+
+
+def default_resolution(window):
+    return "1m" if window <= 1800 else "10m"
+
+
+def parse_params(params):
+    """Validated RollupStore.query() kwargs from request.GET. Raises ValueError."""
+    metric = params.get("metric") or "wpm"
+    if metric not in METRICS:
+        raise ValueError(f"metric must be one of {', '.join(METRICS)}")
+    try:
+        window = int(params.get("window") or 3600)
+    except ValueError:
+        raise ValueError("window must be a number of seconds")
+    if not 0 < window <= MAX_WINDOW:
+        raise ValueError(f"window must be between 1 and {MAX_WINDOW} seconds")
+    resolution = params.get("resolution") or None
+    if resolution is not None and resolution not in RESOLUTIONS:
+        raise ValueError(f"resolution must be one of {', '.join(RESOLUTIONS)}")
+    return {
+        "metric": metric,
+        "window": window,
+        "resolution": resolution,
+        "environment": params.get("environment") or None,
+        "user_id": params.get("user_id") or None,
+    }
+
+
+def _iso(epoch):
+    return iso_z(datetime.fromtimestamp(epoch, tz=timezone.utc))
+
+
+def _epoch(value):
+    return value.timestamp() if isinstance(value, datetime) else value
+
+
+class RollupStore:
+    """
+    Rollups of one worker: add() folds heartbeats into pending buckets, a
+    daemon thread writes them with repository.write_rollups() and the query
+    methods read the stored buckets back.
+    """
+
+    def __init__(
+        self,
+        repository,
+        flush_interval=15.0,
+        retention=None,
+        session_gap=1800,
+        paste_burst=3,
+    ):
+        self.repository = repository
+        self.flush_interval = flush_interval
+        self.retention = dict(DEFAULT_RETENTION, **(retention or {}))
+        self.session_gap = session_gap
+        self.paste_burst = paste_burst
+
+        self._cond = threading.Condition()
+        # (resolution, bucket, user_id) -> [environment, stats]
+        self._pending = {}
+        self._thread = None
+        self._stopped = False
+        self._last_prune = 0.0
+        self._flush_ms = None
+        self._counters = {
+            "heartbeats": 0,
+            "written_buckets": 0,
+            "flushes": 0,
+            "errors": 0,
+        }
+
+    # -- ingest --
+
+    def add(self, user_id, behavior, environment=None, now=None):
+        """Fold one heartbeat's behavior block in. Returns False when there was none."""
+        values = behavior_values(behavior)
+        if values is None:
+            return False
+        now = time.time() if now is None else now
+        with self._cond:
+            for resolution, seconds in RESOLUTIONS.items():
+                key = (resolution, int(now // seconds * seconds), user_id)
+                entry = self._pending.get(key)
+                if entry is None:
+                    entry = self._pending[key] = [environment, new_stats()]
+                elif environment is not None:
+                    entry[0] = environment
+                add_values(entry[1], values)
+            self._counters["heartbeats"] += 1
+        self._ensure_started()
+        return True
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped = False
+            self._thread = threading.Thread(
+                target=self._run, name="xscout-rollups", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._stopped:
+                    self._cond.wait(self.flush_interval)
+                stopped = self._stopped
+            try:
+                self.flush()
+            except Exception:
+                # Buckets were put back by flush(); the next round retries them
+                pass
+            if stopped:
+                return
+
+    def flush(self, now=None):
+        """Write pending buckets (and prune expired ones hourly). Returns the number written."""
+        with self._cond:
+            pending, self._pending = self._pending, {}
+        if pending:
+            rows = [
+                (
+                    resolution,
+                    bucket,
+                    user_id,
+                    environment,
+                    stats,
+                    bucket
+                    + RESOLUTIONS[resolution]
+                    + self.retention[resolution],
+                )
+                for (resolution, bucket, user_id), (
+                    environment,
+                    stats,
+                ) in pending.items()
+            ]
+            started = time.perf_counter()
+            try:
+                self.repository.write_rollups(rows)
+            except Exception as e:
+                with self._cond:
+                    for key, (environment, stats) in pending.items():
+                        current = self._pending.setdefault(
+                            key, [environment, new_stats()]
+                        )
+                        merge_stats(current[1], stats)
+                    self._counters["errors"] += 1
+                logger.warning(
+                    "Writing %d rollup buckets failed: %s", len(rows), e
+                )
+                raise
+            with self._cond:
+                self._flush_ms = (time.perf_counter() - started) * 1000
+                self._counters["written_buckets"] += len(rows)
+                self._counters["flushes"] += 1
+
+        now = time.time() if now is None else now
+        if now - self._last_prune >= PRUNE_INTERVAL:
+            self._last_prune = now
+            self.repository.prune_rollups(now)
+        return len(pending)
+
+    def stop(self, timeout=5.0):
+        """Flush what is left and stop the flush thread."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    # -- queries --
+
+    def _range(self, window, resolution, now):
+        seconds = RESOLUTIONS[resolution]
+        end = int(now // seconds * seconds)
+        return end - (math.ceil(window / seconds) - 1) * seconds, end
+
+    def _students(
+        self, resolution, start, end, environment=None, user_id=None
+    ):
+        """user_id -> [(bucket, stats), ...] in bucket order."""
+        students = defaultdict(list)
+        rows = self.repository.read_rollups(
+            resolution, start, end, user_id=user_id
+        )
+        for bucket, row_user, row_environment, stats in rows:
+            if environment is None or row_environment == environment:
+                students[row_user].append((bucket, stats))
+        for buckets in students.values():
+            buckets.sort(key=lambda item: item[0])
+        return students
+
+    def query(
+        self,
+        metric="wpm",
+        window=3600,
+        resolution=None,
+        environment=None,
+        user_id=None,
+        now=None,
+    ):
+        """
+        Summary and per-bucket series of `metric` over the last `window`
+        seconds, for everyone, one environment or one student. Buckets are
+        whole, so the covered span ('from' to now) can fall short of the
+        window by up to one bucket.
+        """
+        resolution = resolution or default_resolution(window)
+        now = time.time() if now is None else now
+        start, end = self._range(window, resolution, now)
+        offset = _offset(metric)
+
+        students = self._students(resolution, start, end, environment, user_id)
+        points = defaultdict(
+            lambda: {"students": 0, "pastes": 0.0, "stats": new_stats()}
+        )
+        totals = new_stats()
+        student_means = []
+        pastes = 0.0
+        for buckets in students.values():
+            merged = new_stats()
+            for bucket, stats in buckets:
+                merge_stats(merged, stats)
+                merge_stats(points[bucket]["stats"], stats)
+                points[bucket]["students"] += 1
+            for bucket, count in new_pastes(buckets):
+                points[bucket]["pastes"] += count
+                pastes += count
+            merge_stats(totals, merged)
+            student_means.append(merged[offset + 2] / merged[0])
+
+        def describe(stats):
+            if not stats[0]:
+                return {"count": 0, "mean": None, "min": None, "max": None}
+            return {
+                "count": int(stats[0]),
+                "mean": round(stats[offset + 2] / stats[0], 2),
+                "min": stats[offset],
+                "max": stats[offset + 1],
+            }
+
+        summary = describe(totals)
+        summary.update(
+            {
+                "metric": metric,
+                "resolution": resolution,
+                "from": _iso(start),
+                "to": _iso(now),
+                "students": len(students),
+                # Every student weighs the same, however many heartbeats they sent
+                "student_mean": (
+                    round(sum(student_means) / len(student_means), 2)
+                    if student_means
+                    else None
+                ),
+                "pastes": int(pastes),
+            }
+        )
+        series = [
+            dict(
+                describe(point["stats"]),
+                t=_iso(bucket),
+                students=point["students"],
+                pastes=int(point["pastes"]),
+            )
+            for bucket, point in sorted(points.items())
+        ]
+        return {"summary": summary, "series": series}
+
+    def class_average(
+        self, metric="wpm", window=3600, environment=None, now=None
+    ):
+        """Mean of `metric` over every heartbeat in the window, or None without any."""
+        return self.query(metric, window, environment=environment, now=now)[
+            "summary"
+        ]["mean"]
+
+    def sessions(self, user_id, start=None, end=None, now=None):
+        """
+        A student's sessions between start and end (datetimes or epoch
+        seconds; default: the 1-minute retention), oldest first, built from
+        1-minute buckets.
+        """
+        now = time.time() if now is None else now
+        end = _epoch(end) if end is not None else now
+        start = (
+            _epoch(start) if start is not None else now - self.retention["1m"]
+        )
+        buckets = self._students(
+            "1m", int(start // 60 * 60), int(end // 60 * 60), user_id=user_id
+        ).get(user_id, [])
+
+        runs = []
+        for (bucket, stats), (_, pastes) in zip(buckets, new_pastes(buckets)):
+            if not runs or bucket - runs[-1][-1][0] - 60 > self.session_gap:
+                runs.append([])
+            runs[-1].append((bucket, stats, pastes))
+
+        sessions = []
+        for run in runs:
+            merged = new_stats()
+            for _, stats, _ in run:
+                merge_stats(merged, stats)
+            sessions.append(
+                {
+                    "start": _iso(run[0][0]),
+                    "end": _iso(run[-1][0] + 60),
+                    "active_minutes": len(run),
+                    "heartbeats": int(merged[0]),
+                    "metrics": {
+                        metric: {
+                            "min": merged[_offset(metric)],
+                            "max": merged[_offset(metric) + 1],
+                            "mean": round(
+                                merged[_offset(metric) + 2] / merged[0], 2
+                            ),
+                        }
+                        for metric in METRICS
+                    },
+                    "pastes": int(sum(pastes for _, _, pastes in run)),
+                    "paste_bursts": sum(
+                        1 for _, _, pastes in run if pastes >= self.paste_burst
+                    ),
+                }
+            )
+        return sessions
+
+    def metrics(self):
+        with self._cond:
+            data = dict(self._counters)
+            data.update(
+                {
+                    "pending_buckets": len(self._pending),
+                    "last_flush_ms": (
+                        round(self._flush_ms, 2)
+                        if self._flush_ms is not None
+                        else None
+                    ),
+                    "flusher_alive": bool(
+                        self._thread and self._thread.is_alive()
+                    ),
+                }
+            )
+        return data
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Process-wide RollupStore, or None when XSCOUT_ROLLUPS is off."""
+    global _store
+    from django.conf import settings
+
+    if not getattr(settings, "XSCOUT_ROLLUPS", True):
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                from .storage import get_repository
+
+                _store = RollupStore(
+                    get_repository(),
+                    flush_interval=getattr(
+                        settings, "XSCOUT_ROLLUP_FLUSH_INTERVAL", 15.0
+                    ),
+                    retention={
+                        "1m": getattr(
+                            settings, "XSCOUT_ROLLUP_RETENTION_1M", 48
+                        )
+                        * 3600,
+                        "10m": getattr(
+                            settings, "XSCOUT_ROLLUP_RETENTION_10M", 720
+                        )
+                        * 3600,
+                    },
+                    session_gap=getattr(
+                        settings, "XSCOUT_ROLLUP_SESSION_GAP", 1800
+                    ),
+                    paste_burst=getattr(
+                        settings, "XSCOUT_ROLLUP_PASTE_BURST", 3
+                    ),
+                )
+                atexit.register(_store.stop)
+    return _store
+
+
+def metrics():
+    if _store is None:
+        return {"heartbeats": 0, "pending_buckets": 0}
+    return _store.metrics()
@@ -0,0 +1,540 @@
+"""
+Bulk import of authorized-ID rosters.
+
+Authorizing students one at a time (api/add-user/) costs a storage write plus
+two SQL queries per ID, so onboarding a cohort of a couple of thousand took
+many minutes. A roster is imported in a handful of round-trips instead:
+
+- parse(): CSV (a header naming a student ID column, or bare
+  "id,description,active" rows) or JSON (a list of IDs or objects, or
+  {"students": [...]}). Problems are reported per row rather than failing
+  the whole roster; a repeated ID keeps its last row;
+- RosterImporter.run(): diffs the rows against the AuthorizedID table in one
+  query and writes the new rows with bulk_create and the changed ones with
+  bulk_update in one transaction. Storage is diffed the same way, against
+  its records read in batches (repository.get_authorized_many()), and the
+  differences are merged in 500-op batches (the Firestore limit) committed
+  by XSCOUT_ROSTER_WORKERS threads (repository.merge_authorized_many()).
+  Unchanged IDs are never written. With sync=True, active IDs missing from
+  the roster are deactivated (never deleted), so a roster with invalid rows
+  is refused rather than synced;
+- import_roster(): both, then reloads this process's authorization cache
+  (dashboard/authorization.py).
+
+A storage failure doesn't undo the SQL changes: it is reported and the
+changed IDs are queued in the sync outbox (dashboard/authsync.py), which
+retries them; importing the same roster again also writes what storage is
+still missing. Rows and records changed together carry the same timestamp.
+The report includes rows per second and the time spent diffing, in SQL and
+in storage.
+
+The storage records are shaped as XSCOUT_AUTHORIZED_RECORD_STYLE says (see
+authsync.STYLES).
+"""
+
+import csv
+import io
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+from . import authsync
+
+logger = logging.getLogger(__name__)
+
+# AuthorizedID column sizes
+MAX_ID_LENGTH = 50
+MAX_DESCRIPTION_LENGTH = 100
+# Above this many IDs the diff reads the whole table rather than a huge IN (...) list
+MAX_FILTER_IDS = 5000
+# Row problems echoed in a report
+MAX_REPORTED_ERRORS = 50
+
+# Column names and JSON keys, compared lowercased without spaces, dashes and underscores
+ID_KEYS = ("studentid", "id")
+NAME_KEYS = ("name", "studentname")
+DESCRIPTION_KEYS = ("description", "notes")
+ACTIVE_KEYS = ("isactive", "active")
+# Columns of a roster without a header row
+POSITIONAL = ("studentid", "description", "isactive")
+
+TRUE = {"1", "true", "yes", "y", "active", "enabled"}
+FALSE = {"0", "false", "no", "n", "inactive", "disabled"}
+
+
+class RosterError(ValueError):
+    """The roster as a whole can't be read."""
+
+
+def format_for(filename="", content_type=""):
+    """'csv' or 'json' from an upload's name or content type, or None to sniff the content."""
+    filename, content_type = (filename or "").lower(), (
+        content_type or ""
+    ).lower()
+    if filename.endswith(".json") or "json" in content_type:
+        return "json"
+    if filename.endswith((".csv", ".txt")) or "csv" in content_type:
+        return "csv"
+    return None
+
+
+def _key(name):
+    return (
+        str(name)
+        .strip()
+        .lower()
+        .replace(" ", "")
+        .replace("_", "")
+        .replace("-", "")
+    )
+
+
+def _flag(value):
+    if value is None or isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if not text:
+        return None
+    if text in TRUE:
+        return True
+    if text in FALSE:
+        return False
+    raise ValueError(f"active must be true or false, not '{value}'")
+
+
+def _pick(fields, keys):
+    for key in keys:
+        value = fields.get(key)
+        if value is not None and str(value).strip():
+            return str(value).strip()
+    return None
+
+
+def _row(item):
+    """{'student_id', 'name', 'description', 'is_active'} for one roster entry; ValueError if it's unusable."""
+    if isinstance(item, dict):
+        fields = {_key(key): value for key, value in item.items()}
+    elif isinstance(item, (str, int)):
+        fields = {"studentid": item}
+    else:
+        raise ValueError("expected a student ID or an object")
+    student_id = _pick(fields, ID_KEYS)
+    if student_id is None:
+        raise ValueError("missing student ID")
+    if len(student_id) > MAX_ID_LENGTH:
+        raise ValueError(
+            f"student ID is longer than {MAX_ID_LENGTH} characters"
+        )
+    if "/" in student_id:
+        # Storage keys records by ID
+        raise ValueError("student ID can't contain '/'")
+    name = _pick(fields, NAME_KEYS)
+    description = _pick(fields, DESCRIPTION_KEYS) or name
+    if description is not None and len(description) > MAX_DESCRIPTION_LENGTH:
+        raise ValueError(
+            f"description is longer than {MAX_DESCRIPTION_LENGTH} characters"
+        )
+    active = next((fields[key] for key in ACTIVE_KEYS if key in fields), None)
+    return {
+        "student_id": student_id,
+        "name": name,
+        "description": description,
+        "is_active": _flag(active),
+    }
+
+
+def _csv_items(content):
+    reader = csv.reader(io.StringIO(content))
+    header = None
+    for cells in reader:
+        if not any(cell.strip() for cell in cells):
+            continue
+        if header is None:
+            keys = [_key(cell) for cell in cells]
+            if any(key in ID_KEYS for key in keys):
+                header = keys
+                continue
+            header = POSITIONAL
+        yield reader.line_num, dict(zip(header, cells))
+
+
+def _json_items(content):
+    try:
+        data = json.loads(content)
+    except ValueError as e:
+        raise RosterError(f"Roster is not valid JSON: {e}")
+    if isinstance(data, dict):
+        data = next(
+            (
+                data[key]
+                for key in ("students", "users", "ids")
+                if isinstance(data.get(key), list)
+            ),
+            None,
+        )
+    if not isinstance(data, list):
+        raise RosterError(
+            'A JSON roster is a list of student IDs or objects, or {"students": [...]}'
+        )
+    return enumerate(data, 1)
+
+
+def parse(content, format=None):
+    """
+    (rows, errors, duplicates) for a CSV or JSON roster given as text or
+    bytes: rows as _row() returns them, one per ID; errors as {'row',
+    'message'}, 'row' being the CSV line or the position in the JSON list;
+    and how many rows repeated an earlier ID (the last one is used).
+    """
+    if isinstance(content, bytes):
+        try:
+            content = content.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            raise RosterError("Roster must be UTF-8 text")
+    content = content.lstrip("\ufeff")
+    format = format or (
+        "json" if content.lstrip()[:1] in ("[", "{") else "csv"
+    )
+    if format == "json":
+        items = _json_items(content)
+    elif format == "csv":
+        items = _csv_items(content)
+    else:
+        raise RosterError(
+            f"Unknown roster format '{format}'. Use 'csv' or 'json'"
+        )
+
+    rows, errors = {}, []
+    duplicates = 0
+    try:
+        for number, item in items:
+            try:
+                row = _row(item)
+            except ValueError as e:
+                errors.append({"row": number, "message": str(e)})
+                continue
+            duplicates += row["student_id"] in rows
+            rows[row["student_id"]] = row
+    except csv.Error as e:
+        raise RosterError(f"Roster is not valid CSV: {e}")
+    return list(rows.values()), errors, duplicates
+
+
+class RosterImporter:
+    def __init__(
+        self,
+        load_local,
+        save_local,
+        get_repository,
+        record_style="camel",
+        workers=8,
+        batch_size=500,
+        clock=time.perf_counter,
+    ):
+        # load_local(student_ids or None for all) -> {student_id: (pk, is_active, description)}
+        # save_local(created, updated, batch_size, now), both [(pk or None, student_id, is_active, description), ...]
+        self.load_local = load_local
+        self.save_local = save_local
+        self.get_repository = get_repository
+        self.record_style = record_style
+        self.workers = workers
+        self.batch_size = batch_size
+        self._clock = clock
+
+    @property
+    def active_key(self):
+        return authsync.STYLES[self.record_style]["active"]
+
+    def _record(self, row, active, now):
+        """The storage record for an ID storage doesn't have."""
+        extra = (
+            {"studentName": row["name"] or "Roster Import"}
+            if self.record_style == "camel"
+            else None
+        )
+        return authsync.make_record(
+            self.record_style,
+            row["student_id"],
+            active,
+            row["description"] or "",
+            now,
+            now,
+            extra=extra,
+        )
+
+    def diff(self, rows, sync=False):
+        """
+        (created, updated, deactivated, unchanged, wanted) for the rows against
+        the local table, wanted being {student_id: (row or None, is_active)}:
+        the state storage should end up in.
+        """
+        ids = [row["student_id"] for row in rows]
+        existing = self.load_local(
+            None if sync or len(ids) > MAX_FILTER_IDS else ids
+        )
+        created, updated, deactivated, wanted = [], [], [], {}
+        unchanged = 0
+        for row in rows:
+            student_id = row["student_id"]
+            current = existing.get(student_id)
+            if current is None:
+                active = (
+                    row["is_active"] if row["is_active"] is not None else True
+                )
+                created.append(
+                    (None, student_id, active, row["description"] or "")
+                )
+            else:
+                pk, active, description = current
+                if row["is_active"] not in (None, active) or row[
+                    "description"
+                ] not in (None, description):
+                    active = (
+                        row["is_active"]
+                        if row["is_active"] is not None
+                        else active
+                    )
+                    updated.append(
+                        (
+                            pk,
+                            student_id,
+                            active,
+                            row["description"] or description,
+                        )
+                    )
+                else:
+                    unchanged += 1
+            wanted[student_id] = (row, active)
+        if sync:
+            listed = set(ids)
+            for student_id, (pk, active, description) in existing.items():
+                if active and student_id not in listed:
+                    deactivated.append((pk, student_id, False, description))
+                    wanted[student_id] = (None, False)
+        return created, updated, deactivated, unchanged, wanted
+
+    def storage_changes(self, repository, wanted, now):
+        """
+        [(student_id, fields)] to merge so storage matches `wanted`, read in
+        batches of records; every write carries `now`, the time the rows
+        were saved with, as the record's timestamp.
+        """
+        records = repository.get_authorized_many(list(wanted))
+        changes = []
+        for student_id, (row, active) in wanted.items():
+            record = records.get(student_id)
+            if record is None:
+                # Nothing to deactivate where storage never had the ID
+                if row is not None:
+                    changes.append(
+                        (student_id, self._record(row, active, now))
+                    )
+                continue
+            fields = {}
+            if record.get(self.active_key, True) != active:
+                fields[self.active_key] = active
+            if row is not None and row["description"] not in (
+                None,
+                record.get("description"),
+            ):
+                fields["description"] = row["description"]
+            if fields:
+                changes.append(
+                    (
+                        student_id,
+                        authsync.stamp(self.record_style, fields, now),
+                    )
+                )
+        return changes
+
+    def run(self, rows, errors=(), duplicates=0, sync=False, dry_run=False):
+        """Apply parsed roster rows; returns the report."""
+        if sync and errors and not dry_run:
+            # An ID on an unreadable row would be deactivated
+            raise RosterError(
+                f"{len(errors)} rows are invalid (first: row {errors[0]['row']}, "
+                f"{errors[0]['message']}); fix them before syncing"
+            )
+        started = self._clock()
+        now = datetime.now(timezone.utc)
+        created, updated, deactivated, unchanged, wanted = self.diff(
+            rows, sync=sync
+        )
+        diffed = saved = self._clock()
+        if not dry_run:
+            self.save_local(
+                created, updated + deactivated, self.batch_size, now
+            )
+            saved = self._clock()
+
+        # Storage is diffed on its own: a write that failed last time is retried by importing the roster again
+        changes, batches, storage_error = [], 0, None
+        try:
+            repository = self.get_repository()
+            changes = self.storage_changes(repository, wanted, now)
+            if changes and not dry_run:
+                batches = repository.merge_authorized_many(
+                    changes, workers=self.workers
+                )
+        except Exception as e:
+            storage_error = str(e)
+            logger.warning(
+                "Syncing %d roster IDs to storage failed: %s", len(wanted), e
+            )
+        stored = self._clock()
+        runtime = stored - started
+        changed_ids = {
+            student_id
+            for _, student_id, _, _ in created + updated + deactivated
+        }
+        changed_ids.update(student_id for student_id, _ in changes)
+        return {
+            "dry_run": dry_run,
+            "sync": sync,
+            "rows": len(rows),
+            "invalid": len(errors),
+            "duplicates": duplicates,
+            "errors": list(errors)[:MAX_REPORTED_ERRORS],
+            "created": len(created),
+            "updated": len(updated),
+            "deactivated": len(deactivated),
+            "unchanged": unchanged,
+            "storage_writes": len(changes),
+            "storage_batches": batches,
+            "storage_error": storage_error,
+            "changed_ids": sorted(changed_ids),
+            "diff_seconds": round(diffed - started, 3),
+            "sql_seconds": round(saved - diffed, 3),
+            "storage_seconds": round(stored - saved, 3),
+            "runtime": round(runtime, 3),
+            "rows_per_second": (
+                round(len(rows) / runtime) if runtime > 0 else None
+            ),
+        }
+
+
+def describe(report):
+    """One-line summary of an import."""
+    summary = (
+        f"{'Would import' if report['dry_run'] else 'Imported'} {report['rows']} IDs in "
+        f"{report['runtime']:.1f}s ({report['rows_per_second'] or 0} rows/s): {report['created']} added, "
+        f"{report['updated']} updated, {report['deactivated']} deactivated, {report['unchanged']} unchanged, "
+        f"{report['invalid']} invalid rows."
+    )
+    if report["storage_error"]:
+        summary += f" Storage sync failed: {report['storage_error']}"
+        if report.get("queued"):
+            summary += f"; {report['queued']} IDs queued for retry."
+    elif not report["dry_run"]:
+        summary += f" {report['storage_writes']} storage writes ({report['storage_batches']} batched commits)."
+    return summary
+
+
+_last_report = None
+_report_lock = threading.Lock()
+
+
+def _record(report):
+    global _last_report
+    with _report_lock:
+        _last_report = {
+            key: value for key, value in report.items() if key != "errors"
+        }
+        _last_report["finished"] = datetime.now(timezone.utc).isoformat()
+
+
+def _load_local(student_ids=None):
+    from authentication.models import AuthorizedID
+
+    rows = AuthorizedID.objects.all()
+    if student_ids is not None:
+        rows = rows.filter(student_id__in=student_ids)
+    return {
+        student_id: (pk, is_active, description)
+        for pk, student_id, is_active, description in rows.values_list(
+            "pk", "student_id", "is_active", "description"
+        )
+    }
+
+
+def _save_local(created, updated, batch_size, now):
+    from django.db import transaction
+
+    from authentication.models import AuthorizedID
+
+    # Bulk writes send no signals: the importer writes storage itself, see import_roster() for failures
+    with transaction.atomic():
+        AuthorizedID.objects.bulk_create(
+            [
+                AuthorizedID(
+                    student_id=student_id,
+                    is_active=active,
+                    description=description,
+                )
+                for _, student_id, active, description in created
+            ],
+            batch_size=batch_size,
+        )
+        AuthorizedID.objects.bulk_update(
+            [
+                AuthorizedID(
+                    pk=pk,
+                    student_id=student_id,
+                    is_active=active,
+                    description=description,
+                    updated_at=now,
+                )
+                for pk, student_id, active, description in updated
+            ],
+            ["is_active", "description", "updated_at"],
+            batch_size=batch_size,
+        )
+
+
+def get_importer():
+    from django.conf import settings
+
+    from . import storage
+
+    return RosterImporter(
+        _load_local,
+        _save_local,
+        storage.get_repository,
+        record_style=getattr(
+            settings, "XSCOUT_AUTHORIZED_RECORD_STYLE", "camel"
+        ),
+        workers=getattr(settings, "XSCOUT_ROSTER_WORKERS", 8),
+        batch_size=getattr(settings, "XSCOUT_ROSTER_BATCH", 500),
+    )
+
+
+def import_roster(content, format=None, sync=False, dry_run=False):
+    """
+    Parse and apply a roster, then reload this process's authorization cache.
+    If storage couldn't be written, the changed IDs go to the sync outbox
+    and are retried from there. Raises RosterError.
+    """
+    from . import authorization
+
+    rows, errors, duplicates = parse(content, format)
+    if not rows and not errors:
+        raise RosterError("Roster is empty")
+    report = get_importer().run(
+        rows, errors, duplicates, sync=sync, dry_run=dry_run
+    )
+    changed_ids = report.pop("changed_ids")
+    report["queued"] = 0
+    if not dry_run:
+        if report["storage_error"] and changed_ids:
+            authsync.enqueue(changed_ids)
+            report["queued"] = len(changed_ids)
+        authorization.reload(changed_ids)
+        _record(report)
+    return report
+
+
+def metrics():
+    with _report_lock:
+        return {"last_import": _last_report}
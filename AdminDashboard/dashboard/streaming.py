@@ -0,0 +1,173 @@
+"""
+Incremental JSON serialisation for large Firestore reads.
+
+collection.stream() already yields documents one gRPC page at a time; these
+helpers keep that property all the way to the socket instead of collecting
+every document into a list first, so memory stays flat with tenant size and
+the first byte goes out after the first page.
+
+Formats:
+
+- json_envelope(): {"data": [...], "status": "success"}, the same document
+  the buffered endpoint returns. "status" comes last so a failure half-way
+  through can still close the JSON with "status": "error".
+- json_object(): {"<doc id>": {...}, ...}, the system_backup shape. A failure
+  is recorded under "__error__" (Firestore reserves __*__ ids, so it never
+  collides with a document).
+- ndjson(): one document per line; a failure ends the stream with an
+  {"status": "error"} line.
+
+Documents are written in CHUNK_SIZE pieces rather than one write per
+document. Build the responses with response(): Django's ASGI handler reads a
+synchronous iterator into a list before sending a byte, so under ASGI the
+iterator is handed over as an asynchronous one.
+"""
+
+import itertools
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+CHUNK_SIZE = 64 * 1024
+
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+
+_END = object()
+
+
+def _dumps(value, indent=None):
+    return json.dumps(value, cls=DjangoJSONEncoder, indent=indent)
+
+
+def wants_stream(request):
+    """Streaming is selected with ?stream=1 or ?format=ndjson."""
+    if request.GET.get("format") == "ndjson":
+        return True
+    return request.GET.get("stream", "").lower() in ("1", "true", "yes")
+
+
+def primed(iterable):
+    """
+    Start the iterator now so a query that fails outright raises here, while
+    the view can still answer with a normal 500, rather than mid-response.
+    """
+    iterator = iter(iterable)
+    try:
+        first = next(iterator)
+    except StopIteration:
+        return iter(())
+    return itertools.chain([first], iterator)
+
+
+def documents(docs):
+    """Snapshots -> dicts with their 'id', like the buffered endpoints."""
+    for doc in docs:
+        data = doc.to_dict()
+        data["id"] = doc.id
+        yield data
+
+
+def chunked(pieces, size=CHUNK_SIZE):
+    buffer = []
+    buffered = 0
+    for piece in pieces:
+        buffer.append(piece)
+        buffered += len(piece)
+        if buffered >= size:
+            yield "".join(buffer)
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def _json_envelope(items, key):
+    yield f'{{"{key}": ['
+    try:
+        for i, item in enumerate(items):
+            yield (", " if i else "") + _dumps(item)
+    except Exception as e:
+        yield f'], "status": "error", "message": {_dumps(str(e))}}}'
+        return
+    yield '], "status": "success"}'
+
+
+def _json_object(pairs, indent):
+    pad = " " * indent if indent else ""
+    newline = "\n" if indent else ""
+    yield "{"
+    first = True
+    try:
+        for key, value in pairs:
+            body = _dumps(value, indent)
+            if indent:
+                body = body.replace("\n", "\n" + pad)
+            yield (
+                "" if first else ","
+            ) + f"{newline}{pad}{_dumps(key)}: {body}"
+            first = False
+    except Exception as e:
+        yield (
+            "" if first else ","
+        ) + f'{newline}{pad}"__error__": {_dumps(str(e))}'
+        first = False
+    yield ("" if first else newline) + "}"
+
+
+def _ndjson(items):
+    try:
+        for item in items:
+            yield _dumps(item) + "\n"
+    except Exception as e:
+        yield _dumps({"status": "error", "message": str(e)}) + "\n"
+
+
+def json_envelope(items, key="data"):
+    return chunked(_json_envelope(items, key))
+
+
+def json_object(pairs, indent=None):
+    return chunked(_json_object(pairs, indent))
+
+
+def ndjson(items):
+    return chunked(_ndjson(items))
+
+
+async def _aiterate(iterable):
+    # Each chunk is produced on the request's thread (the view's, so its
+    # database connection), one await at a time
+    iterator = iter(iterable)
+    advance = sync_to_async(next)
+    try:
+        while True:
+            chunk = await advance(iterator, _END)
+            if chunk is _END:
+                return
+            yield chunk
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            await sync_to_async(close)()
+
+
+def response(request, content, **kwargs):
+    """A StreamingHttpResponse that also streams under ASGI."""
+    if isinstance(request, ASGIRequest):
+        content = _aiterate(content)
+    return StreamingHttpResponse(content, **kwargs)
+
+
+def stream_documents(request, docs):
+    """StreamingHttpResponse for a collection read in the format the request asked for."""
+    items = documents(primed(docs))
+    if request.GET.get("format") == "ndjson":
+        return response(
+            request, ndjson(items), content_type=NDJSON_CONTENT_TYPE
+        )
+    return response(
+        request, json_envelope(items), content_type="application/json"
+    )
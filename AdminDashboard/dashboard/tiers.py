@@ -0,0 +1,591 @@
+"""
+Hot/cold history tiers.
+
+Every heartbeat adds a history document, and playback of last month's
+session reads them one by one like today's. `manage.py compact_history`
+(run daily, see render.yaml) rolls each completed session older than
+XSCOUT_COMPACT_AFTER_HOURS into archive documents next to the student's
+history subcollection:
+
+    reports/{user}/history_archive/{start}_{first doc id}
+        start, end   first and last entry timestamp (ISO 8601, ms, Z)
+        count        entries held
+        bytes        size of blob
+        blob         zlib-compressed JSON [[doc_id, entry], ...]
+
+A session is a run of entries without a gap of more than
+XSCOUT_ROLLUP_SESSION_GAP seconds, the same definition as the rollups'.
+Entries in a blob are re-encoded against keyframes inside the same blob,
+so an archive decodes on its own. Sessions too large for one Firestore
+document (MAX_BLOB_BYTES) are split over several archives.
+
+Reads are transparent: TelemetryRepository.history_page() calls
+history_page() here, which returns the hot page alone when no archive
+overlaps the requested range, and otherwise merges the hot page with the
+archived entries in (timestamp, id) order. Cursors are the same opaque
+(timestamp, id) pairs either way. Each process caches a student's archive
+index for XSCOUT_COLD_INDEX_TTL seconds and the last MAX_CACHED_ARCHIVES
+archives it read (stored form, decoded per page).
+
+A compaction run writes every archive first, waits out the index TTL so
+no reader still holds an index without them, then deletes the hot
+documents. Keyframes that hot deltas after the compacted range still
+point at stay hot until a later run; hot copies left behind by an
+interrupted run are found in their archive and deleted.
+"""
+
+import threading
+import time
+import zlib
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from . import archive, history, ingest, playback
+
+META_FIELDS = ("start", "end", "count", "bytes")
+# Under Firestore's 1 MiB document limit, with room for the other fields
+MAX_BLOB_BYTES = 900 * 1024
+MAX_ARCHIVE_ENTRIES = 5000
+MAX_CACHED_ARCHIVES = 32
+# Hot entries after a compacted range checked for deltas pointing into it
+KEYFRAME_LOOKAHEAD = 100
+
+
+def sort_key(timestamp):
+    """Stored timestamps (datetime or ISO string) as comparable text, the format archives use for start/end."""
+    if isinstance(timestamp, datetime):
+        return playback.iso_z(timestamp)
+    return "" if timestamp is None else str(timestamp)
+
+
+def pack(entries, keyframe_interval=20):
+    """[(doc_id, decoded entry), ...] -> blob, re-encoded so deltas only point inside it."""
+    encoder = history.HistoryEncoder(keyframe_interval=keyframe_interval)
+    stored = [
+        [doc_id, encoder.encode("", doc_id, entry)]
+        for doc_id, entry in entries
+    ]
+    return zlib.compress(archive.dumps(stored).encode(), 6)
+
+
+def unpack(blob):
+    """blob -> [(doc_id, stored entry), ...] in (timestamp, id) order."""
+    return [
+        (doc_id, entry)
+        for doc_id, entry in archive.loads(zlib.decompress(blob).decode())
+    ]
+
+
+def _decode(entries, keyframes, fields):
+    """build_page()'s decoding step for some entries of one archive, whose keyframes are in `keyframes`."""
+    if fields is not None and set(fields) <= set(history.INDEX_FIELDS):
+        return [
+            {key: entry[key] for key in fields if key in entry}
+            for _, entry in entries
+        ]
+    data = history.decode_entries(
+        entries,
+        lambda doc_ids: {
+            doc_id: keyframes[doc_id]
+            for doc_id in doc_ids
+            if doc_id in keyframes
+        },
+    )
+    if fields is not None:
+        data = [
+            {key: entry[key] for key in fields if key in entry}
+            for entry in data
+        ]
+    return data
+
+
+class ColdCache:
+    """Per-process cache of archive indexes (TTL) and archive contents (LRU)."""
+
+    def __init__(
+        self,
+        index_ttl=30.0,
+        max_archives=MAX_CACHED_ARCHIVES,
+        clock=time.monotonic,
+    ):
+        self.index_ttl = index_ttl
+        self.max_archives = max_archives
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._indexes = {}  # user -> (expires, metas)
+        self._archives = (
+            OrderedDict()
+        )  # (user, id, count, bytes) -> {'stored', 'keys', 'keyframes', 'ids'}
+        self.hits = self.misses = 0
+
+    def index(self, repository, user_id):
+        now = self._clock()
+        with self._lock:
+            cached = self._indexes.get(user_id)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        metas = repository.history_archives(user_id)
+        with self._lock:
+            self._indexes[user_id] = (now + self.index_ttl, metas)
+        return metas
+
+    def load(self, repository, user_id, meta):
+        key = (user_id, meta["id"], meta["count"], meta["bytes"])
+        with self._lock:
+            cached = self._archives.get(key)
+            if cached is not None:
+                self._archives.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+        blob = repository.read_history_archive(user_id, meta["id"])
+        stored = (
+            sorted(
+                unpack(blob),
+                key=lambda item: (sort_key(item[1].get("timestamp")), item[0]),
+            )
+            if blob is not None
+            else []
+        )
+        loaded = {
+            "stored": stored,
+            "keys": [sort_key(entry.get("timestamp")) for _, entry in stored],
+            "keyframes": {
+                doc_id: entry
+                for doc_id, entry in stored
+                if entry.get("encoding") != history.DELTA
+            },
+            "ids": {doc_id for doc_id, _ in stored},
+        }
+        with self._lock:
+            self._archives[key] = loaded
+            while len(self._archives) > self.max_archives:
+                self._archives.popitem(last=False)
+        return loaded
+
+    def forget(self, user_id):
+        with self._lock:
+            self._indexes.pop(user_id, None)
+            for key in [key for key in self._archives if key[0] == user_id]:
+                del self._archives[key]
+
+
+def _cold_candidates(loaded, start_key, end_key, cursor, descending, count):
+    """Up to `count` (key, doc_id, index) of one archive in page order, after the cursor and within the range."""
+    keys, stored = loaded["keys"], loaded["stored"]
+    if descending:
+        bound = min(
+            (
+                key
+                for key in (end_key, cursor and sort_key(cursor[0]))
+                if key is not None
+            ),
+            default=None,
+        )
+        indexes = range(
+            (bisect_right(keys, bound) if bound is not None else len(keys))
+            - 1,
+            -1,
+            -1,
+        )
+    else:
+        bound = max(
+            (
+                key
+                for key in (start_key, cursor and sort_key(cursor[0]))
+                if key is not None
+            ),
+            default=None,
+        )
+        indexes = range(
+            bisect_left(keys, bound) if bound is not None else 0, len(keys)
+        )
+    picked = []
+    for index in indexes:
+        key, doc_id = keys[index], stored[index][0]
+        if (start_key is not None and key < start_key) or (
+            end_key is not None and key > end_key
+        ):
+            break
+        if cursor is not None and (
+            (key, doc_id) >= (sort_key(cursor[0]), cursor[1])
+            if descending
+            else (key, doc_id) <= (sort_key(cursor[0]), cursor[1])
+        ):
+            continue
+        picked.append((key, doc_id, index))
+        if len(picked) == count:
+            break
+    return picked
+
+
+def history_page(
+    repository,
+    user_id,
+    start=None,
+    end=None,
+    limit=playback.DEFAULT_LIMIT,
+    cursor=None,
+    fields=None,
+    descending=False,
+    iso_timestamps=False,
+    cache=None,
+):
+    """One page of decoded history from both tiers, in the shape of playback.fetch_page()."""
+    params = {
+        "limit": limit,
+        "cursor": cursor,
+        "descending": descending,
+        "iso_timestamps": iso_timestamps,
+    }
+    cache = cache or get_cache()
+    start_key = sort_key(start) if start is not None else None
+    end_key = sort_key(end) if end is not None else None
+    cursor_key = sort_key(cursor[0]) if cursor is not None else None
+    metas = []
+    for meta in cache.index(repository, user_id):
+        if (start_key is not None and meta["end"] < start_key) or (
+            end_key is not None and meta["start"] > end_key
+        ):
+            continue
+        if cursor is not None and (
+            meta["start"] > cursor_key
+            if descending
+            else meta["end"] < cursor_key
+        ):
+            continue
+        metas.append(meta)
+    if not metas:
+        return repository.hot_history_page(
+            user_id, start=start, end=end, fields=fields, **params
+        )
+
+    cold = []
+    for meta in metas:
+        loaded = cache.load(repository, user_id, meta)
+        cold.extend(
+            (key, doc_id, None, (loaded, index))
+            for key, doc_id, index in _cold_candidates(
+                loaded, start_key, end_key, cursor, descending, limit + 1
+            )
+        )
+    cold.sort(key=lambda item: (item[0], item[1]), reverse=descending)
+    cold = cold[: limit + 1]
+
+    # Archives alone fill the page: hot entries past the last of them can't be on it
+    hot_start, hot_end = start, end
+    if len(cold) > limit:
+        bound = playback.parse_time(cold[-1][0])
+        if descending:
+            hot_start = max(start, bound) if start is not None else bound
+        else:
+            # Keys are cut to milliseconds
+            bound += timedelta(milliseconds=1)
+            hot_end = min(end, bound) if end is not None else bound
+    # The hot page needs each entry's timestamp to merge on
+    hot_fields = (
+        None if fields is None else list(dict.fromkeys([*fields, "timestamp"]))
+    )
+    hot = repository.hot_history_page(
+        user_id, start=hot_start, end=hot_end, fields=hot_fields, **params
+    )
+    candidates = [
+        (sort_key(entry.get("timestamp")), entry["id"], entry, None)
+        for entry in hot["data"]
+    ] + cold
+    candidates.sort(key=lambda item: (item[0], item[1]), reverse=descending)
+
+    page, seen = [], set()
+    for candidate in candidates:
+        if candidate[1] not in seen:
+            seen.add(candidate[1])
+            page.append(candidate)
+    has_more = len(page) > limit or hot["has_more"]
+    page = page[:limit]
+
+    # Decode the archived entries on the page, one archive at a time
+    picked = {}
+    for position, (_, _, _, source) in enumerate(page):
+        if source is not None:
+            picked.setdefault(id(source[0]), (source[0], []))[1].append(
+                (source[1], position)
+            )
+    data = [entry for _, _, entry, _ in page]
+    stamps = [
+        entry.get("timestamp") if entry is not None else None for entry in data
+    ]
+    for loaded, wanted in picked.values():
+        entries = [loaded["stored"][index] for index, _ in wanted]
+        for (doc_id, stored), (_, position), entry in zip(
+            entries, wanted, _decode(entries, loaded["keyframes"], fields)
+        ):
+            data[position] = dict(entry, id=doc_id)
+            stamps[position] = stored.get("timestamp")
+    if fields is not None and "timestamp" not in fields:
+        data = [
+            {key: value for key, value in entry.items() if key != "timestamp"}
+            for entry in data
+        ]
+
+    next_cursor = None
+    if has_more and page:
+        next_cursor = playback.encode_cursor(stamps[-1], page[-1][1])
+    return {"data": data, "next_cursor": next_cursor, "has_more": has_more}
+
+
+def stream_cold(repository, user_id):
+    """A student's archived entries as (doc_id, stored entry), archive by archive."""
+    for meta in repository.history_archives(user_id):
+        blob = repository.read_history_archive(user_id, meta["id"])
+        if blob is not None:
+            yield from unpack(blob)
+
+
+class Compactor:
+    def __init__(
+        self,
+        repository,
+        compact_after=timedelta(hours=24),
+        session_gap=1800,
+        batch_size=500,
+        keyframe_interval=20,
+        iso_timestamps=False,
+        cache=None,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        self.repository = repository
+        self.compact_after = compact_after
+        self.session_gap = session_gap
+        self.batch_size = batch_size
+        self.keyframe_interval = keyframe_interval
+        # Passed to scan_history(): the AdminDashboard stores timestamps as ISO strings
+        self.iso_timestamps = iso_timestamps
+        self.cache = cache or get_cache()
+        self._clock = clock
+        self._sleep = sleep
+
+    def run(self, now=None, dry_run=False, environment=None):
+        """Compact every student's completed sessions (or those in `environment`). Returns the report."""
+        now = now or datetime.now(timezone.utc)
+        started = self._clock()
+        report = {
+            "dry_run": dry_run,
+            "students": 0,
+            "affected_students": 0,
+            "sessions": 0,
+            "archives": 0,
+            "documents": 0,
+            "bytes": 0,
+            "kept_keyframes": 0,
+        }
+        docs = (
+            self.repository.stream_latest(fields=["environment"])
+            if environment is None
+            else self.repository.stream_environment(environment)
+        )
+        pending = []
+        for doc in docs:
+            report["students"] += 1
+            expired = self._compact(
+                doc.id, now - self.compact_after, dry_run, report
+            )
+            if expired:
+                report["affected_students"] += 1
+                report["documents"] += len(expired)
+                pending.append((doc.id, expired))
+
+        if pending and not dry_run:
+            # Other workers may hold an archive index from before this run until it expires
+            self._sleep(self.cache.index_ttl)
+            for user_id, expired in pending:
+                for chunk in ingest.chunks(expired, self.batch_size):
+                    self.repository.delete_history(user_id, chunk)
+                self.cache.forget(user_id)
+        report["runtime"] = round(self._clock() - started, 3)
+        _record(report)
+        return report
+
+    def _compact(self, user_id, horizon, dry_run, report):
+        """Archive one student's completed sessions before `horizon`. Returns the hot ids that can go."""
+        metas = self.repository.history_archives(user_id)
+        archived_until = max((meta["end"] for meta in metas), default="")
+        expired = []
+        session = []
+        last = None
+        cursor = None
+        while True:
+            page = self.repository.scan_history(
+                user_id,
+                before=horizon,
+                limit=self.batch_size,
+                cursor=cursor,
+                iso_timestamps=self.iso_timestamps,
+            )
+            for doc_id, data in page:
+                moment = archive._moment(data.get("timestamp"))
+                if moment is None:
+                    continue
+                if sort_key(
+                    data["timestamp"]
+                ) <= archived_until and self._archived(
+                    user_id, metas, doc_id, data
+                ):
+                    # Left hot by an interrupted run, or a keyframe that was still referenced
+                    expired.append(doc_id)
+                    continue
+                if (
+                    session
+                    and (moment - last).total_seconds() > self.session_gap
+                ):
+                    expired.extend(
+                        self._archive(user_id, session, dry_run, report)
+                    )
+                    session = []
+                session.append((doc_id, data))
+                last = moment
+            if len(page) < self.batch_size:
+                break
+            cursor = (page[-1][1].get("timestamp"), page[-1][0])
+
+        # The last session is complete once nothing before the horizon can still join it
+        if session and (horizon - last).total_seconds() > self.session_gap:
+            expired.extend(self._archive(user_id, session, dry_run, report))
+            session = []
+        if not expired:
+            return expired
+
+        # Deltas that stay hot may point at keyframes that were just archived
+        hot_from = (
+            archive._moment(session[0][1]["timestamp"]) if session else horizon
+        )
+        retained = self.repository.scan_history(
+            user_id,
+            start=hot_from,
+            limit=KEYFRAME_LOOKAHEAD,
+            fields=["encoding", "keyframe"],
+            iso_timestamps=self.iso_timestamps,
+        )
+        pinned = history.keyframe_refs(retained)
+        report["kept_keyframes"] += sum(
+            1 for doc_id in expired if doc_id in pinned
+        )
+        return [doc_id for doc_id in expired if doc_id not in pinned]
+
+    def _archived(self, user_id, metas, doc_id, data):
+        key = sort_key(data["timestamp"])
+        covering = [
+            meta for meta in metas if meta["start"] <= key <= meta["end"]
+        ]
+        return any(
+            doc_id in self.cache.load(self.repository, user_id, meta)["ids"]
+            for meta in covering
+        )
+
+    def _archive(self, user_id, session, dry_run, report):
+        """Write one session as one or more archives. Returns the hot ids they hold."""
+        doc_ids = [doc_id for doc_id, _ in session]
+        decoded = history.decode_entries(
+            session, lambda ids: self.repository.get_history_many(user_id, ids)
+        )
+        entries = list(zip(doc_ids, decoded))
+        report["sessions"] += 1
+        for chunk in ingest.chunks(entries, MAX_ARCHIVE_ENTRIES):
+            self._write(user_id, chunk, dry_run, report)
+        return doc_ids
+
+    def _write(self, user_id, entries, dry_run, report):
+        blob = pack(entries, self.keyframe_interval)
+        if len(blob) > MAX_BLOB_BYTES and len(entries) > 1:
+            half = len(entries) // 2
+            self._write(user_id, entries[:half], dry_run, report)
+            self._write(user_id, entries[half:], dry_run, report)
+            return
+        start = sort_key(entries[0][1].get("timestamp"))
+        meta = {
+            "start": start,
+            "end": sort_key(entries[-1][1].get("timestamp")),
+            "count": len(entries),
+            "bytes": len(blob),
+        }
+        if not dry_run:
+            self.repository.write_history_archive(
+                user_id, f"{start}_{entries[0][0]}", meta, blob
+            )
+        report["archives"] += 1
+        report["bytes"] += len(blob)
+
+
+def describe(report):
+    """One-line summary of a run."""
+    return (
+        f"{'Would compact' if report['dry_run'] else 'Compacted'} {report['documents']} history entries from "
+        f"{report['sessions']} sessions of {report['affected_students']} of {report['students']} students into "
+        f"{report['archives']} archives ({report['bytes'] / 1e6:.1f} MB) in {report['runtime']:.1f}s."
+    )
+
+
+_cache = None
+_cache_lock = threading.Lock()
+_last_report = None
+_report_lock = threading.Lock()
+
+
+def _record(report):
+    global _last_report
+    with _report_lock:
+        _last_report = dict(
+            report, finished_at=playback.iso_z(datetime.now(timezone.utc))
+        )
+
+
+def get_cache():
+    """The process-wide ColdCache."""
+    global _cache
+    if _cache is None:
+        from django.conf import settings
+
+        with _cache_lock:
+            if _cache is None:
+                _cache = ColdCache(
+                    index_ttl=getattr(settings, "XSCOUT_COLD_INDEX_TTL", 30.0)
+                )
+    return _cache
+
+
+def forget(user_id):
+    """Drop this process's cached archives of a student, after writing or deleting some."""
+    get_cache().forget(user_id)
+
+
+def get_compactor(iso_timestamps=False):
+    """A Compactor over the storage repository, configured from settings."""
+    from django.conf import settings
+
+    from . import storage
+
+    return Compactor(
+        storage.get_repository(),
+        compact_after=timedelta(
+            hours=getattr(settings, "XSCOUT_COMPACT_AFTER_HOURS", 24.0)
+        ),
+        session_gap=getattr(settings, "XSCOUT_ROLLUP_SESSION_GAP", 1800),
+        batch_size=getattr(settings, "XSCOUT_COMPACT_BATCH", 500),
+        keyframe_interval=getattr(
+            settings, "XSCOUT_HISTORY_KEYFRAME_INTERVAL", 20
+        ),
+        iso_timestamps=iso_timestamps,
+    )
+
+
+def metrics():
+    """Cold read cache counters and the last compaction run in this process."""
+    cache = get_cache()
+    with _report_lock:
+        last = _last_report
+    return {
+        "archive_cache_hits": cache.hits,
+        "archive_cache_misses": cache.misses,
+        "last_compaction": last,
+    }
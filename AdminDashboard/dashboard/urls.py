@@ -15,6 +15,27 @@ urlpatterns = [
         views.get_dashboard_data,
         name="get_dashboard_data",
     ),
+    path(
+        "api/telemetry/metrics/",
+        views.ingest_metrics,
+        name="ingest_metrics",
+    ),
+    path("api/live/", views.live_updates, name="live_updates"),
+    path(
+        "api/rollups/",
+        views.get_behavior_rollups,
+        name="get_behavior_rollups",
+    ),
+    path(
+        "api/analytics/",
+        views.get_risk_analytics,
+        name="get_risk_analytics",
+    ),
+    path(
+        "api/rollups/<str:user_id>/sessions/",
+        views.get_behavior_sessions,
+        name="get_behavior_sessions",
+    ),
     path(
         "api/history/<str:user_id>/",
         views.get_user_history,
@@ -22,6 +43,13 @@ urlpatterns = [
     ),  # Time Travel Endpoint
     # Data Management
     path("api/export-logs/", views.export_logs, name="export_logs"),
+    path("api/jobs/", views.create_job, name="create_job"),
+    path("api/jobs/<str:job_id>/", views.get_job, name="get_job"),
+    path(
+        "api/jobs/<str:job_id>/download/",
+        views.download_job,
+        name="download_job",
+    ),
     path("api/system-backup/", views.system_backup, name="system_backup"),
     path("api/purge-logs/", views.purge_logs, name="purge_logs"),
     # Explorer API
@@ -70,4 +98,9 @@ urlpatterns = [
     # Network Graph
     path("network/", views.network_view, name="network_graph"),
     path("api/network-data/", views.get_network_data, name="get_network_data"),
+    path(
+        "api/similarity/sources/<str:user_id>/",
+        views.get_similarity_sources,
+        name="get_similarity_sources",
+    ),
 ]
@@ -1,52 +1,57 @@
-from authentication.models import AuthorizedID
 import os
 import django
-import firebase_admin
-from firebase_admin import credentials, firestore
 import datetime
+import time
 
 # Setup Django Environment
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "dashboard.settings")
 django.setup()
 
+from django.conf import settings  # noqa: E402
 
-# Setup Firebase
-if not firebase_admin._apps:
-    cred = credentials.Certificate("serviceAccountKey.json")
-    firebase_admin.initialize_app(cred)
-
-db = firestore.client()
+from authentication.models import AuthorizedID  # noqa: E402
+from dashboard import storage  # noqa: E402
 
 
 def migrate():
     print("Starting migration from SQLite to Firestore...")
-
-    users = AuthorizedID.objects.all()
-    count = 0
-
-    for user in users:
-        print(f"Migrating: {user.student_id}")
-
-        doc_ref = db.collection("authorized_users").document(user.student_id)
-        if not doc_ref.get().exists:
-            doc_ref.set(
-                {
-                    "student_id": user.student_id,
-                    "description": user.description,
-                    "is_active": user.is_active,
-                    "created_at": (
-                        user.created_at.isoformat()
-                        if user.created_at
-                        else datetime.datetime.now().isoformat()
-                    ),
-                }
-            )
-            count += 1
-            print(" -> Copied.")
-        else:
-            print(" -> Already exists in Firestore. Skipping.")
-
-    print(f"Migration complete. Copied {count} users.")
+    started = time.perf_counter()
+
+    users = list(AuthorizedID.objects.all())
+    repository = storage.get_repository()
+
+    # What Firestore already has, read in batches rather than a get() per user
+    existing = repository.get_authorized_many(
+        [user.student_id for user in users]
+    )
+    records = [
+        (
+            user.student_id,
+            {
+                "student_id": user.student_id,
+                "description": user.description,
+                "is_active": user.is_active,
+                "created_at": (
+                    user.created_at.isoformat()
+                    if user.created_at
+                    else datetime.datetime.now().isoformat()
+                ),
+            },
+        )
+        for user in users
+        if user.student_id not in existing
+    ]
+    print(f"{len(existing)} users already exist in Firestore. Skipping.")
+
+    # 500-op batched writes, committed side by side
+    batches = repository.merge_authorized_many(
+        records, workers=getattr(settings, "XSCOUT_ROSTER_WORKERS", 8)
+    )
+    elapsed = time.perf_counter() - started
+    print(
+        f"Migration complete. Copied {len(records)} users in {batches} "
+        f"batches, {elapsed:.1f}s."
+    )
 
 
 if __name__ == "__main__":
@@ -1,30 +1,73 @@
 // Polling Dashboard
 const POLLING_INTERVAL = 3000;
+// Idle students only refresh 'timestamp' / 'lastSeen' every XSCOUT_LAST_SEEN_INTERVAL (10s) server-side
+const LIVE_WINDOW_MS = 45000;
+// Polls after the first only ask for what changed since this (see changes.py)
+let telemetryWatermark = null;
+// High-risk students are scored server-side over the whole class (see analytics.py)
+const RISK_INTERVAL = 10000;
+let highRiskIds = new Set();
 
 function initDashboard() {
     console.log("Initializing xScout Dashboard (True Master Mode)...");
-    fetchData();
-    setInterval(fetchData, POLLING_INTERVAL);
+    // Pushed over /api/live/ when available, polled otherwise (see live.js)
+    xscoutLive('all', {
+        snapshot: renderTelemetry,
+        update: rows => renderTelemetry(mergeLiveRows(window.lastTelemetryData || [], rows)),
+        poll: fetchData,
+        interval: POLLING_INTERVAL
+    });
+    fetchRiskSummary();
+    setInterval(fetchRiskSummary, RISK_INTERVAL);
+}
+
+async function fetchRiskSummary() {
+    try {
+        const response = await fetch('/api/analytics/');
+        const json = await response.json();
+        if (json.status !== 'success') return;
+
+        highRiskIds = new Set(json.data.high_risk_ids);
+        const threatsEl = document.querySelector('.stat-value.error');
+        if (threatsEl) threatsEl.innerText = json.data.high_risk;
+        if (window.lastTelemetryData) updateTable(window.lastTelemetryData);
+    } catch (error) {
+        console.error("Error fetching risk analytics:", error);
+    }
 }
 
 async function fetchData() {
     try {
-        const response = await fetch('/api/telemetry');
+        const url = telemetryWatermark
+            ? `/api/telemetry/?since=${encodeURIComponent(telemetryWatermark)}`
+            : '/api/telemetry/';
+        const response = await fetch(url);
         const json = await response.json();
 
         if (json.status === 'success') {
-            window.lastTelemetryData = json.data;
-            updateTable(json.data);
-
-            if (window.networkGraph) {
-                window.networkGraph.updateData(json.data);
+            telemetryWatermark = json.watermark || null;
+            if (json.reset === false) {
+                renderTelemetry(mergeLiveRows(window.lastTelemetryData || [], json.data, json.removed, json.touched));
+            } else {
+                renderTelemetry(json.data);
             }
+        } else {
+            telemetryWatermark = null;
         }
     } catch (error) {
         console.error("Error fetching telemetry:", error);
     }
 }
 
+function renderTelemetry(data) {
+    window.lastTelemetryData = data;
+    updateTable(data);
+
+    if (window.networkGraph) {
+        window.networkGraph.updateData(data);
+    }
+}
+
 function updateTable(dataList) {
     const tableBody = document.getElementById('student-table');
     if (!tableBody) return;
@@ -35,12 +78,12 @@ function updateTable(dataList) {
 
 function renderRow(container, data) {
     try {
-        const lastActiveTime = data.timestamp;
-        const statusClass = (Date.now() - new Date(lastActiveTime).getTime() < 15000) ? 'online' : 'offline';
+        const lastActiveTime = data.lastSeen || data.timestamp;
+        const statusClass = (Date.now() - new Date(lastActiveTime).getTime() < LIVE_WINDOW_MS) ? 'online' : 'offline';
         const statusText = (statusClass === 'online') ? 'Live' : 'Last Seen';
         
         let userName = data.studentId || data.user || data.id || 'Unknown';
-        const flowBadge = data.ai > 0.6 ? '<span style="background: rgba(255, 68, 68, 0.2); color: #ff6b6b; padding: 2px 6px; border-radius: 4px; font-size: 0.7rem; margin-left: 5px;">HIGH RISK</span>' : '';
+        const flowBadge = highRiskIds.has(data.id) ? '<span style="background: rgba(255, 68, 68, 0.2); color: #ff6b6b; padding: 2px 6px; border-radius: 4px; font-size: 0.7rem; margin-left: 5px;">HIGH RISK</span>' : '';
 
         const row = document.createElement('tr');
         row.innerHTML = `
@@ -118,4 +161,5 @@ function switchTab(tabId) {
     if (targetContent) targetContent.style.display = 'block';
 }
 
-initDashboard();
+// monitor.html loads this file for its helpers and subscribes to its own student
+if (document.getElementById('student-table')) initDashboard();
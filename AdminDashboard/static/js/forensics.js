@@ -32,6 +32,28 @@ function openForensicModal(data) {
     modal.style.display = 'block';
 }
 
+// /api/history/ answers the newest page first (oldest first within it); follow
+// next_cursor back to the start so the slider covers the whole session
+const HISTORY_PAGE = 500;
+let historyRequest = 0;
+
+async function fetchAllHistory(userId) {
+    const request = ++historyRequest;
+    let entries = [];
+    let cursor = null;
+    do {
+        const params = new URLSearchParams({ limit: HISTORY_PAGE });
+        if (cursor) params.set('cursor', cursor);
+        const response = await fetch(`/api/history/${encodeURIComponent(userId)}/?${params}`);
+        const json = await response.json();
+        if (json.status !== 'success') throw new Error(json.message || 'History fetch failed');
+        entries = json.data.concat(entries);
+        cursor = json.next_cursor;
+    } while (cursor && request === historyRequest);
+    // null when another student's modal was opened meanwhile
+    return request === historyRequest ? entries : null;
+}
+
 async function fetchHistory(userId) {
     if (!userId) return;
     const slider = document.getElementById('time-travel-slider');
@@ -45,11 +67,11 @@ async function fetchHistory(userId) {
     currentHistory = [];
 
     try {
-        const response = await fetch(`/api/history/${userId}/`);
-        const json = await response.json();
+        const entries = await fetchAllHistory(userId);
+        if (entries === null) return;
 
-        if (json.status === 'success' && json.data.length > 0) {
-            currentHistory = json.data;
+        if (entries.length > 0) {
+            currentHistory = entries;
             slider.disabled = false;
             slider.max = currentHistory.length - 1;
             slider.value = currentHistory.length - 1; // Default to latest
@@ -0,0 +1,62 @@
+// -- LIVE UPDATES (Server-Sent Events with polling fallback) --
+// xscoutLive(topic, { snapshot(rows), update(rows), poll(), interval })
+//   snapshot: full state for the topic (on connect and after a resync)
+//   update:   only the students that changed since the last event
+//   poll:     the existing polling fetch, used until the stream is up and
+//             whenever it drops (or for good if the server answers 503)
+const LIVE_CONNECT_TIMEOUT_MS = 5000;
+
+function xscoutLive(topic, handlers) {
+    const interval = handlers.interval || 3000;
+    let pollTimer = null;
+
+    function startPolling() {
+        if (pollTimer) return;
+        console.log(`[LIVE] Polling every ${interval}ms (${topic})`);
+        handlers.poll();
+        pollTimer = setInterval(handlers.poll, interval);
+    }
+
+    function stopPolling() {
+        if (!pollTimer) return;
+        clearInterval(pollTimer);
+        pollTimer = null;
+    }
+
+    if (!window.EventSource) {
+        startPolling();
+        return null;
+    }
+
+    const source = new EventSource(`/api/live/?topic=${encodeURIComponent(topic)}`);
+    const connectTimer = setTimeout(startPolling, LIVE_CONNECT_TIMEOUT_MS);
+
+    source.addEventListener('snapshot', (e) => {
+        clearTimeout(connectTimer);
+        stopPolling();
+        handlers.snapshot(JSON.parse(e.data).data);
+    });
+    source.addEventListener('update', (e) => {
+        handlers.update(JSON.parse(e.data).data);
+    });
+    source.onerror = () => {
+        // CONNECTING: the browser retries and a new snapshot stops polling again.
+        // CLOSED: live updates are unavailable (e.g. 503 under WSGI).
+        clearTimeout(connectTimer);
+        startPolling();
+    };
+    return source;
+}
+
+// Merge changed rows into a list of students, matching on 'id', and drop removed ids.
+// 'touched' rows only carry fresher liveness fields ('timestamp', 'lastSeen') for known students
+function mergeLiveRows(current, rows, removed = [], touched = []) {
+    const byId = new Map(current.map(row => [row.id, row]));
+    rows.forEach(row => byId.set(row.id, row));
+    touched.forEach(fields => {
+        const row = byId.get(fields.id);
+        if (row) byId.set(fields.id, { ...row, ...fields });
+    });
+    removed.forEach(id => byId.delete(id));
+    return Array.from(byId.values());
+}
@@ -103,7 +103,7 @@ class NetworkGraph3D {
 
         // Color based on Flow State
         const flowState = data.behavior && data.behavior.flowState ? data.behavior.flowState : 'NORMAL';
-        const isOnline = (Date.now() - new Date(data.timestamp).getTime()) < 10000;
+        const isOnline = (Date.now() - new Date(data.lastSeen || data.timestamp).getTime()) < 45000; // lastSeen refresh is 30s when idle
         let color = 0x555555; // Offline/Idle default
 
         if (isOnline) {
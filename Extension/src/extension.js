@@ -111,7 +111,7 @@ function activate(context) {
 
 			const requestModule = DASHBOARD_PORT === 443 ? https : http;
 			const req = requestModule.request(options, (res) => {
-				if (res.statusCode === 200 || res.statusCode === 201) {
+				if (res.statusCode >= 200 && res.statusCode < 300) { // 202 = queued by async ingest
 					console.log('📡 Telemetry Signal Sent');
 				} else {
 					console.error(`📡 SIGNAL FAILED: ${res.statusCode}`);
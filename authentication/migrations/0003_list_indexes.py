@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("authentication", "0002_sync"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="authorizedid",
+            index=models.Index(
+                fields=["created_at", "id"], name="authorizedid_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="authorizedid",
+            index=models.Index(
+                fields=["is_active", "created_at", "id"], name="authorizedid_active_idx"
+            ),
+        ),
+    ]
@@ -5,6 +5,8 @@ class AuthorizedID(models.Model):
     is_active = models.BooleanField(default=True, help_text="Uncheck to temporarily disable access for this ID")
     created_at = models.DateTimeField(auto_now_add=True)
     description = models.CharField(max_length=100, blank=True, help_text="Optional: Name or notes for this ID")
+    # Compared with the storage record's own timestamp when syncing (see dashboard/authsync.py)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.student_id
@@ -12,3 +14,32 @@ class AuthorizedID(models.Model):
     class Meta:
         verbose_name = "Authorized Student ID"
         verbose_name_plural = "Authorized Student IDs"
+        # Keyset pages of the Users tab, all IDs or filtered by status (see dashboard/userlist.py)
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='authorizedid_created_idx'),
+            models.Index(fields=['is_active', 'created_at', 'id'], name='authorizedid_active_idx'),
+        ]
+
+
+class AuthorizedIDOutbox(models.Model):
+    """IDs changed locally whose storage record hasn't been written yet (see dashboard/authsync.py)."""
+    student_id = models.CharField(max_length=50, unique=True)
+    # Storage-only fields to merge with the next write, e.g. a name given when the ID was added
+    extra = models.JSONField(default=dict, blank=True)
+    queued_at = models.DateTimeField()
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(db_index=True)
+    last_error = models.TextField(blank=True)
+
+    def __str__(self):
+        return self.student_id
+
+
+class SyncCheckpoint(models.Model):
+    """How far a sync has read the other side, e.g. the newest storage timestamp pulled."""
+    name = models.CharField(max_length=50, unique=True)
+    value = models.CharField(max_length=64)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.name}: {self.value}'
@@ -4,6 +4,8 @@ from . import views
 urlpatterns = [
     path('api/verify-id/', views.verify_student_id, name='verify_student_id'),
     path('api/add-user/', views.add_authorized_user, name='add_authorized_user'),
+    path('api/import-users/', views.import_authorized_users, name='import_authorized_users'),
     path('api/list-users/', views.get_authorized_users, name='get_authorized_users'),
+    path('api/count-users/', views.count_authorized_users, name='count_authorized_users'),
     path('api/toggle-status/', views.toggle_user_status, name='toggle_user_status'),
 ]
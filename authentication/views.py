@@ -4,27 +4,7 @@ from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
 from .models import AuthorizedID
 import json
-import firebase_admin
-from firebase_admin import credentials, firestore
-import os
-
-# Initialize Firebase (Singleton)
-if not firebase_admin._apps:
-    try:
-        current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        cred_path = os.path.join(current_dir, 'xscout-68489-firebase-adminsdk-fbsvc-71d744a27c.json')
-        if not os.path.exists(cred_path):
-             cred_path = os.path.join(current_dir, 'serviceAccountKey.json')
-
-        if os.path.exists(cred_path):
-            cred = credentials.Certificate(cred_path)
-            firebase_admin.initialize_app(cred)
-        else:
-            firebase_admin.initialize_app()
-    except Exception as e:
-        print(f"Firebase Auth Init Warning: {e}")
-
-db = firestore.client()
+from dashboard import authorization, authsync, roster, userlist
 
 @csrf_exempt
 @require_POST
@@ -36,31 +16,30 @@ def verify_student_id(request):
         if not student_id:
             return JsonResponse({'success': False, 'message': 'Student ID is required'}, status=400)
             
-        # 1. Check Firestore (Cloud Source of Truth)
+        # Both sources are held in memory (dashboard/authorization.py)
         try:
-            doc = db.collection('authorized_students').document(student_id).get()
-            if doc.exists:
-                # Firestore existence is enough for authorization in this flow
-                return JsonResponse({
-                    'success': True, 
-                    'message': 'Connection Authorized (Cloud Sync)', 
-                    'source': 'firestore',
-                    'redirect': '/dashboard/'
-                })
-        except Exception as fe:
-            print(f"Firestore check failed: {fe}")
+            local_active, record = authorization.lookup(student_id)
+        except authorization.StorageUnavailable:
+            local_active, record = None, None
 
-        # 2. Fallback: Check local Database
-        try:
-            auth_id = AuthorizedID.objects.get(student_id=student_id, is_active=True)
+        # 1. Firestore (Cloud Source of Truth), unless the ID was disabled there
+        if record is not None and record.get('isActive', True):
+            return JsonResponse({
+                'success': True, 
+                'message': 'Connection Authorized (Cloud Sync)', 
+                'source': 'firestore',
+                'redirect': '/dashboard/'
+            })
+
+        # 2. Fallback: local Database
+        if local_active:
             return JsonResponse({
                 'success': True, 
                 'message': 'Connection Authorized (Local Engine)', 
                 'source': 'local',
                 'redirect': '/dashboard/'
             })
-        except AuthorizedID.DoesNotExist:
-            return JsonResponse({'success': False, 'message': 'Access Denied: ID not authorized'}, status=403)
+        return JsonResponse({'success': False, 'message': 'Access Denied: ID not authorized'}, status=403)
             
     except Exception as e:
         return JsonResponse({'success': False, 'message': str(e)}, status=500)
@@ -78,31 +57,65 @@ def add_authorized_user(request):
         if not student_id:
             return JsonResponse({'success': False, 'message': 'Student ID is required'}, status=400)
             
-        # 1. Sync to Firestore
-        try:
-            db.collection('authorized_students').document(student_id).set({
-                'studentId': student_id,
-                'studentName': name,
-                'description': description,
-                'authorizedAt': firestore.SERVER_TIMESTAMP,
-                'isActive': True
-            })
-        except Exception as fe:
-            print(f"Firestore sync failed: {fe}")
-
-        # 2. Keep local DB for redundancy
+        # Local DB first; the record in Firestore is written from the sync outbox (dashboard/authsync.py)
         if not AuthorizedID.objects.filter(student_id=student_id).exists():
             AuthorizedID.objects.create(student_id=student_id, description=description)
+        authsync.enqueue([student_id], extra={'studentName': name})
+        authorization.invalidate(student_id)
             
-        return JsonResponse({'success': True, 'message': 'User authorized and synced to cloud'})
+        return JsonResponse({'success': True, 'message': 'User authorized, syncing to cloud'})
+    except Exception as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=500)
+
+
+@csrf_exempt
+@require_POST
+@login_required
+def import_authorized_users(request):
+    # A CSV/JSON roster as a 'roster' upload or the raw body; ?sync=1 deactivates IDs it leaves out (dashboard/roster.py)
+    try:
+        if request.content_type == 'multipart/form-data':
+            upload = request.FILES.get('roster')
+            if upload is None:
+                return JsonResponse({'success': False, 'message': "Upload the roster as a 'roster' file"}, status=400)
+            content, options = upload.read(), request.POST
+            roster_format = roster.format_for(upload.name, upload.content_type)
+        else:
+            content, options = request.body, request.GET
+            roster_format = roster.format_for(content_type=request.content_type)
+        report = roster.import_roster(content, format=roster_format,
+                                      sync=options.get('sync') in ('1', 'true', 'on'),
+                                      dry_run=options.get('dry_run') in ('1', 'true', 'on'))
+        return JsonResponse({'success': True, 'message': roster.describe(report), 'report': report})
+    except roster.RosterError as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
     except Exception as e:
         return JsonResponse({'success': False, 'message': str(e)}, status=500)
 
 @login_required
 def get_authorized_users(request):
-    # Merge local and firestore? For simplicity, we'll return local but notes it might be lagging
-    users = AuthorizedID.objects.all().order_by('-created_at').values('student_id', 'description', 'is_active', 'created_at')
-    return JsonResponse({'success': True, 'users': list(users)})
+    """
+    One page of local rows, newest first.
+    Supports ?limit=&cursor=&q=&active= (see dashboard/userlist.py).
+    """
+    # Local rows; changes made in Firestore are pulled in by the sync thread (dashboard/authsync.py)
+    try:
+        params = userlist.parse_params(request.GET)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
+    page = userlist.fetch_page(AuthorizedID.objects.all(), **params)
+    return JsonResponse({'success': True, **page, 'sync': authsync.status()})
+
+
+@login_required
+def count_authorized_users(request):
+    # Accepts the list's q= and active= filters
+    try:
+        params = userlist.parse_params(request.GET)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
+    counts = userlist.counts(AuthorizedID.objects.all(), q=params['q'], active=params['active'])
+    return JsonResponse({'success': True, **counts})
 
 @csrf_exempt
 @require_POST
@@ -113,14 +126,9 @@ def toggle_user_status(request):
         student_id = data.get('student_id')
         user = AuthorizedID.objects.get(student_id=student_id)
         user.is_active = not user.is_active
+        # Queues the change for Firestore (authentication/signals.py)
         user.save()
-        
-        # Sync to Firestore
-        try:
-            db.collection('authorized_students').document(student_id).update({
-                'isActive': user.is_active
-            })
-        except: pass
+        authorization.invalidate(student_id)
             
         return JsonResponse({'success': True, 'active': user.is_active})
     except Exception as e:
@@ -0,0 +1,85 @@
+"""
+Class-wide risk analytics (dashboard/analytics.py) for a large class.
+
+Builds --students latest-state rows spread over --environments, shaped like
+what the dashboard reads back (ai 0-100 and the extension's behavior block,
+with a few pasting outliers), then times:
+
+- columns: rows -> NumPy arrays;
+- score: distributions, z-score outliers and high-risk counts;
+- score+students: the same with every student's z-scores and percentiles;
+- cached: a RiskAnalytics.get() hit within the TTL.
+
+    python benchmarks/bench_analytics.py --students 10000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+settings.configure(BASE_DIR=ROOT)
+django.setup()
+
+from dashboard import analytics  # noqa: E402
+from dashboard.analytics import RiskAnalytics  # noqa: E402
+
+
+def make_rows(args):
+    rng = random.Random(args.seed)
+    rows = []
+    for i in range(args.students):
+        pasting = rng.random() < 0.01
+        rows.append({
+            'id': f"student_{i:05d}",
+            'environment': f"ENV{i % args.environments + 1}",
+            'ai': rng.uniform(70, 100) if pasting else rng.uniform(0, 70),
+            'behavior': {'wpm': 2 if pasting else rng.gauss(45, 12), 'backspaceCount': rng.randint(0, 200),
+                         'pasteCount': rng.randint(20, 40) if pasting else rng.randint(0, 3),
+                         'idleTime': rng.uniform(0, 600)},
+        })
+    return rows
+
+
+def timed(func, runs):
+    result = func()  # warm-up, NumPy's first call pays for its own imports
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return result, statistics.median(samples)
+
+
+def main(args):
+    rows = make_rows(args)
+    risk = RiskAnalytics(ttl=3600)
+
+    _, columns_ms = timed(lambda: analytics.columns(rows), args.runs)
+    result, score_ms = timed(lambda: analytics.score(rows), args.runs)
+    _, students_ms = timed(lambda: analytics.score(rows, students=True), args.runs)
+    _, cached_ms = timed(lambda: risk.get(lambda: rows), args.runs)
+
+    print(f"{args.students} students in {args.environments} environments: {result['high_risk']} high risk, "
+          f"{len(result['outliers'])} outliers")
+    print(f"{'step':<16}{'median ms':>11}")
+    print(f"{'columns':<16}{columns_ms:>11.1f}")
+    print(f"{'score':<16}{score_ms:>11.1f}")
+    print(f"{'score+students':<16}{students_ms:>11.1f}")
+    print(f"{'cached':<16}{cached_ms:>11.3f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=10000)
+    parser.add_argument('--environments', type=int, default=8)
+    parser.add_argument('--runs', type=int, default=9)
+    parser.add_argument('--seed', type=int, default=7)
+    main(parser.parse_args())
@@ -0,0 +1,145 @@
+"""
+Backup throughput: system_backup's JSON dump vs the columnar archive
+(dashboard/archive.py).
+
+Fills a SQLite repository with --users students of --rows history entries
+each (delta-encoded, like ingest writes them), then measures:
+
+- json (latest): the current system_backup body, latest state only;
+- json (+history): the same JSON with every history document added, the
+  closest JSON equivalent of what the archive holds;
+- archive: write_archive() into a directory of Parquet files.
+
+For each: time to write, size on disk, time to read it back (json.load,
+or reading every Parquet column without parsing the 'data' JSON), and
+restore throughput into an empty repository (JSON: parse then
+bulk_write() in --batch-size batches; archive: restore()). Restores into
+SQLite are bound by JSON decoding and the single writer either way; on
+Firestore the archive's concurrent batch commits are what matter.
+
+    python benchmarks/bench_archive.py --users 200 --rows 500
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+settings.configure(BASE_DIR=ROOT, XSCOUT_INGEST_MODE='sync')
+django.setup()
+
+import pyarrow.parquet as pq  # noqa: E402
+
+from dashboard import archive, streaming  # noqa: E402
+from dashboard.history import HistoryEncoder  # noqa: E402
+from dashboard.storage import SQLiteRepository  # noqa: E402
+
+T0 = datetime(2024, 5, 1, 9, 0, tzinfo=timezone.utc)
+APPS = ['VS Code', 'Chrome', 'Terminal', 'Slack']
+
+
+def fill(repo, args):
+    encoder = HistoryEncoder()
+    code = [f"line_{n} = compute({n})" for n in range(args.code_lines)]
+    for u in range(args.users):
+        user_id = f"student_{u:04d}"
+        history = []
+        for n in range(args.rows):
+            code[(u + n) % len(code)] = f"line_{n} = edited({u}, {n})"
+            entry = {'timestamp': T0 + timedelta(seconds=5 * n), 'ai_score': (u + n) % 100, 'code': '\n'.join(code),
+                     'forensic': {'activeApp': APPS[n % 4], 'activeWindow': f"lab{n % 7}.py"},
+                     'behavior': {'wpm': 20 + (u * n) % 60}}
+            history.append((f"{n:06d}", encoder.encode(user_id, f"{n:06d}", entry)))
+        repo.write_heartbeat(user_id, {'environment': f"ENV{u % 10}", 'ai': u % 100, 'code': '\n'.join(code)},
+                             history=history, last_seen=T0)
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - started, result
+
+
+def json_backup(repo, path, with_history):
+    def pairs():
+        for doc in repo.stream_latest():
+            yield doc.id, doc.to_dict()
+            if with_history:
+                for entry in repo.stream_history(doc.id):
+                    yield f"{doc.id}/history/{entry.id}", entry.to_dict()
+
+    with open(path, 'w') as f:
+        for chunk in streaming.json_object(pairs(), indent=2):
+            f.write(chunk)
+    return os.path.getsize(path)
+
+
+def json_restore(path, batch_size):
+    repo = SQLiteRepository()
+    with open(path) as f:
+        data = json.load(f)
+    latest, history = [], []
+    for key, value in data.items():
+        if '/history/' in key:
+            user_id, _, doc_id = key.split('/')
+            history.append((user_id, doc_id, value))
+        else:
+            latest.append((key, value))
+    for i in range(0, len(latest), batch_size):
+        repo.bulk_write(latest=latest[i:i + batch_size])
+    for i in range(0, len(history), batch_size):
+        repo.bulk_write(history=history[i:i + batch_size])
+    return len(latest) + len(history)
+
+
+def read_parquet(directory, manifest):
+    for name in manifest['files']:
+        pq.read_table(os.path.join(directory, name))
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        repo = SQLiteRepository(os.path.join(workdir, 'telemetry.sqlite3'))
+        elapsed, _ = timed(lambda: fill(repo, args))
+        print(f"filled {args.users} users x {args.rows} rows in {elapsed:.1f}s")
+
+        rows = args.users * (args.rows + 1)
+        print(f"{'format':<16}{'docs':>9}{'write s':>9}{'MB':>8}{'read s':>8}{'restore s':>11}{'docs/s':>9}")
+        for label, name, with_history in (('json (latest)', 'latest', False), ('json (+history)', 'all', True)):
+            path = os.path.join(workdir, f"{name}.json")
+            write, size = timed(lambda: json_backup(repo, path, with_history))
+            read, _ = timed(lambda: json.load(open(path)))
+            restore, docs = timed(lambda: json_restore(path, args.batch_size))
+            print(f"{label:<16}{docs:>9}{write:>9.2f}{size / 1e6:>8.1f}{read:>8.2f}{restore:>11.2f}"
+                  f"{docs / restore:>9.0f}")
+
+        directory = os.path.join(workdir, 'archive')
+        os.makedirs(directory)
+        write, manifest = timed(lambda: archive.write_archive(repo, directory, workers=args.workers))
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in manifest['files'])
+        read, _ = timed(lambda: read_parquet(directory, manifest))
+        restore, counts = timed(lambda: archive.restore(SQLiteRepository(), directory, batch_size=args.batch_size,
+                                                        workers=args.workers))
+        docs = counts['students'] + counts['history']
+        assert docs == rows, (docs, rows)
+        print(f"{'archive':<16}{docs:>9}{write:>9.2f}{size / 1e6:>8.1f}{read:>8.2f}{restore:>11.2f}"
+              f"{docs / restore:>9.0f}")
+        print(f"archive: {len(manifest['files'])} files")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--rows', type=int, default=500)
+    parser.add_argument('--code-lines', type=int, default=80)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=4)
+    main(parser.parse_args())
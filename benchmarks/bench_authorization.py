@@ -0,0 +1,104 @@
+"""
+verify_student_id under a class connecting at once: a storage round-trip
+plus a SQL query per call vs the in-memory cache (dashboard/authorization.py).
+
+--students IDs are authorized (half as local rows, half as storage
+records); --threads clients then verify every ID --rounds times, plus
+--unknown IDs that aren't authorized anywhere. Storage and SQL round-trips
+are simulated with --latency-ms sleeps, roughly a Firestore get from a
+nearby region.
+
+    python benchmarks/bench_authorization.py --students 300 --threads 50
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from dashboard.authorization import AuthorizationCache  # noqa: E402
+
+
+class Sources:
+    def __init__(self, args):
+        self.latency = args.latency_ms / 1000
+        self.local = {f"s{n:04d}": True for n in range(0, args.students, 2)}
+        self.remote = {f"s{n:04d}": {'isActive': True} for n in range(1, args.students, 2)}
+        self.round_trips = 0
+        self._lock = threading.Lock()
+
+    def _trip(self):
+        with self._lock:
+            self.round_trips += 1
+        time.sleep(self.latency)
+
+    def load_local(self):
+        self._trip()
+        return dict(self.local)
+
+    def get_local(self, student_id):
+        self._trip()
+        return self.local.get(student_id)
+
+    def get_authorized(self, student_id):
+        self._trip()
+        return self.remote.get(student_id)
+
+    def stream_authorized(self):
+        self._trip()
+        return [type('Doc', (), {'id': key, 'to_dict': lambda self, value=value: value})()
+                for key, value in self.remote.items()]
+
+    def watch_authorized(self, callback):
+        return None
+
+
+def run(label, verify, sources, args):
+    ids = [f"s{n:04d}" for n in range(args.students)] + [f"ghost{n}" for n in range(args.unknown)]
+    calls = ids * args.rounds
+    sources.round_trips = 0
+
+    def timed(student_id):
+        started = time.perf_counter()
+        verify(student_id)
+        return (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        latencies = sorted(executor.map(timed, calls))
+    elapsed = time.perf_counter() - started
+    print(f"{label:<8}{len(calls):>8}{sources.round_trips:>12}{statistics.median(latencies):>10.3f}"
+          f"{latencies[int(len(latencies) * 0.99)]:>10.3f}{len(calls) / elapsed:>10.0f}")
+
+
+def main(args):
+    print(f"{'mode':<8}{'calls':>8}{'round-trips':>12}{'p50 ms':>10}{'p99 ms':>10}{'calls/s':>10}")
+    sources = Sources(args)
+
+    def direct(student_id):
+        # The old views: storage first, then the local table
+        if sources.get_authorized(student_id) is None:
+            sources.get_local(student_id)
+
+    run('direct', direct, sources, args)
+
+    cache = AuthorizationCache(sources.load_local, sources.get_local, lambda: sources,
+                               negative_ttl=args.negative_ttl)
+    cache.refresh()
+    run('cached', cache.lookup, sources, args)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=300)
+    parser.add_argument('--unknown', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--threads', type=int, default=50)
+    parser.add_argument('--latency-ms', type=float, default=15.0)
+    parser.add_argument('--negative-ttl', type=float, default=5.0)
+    main(parser.parse_args())
@@ -0,0 +1,122 @@
+"""
+Payload and read benchmark for GET /api/telemetry/?since=<watermark>.
+
+Simulates --viewers dashboards polling every 3 s for --minutes against a
+class of --students, for an idle class, a few active students and everyone
+active. It compares the full poll (the whole list every time) with delta
+polls through dashboard.changes.ChangeIndex, counting response bytes and
+latest-state documents read. Full polls go through the latest-state cache
+(one scan per 5 s TTL). Delta polls read when the index refreshes (every
+XSCOUT_CHANGE_INDEX_REFRESH, 3 s: a 'changedAt' query billed as the
+documents it returns, at least one) and when it reconciles (every
+XSCOUT_CHANGE_INDEX_RECONCILE, 20 s, a full scan through the same cache).
+An active student's heartbeat changes its content; everyone else's only
+moves the clock, which the index passes on in "touched" every
+XSCOUT_LAST_SEEN_INTERVAL (10 s). Time is simulated in poll periods instead
+of waited out.
+
+    python benchmarks/bench_delta_sync.py --students 2000 --viewers 30
+"""
+import argparse
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dashboard.changes import CLOCK_SKEW, ChangeIndex  # noqa: E402
+
+POLL_S = 3
+CACHE_TTL_S = 5
+REFRESH_S = 3
+RECONCILE_S = 20
+LIVENESS_S = 10
+
+
+def report(i, tick):
+    return {
+        'studentId': f"student_{i:05d}", 'studentName': f"Student {i}", 'email': f"student_{i}@xscout.app",
+        'timestamp': tick, 'isActive': True, 'ai': (i * 7) % 100,
+        'behavior': {'wpm': 40 + i % 30, 'backspaceRate': i % 11, 'pasteEvents': i % 3, 'idleTime': 0},
+        'stack': 'Python', 'tech': {'detectedTech': 'Python'}, 'titleHistory': ['main.py', 'utils.py'],
+    }
+
+
+def run(students, viewers, minutes, active):
+    rng = random.Random(1)
+    state = {f"student_{i:05d}": report(i, 0) for i in range(students)}
+    # Written before the index started
+    changed_at = dict.fromkeys(state, -60.0)
+    reads = {'full': 0, 'reconcile': 0, 'refresh': 0}
+
+    def loader():
+        # Through the latest-state cache, like _latest_state
+        if clock[0] - cached[0] >= CACHE_TTL_S:
+            cached[0] = clock[0]
+            reads['reconcile'] += len(state)
+        return [dict(data, id=doc_id) for doc_id, data in state.items()]
+
+    def changed_since(since):
+        # Like _latest_changed: Firestore bills a query that matches nothing as one read
+        found = [dict(state[doc_id], id=doc_id) for doc_id, at in changed_at.items() if at >= since]
+        reads['refresh'] += max(len(found), 1)
+        return found
+
+    # Refreshes, reconciles and watermarks are driven by the simulated clock below, not wall time
+    clock = [0.0]
+    cached = [-CACHE_TTL_S]
+    index = ChangeIndex(reconcile_interval=float('inf'), refresh_interval=float('inf'), liveness_interval=LIVENESS_S,
+                        lag=REFRESH_S + CLOCK_SKEW, full_lag=RECONCILE_S + CACHE_TTL_S + CLOCK_SKEW,
+                        clock=lambda: clock[0])
+    watermarks = [index.changes(None, loader)['watermark'] for _ in range(viewers)]
+    reads['reconcile'] = 0
+
+    full_bytes = delta_bytes = polls = 0
+    periods = int(minutes * 60 / POLL_S)
+    for tick in range(1, periods + 1):
+        clock[0] = tick * POLL_S
+        changed = set(rng.sample(sorted(state), active))
+        for doc_id in state:
+            edit = {'ai': rng.randrange(100)} if doc_id in changed else {}
+            state[doc_id] = dict(state[doc_id], timestamp=tick * POLL_S, **edit)
+            if edit:
+                # Sometime during the poll period
+                changed_at[doc_id] = (tick - rng.random()) * POLL_S
+            index.record(doc_id, state[doc_id])
+        if tick * POLL_S % RECONCILE_S < POLL_S:
+            index.reconcile(loader())
+        elif tick * POLL_S % REFRESH_S < POLL_S:
+            index.refresh(changed_since)
+        if tick * POLL_S % CACHE_TTL_S < POLL_S:
+            reads['full'] += len(state)
+
+        full = json.dumps({'status': 'success', 'data': [dict(d, id=i) for i, d in state.items()]})
+        for v in range(viewers):
+            delta = index.changes(watermarks[v], loader)
+            watermarks[v] = delta['watermark']
+            delta_bytes += len(json.dumps({'status': 'success', **delta}))
+            full_bytes += len(full)
+            polls += 1
+    return polls, full_bytes, delta_bytes, reads, minutes
+
+
+def main(args):
+    print(f"{args.students} students, {args.viewers} viewers polling every {POLL_S}s for {args.minutes} min")
+    print(f"{'scenario':<22}{'full KB/poll':>14}{'delta KB/poll':>15}{'full reads/min':>16}{'delta reads/min':>17}"
+          f"{'(refresh':>10}{'+ reconcile)':>14}")
+    for name, active in [('idle', 0), ('5 active per poll', 5), ('10% active per poll', args.students // 10),
+                         ('all active per poll', args.students)]:
+        polls, full_bytes, delta_bytes, reads, minutes = run(args.students, args.viewers, args.minutes, active)
+        print(f"{name:<22}{full_bytes / polls / 1024:>14.1f}{delta_bytes / polls / 1024:>15.2f}"
+              f"{reads['full'] / minutes:>16.0f}{(reads['refresh'] + reads['reconcile']) / minutes:>17.0f}"
+              f"{reads['refresh'] / minutes:>10.0f}{reads['reconcile'] / minutes:>14.0f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--viewers', type=int, default=30)
+    parser.add_argument('--minutes', type=float, default=2)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,125 @@
+"""
+Environment grid polls: where() query every poll vs the environment index.
+
+Fills a repository (dashboard/storage.py) with --students students spread
+over environments, then simulates --minutes of one open grid for a class of
+--class-size: every student sends a heartbeat every --interval seconds and
+the grid polls every --poll seconds. With --workers N only 1 in N
+heartbeats reaches this worker's EnvironmentIndex, as behind a load
+balancer. Reported per poll, for both ways of answering it:
+
+- docs: documents read from the store (what Firestore bills);
+- ms: time to answer on the chosen backend.
+
+    python benchmarks/bench_environments.py --students 20000 --class-size 30 --workers 4
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+settings.configure(BASE_DIR=ROOT, XSCOUT_INGEST_MODE='sync')
+django.setup()
+
+from dashboard import firebase, storage  # noqa: E402
+from dashboard.environments import EnvironmentIndex  # noqa: E402
+
+CLASS = 'CLASS'
+
+
+def make_repository(backend, workdir):
+    if backend == 'sqlite':
+        return storage.SQLiteRepository(os.path.join(workdir, 'telemetry.sqlite3'))
+    if backend == 'memory':
+        return storage.SQLiteRepository(':memory:')
+    return storage.FirestoreRepository(firebase.get_client(), collection='bench_reports',
+                                       authorized_collection='bench_authorized')
+
+
+def count_reads(repo):
+    """Wrap the repository's reads so they add up the documents returned."""
+    reads = [0]
+    stream_environment, get_latest_many = repo.stream_environment, repo.get_latest_many
+
+    def counted_stream(env_code):
+        for doc in stream_environment(env_code):
+            reads[0] += 1
+            yield doc
+
+    def counted_get(doc_ids):
+        found = get_latest_many(doc_ids)
+        reads[0] += len(doc_ids)
+        return found
+
+    repo.stream_environment, repo.get_latest_many = counted_stream, counted_get
+    return reads
+
+
+def state(environment, rng):
+    return {'environment': environment, 'ai': rng.randrange(100), 'behavior': {'wpm': rng.randrange(80)},
+            'code': 'print("hello")\n' * 40}
+
+
+def main(args):
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as workdir:
+        repo = make_repository(args.backend, workdir)
+        members = [f"class_{i:04d}" for i in range(args.class_size)]
+        for i in range(args.students - args.class_size):
+            repo.write_heartbeat(f"student_{i:06d}", state(f"ENV{i % 500}", rng))
+        for student in members:
+            repo.write_heartbeat(student, state(CLASS, rng))
+
+        reads = count_reads(repo)
+        index = EnvironmentIndex(max_age=args.max_age, reconcile_interval=args.reconcile)
+        samples = {'where': ([], []), 'index': ([], [])}
+        for second in range(int(args.minutes * 60)):
+            for i, student in enumerate(members):
+                if (second + i) % args.interval == 0:
+                    data = state(CLASS, rng)
+                    repo.write_heartbeat(student, data)
+                    if rng.randrange(args.workers) == 0:
+                        index.record(student, data, now=second)
+            if second % args.poll:
+                continue
+            for name, poll in (('where', lambda: [doc.to_dict() for doc in repo.stream_environment(CLASS)]),
+                               ('index', lambda: index.students(CLASS, repo, now=second))):
+                before = reads[0]
+                started = time.perf_counter()
+                students = poll()
+                samples[name][1].append((time.perf_counter() - started) * 1000)
+                samples[name][0].append(reads[0] - before)
+                assert len(students) == args.class_size
+
+        polls = len(samples['where'][0])
+        print(f"{args.students} students, class of {args.class_size}, {polls} polls over {args.minutes} min, "
+              f"{args.workers} worker(s), backend {args.backend}")
+        print(f"{'per poll':<10}{'docs':>8}{'median ms':>11}{'p95 ms':>9}")
+        for name, (docs, ms) in samples.items():
+            p95 = statistics.quantiles(ms, n=20)[-1]
+            print(f"{name:<10}{statistics.mean(docs):>8.1f}{statistics.median(ms):>11.3f}{p95:>9.3f}")
+        print(f"index: {index.metrics()}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=['sqlite', 'memory', 'firestore'], default='sqlite')
+    parser.add_argument('--students', type=int, default=20000)
+    parser.add_argument('--class-size', type=int, default=30)
+    parser.add_argument('--minutes', type=float, default=5)
+    parser.add_argument('--interval', type=int, default=5, help='seconds between heartbeats')
+    parser.add_argument('--poll', type=int, default=3, help='seconds between grid polls')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--max-age', type=float, default=5)
+    parser.add_argument('--reconcile', type=float, default=60)
+    parser.add_argument('--seed', type=int, default=7)
+    main(parser.parse_args())
@@ -0,0 +1,107 @@
+"""
+History CSV export (dashboard/export.py): sequential vs thread-pool fan-out.
+
+Fills a repository (dashboard/storage.py) with --users students of
+--rows history entries each, then exports the whole history as CSV with
+--workers 1 and each of --parallel, plain and gzip. Reports total time,
+time to the first row, rows/s and output size.
+
+SQLite reads are local, so the fan-out mostly overlaps JSON decoding with
+I/O. --page-latency-ms adds a delay per history page to stand in for a
+Firestore round-trip (roughly 20-60 ms from a server outside the region),
+which is what the worker pool is there to hide. --backend firestore runs
+against real Firestore (credentials or FIRESTORE_EMULATOR_HOST) in bench_*
+collections.
+
+    python benchmarks/bench_export.py --users 500 --rows 2000 --page-latency-ms 30
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+settings.configure(BASE_DIR=ROOT, XSCOUT_INGEST_MODE='sync')
+django.setup()
+
+from dashboard import export, firebase, storage  # noqa: E402
+from dashboard.export import Exporter  # noqa: E402
+
+T0 = datetime(2024, 5, 1, 9, 0, tzinfo=timezone.utc)
+APPS = ['VS Code', 'Chrome', 'Terminal', 'Slack']
+
+
+def make_repository(backend, workdir, latency):
+    if backend == 'firestore':
+        return storage.FirestoreRepository(firebase.get_client(), collection='bench_reports',
+                                           authorized_collection='bench_authorized')
+
+    class Remote(storage.SQLiteRepository):
+        def history_page(self, user_id, **params):
+            time.sleep(latency)
+            return super().history_page(user_id, **params)
+
+    return Remote(os.path.join(workdir, 'telemetry.sqlite3'))
+
+
+def fill(repo, args):
+    for u in range(args.users):
+        user_id = f"student_{u:04d}"
+        entries = [(f"{n:06d}", {'timestamp': T0 + timedelta(seconds=5 * n), 'ai_score': (u + n) % 100,
+                                 'forensic': {'activeApp': APPS[n % 4], 'activeWindow': f"lab{n % 7}.py"},
+                                 'behavior': {'wpm': 20 + (u * n) % 60}})
+                   for n in range(args.rows)]
+        repo.write_heartbeat(user_id, {'environment': f"ENV{u % 10}", 'ai': u % 100}, history=entries)
+
+
+def run(repo, workers, compress):
+    chunks = Exporter(repo, workers=workers).csv(scope='history')
+    if compress:
+        chunks = export.gzipped(chunks)
+    started = time.perf_counter()
+    first = None
+    size = lines = 0
+    for chunk in chunks:
+        if first is None and size:
+            first = time.perf_counter() - started
+        size += len(chunk)
+        if not compress:
+            lines += chunk.count('\n')
+    return time.perf_counter() - started, first or 0.0, size, lines - 1
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        repo = make_repository(args.backend, workdir, args.page_latency_ms / 1000)
+        if args.backend != 'firestore' or args.fill:
+            started = time.perf_counter()
+            fill(repo, args)
+            print(f"filled {args.users} users x {args.rows} rows in {time.perf_counter() - started:.1f}s")
+
+        total = args.users * args.rows
+        print(f"{'workers':>7}{'output':>8}{'total s':>9}{'first row s':>13}{'rows/s':>10}{'MB':>8}")
+        for workers in [1] + args.parallel:
+            for compress in (False, True):
+                elapsed, first, size, lines = run(repo, workers, compress)
+                if not compress:
+                    assert lines == total, (lines, total)
+                print(f"{workers:>7}{'gzip' if compress else 'csv':>8}{elapsed:>9.2f}{first:>13.3f}"
+                      f"{total / elapsed:>10.0f}{size / 1e6:>8.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=['sqlite', 'firestore'], default='sqlite')
+    parser.add_argument('--fill', action='store_true', help='write the test data to Firestore first')
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--parallel', type=int, nargs='+', default=[8, 16])
+    parser.add_argument('--page-latency-ms', type=float, default=0)
+    main(parser.parse_args())
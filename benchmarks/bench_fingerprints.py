@@ -0,0 +1,94 @@
+"""
+Plagiarism search over history: the fingerprint index (dashboard/fingerprints.py)
+vs comparing a snapshot with every stored one.
+
+For each corpus size in --corpus, --students students share that many
+snapshots of a generated program each (every one edits a few lines of the
+last); the query is a copy of the first student's second snapshot. Times:
+
+- index:    FingerprintIndex.index() of the corpus, in ingest order
+            (postings written: only fingerprints new for each student);
+- query:    sources() for the copied snapshot, median of --repeat;
+- scan:     what a query without the index costs: winnow every stored
+            snapshot and intersect it with the query's fingerprints.
+
+Storage is SQLiteRepository (in memory).
+
+    python benchmarks/bench_fingerprints.py --corpus 1000 10000 50000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from dashboard import fingerprints  # noqa: E402
+from dashboard.fingerprints import FingerprintIndex  # noqa: E402
+from dashboard.storage import SQLiteRepository  # noqa: E402
+
+WORDS = ['total', 'count', 'items', 'value', 'result', 'index', 'node', 'left', 'right', 'key', 'data', 'buffer']
+
+
+def line(rng):
+    a, b, c = rng.sample(WORDS, 3)
+    return f'    {a} = {b} {rng.choice("+-*")} {c}[{rng.randrange(100)}] if {a} else {rng.randrange(1000)}'
+
+
+def corpus(size, students, rng):
+    """[(user_id, entry_id, code), ...] in ingest order."""
+    snapshots_each = max(size // students, 1)
+    programs = {f's{n:05d}': [f'def task_{n}():'] + [line(rng) for _ in range(60)] for n in range(students)}
+    rows = []
+    for seq in range(snapshots_each):
+        for user_id, lines in programs.items():
+            for _ in range(3):
+                lines[rng.randrange(1, len(lines))] = line(rng)
+            rows.append((user_id, f'e{seq:04d}', '\n'.join(lines)))
+            if len(rows) == size:
+                return rows
+    return rows
+
+
+def main(args):
+    print(f"{'corpus':>8}{'postings':>10}{'index s':>9}{'query ms':>10}{'scan ms':>10}{'top source':>14}")
+    for size in args.corpus:
+        rng = random.Random(args.seed)
+        rows = corpus(size, args.students, rng)
+        copied = rows[args.students]  # a second-round snapshot of the first student
+        repo = SQLiteRepository()
+        index = FingerprintIndex(repo)
+
+        started = time.perf_counter()
+        postings = 0
+        for i in range(0, len(rows), 500):
+            postings += index.index([(user_id, entry_id, code, None) for user_id, entry_id, code in rows[i:i + 500]])
+        indexed = time.perf_counter() - started
+
+        samples = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            found = index.sources(copied[2], exclude='copier')
+            samples.append(time.perf_counter() - started)
+        top = found['sources'][0]
+
+        started = time.perf_counter()
+        wanted = fingerprints.fingerprint(copied[2])
+        best = max(((len(wanted & fingerprints.fingerprint(code)), user_id) for user_id, _, code in rows))
+        scan = time.perf_counter() - started
+        assert best[1] == top['user_id']
+
+        print(f"{len(rows):>8}{postings:>10}{indexed:>9.1f}{statistics.median(samples) * 1000:>10.1f}"
+              f"{scan * 1000:>10.0f}{top['user_id'] + ' ' + top['entries'][0]['id']:>14}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--students', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=7)
+    main(parser.parse_args())
@@ -0,0 +1,93 @@
+"""
+Benchmark for the snapshot history encoding.
+
+Simulates one student's session (a heartbeat every 5 seconds while they type
+into a growing file) and compares the bytes written to the history
+subcollection with full entries vs keyframes + deltas, plus the time it takes
+to rebuild the session for playback.
+
+    python benchmarks/bench_history_encoding.py --minutes 120
+    python benchmarks/bench_history_encoding.py --minutes 120 --keyframe-interval 50
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dashboard.history import HistoryEncoder, decode_entries  # noqa: E402
+
+WORDS = ['total', 'count', 'value', 'items', 'result', 'index', 'data', 'node',
+         'left', 'right', 'acc', 'temp', 'queue', 'stack', 'seen', 'graph']
+
+
+def random_line(rng):
+    a, b, c = rng.sample(WORDS, 3)
+    return f"    {a} = {b} + {c}[{rng.randint(0, 99)}]"
+
+
+def session(rng, heartbeats, start_lines):
+    """Yields android_report-shaped history entries for one student."""
+    lines = ["def solve(data):"] + [random_line(rng) for _ in range(start_lines)]
+    for i in range(heartbeats):
+        roll = rng.random()
+        if roll < 0.5:
+            lines.insert(rng.randint(1, len(lines)), random_line(rng))
+        elif roll < 0.8:
+            lines[rng.randint(1, len(lines) - 1)] = random_line(rng)
+        # else: idle heartbeat, code unchanged
+        yield f"hb{i:05d}", {
+            'timestamp': f"2026-01-01T00:{i // 12:04d}:{(i % 12) * 5:02d}",
+            'ai': rng.random() < 0.02,
+            'ai_score': round(rng.random() * 0.3, 3),
+            'forensic': {
+                'snapshot': '\n'.join(lines),
+                'filename': 'solution.py',
+                'cursor': rng.randint(0, 5000),
+            },
+        }
+
+
+def size(doc):
+    return len(json.dumps(doc, default=str))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--minutes', type=int, default=120)
+    parser.add_argument('--interval', type=int, default=5, help='seconds between heartbeats')
+    parser.add_argument('--start-lines', type=int, default=80)
+    parser.add_argument('--keyframe-interval', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    heartbeats = args.minutes * 60 // args.interval
+    entries = list(session(random.Random(args.seed), heartbeats, args.start_lines))
+
+    encoder = HistoryEncoder(keyframe_interval=args.keyframe_interval)
+    started = time.perf_counter()
+    stored = [(doc_id, encoder.encode('student', doc_id, entry)) for doc_id, entry in entries]
+    encode_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    decoded = decode_entries(stored)
+    decode_ms = (time.perf_counter() - started) * 1000
+    assert decoded == [entry for _, entry in entries], "round trip mismatch"
+
+    full_bytes = sum(size(entry) for _, entry in entries)
+    delta_bytes = sum(size(doc) for _, doc in stored)
+    keyframes = sum(1 for _, doc in stored if doc['encoding'] == 'keyframe')
+
+    print(f"heartbeats:        {heartbeats} ({args.minutes} min @ {args.interval}s)")
+    print(f"keyframes:         {keyframes}")
+    print(f"full entries:      {full_bytes / 1024:.1f} KiB")
+    print(f"keyframe + delta:  {delta_bytes / 1024:.1f} KiB ({full_bytes / delta_bytes:.1f}x smaller)")
+    print(f"encode:            {encode_ms:.1f} ms total, {encode_ms / heartbeats:.3f} ms/heartbeat")
+    print(f"decode session:    {decode_ms:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
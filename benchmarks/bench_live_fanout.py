@@ -0,0 +1,170 @@
+"""
+Load test for the /api/live/ Server-Sent Events fan-out.
+
+Runs Django's ASGI handler in-process with N concurrent viewers on one event
+loop (one worker process), while a publisher thread plays the ingest POST
+path: a heartbeat from a random student every --interval seconds, published
+from outside the loop exactly like a sync view does. A few viewers stall
+for a few seconds to show that backpressure resyncs them without
+holding up the rest.
+
+Reports delivery latency (publish -> event received) across all viewers,
+latest-state reads, resyncs and RSS.
+
+    python benchmarks/bench_live_fanout.py --viewers 200 --seconds 10
+"""
+import argparse
+import asyncio
+import os
+import random
+import resource
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+settings.configure(
+    DEBUG=False,
+    ALLOWED_HOSTS=['*'],
+    ROOT_URLCONF=__name__,
+    XSCOUT_LIVE_RESCAN_INTERVAL=2.0,
+)
+django.setup()
+
+from django.core.asgi import get_asgi_application  # noqa: E402
+from django.urls import path  # noqa: E402
+
+from dashboard import live  # noqa: E402
+
+STATE = {}
+READS = {'count': 0}
+
+
+def latest_state():
+    READS['count'] += 1
+    return [dict(data, id=doc_id) for doc_id, data in STATE.items()]
+
+
+async def live_view(request):
+    return live.stream(live.parse_topic(request.GET.get('topic')), latest_state)
+
+
+urlpatterns = [path('api/live/', live_view)]
+
+
+class Viewer:
+    def __init__(self, topic, stall=0.0):
+        self.topic = topic
+        self.slow = stall > 0
+        self.stall = stall
+        self.latencies = []
+        self.snapshots = 0
+        self.closed = asyncio.Event()
+        self._sent_request = False
+
+    async def receive(self):
+        if not self._sent_request:
+            self._sent_request = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await self.closed.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        if message['type'] != 'http.response.body':
+            return
+        now = time.perf_counter()
+        for block in message.get('body', b'').decode().split('\n\n'):
+            if block.startswith('event: snapshot'):
+                self.snapshots += 1
+            elif block.startswith('event: update'):
+                for sent in block.split('"sent": ')[1:]:
+                    self.latencies.append(now - float(sent.split('}')[0].split(',')[0]))
+                if self.stall:
+                    # A stalled tab / slow link: the server can't write to it for a while
+                    stall, self.stall = self.stall, 0.0
+                    await asyncio.sleep(stall)
+
+    def scope(self):
+        return {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': '/api/live/', 'raw_path': b'/api/live/', 'root_path': '',
+            'query_string': f'topic={self.topic}'.encode(), 'headers': [(b'host', b'localhost')],
+            'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+        }
+
+
+def publisher(students, interval, stop):
+    rng = random.Random(1)
+    broker = live.get_broker()
+    while not stop.is_set():
+        doc_id = f"student_{rng.randrange(students):04d}"
+        record = {'environment': f"ENV{int(doc_id[-4:]) % 10}", 'ai': rng.random(), 'sent': time.perf_counter()}
+        STATE[doc_id] = record
+        broker.publish([dict(record, id=doc_id)])
+        time.sleep(interval)
+
+
+async def main(args):
+    for i in range(args.students):
+        STATE[f"student_{i:04d}"] = {'environment': f"ENV{i % 10}", 'ai': 0.0, 'sent': time.perf_counter()}
+
+    app = get_asgi_application()
+    viewers = []
+    for i in range(args.viewers):
+        topic = 'all' if i % 2 == 0 else f"env:ENV{i % 10}"
+        viewers.append(Viewer(topic, stall=args.stall if i < args.slow else 0.0))
+
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    tasks = [asyncio.create_task(app(v.scope(), v.receive, v.send)) for v in viewers]
+    started = time.perf_counter()
+    while any(v.snapshots == 0 for v in viewers):
+        await asyncio.sleep(0.05)
+    connect_s = time.perf_counter() - started
+    reads_after_connect = READS['count']
+
+    stop = threading.Event()
+    thread = threading.Thread(target=publisher, args=(args.students, args.interval, stop), daemon=True)
+    thread.start()
+    await asyncio.sleep(args.seconds)
+    stop.set()
+    thread.join()
+    await asyncio.sleep(0.5)
+
+    for viewer in viewers:
+        viewer.closed.set()
+    await asyncio.wait(tasks, timeout=5)
+
+    fast = [v for v in viewers if not v.slow]
+    latencies = sorted(lat for v in fast for lat in v.latencies)
+    published = live.get_broker().metrics()['published']
+    pct = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000  # noqa: E731
+
+    print(f"viewers:            {args.viewers} ({args.slow} slow), {args.students} students, "
+          f"{1 / args.interval:.0f} heartbeats/s for {args.seconds}s")
+    print(f"all connected in:   {connect_s * 1000:.0f} ms (initial snapshots)")
+    print(f"published records:  {published}")
+    print(f"delivered events:   {len(latencies)} to fast viewers "
+          f"(avg {statistics.mean(len(v.latencies) for v in fast):.0f} per viewer)")
+    print(f"delivery latency:   p50 {pct(0.5):.1f} ms  p95 {pct(0.95):.1f} ms  p99 {pct(0.99):.1f} ms  "
+          f"max {latencies[-1] * 1000:.1f} ms")
+    print(f"slow viewer resyncs: {sum(v.snapshots - 1 for v in viewers if v.slow)}")
+    print(f"latest-state reads: {reads_after_connect} for initial snapshots, "
+          f"{READS['count'] - reads_after_connect} during the run "
+          f"(polling: {args.viewers * args.seconds / 3:.0f} full reads)")
+    print(f"peak RSS growth:    {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 - baseline_rss:.1f} MiB")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--viewers', type=int, default=200)
+    parser.add_argument('--slow', type=int, default=5, help='viewers that stall once')
+    parser.add_argument('--stall', type=float, default=6.0, help='seconds a slow viewer stops reading')
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--interval', type=float, default=0.01, help='seconds between heartbeats')
+    parser.add_argument('--seconds', type=float, default=10)
+    asyncio.run(main(parser.parse_args()))
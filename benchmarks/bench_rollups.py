@@ -0,0 +1,115 @@
+"""
+"Class average WPM over the last hour": history scan vs behavior rollups.
+
+Fills a SQLite repository (dashboard/storage.py) with --students heartbeats
+every --interval seconds for --hours. Every history entry carries the
+behavior block (as the AdminDashboard stores the raw payload) and every
+heartbeat also goes through a RollupStore. Then it answers the question
+both ways:
+
+- history: page through each student's history for the last hour and
+  average behavior.wpm (what a trend view needs without rollups);
+- rollups: RollupStore.class_average(), i.e. read the 10-minute buckets.
+
+It also reports rollup ingest overhead per heartbeat and the rows read.
+
+    python benchmarks/bench_rollups.py --students 100 --hours 2
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+settings.configure(BASE_DIR=ROOT, XSCOUT_INGEST_MODE='sync')
+django.setup()
+
+from dashboard import playback  # noqa: E402
+from dashboard.rollups import RollupStore  # noqa: E402
+from dashboard.storage import SQLiteRepository  # noqa: E402
+
+T0 = datetime(2024, 5, 1, 8, 0, tzinfo=timezone.utc)
+
+
+def fill(repo, store, args):
+    beats = int(args.hours * 3600 / args.interval)
+    add_ms = []
+    for beat in range(beats):
+        moment = T0 + timedelta(seconds=beat * args.interval)
+        for i in range(args.students):
+            student = f"student_{i:05d}"
+            behavior = {'wpm': 30 + (i + beat) % 40, 'backspaceRate': beat % 7, 'pasteEvents': beat // 100,
+                        'idleTime': 0}
+            entry = {'timestamp': moment, 'ai_score': i % 100, 'behavior': behavior}
+            repo.write_heartbeat(student, {'behavior': behavior}, history=[(f"{beat:08d}", entry)])
+            started = time.perf_counter()
+            store.add(student, behavior, now=moment.timestamp())
+            add_ms.append((time.perf_counter() - started) * 1000)
+        if beat % 12 == 11:
+            store.flush(now=moment.timestamp())
+    end = T0 + timedelta(seconds=beats * args.interval)
+    store.flush(now=end.timestamp())
+    return end, add_ms
+
+
+def from_history(repo, students, now):
+    total = count = 0
+    for student in students:
+        cursor = None
+        while True:
+            page = repo.history_page(student, start=now - timedelta(hours=1), end=now, limit=playback.MAX_LIMIT,
+                                     cursor=playback.decode_cursor(cursor) if cursor else None)
+            for entry in page['data']:
+                total += entry['behavior']['wpm']
+                count += 1
+            cursor = page['next_cursor']
+            if not page['has_more']:
+                break
+    return total / count, count
+
+
+def timed(func, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return result, statistics.median(samples)
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        repo = SQLiteRepository(os.path.join(workdir, 'telemetry.sqlite3'))
+        store = RollupStore(repo, flush_interval=3600)
+        now, add_ms = fill(repo, store, args)
+        students = [f"student_{i:05d}" for i in range(args.students)]
+
+        (scan_mean, rows), scan_ms = timed(lambda: from_history(repo, students, now), args.runs)
+        rollup_mean, rollup_ms = timed(lambda: store.class_average('wpm', 3600, now=now.timestamp()), args.runs)
+        buckets = len(list(repo.read_rollups('10m', int(now.timestamp()) - 3000, int(now.timestamp()))))
+
+        print(f"{args.students} students, heartbeat every {args.interval}s for {args.hours} h "
+              f"({len(add_ms)} heartbeats)")
+        print(f"rollup ingest overhead: {statistics.mean(add_ms) * 1000:.1f} us/heartbeat (in memory), "
+              f"{store.metrics()['written_buckets']} bucket rows written")
+        print(f"{'source':<10}{'median ms':>11}{'rows read':>11}{'mean wpm':>10}")
+        print(f"{'history':<10}{scan_ms:>11.1f}{rows:>11}{scan_mean:>10.2f}")
+        print(f"{'rollups':<10}{rollup_ms:>11.2f}{buckets:>11}{rollup_mean:>10.2f}")
+        print("(rollups cover whole 10-minute buckets, so their hour starts up to 10 min later)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=100)
+    parser.add_argument('--hours', type=float, default=2)
+    parser.add_argument('--interval', type=int, default=5, help='seconds between heartbeats')
+    parser.add_argument('--runs', type=int, default=5)
+    main(parser.parse_args())
@@ -0,0 +1,171 @@
+"""
+Onboarding a cohort: add_authorized_user once per ID vs a roster import
+(dashboard/roster.py).
+
+--students new IDs (plus --existing already authorized, a tenth of which the
+roster changes) are authorized:
+
+- per-id:  what api/add-user/ does for each ID in turn: a storage set()
+           plus a SQL exists() and create();
+- roster:  one SQL query to diff, one bulk transaction, then storage read
+           and written in 500-op batches committed by --workers threads
+           (FirestoreRepository against a simulated client).
+
+Every SQL query and storage round-trip sleeps --latency-ms, roughly a
+Firestore call from a nearby region.
+
+    python benchmarks/bench_roster.py --students 2000 --workers 8
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from dashboard import firebase  # noqa: E402
+from dashboard.roster import RosterImporter, parse  # noqa: E402
+from dashboard.storage import FirestoreRepository  # noqa: E402
+
+
+class Trips:
+    def __init__(self, latency):
+        self.latency = latency
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.count += 1
+        time.sleep(self.latency)
+
+
+class Snapshot:
+    def __init__(self, doc_id, data):
+        self.id, self._data, self.exists = doc_id, data, data is not None
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class Ref:
+    def __init__(self, db, doc_id):
+        self.db, self.id = db, doc_id
+
+    def document(self, doc_id):
+        return Ref(self.db, doc_id)
+
+    def set(self, data):
+        self.db.trip()
+        self.db.docs[self.id] = data
+
+
+class Batch:
+    def __init__(self, db):
+        self.db, self.ops = db, []
+
+    def set(self, ref, data, merge=False):
+        self.ops.append((ref.id, data))
+
+    def commit(self):
+        self.db.trip()
+        for doc_id, data in self.ops:
+            self.db.docs.setdefault(doc_id, {}).update(data)
+
+
+class Client:
+    """The calls FirestoreRepository makes for authorized IDs, one round-trip each."""
+
+    def __init__(self, trip):
+        self.trip = trip
+        self.docs = {}
+
+    def collection(self, name):
+        return Ref(self, None)
+
+    def get_all(self, refs):
+        self.trip()
+        return [Snapshot(ref.id, self.docs.get(ref.id)) for ref in refs]
+
+    def batch(self):
+        return Batch(self)
+
+
+class Table:
+    """AuthorizedID, one round-trip per query."""
+
+    def __init__(self, trip, existing):
+        self.trip = trip
+        self.rows = {student_id: (n, True, 'existing') for n, student_id in enumerate(existing)}
+        self.updated_at = {}
+
+    def exists(self, student_id):
+        self.trip()
+        return student_id in self.rows
+
+    def create(self, student_id, description):
+        self.trip()
+        self.rows[student_id] = (len(self.rows), True, description)
+
+    def load(self, student_ids):
+        self.trip()
+        return {student_id: self.rows[student_id] for student_id in student_ids if student_id in self.rows}
+
+    def save(self, created, updated, batch_size, now):
+        self.trip()  # one transaction, bulk statements
+        for pk, student_id, active, description in created + updated:
+            self.rows[student_id] = (pk, active, description)
+        # bulk_update() doesn't run auto_now: _save_local stamps updated_at itself
+        for _, student_id, _, _ in updated:
+            self.updated_at[student_id] = now
+
+
+def setup(args):
+    trip = Trips(args.latency_ms / 1000)
+    existing = [f"old{n:05d}" for n in range(args.existing)]
+    client = Client(trip)
+    client.docs = {student_id: {'studentId': student_id, 'description': 'existing', 'isActive': True}
+                   for student_id in existing}
+    lines = [f"new{n:05d},Student {n}" for n in range(args.students)]
+    lines += [f"{student_id},{'renamed' if n % 10 == 0 else 'existing'}" for n, student_id in enumerate(existing)]
+    return trip, Table(trip, existing), client, 'id,description\n' + '\n'.join(lines)
+
+
+def main(args):
+    print(f"{'mode':<8}{'rows':>7}{'round-trips':>13}{'seconds':>10}{'rows/s':>9}")
+
+    trip, table, client, content = setup(args)
+    rows, _, _ = parse(content)
+    started = time.perf_counter()
+    for row in rows:
+        client.collection('authorized_students').document(row['student_id']).set(
+            {'studentId': row['student_id'], 'description': row['description'], 'isActive': True})
+        if not table.exists(row['student_id']):
+            table.create(row['student_id'], row['description'])
+    elapsed = time.perf_counter() - started
+    print(f"{'per-id':<8}{len(rows):>7}{trip.count:>13}{elapsed:>10.2f}{len(rows) / elapsed:>9.0f}")
+
+    # firebase_admin is already imported in a running server
+    firebase.SERVER_TIMESTAMP
+    trip, table, client, content = setup(args)
+    repository = FirestoreRepository(client)
+    importer = RosterImporter(table.load, table.save, lambda: repository, workers=args.workers)
+    rows, errors, duplicates = parse(content)
+    started = time.perf_counter()
+    report = importer.run(rows, errors, duplicates)
+    elapsed = time.perf_counter() - started
+    print(f"{'roster':<8}{len(rows):>7}{trip.count:>13}{elapsed:>10.2f}{len(rows) / elapsed:>9.0f}")
+    print(f"  {report['created']} added, {report['updated']} updated, {report['unchanged']} unchanged; "
+          f"diff {report['diff_seconds']}s, SQL {report['sql_seconds']}s, storage {report['storage_seconds']}s "
+          f"({report['storage_writes']} writes, {report['storage_batches']} commits)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--existing', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--latency-ms', type=float, default=15.0)
+    main(parser.parse_args())
@@ -0,0 +1,99 @@
+"""
+Cold-start benchmark for both projects (the root app and AdminDashboard).
+
+Each measurement runs in a fresh interpreter, as a deploy or worker restart
+would:
+
+- check:  `python manage.py check`, i.e. what every management command and
+          build step (build.sh) pays before doing any work;
+- worker: what a gunicorn worker does after the fork: import the ASGI
+          application and resolve the URLconf, which imports every view.
+          Deploys pay this WEB_CONCURRENCY times.
+
+Both report the median wall time over --runs and whether firebase_admin/grpc
+got imported. --baseline REV runs the same workload against a git revision
+(extracted with git archive) for a before/after comparison.
+
+    python benchmarks/bench_startup.py --runs 10 --baseline HEAD~1
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECTS = {'root': '.', 'admin': 'AdminDashboard'}
+
+WORKER = """
+import json, os, sys, time
+started = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dashboard.settings')
+from dashboard.asgi import application
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(json.dumps({'app_ms': (time.perf_counter() - started) * 1000,
+                  'firebase': 'firebase_admin' in sys.modules, 'grpc': 'grpc' in sys.modules}))
+"""
+
+
+def timed_run(command, cwd, env):
+    started = time.perf_counter()
+    result = subprocess.run(command, cwd=cwd, env=env, capture_output=True, text=True)
+    elapsed = (time.perf_counter() - started) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'failed')
+    return elapsed, result.stdout
+
+
+def measure(tree, args):
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    rows = []
+    for name, subdir in PROJECTS.items():
+        cwd = os.path.join(tree, subdir)
+        # Compile once so every run measures imports, not bytecode compilation
+        subprocess.run([sys.executable, '-m', 'compileall', '-q', cwd], capture_output=True)
+        for workload, command in [('check', [sys.executable, 'manage.py', 'check']),
+                                  ('worker', [sys.executable, '-c', WORKER])]:
+            try:
+                runs = [timed_run(command, cwd, env) for _ in range(args.runs)]
+            except RuntimeError as e:
+                rows.append((name, workload, None, f"failed: {e}"))
+                continue
+            note = ''
+            if workload == 'worker':
+                info = json.loads(runs[-1][1])
+                app_ms = statistics.median(json.loads(out)['app_ms'] for _, out in runs)
+                note = f"app {app_ms:.0f} ms, firebase_admin={info['firebase']}, grpc={info['grpc']}"
+            rows.append((name, workload, statistics.median(ms for ms, _ in runs), note))
+    return rows
+
+
+def main(args):
+    trees = [('current', ROOT)]
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.baseline:
+            archive = subprocess.run(['git', 'archive', args.baseline], cwd=ROOT, capture_output=True, check=True)
+            subprocess.run(['tar', '-x', '-C', workdir], input=archive.stdout, check=True)
+            trees.insert(0, (args.baseline, workdir))
+
+        print(f"median of {args.runs} runs, {args.workers} workers per deploy")
+        print(f"{'tree':<10}{'project':<9}{'workload':<10}{'ms':>8}{'x workers':>11}  notes")
+        for label, tree in trees:
+            for project, workload, ms, note in measure(tree, args):
+                if ms is None:
+                    print(f"{label:<10}{project:<9}{workload:<10}{'-':>8}{'-':>11}  {note}")
+                    continue
+                total = ms * args.workers if workload == 'worker' else ms
+                print(f"{label:<10}{project:<9}{workload:<10}{ms:>8.0f}{total:>11.0f}  {note}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_CONCURRENCY', 4)))
+    parser.add_argument('--baseline', help='git revision to compare against, e.g. HEAD~1')
+    main(parser.parse_args())
@@ -0,0 +1,121 @@
+"""
+Shared workload for the storage backends (dashboard/storage.py).
+
+Runs the same operations through the TelemetryRepository interface against
+each backend and reports per-operation latency and throughput:
+
+- ingest:      write_heartbeat() with one delta-encoded history entry
+- scan:        stream_latest() over every student (dashboard poll)
+- environment: stream_environment() for one class
+- timeline:    history_page(fields=timestamp,ai_score, limit=1000)
+- frames:      history_page(limit=50) with snapshots rebuilt from deltas
+- authorize:   get_authorized() for a student ID
+
+Backends: 'sqlite' (WAL file in a temp dir), 'memory' (':memory:') and
+'firestore', which needs credentials or FIRESTORE_EMULATOR_HOST and writes
+to separate bench_* collections.
+
+    python benchmarks/bench_storage.py --backend sqlite memory --students 200 --heartbeats 20
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+settings.configure(BASE_DIR=ROOT, XSCOUT_INGEST_MODE='sync')
+django.setup()
+
+from dashboard import firebase, storage  # noqa: E402
+from dashboard.history import HistoryEncoder  # noqa: E402
+
+T0 = datetime(2024, 5, 1, 9, 0, tzinfo=timezone.utc)
+ENVIRONMENTS = 10
+
+
+def make_repository(backend, workdir):
+    if backend == 'sqlite':
+        return storage.SQLiteRepository(os.path.join(workdir, 'telemetry.sqlite3'))
+    if backend == 'memory':
+        return storage.SQLiteRepository(':memory:')
+    return storage.FirestoreRepository(firebase.get_client(), collection='bench_reports',
+                                       authorized_collection='bench_authorized')
+
+
+def timed(samples, func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    samples.append((time.perf_counter() - started) * 1000)
+    return result
+
+
+def heartbeat(i, beat):
+    code = ''.join(f"def step_{n}(x):\n    return x * {n}\n" for n in range(40)) + f"# edit {beat}\n"
+    latest = {'studentId': f"student_{i:05d}", 'environment': f"ENV{i % ENVIRONMENTS}", 'ai': (i + beat) % 100,
+              'behavior': {'wpm': 40 + beat % 30, 'backspaceRate': beat % 7, 'pasteEvents': 0, 'idleTime': 0},
+              'snapshot': {'file': 'main.py', 'code': code}}
+    entry = {'timestamp': T0 + timedelta(seconds=beat * 5), 'file': 'main.py', 'code': code, 'language': 'python',
+             'ai_score': latest['ai']}
+    return latest, entry
+
+
+def run(backend, args, workdir):
+    repo = make_repository(backend, workdir)
+    encoder = HistoryEncoder()
+    rng = random.Random(1)
+    students = [f"student_{i:05d}" for i in range(args.students)]
+    samples = {name: [] for name in ('ingest', 'scan', 'environment', 'timeline', 'frames', 'authorize')}
+
+    for i, student in enumerate(students):
+        repo.set_authorized(student, {'studentId': student, 'isActive': True})
+    for beat in range(args.heartbeats):
+        for i, student in enumerate(students):
+            latest, entry = heartbeat(i, beat)
+            doc_id = repo.new_history_id(student)
+            timed(samples['ingest'], repo.write_heartbeat, student, latest,
+                  history=[(doc_id, encoder.encode(student, doc_id, entry))], last_seen=T0)
+
+    for _ in range(args.reads):
+        timed(samples['scan'], lambda: list(repo.stream_latest()))
+        timed(samples['environment'], lambda: list(repo.stream_environment(f"ENV{rng.randrange(ENVIRONMENTS)}")))
+        student = rng.choice(students)
+        timed(samples['timeline'], repo.history_page, student, limit=1000, fields=['timestamp', 'ai_score'])
+        timed(samples['frames'], repo.history_page, student, limit=50)
+        timed(samples['authorize'], repo.get_authorized, rng.choice(students))
+    return samples
+
+
+def main(args):
+    print(f"{args.students} students x {args.heartbeats} heartbeats, {args.reads} rounds of reads")
+    print(f"{'backend':<10}{'operation':<13}{'ops':>7}{'ops/s':>10}{'p50 ms':>9}{'p95 ms':>9}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for backend in args.backend:
+            try:
+                samples = run(backend, args, workdir)
+            except Exception as e:
+                print(f"{backend:<10}skipped: {e}")
+                continue
+            for name, values in samples.items():
+                ordered = sorted(values)
+                p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+                print(f"{backend:<10}{name:<13}{len(values):>7}{1000 / statistics.mean(values):>10.0f}"
+                      f"{statistics.median(values):>9.2f}{p95:>9.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', nargs='+', default=['sqlite', 'memory', 'firestore'],
+                        choices=['sqlite', 'memory', 'firestore'])
+    parser.add_argument('--students', type=int, default=200)
+    parser.add_argument('--heartbeats', type=int, default=20, help='heartbeats (history entries) per student')
+    parser.add_argument('--reads', type=int, default=50, help='rounds of read operations')
+    main(parser.parse_args())
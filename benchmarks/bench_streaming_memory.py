@@ -0,0 +1,111 @@
+"""
+Memory benchmark for the dashboard GET / system_backup responses.
+
+Serves a synthetic collection of report documents (yielded lazily, the way
+collection.stream() does) through the buffered JsonResponse path and the
+streaming paths, each in a fresh subprocess, and reports peak RSS growth and
+time to first byte. The response body is consumed and discarded like a WSGI
+server writing to a socket.
+
+    python benchmarks/bench_streaming_memory.py --docs 50000
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODES = ['buffered', 'json', 'ndjson', 'backup-buffered', 'backup-json']
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+
+    def to_dict(self):
+        return self._data
+
+
+def fake_stream(count):
+    """Report-shaped documents, roughly 1.5 KB of JSON each."""
+    for i in range(count):
+        yield FakeSnapshot(f"student_{i:06d}", {
+            'studentId': f"student_{i:06d}",
+            'studentName': f"Student {i}",
+            'email': f"student_{i}@xscout.app",
+            'timestamp': f"2026-01-01T10:{i % 60:02d}:00.000Z",
+            'isActive': True,
+            'ai': i % 100,
+            'behavior': {'wpm': 40 + i % 30, 'backspaceRate': i % 17, 'pasteEvents': i % 3, 'idleTime': i % 120},
+            'stack': 'Python',
+            'project': {'name': f"assignment-{i % 5}", 'files': [f"src/module_{n}.py" for n in range(12)]},
+            'tech': {'detectedTech': 'Python', 'frameworks': ['django', 'pytest'], 'editor': 'vscode'},
+            'titleHistory': [f"module_{n}.py - assignment - Visual Studio Code" for n in range(8)],
+        })
+
+
+def max_rss_mib():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def run_mode(mode, count):
+    from django.conf import settings
+    settings.configure(DEFAULT_CHARSET='utf-8')
+
+    from django.http import JsonResponse, StreamingHttpResponse
+    from dashboard import streaming
+
+    baseline = max_rss_mib()
+    started = time.perf_counter()
+    docs = fake_stream(count)
+
+    if mode == 'buffered':
+        data = []
+        for doc in docs:
+            doc_data = doc.to_dict()
+            doc_data['id'] = doc.id
+            data.append(doc_data)
+        chunks = iter([JsonResponse({'status': 'success', 'data': data}).content])
+    elif mode == 'backup-buffered':
+        chunks = iter([JsonResponse({doc.id: doc.to_dict() for doc in docs}, json_dumps_params={'indent': 2}).content])
+    elif mode == 'backup-json':
+        pairs = ((doc.id, doc.to_dict()) for doc in streaming.primed(docs))
+        chunks = StreamingHttpResponse(streaming.json_object(pairs, indent=2)).streaming_content
+    else:
+        items = streaming.documents(streaming.primed(docs))
+        body = streaming.ndjson(items) if mode == 'ndjson' else streaming.json_envelope(items)
+        chunks = StreamingHttpResponse(body).streaming_content
+
+    size = len(next(chunks))
+    first_byte = time.perf_counter() - started
+    for chunk in chunks:
+        size += len(chunk)
+    total = time.perf_counter() - started
+    print(f"{mode:16} {size / 2**20:9.1f} MiB body  {max_rss_mib() - baseline:8.1f} MiB peak RSS growth  "
+          f"first byte {first_byte * 1000:8.1f} ms  total {total:6.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=50000)
+    parser.add_argument('--mode', choices=MODES, help='run a single mode in this process')
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.docs)
+        return
+
+    print(f"{args.docs} documents")
+    for mode in MODES:
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--docs', str(args.docs), '--mode', mode], check=True)
+
+
+if __name__ == '__main__':
+    main()
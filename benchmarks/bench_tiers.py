@@ -0,0 +1,148 @@
+"""
+Playback of old sessions from the hot tier vs compacted archives
+(dashboard/tiers.py).
+
+Fills a SQLite repository with --users students, each with --sessions past
+sessions of --rows heartbeats (delta-encoded, like ingest writes them),
+then pages through every student's full history with history_page()
+(--limit entries per page, the playback default) before and after
+`compact_history`:
+
+- hot:          history documents only;
+- cold (first): archives, with an empty per-process cache;
+- cold (warm):  archives again, decoded from the cache.
+
+Reports documents stored, documents a Firestore read would bill (every
+entry on a page plus the keyframes its deltas need, vs one read per
+archive plus the archive index query) and page latency.
+
+    python benchmarks/bench_tiers.py --users 20 --sessions 10 --rows 300
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+settings.configure(BASE_DIR=ROOT, XSCOUT_INGEST_MODE='sync')
+django.setup()
+
+from dashboard import playback, tiers  # noqa: E402
+from dashboard.history import HistoryEncoder  # noqa: E402
+from dashboard.storage import SQLiteRepository  # noqa: E402
+
+NOW = datetime(2024, 6, 1, 12, 0, tzinfo=timezone.utc)
+APPS = ['VS Code', 'Chrome', 'Terminal', 'Slack']
+
+
+def fill(repo, args):
+    encoder = HistoryEncoder()
+    code = [f"line_{n} = compute({n})" for n in range(args.code_lines)]
+    for u in range(args.users):
+        user_id = f"student_{u:04d}"
+        history = []
+        for s in range(args.sessions):
+            started = NOW - timedelta(days=args.sessions - s)
+            for n in range(args.rows):
+                code[(u + n) % len(code)] = f"line_{n} = edited({u}, {s}, {n})"
+                doc_id = f"{s:03d}-{n:05d}"
+                entry = {'timestamp': started + timedelta(seconds=5 * n), 'ai_score': (u + n) % 100,
+                         'code': '\n'.join(code), 'forensic': {'activeApp': APPS[n % 4]}}
+                history.append((doc_id, encoder.encode(user_id, doc_id, entry)))
+        repo.write_heartbeat(user_id, {'environment': f"ENV{u % 10}", 'ai': u % 100}, history=history)
+
+
+class Counting(SQLiteRepository):
+    """Counts the documents a Firestore read of the same pages would bill."""
+
+    reads = 0
+
+    def hot_history_page(self, user_id, **params):
+        page = super().hot_history_page(user_id, **params)
+        self.reads += max(1, len(page['data']) + page['has_more'])
+        return page
+
+    def get_history_many(self, user_id, doc_ids):
+        found = super().get_history_many(user_id, doc_ids)
+        self.reads += len(found)
+        return found
+
+    def history_archives(self, user_id):
+        metas = super().history_archives(user_id)
+        self.reads += max(1, len(metas))
+        return metas
+
+    def read_history_archive(self, user_id, archive_id):
+        self.reads += 1
+        return super().read_history_archive(user_id, archive_id)
+
+
+def playback_pass(repo, args):
+    repo.reads = 0
+    latencies = []
+    for u in range(args.users):
+        cursor = None
+        while True:
+            started = time.perf_counter()
+            page = repo.history_page(f"student_{u:04d}", limit=args.limit, cursor=cursor)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if not page['has_more']:
+                break
+            cursor = playback.decode_cursor(page['next_cursor'])
+    return latencies, repo.reads
+
+
+def stored(repo):
+    hot = repo.conn.execute('SELECT count(*) FROM history').fetchone()[0]
+    archives = repo.conn.execute('SELECT count(*), coalesce(sum(bytes), 0) FROM history_archive').fetchone()
+    return hot, archives[0], archives[1]
+
+
+def report(label, latencies, reads, docs):
+    print(f"{label:<14}{docs:>9}{reads:>10}{len(latencies):>8}{statistics.median(latencies):>10.2f}"
+          f"{sorted(latencies)[int(len(latencies) * 0.95)]:>10.2f}{sum(latencies) / 1000:>9.2f}")
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        repo = Counting(os.path.join(workdir, 'telemetry.sqlite3'))
+        started = time.perf_counter()
+        fill(repo, args)
+        print(f"filled {args.users} users x {args.sessions} sessions x {args.rows} rows "
+              f"in {time.perf_counter() - started:.1f}s")
+
+        print(f"{'tier':<14}{'docs':>9}{'reads':>10}{'pages':>8}{'p50 ms':>10}{'p95 ms':>10}{'total s':>9}")
+        latencies, reads = playback_pass(repo, args)
+        report('hot', latencies, reads, stored(repo)[0])
+
+        cache = tiers.ColdCache(index_ttl=3600)
+        tiers._cache = cache
+        started = time.perf_counter()
+        compaction = tiers.Compactor(repo, cache=cache, sleep=lambda seconds: None).run(now=NOW)
+        hot, archives, size = stored(repo)
+        print(f"compacted {compaction['documents']} documents into {archives} archives ({size / 1e6:.1f} MB) "
+              f"in {time.perf_counter() - started:.1f}s, {hot} left hot")
+
+        tiers._cache = cache = tiers.ColdCache(index_ttl=3600)
+        latencies, reads = playback_pass(repo, args)
+        report('cold (first)', latencies, reads, hot + archives)
+        latencies, reads = playback_pass(repo, args)
+        report('cold (warm)', latencies, reads, hot + archives)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--sessions', type=int, default=10)
+    parser.add_argument('--rows', type=int, default=300)
+    parser.add_argument('--code-lines', type=int, default=80)
+    parser.add_argument('--limit', type=int, default=playback.DEFAULT_LIMIT)
+    main(parser.parse_args())
@@ -0,0 +1,133 @@
+"""
+The Users tab at scale: the old list-users response vs keyset pages
+(dashboard/userlist.py).
+
+Inserts --students AuthorizedID rows (a tenth revoked, created a second
+apart) into the database at --database-url, migrated first, then times:
+
+- full-list:  the old response, every row ordered by created_at, as JSON;
+- first:      the first page;
+- deep:       a page from the middle, via the cursor of the page before it;
+- revoked:    the first page of ?active=false;
+- prefix:     the first page of ?q=<an ID prefix>;
+- counts:     count-users, unfiltered and filtered;
+
+each with the list indexes in place, and the page queries once more with
+them dropped. SQLite by default; for Postgres point it at a scratch
+database. Benchmark rows are deleted afterwards.
+
+    python benchmarks/bench_userlist.py --students 100000
+    python benchmarks/bench_userlist.py --database-url postgres://localhost/xscout_bench
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PREFIX = 'bench-'
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000, result
+
+
+def populate(AuthorizedID, students):
+    t0 = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    AuthorizedID.objects.filter(student_id__startswith=PREFIX).delete()
+    AuthorizedID.objects.bulk_create(
+        (AuthorizedID(student_id=f'{PREFIX}{n:07d}', description=f'Student {n} - Lab {n % 40}',
+                      is_active=n % 10 != 0) for n in range(students)),
+        batch_size=5000)
+    # auto_now_add stamps every row with now; spread them out like real sign-ups
+    for start in range(0, students, 5000):
+        ids = [f'{PREFIX}{n:07d}' for n in range(start, min(start + 5000, students))]
+        rows = AuthorizedID.objects.filter(student_id__in=ids).only('id', 'student_id')
+        for row in rows:
+            row.created_at = t0 + timedelta(seconds=int(row.student_id[len(PREFIX):]))
+        AuthorizedID.objects.bulk_update(rows, ['created_at'], batch_size=1000)
+
+
+def page_queries(AuthorizedID, userlist, args):
+    queryset = AuthorizedID.objects.all()
+    middle = userlist.fetch_page(queryset, limit=args.students // 2)
+    cursor = userlist.playback.decode_cursor(middle['next_cursor'])
+    return {
+        'first': lambda: userlist.fetch_page(queryset, limit=args.limit),
+        'deep': lambda: userlist.fetch_page(queryset, limit=args.limit, cursor=cursor),
+        'revoked': lambda: userlist.fetch_page(queryset, limit=args.limit, active=False),
+        'prefix': lambda: userlist.fetch_page(queryset, limit=args.limit, q=f'{PREFIX}00123'),
+        'counts': lambda: (userlist.counts(queryset), userlist.counts(queryset, active=False)),
+    }
+
+
+def main(args):
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        scratch = tempfile.mkdtemp()
+        os.environ['DATABASE_URL'] = f'sqlite:///{scratch}/bench.sqlite3'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dashboard.settings')
+
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from django.core.serializers.json import DjangoJSONEncoder
+    from django.db import connection
+    import json
+
+    from authentication.models import AuthorizedID
+    from dashboard import userlist
+
+    call_command('migrate', 'authentication', verbosity=0)
+    started = time.perf_counter()
+    populate(AuthorizedID, args.students)
+    print(f"{connection.vendor}: {args.students} IDs inserted in {time.perf_counter() - started:.1f}s")
+
+    def full_list():
+        users = AuthorizedID.objects.all().order_by('-created_at').values(
+            'student_id', 'description', 'is_active', 'created_at')
+        return json.dumps({'success': True, 'users': list(users)}, cls=DjangoJSONEncoder)
+
+    try:
+        print(f"{'query':<12}{'indexed ms':>12}{'no index ms':>13}{'rows':>8}{'bytes':>11}")
+        ms, body = timed(full_list, args.repeat)
+        print(f"{'full-list':<12}{ms:>12.1f}{'':>13}{args.students:>8}{len(body):>11}")
+
+        queries = page_queries(AuthorizedID, userlist, args)
+        indexed = {name: timed(fn, args.repeat) for name, fn in queries.items()}
+        with connection.schema_editor() as editor:
+            for index in AuthorizedID._meta.indexes:
+                editor.remove_index(AuthorizedID, index)
+        try:
+            unindexed = {name: timed(fn, args.repeat)[0] for name, fn in queries.items()}
+        finally:
+            with connection.schema_editor() as editor:
+                for index in AuthorizedID._meta.indexes:
+                    editor.add_index(AuthorizedID, index)
+
+        for name, (ms, result) in indexed.items():
+            rows = len(result['users']) if isinstance(result, dict) else ''
+            body = json.dumps(result, cls=DjangoJSONEncoder)
+            print(f"{name:<12}{ms:>12.1f}{unindexed[name]:>13.1f}{rows:>8}{len(body):>11}")
+    finally:
+        AuthorizedID.objects.filter(student_id__startswith=PREFIX).delete()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=100000)
+    parser.add_argument('--limit', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--database-url', help='defaults to a throwaway SQLite file')
+    main(parser.parse_args())
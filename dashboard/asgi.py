@@ -3,6 +3,9 @@ ASGI config for dashboard project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+This is the production entry point (see Procfile): besides the regular views it
+keeps the /api/live/ Server-Sent Events streams open (dashboard/live.py).
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 """
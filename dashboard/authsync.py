@@ -0,0 +1,455 @@
+"""
+Two-way sync between the AuthorizedID table and the authorized-ID records
+in storage.
+
+Both sides used to be written by whichever view touched an ID, with storage
+failures swallowed, so they drifted. Now every row and every record carries
+the time it last changed (AuthorizedID.updated_at and the record's
+'updatedAt' / 'updated_at'), and this engine moves changes across:
+
+- push: saving or deleting an AuthorizedID queues its ID in a durable
+  outbox (AuthorizedIDOutbox, filled by authentication/signals.py).
+  Queued IDs are written to storage as the row now stands, or deleted
+  there, in batched writes (repository.merge_authorized_many()) shortly
+  after the change commits. A failed write stays queued and is retried
+  with exponential backoff, across restarts;
+- pull: records whose timestamp is at or after the last checkpoint (less
+  CHECKPOINT_OVERLAP, for writers whose clock or commit lags) are read with
+  one query (repository.stream_authorized_since()) and applied to the
+  table without queueing them again. The newer side wins; a record equal
+  to the row, such as one just pushed, is skipped;
+- reconcile(): on demand only (`manage.py sync_authorized --full`), reads
+  both sides in full, pushes or pulls whatever differs and resets the
+  checkpoint. It is also how records deleted in storage, which no query
+  can return, get noticed: they are pushed again.
+
+Each process runs push and pull on a daemon thread every
+XSCOUT_AUTH_SYNC_INTERVAL seconds, woken at once by a local change, so
+requests never wait on storage or scan either side.
+
+Records are shaped like each project writes them: 'camel' (studentId,
+isActive, authorizedAt, updatedAt as timestamps) or 'snake' (student_id,
+is_active, created_at, updated_at as ISO strings).
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+STYLES = {
+    'camel': {'id': 'studentId', 'active': 'isActive', 'created': 'authorizedAt', 'updated': 'updatedAt'},
+    'snake': {'id': 'student_id', 'active': 'is_active', 'created': 'created_at', 'updated': 'updated_at'},
+}
+CHECKPOINT = 'authorized-pull'
+CHECKPOINT_OVERLAP = timedelta(seconds=60)
+# Outbox entries written per push
+MAX_PUSH = 5000
+RETRY_BASE = 5.0
+RETRY_MAX = 900.0
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def parse_time(value):
+    """A record's timestamp (a datetime, or the ISO string snake records and the SQLite store hold) as a UTC datetime."""
+    if value is None or isinstance(value, datetime):
+        return value
+    from django.utils.dateparse import parse_datetime
+
+    try:
+        return parse_datetime(str(value))
+    except ValueError:
+        return None
+
+
+def record_time(style, moment):
+    """How a record of this style stores a timestamp."""
+    if style == 'snake':
+        return moment.astimezone(timezone.utc).isoformat(timespec='microseconds')
+    return moment
+
+
+def make_record(style, student_id, active, description, created_at, updated_at, extra=None):
+    """The whole storage record for an ID."""
+    fields = STYLES[style]
+    record = dict(extra or {})
+    record.update({
+        fields['id']: student_id,
+        'description': description,
+        fields['active']: active,
+        fields['created']: record_time(style, created_at),
+        fields['updated']: record_time(style, updated_at),
+    })
+    return record
+
+
+def stamp(style, fields, moment):
+    """`fields` with the record timestamp, for writers that merge part of a record."""
+    return dict(fields, **{STYLES[style]['updated']: record_time(style, moment)})
+
+
+class AuthorizedSync:
+    def __init__(self, local, get_repository, record_style='camel', workers=8, interval=60.0, clock=None):
+        # local: the table and outbox, see DjangoLocal for what it provides
+        self.local = local
+        self.get_repository = get_repository
+        self.record_style = record_style
+        self.fields = STYLES[record_style]
+        self.workers = workers
+        self.interval = interval
+        self._clock = clock or (lambda: datetime.now(timezone.utc))
+
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._counters = {'pushed': 0, 'deleted': 0, 'pulled': 0, 'push_failures': 0, 'pull_failures': 0}
+        self._last = {'push': None, 'pull': None, 'error': None}
+
+    def _remote(self, record):
+        return (bool(record.get(self.fields['active'], True)), record.get('description') or '',
+                parse_time(record.get(self.fields['updated'])))
+
+    # -- push --
+
+    def enqueue(self, student_ids, extra=None):
+        """Queue IDs for the next push; `extra` fields are merged into their records then."""
+        self.local.enqueue(list(student_ids), self._clock(), extra)
+
+    def push(self):
+        """Write the due outbox entries to storage. Returns (written, deleted), or raises after rescheduling them."""
+        started = self._clock()
+        due = self.local.due(started, MAX_PUSH)
+        if not due:
+            return 0, 0
+        ids = [student_id for student_id, _, _ in due]
+        rows = self.local.rows(ids)
+        records, deletes = [], []
+        for student_id, extra, _ in due:
+            row = rows.get(student_id)
+            if row is None:
+                deletes.append(student_id)
+            else:
+                records.append((student_id, make_record(self.record_style, student_id, *row, extra=extra)))
+        try:
+            repository = self.get_repository()
+            if records:
+                repository.merge_authorized_many(records, workers=self.workers)
+            if deletes:
+                repository.delete_authorized_many(deletes)
+        except Exception as e:
+            retries = {student_id: started + timedelta(seconds=min(RETRY_BASE * 2 ** attempts, RETRY_MAX))
+                       for student_id, _, attempts in due}
+            self.local.failed(retries, str(e))
+            with self._lock:
+                self._counters['push_failures'] += 1
+                self._last['error'] = str(e)
+            raise
+        # Entries queued again while this push ran stay for the next one
+        self.local.done(ids, started)
+        with self._lock:
+            self._counters['pushed'] += len(records)
+            self._counters['deleted'] += len(deletes)
+            self._last['push'] = started.isoformat()
+        return len(records), len(deletes)
+
+    # -- pull --
+
+    def _apply(self, remote, rows):
+        """[(student_id, is_active, description, updated_at)] for records newer than, and different from, their rows."""
+        changes = []
+        for student_id, record in remote.items():
+            active, description, updated = self._remote(record)
+            row = rows.get(student_id)
+            if row is not None:
+                if (active, description) == (row[0], row[1]):
+                    continue
+                # Without a timestamp the record is older than any row
+                if updated is None or updated <= row[3]:
+                    continue
+            changes.append((student_id, active, description, updated))
+        return changes
+
+    def pull(self):
+        """Apply the storage records changed since the checkpoint. Returns the IDs changed locally."""
+        checkpoint = parse_time(self.local.checkpoint(CHECKPOINT))
+        since = max(checkpoint - CHECKPOINT_OVERLAP, EPOCH) if checkpoint else EPOCH
+        remote = {doc.id: doc.to_dict() for doc in self.get_repository().stream_authorized_since(
+            self.fields['updated'], record_time(self.record_style, since))}
+        changes = self._apply(remote, self.local.rows(list(remote)))
+        if changes:
+            self.local.apply(changes)
+        newest = max((self._remote(record)[2] for record in remote.values()), default=None, key=lambda t: t or EPOCH)
+        if newest is not None and (checkpoint is None or newest > checkpoint):
+            self.local.set_checkpoint(CHECKPOINT, newest.isoformat())
+        with self._lock:
+            self._counters['pulled'] += len(changes)
+            self._last['pull'] = self._clock().isoformat()
+        return [student_id for student_id, _, _, _ in changes]
+
+    # -- full reconciliation --
+
+    def reconcile(self, dry_run=False):
+        """Compare both sides in full and bring them together. Returns a report."""
+        started = time.perf_counter()
+        remote = {doc.id: doc.to_dict() for doc in self.get_repository().stream_authorized()}
+        rows = self.local.rows()
+        pulls = self._apply(remote, rows)
+        pulled = {student_id for student_id, _, _, _ in pulls}
+        pushes, in_sync = [], 0
+        for student_id, row in rows.items():
+            record = remote.get(student_id)
+            if record is None:
+                pushes.append(student_id)
+            elif self._remote(record)[:2] == (row[0], row[1]):
+                in_sync += 1
+            elif student_id not in pulled:
+                pushes.append(student_id)
+        if not dry_run:
+            if pulls:
+                self.local.apply(pulls)
+            if pushes:
+                self.enqueue(pushes)
+                while sum(self.push()):
+                    pass
+            newest = max((self._remote(record)[2] or EPOCH for record in remote.values()), default=None)
+            if newest is not None and newest > EPOCH:
+                self.local.set_checkpoint(CHECKPOINT, newest.isoformat())
+        return {
+            'dry_run': dry_run,
+            'local': len(rows),
+            'remote': len(remote),
+            'pushed': len(pushes),
+            'pulled': len(pulls),
+            'in_sync': in_sync,
+            'runtime': round(time.perf_counter() - started, 3),
+            'changed_ids': sorted(pulled | set(pushes)),
+        }
+
+    # -- background --
+
+    def run_once(self):
+        """Push, then pull. Returns the IDs the pull changed; errors are logged and counted."""
+        changed = []
+        with self._run_lock:
+            try:
+                # More than MAX_PUSH queued: keep going until the outbox has nothing due
+                while sum(self.push()):
+                    pass
+            except Exception as e:
+                logger.warning('Pushing authorized IDs failed, will retry: %s', e)
+            try:
+                changed = self.pull()
+            except Exception as e:
+                with self._lock:
+                    self._counters['pull_failures'] += 1
+                    self._last['error'] = str(e)
+                logger.warning('Pulling authorized IDs failed: %s', e)
+            finally:
+                self.local.close()
+        return changed
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='xscout-authsync', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            changed = self.run_once()
+            if changed:
+                from . import authorization
+
+                authorization.reload(changed)
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def push_soon(self):
+        """Wake the sync thread (starting it if needed) to push what was just queued."""
+        self.start()
+        self._wake.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+
+    def metrics(self):
+        with self._lock:
+            return dict(self._counters, last_push=self._last['push'], last_pull=self._last['pull'],
+                        last_error=self._last['error'])
+
+
+class DjangoLocal:
+    """The AuthorizedID table, outbox and checkpoints, for AuthorizedSync."""
+
+    def rows(self, student_ids=None):
+        """{student_id: (is_active, description, created_at, updated_at)}, for these IDs or all."""
+        from authentication.models import AuthorizedID
+
+        rows = AuthorizedID.objects.all()
+        if student_ids is not None:
+            rows = rows.filter(student_id__in=student_ids)
+        return {student_id: (active, description, created_at, updated_at)
+                for student_id, active, description, created_at, updated_at
+                in rows.values_list('student_id', 'is_active', 'description', 'created_at', 'updated_at')}
+
+    def apply(self, changes):
+        """Write pulled [(student_id, is_active, description, updated_at or None)] without queueing them."""
+        from django.db import transaction
+
+        from authentication.models import AuthorizedID
+
+        # Bulk writes send no signals, so nothing lands in the outbox
+        with transaction.atomic():
+            existing = dict(AuthorizedID.objects.filter(student_id__in=[change[0] for change in changes])
+                            .values_list('student_id', 'pk'))
+            now = datetime.now(timezone.utc)
+            AuthorizedID.objects.bulk_create([
+                AuthorizedID(student_id=student_id, is_active=active, description=description)
+                for student_id, active, description, _ in changes if student_id not in existing])
+            AuthorizedID.objects.bulk_update([
+                AuthorizedID(pk=existing[student_id], is_active=active, description=description,
+                             updated_at=updated or now)
+                for student_id, active, description, updated in changes if student_id in existing],
+                ['is_active', 'description', 'updated_at'], batch_size=500)
+
+    def enqueue(self, student_ids, now, extra=None):
+        from authentication.models import AuthorizedIDOutbox
+
+        if extra:
+            for student_id in student_ids:
+                entry, _ = AuthorizedIDOutbox.objects.get_or_create(
+                    student_id=student_id, defaults={'queued_at': now, 'next_attempt_at': now})
+                entry.extra = dict(entry.extra, **extra)
+                entry.queued_at = entry.next_attempt_at = now
+                entry.attempts = 0
+                entry.save()
+            return
+        AuthorizedIDOutbox.objects.bulk_create(
+            [AuthorizedIDOutbox(student_id=student_id, queued_at=now, next_attempt_at=now)
+             for student_id in student_ids],
+            update_conflicts=True, unique_fields=['student_id'],
+            update_fields=['queued_at', 'next_attempt_at', 'attempts'], batch_size=500)
+
+    def due(self, now, limit):
+        """[(student_id, extra, attempts)] of the entries due by `now`, oldest first."""
+        from authentication.models import AuthorizedIDOutbox
+
+        return list(AuthorizedIDOutbox.objects.filter(next_attempt_at__lte=now).order_by('queued_at')
+                    .values_list('student_id', 'extra', 'attempts')[:limit])
+
+    def done(self, student_ids, before):
+        from authentication.models import AuthorizedIDOutbox
+
+        AuthorizedIDOutbox.objects.filter(student_id__in=student_ids, queued_at__lte=before).delete()
+
+    def failed(self, retries, error):
+        """Reschedule entries: `retries` maps each ID to its next attempt."""
+        from django.db import transaction
+        from django.db.models import F
+
+        from authentication.models import AuthorizedIDOutbox
+
+        with transaction.atomic():
+            for student_id, next_attempt in retries.items():
+                AuthorizedIDOutbox.objects.filter(student_id=student_id).update(
+                    attempts=F('attempts') + 1, next_attempt_at=next_attempt, last_error=error[:1000])
+
+    def pending(self):
+        from authentication.models import AuthorizedIDOutbox
+
+        return AuthorizedIDOutbox.objects.count()
+
+    def checkpoint(self, name):
+        from authentication.models import SyncCheckpoint
+
+        return SyncCheckpoint.objects.filter(name=name).values_list('value', flat=True).first()
+
+    def set_checkpoint(self, name, value):
+        from authentication.models import SyncCheckpoint
+
+        SyncCheckpoint.objects.update_or_create(name=name, defaults={'value': value})
+
+    def close(self):
+        from django.db import connection
+
+        # The sync thread runs between requests: don't hold a connection between runs
+        connection.close()
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine(record_style=None):
+    """The process-wide AuthorizedSync, shaped by XSCOUT_AUTHORIZED_RECORD_STYLE."""
+    global _engine
+    if _engine is None:
+        from django.conf import settings
+
+        from . import storage
+        with _engine_lock:
+            if _engine is None:
+                _engine = AuthorizedSync(
+                    DjangoLocal(), storage.get_repository,
+                    record_style=getattr(settings, 'XSCOUT_AUTHORIZED_RECORD_STYLE', 'camel'),
+                    workers=getattr(settings, 'XSCOUT_ROSTER_WORKERS', 8),
+                    interval=getattr(settings, 'XSCOUT_AUTH_SYNC_INTERVAL', 60.0),
+                )
+    return _engine
+
+
+def sync_now():
+    """Push everything due, then pull, in this process (`manage.py sync_authorized`). Returns a report."""
+    engine = get_engine()
+    started = time.perf_counter()
+    pushed = deleted = 0
+    while True:
+        written, removed = engine.push()
+        if not written + removed:
+            break
+        pushed += written
+        deleted += removed
+    pulled = engine.pull()
+    return {'pushed': pushed, 'deleted': deleted, 'pulled': len(pulled), 'pending': engine.local.pending(),
+            'runtime': round(time.perf_counter() - started, 3), 'changed_ids': pulled}
+
+
+def describe(report):
+    """One-line summary of sync_now() or reconcile()."""
+    if 'remote' in report:
+        return (f"{'Would reconcile' if report['dry_run'] else 'Reconciled'} {report['local']} local IDs with "
+                f"{report['remote']} storage records in {report['runtime']:.1f}s: {report['pushed']} pushed, "
+                f"{report['pulled']} pulled, {report['in_sync']} already in step.")
+    return (f"Pushed {report['pushed']} records and {report['deleted']} deletions, pulled {report['pulled']} changes "
+            f"in {report['runtime']:.1f}s; {report['pending']} IDs still queued.")
+
+
+def enqueue(student_ids, extra=None):
+    get_engine().enqueue(student_ids, extra)
+
+
+def push_soon():
+    get_engine().push_soon()
+
+
+def start():
+    """Start this process's sync thread (gunicorn does, as each worker boots)."""
+    get_engine().start()
+
+
+def status():
+    """For the user list: IDs waiting to be written to storage and when the last push and pull ran."""
+    engine = get_engine()
+    return dict(engine.metrics(), pending=engine.local.pending())
+
+
+def metrics():
+    if _engine is None:
+        return None
+    return _engine.metrics()
@@ -0,0 +1,300 @@
+"""
+Change index behind GET /api/telemetry/?since=<watermark>.
+
+A polling dashboard only needs what changed since its last poll. The index
+notes when each student record's content last changed (clock fields
+ignored, see ingest.VOLATILE_FIELDS) and keeps a tombstone when a student
+is removed. A poll with a watermark gets back only the records and
+tombstones noted after it, plus the next watermark:
+
+    {"status": "success", "data": [...], "removed": [ids], "touched": [...], "watermark": "...", "reset": false}
+
+A student whose heartbeats only move the clock is not in "data". Their
+liveness fields ('timestamp', 'lastSeen') are sent in "touched" as
+{"id", "timestamp", "lastSeen"}, at most every liveness_interval seconds,
+which is the cadence the coalescer refreshes them in storage
+(XSCOUT_LAST_SEEN_INTERVAL). An idle class answers with a few ids, without
+touching Firestore.
+
+Records come in three ways. The ingest POST path records what it just
+wrote. At most every XSCOUT_CHANGE_INDEX_REFRESH seconds a delta poll
+refreshes the index with the students whose content changed since the
+previous refresh (a query on 'changedAt', which full writes stamp and
+liveness touches don't, see storage.stream_latest_changed), so an idle
+class costs one query and no document reads. At most every
+XSCOUT_CHANGE_INDEX_RECONCILE seconds it reconciles the index against the
+full latest state (through the latest-state cache) instead, which picks up
+deletes and liveness written by other workers.
+
+Each worker keeps its own index, but watermarks are wall-clock times
+('<ms>-<worker>'), so any worker can answer any of them. A worker's records
+can trail storage by at most `lag` seconds (refresh interval plus clock
+skew), its touches and tombstones by `full_lag` (reconcile interval plus
+cache TTL plus clock skew), so for another worker's watermark the answer
+starts that much earlier: a few records may be sent twice, none are
+missed. Only a watermark older than this worker's first reconcile, older
+than the oldest tombstone still kept (XSCOUT_CHANGE_INDEX_TOMBSTONES) or
+from the future gets the full list with "reset": true, so the client
+replaces its list instead of merging into it.
+"""
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from .cache import resolve_server_timestamps
+from .ingest import LIVENESS_FIELDS, content_hash
+
+TIMESTAMP_FIELD = 'timestamp'
+# Allowed difference between two workers' clocks
+CLOCK_SKEW = 1.0
+WATERMARK = re.compile(r'^(\d+)-([0-9a-f]+)$')
+
+
+def _advanced(new, old):
+    """Whether `new` replaces `old`: a newer timestamp, or any change when they don't compare."""
+    new_ts, old_ts = new.get(TIMESTAMP_FIELD), old.get(TIMESTAMP_FIELD)
+    if new_ts is None or old_ts is None:
+        return new != old
+    try:
+        return new_ts > old_ts
+    except TypeError:
+        return new_ts != old_ts
+
+
+def _liveness(record):
+    return {field: record[field] for field in LIVENESS_FIELDS if field in record}
+
+
+class ChangeIndex:
+    def __init__(self, reconcile_interval=20.0, refresh_interval=3.0, max_tombstones=1000, liveness_interval=10.0,
+                 lag=None, full_lag=None, clock=time.time):
+        self.reconcile_interval = reconcile_interval
+        self.refresh_interval = refresh_interval
+        self.max_tombstones = max_tombstones
+        self.liveness_interval = liveness_interval
+        self.lag = min(refresh_interval, reconcile_interval) + CLOCK_SKEW if lag is None else lag
+        self.full_lag = max(self.lag, reconcile_interval + CLOCK_SKEW) if full_lag is None else full_lag
+        self.clock = clock
+        self.worker = secrets.token_hex(4)
+        self._lock = threading.Lock()
+        # Each in noted_at order: id -> [noted_at, record, digest,
+        # liveness sent], id -> [noted_at, liveness], id -> noted_at
+        self._records = OrderedDict()
+        self._touched = OrderedDict()
+        self._tombstones = OrderedDict()
+        # Watermarks before this may have missed a removal (the first
+        # reconcile, or the newest dropped tombstone)
+        self._horizon = None
+        # Recorded by ingest since the last reconcile: a scan may not show them yet
+        self._recent = set()
+        self._reconciled_at = None
+        # Where the next refresh query starts, and when the last one ran
+        self._changed_since = None
+        self._refreshed_at = None
+        self._counters = {'changes': 0, 'touches': 0, 'unchanged': 0, 'removals': 0,
+                          'full': 0, 'deltas': 0, 'resets': 0, 'reconciles': 0, 'refreshes': 0}
+
+    def watermark(self):
+        with self._lock:
+            return self._format(self.clock())
+
+    def parse(self, watermark):
+        """(seconds, worker) of a watermark. Raises ValueError."""
+        match = WATERMARK.match(watermark or '')
+        if match is None:
+            raise ValueError(f"Invalid watermark '{watermark}'")
+        return int(match.group(1)) / 1000, match.group(2)
+
+    def record(self, doc_id, data):
+        """Called by the ingest POST path after a heartbeat is written or queued."""
+        data = resolve_server_timestamps(data)
+        with self._lock:
+            self._note(doc_id, dict(data, id=doc_id), self.clock())
+            self._recent.add(doc_id)
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id, self.clock())
+
+    def reconcile(self, records):
+        """
+        Bring the index in line with the full latest state ([{..., 'id'}, ...]).
+        Records whose content changed are noted again; students that are gone
+        get a tombstone, unless this process recorded them since the last
+        reconcile (their write may not be visible yet).
+        """
+        with self._lock:
+            now = self.clock()
+            seen = set()
+            for record in records:
+                doc_id = record['id']
+                seen.add(doc_id)
+                current = self._records.get(doc_id)
+                if current is None or _advanced(record, current[1]):
+                    self._note(doc_id, record, now)
+            for doc_id in [doc_id for doc_id in self._records if doc_id not in seen]:
+                if doc_id not in self._recent:
+                    self._remove(doc_id, now)
+            self._recent.clear()
+            if self._reconciled_at is None:
+                self._horizon = now
+                # The scan may have come from a cache up to full_lag old
+                self._changed_since = now - self.full_lag
+            self._reconciled_at = time.monotonic()
+            self._counters['reconciles'] += 1
+
+    def refresh(self, changed):
+        """
+        Note the records whose content changed since the previous refresh.
+        changed(since) -> [{..., 'id'}, ...] is the (blocking) query for
+        records written at or after `since` seconds. Nothing is removed:
+        deletes only show up at a full reconcile.
+        """
+        with self._lock:
+            started = self.clock()
+            since = started - self.full_lag if self._changed_since is None else self._changed_since
+        records = changed(since - CLOCK_SKEW)
+        with self._lock:
+            now = self.clock()
+            for record in records:
+                current = self._records.get(record['id'])
+                if current is None or _advanced(record, current[1]):
+                    self._note(record['id'], record, now)
+            self._changed_since = started
+            self._refreshed_at = time.monotonic()
+            self._counters['refreshes'] += 1
+
+    def changes(self, watermark, loader, changed=None):
+        """
+        Everything noted after `watermark` as {'data', 'removed', 'touched',
+        'watermark', 'reset'}; every record (reset) when `watermark` is None
+        or can't be served incrementally. loader() -> [record, ...] is the
+        (blocking) latest-state read, called for full answers and when a
+        reconcile is due; changed(since) is the query refresh() runs in
+        between. Raises ValueError for a malformed watermark.
+        """
+        since, worker = self.parse(watermark) if watermark is not None else (None, None)
+        if watermark is None or self._due(self._reconciled_at, self.reconcile_interval):
+            self.reconcile(loader())
+        elif changed is not None and self._due(self._refreshed_at, self.refresh_interval):
+            self.refresh(changed)
+
+        with self._lock:
+            now = self.clock()
+            full_since = since
+            if since is not None and worker != self.worker:
+                # Another worker may have missed what this one noted up
+                # to `lag` (touches and removals `full_lag`) ago
+                since -= self.lag
+                full_since -= self.full_lag
+            if since is None or full_since < self._horizon or since > now + CLOCK_SKEW:
+                self._counters['full' if watermark is None else 'resets'] += 1
+                # In document id order, like a Firestore scan
+                data = [self._records[doc_id][1] for doc_id in sorted(self._records)]
+                return {'data': data, 'removed': [], 'touched': [], 'watermark': self._format(now), 'reset': True}
+
+            data = self._after(self._records, since, lambda doc_id, entry: entry[1])
+            touched = self._after(self._touched, full_since, lambda doc_id, entry: dict(entry[1], id=doc_id))
+            changed = {record['id'] for record in data}
+            self._counters['deltas'] += 1
+            return {
+                'data': data,
+                'removed': self._after(self._tombstones, full_since, lambda doc_id, entry: doc_id),
+                # A record in 'data' already carries its liveness fields
+                'touched': [entry for entry in touched if entry['id'] not in changed],
+                'watermark': self._format(now),
+                'reset': False,
+            }
+
+    def metrics(self):
+        with self._lock:
+            data = dict(self._counters)
+            data['records'] = len(self._records)
+            data['tombstones'] = len(self._tombstones)
+            data['watermark'] = self._format(self.clock())
+        return data
+
+    def _due(self, last, interval):
+        with self._lock:
+            return last is None or time.monotonic() - last >= interval
+
+    def _format(self, seconds):
+        return f'{int(seconds * 1000)}-{self.worker}'
+
+    @staticmethod
+    def _after(entries, since, value):
+        found = []
+        for doc_id, entry in reversed(entries.items()):
+            noted_at = entry[0] if isinstance(entry, list) else entry
+            if noted_at <= since:
+                break
+            found.append(value(doc_id, entry))
+        return found[::-1]
+
+    def _note(self, doc_id, record, now):
+        digest = content_hash(record)
+        current = self._records.get(doc_id)
+        self._tombstones.pop(doc_id, None)
+        if current is None or current[2] != digest:
+            self._records[doc_id] = [now, record, digest, _liveness(record)]
+            self._records.move_to_end(doc_id)
+            self._touched.pop(doc_id, None)
+            self._counters['changes'] += 1
+            return
+
+        # Same content: keep the newest copy for full answers, pass
+        # the clock on at the storage cadence
+        current[1] = record
+        liveness = _liveness(record)
+        touched = self._touched.get(doc_id)
+        last = touched[0] if touched is not None else current[0]
+        if liveness != current[3] and now - last >= self.liveness_interval:
+            current[3] = liveness
+            self._touched[doc_id] = [now, liveness]
+            self._touched.move_to_end(doc_id)
+            self._counters['touches'] += 1
+        else:
+            self._counters['unchanged'] += 1
+
+    def _remove(self, doc_id, now):
+        if self._records.pop(doc_id, None) is None:
+            return
+        self._touched.pop(doc_id, None)
+        self._tombstones[doc_id] = now
+        self._counters['removals'] += 1
+        while len(self._tombstones) > self.max_tombstones:
+            _, dropped = self._tombstones.popitem(last=False)
+            self._horizon = max(self._horizon or dropped, dropped)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(namespace='latest'):
+    """Process-wide ChangeIndex, or None when XSCOUT_CHANGE_INDEX is off."""
+    from django.conf import settings
+
+    if not getattr(settings, 'XSCOUT_CHANGE_INDEX', True):
+        return None
+    with _indexes_lock:
+        if namespace not in _indexes:
+            reconcile_interval = getattr(settings, 'XSCOUT_CHANGE_INDEX_RECONCILE', 20.0)
+            refresh_interval = getattr(settings, 'XSCOUT_CHANGE_INDEX_REFRESH', 3.0)
+            cache_ttl = getattr(settings, 'XSCOUT_LATEST_STATE_CACHE_TTL', 5.0)
+            _indexes[namespace] = ChangeIndex(
+                reconcile_interval=reconcile_interval,
+                refresh_interval=refresh_interval,
+                max_tombstones=getattr(settings, 'XSCOUT_CHANGE_INDEX_TOMBSTONES', 1000),
+                liveness_interval=getattr(settings, 'XSCOUT_LAST_SEEN_INTERVAL', 10.0),
+                lag=refresh_interval + CLOCK_SKEW,
+                full_lag=reconcile_interval + cache_ttl + CLOCK_SKEW,
+            )
+        return _indexes[namespace]
+
+
+def metrics():
+    with _indexes_lock:
+        return {namespace: index.metrics() for namespace, index in _indexes.items()}
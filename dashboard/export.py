@@ -0,0 +1,220 @@
+"""
+CSV export engine behind GET /api/export-logs/.
+
+The export used to write the latest state of every student into one
+in-memory HttpResponse. It now streams, and can export history:
+
+- scope: 'latest' (one row per student, the default) or 'history' (one row
+  per history entry);
+- environment: only students whose latest state carries this environment;
+- users: comma-separated student ids;
+- start / end: ISO 8601 time or epoch milliseconds, both inclusive, on the
+  history entries' timestamp (scope=history only);
+- compress: 'gzip' for a .csv.gz download.
+
+A history export fans out over a thread pool (XSCOUT_EXPORT_WORKERS), one
+task per student paging through that student's history subcollection.
+Pages go through a bounded queue, so rows are written as they arrive (pages
+of different students interleave) and memory stays flat however large the
+export is. Closing the response stops the workers after their current page.
+
+Rows are written in streaming.CHUNK_SIZE pieces. A failure half-way through
+ends the file with an '__error__' row, like the JSON exports.
+"""
+import csv
+import io
+import queue
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from . import playback
+from .streaming import chunked
+
+SCOPES = ('latest', 'history')
+COLUMNS = ['User ID', 'Timestamp', 'App', 'Window Title', 'AI Risk Score', 'WPM']
+# Top-level history fields the rows are built from
+FIELDS = ['timestamp', 'ai', 'ai_score', 'forensic', 'behavior']
+# Pages waiting to be written; workers block once it is full
+MAX_QUEUED_PAGES = 64
+
+
+def parse_params(params):
+    """Validated Exporter.csv() kwargs, plus 'compress', from request.GET. Raises ValueError."""
+    scope = params.get('scope') or 'latest'
+    if scope not in SCOPES:
+        raise ValueError(f"scope must be one of {', '.join(SCOPES)}")
+    compress = params.get('compress') or None
+    if compress not in (None, 'gzip'):
+        raise ValueError("compress must be 'gzip'")
+    users = params.get('users')
+    start = playback.parse_time(params['start']) if params.get('start') else None
+    end = playback.parse_time(params['end']) if params.get('end') else None
+    if scope == 'latest' and (start or end):
+        raise ValueError('start and end need scope=history')
+    return {
+        'scope': scope,
+        'environment': params.get('environment') or None,
+        'users': sorted({u.strip() for u in users.split(',') if u.strip()}) if users else None,
+        'start': start,
+        'end': end,
+        'compress': compress,
+    }
+
+
+def _text(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def row(user_id, data):
+    forensic = data.get('forensic') or {}
+    behavior = data.get('behavior') or {}
+    return [
+        user_id,
+        _text(data.get('timestamp', 'N/A')),
+        forensic.get('activeApp', 'N/A'),
+        forensic.get('activeWindow', 'N/A'),
+        data.get('ai', data.get('ai_score', 0)),
+        behavior.get('wpm', 0),
+    ]
+
+
+class Exporter:
+    def __init__(self, repository, workers=8, page_size=playback.MAX_LIMIT, iso_timestamps=False, progress=None):
+        self.repository = repository
+        self.workers = workers
+        self.page_size = page_size
+        # Passed to history_page(): the AdminDashboard stores timestamps as ISO strings
+        self.iso_timestamps = iso_timestamps
+        # progress(done, total) after each student, total None when not known up front
+        self.progress = progress
+
+    def _report(self, done, total):
+        if self.progress is not None:
+            self.progress(done, total)
+
+    def user_ids(self, environment=None, users=None):
+        """Students to export: `users`, narrowed to `environment` when both are given."""
+        if environment is not None:
+            ids = {doc.id for doc in self.repository.stream_environment(environment)}
+            return sorted(ids & set(users) if users is not None else ids)
+        if users is not None:
+            return list(users)
+        return [doc.id for doc in self.repository.stream_latest(fields=[])]
+
+    def latest_pages(self, environment=None, users=None):
+        if environment is not None:
+            docs = self.repository.stream_environment(environment)
+        elif users is not None:
+            found = self.repository.get_latest_many(users)
+            yield [row(user_id, found[user_id]) for user_id in users if user_id in found]
+            return
+        else:
+            docs = self.repository.stream_latest()
+        wanted = set(users) if users is not None else None
+        for done, doc in enumerate(docs, start=1):
+            if wanted is None or doc.id in wanted:
+                yield [row(doc.id, doc.to_dict())]
+            self._report(done, None)
+
+    def history_pages(self, user_ids, start=None, end=None):
+        """Lists of rows, one per history page, as the workers read them."""
+        pages = queue.Queue(maxsize=MAX_QUEUED_PAGES)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        def export_user(user_id):
+            error = None
+            try:
+                cursor = None
+                while not stop.is_set():
+                    page = self.repository.history_page(user_id, start=start, end=end, limit=self.page_size,
+                                                        cursor=cursor, fields=FIELDS,
+                                                        iso_timestamps=self.iso_timestamps)
+                    if page['data']:
+                        put([row(user_id, entry) for entry in page['data']])
+                    if not page['has_more']:
+                        break
+                    cursor = playback.decode_cursor(page['next_cursor'])
+            except Exception as e:
+                error = e
+            # A tuple marks the end of a student, row pages are lists
+            put((user_id, error))
+
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='xscout-export')
+        try:
+            for user_id in user_ids:
+                executor.submit(export_user, user_id)
+            remaining = len(user_ids)
+            while remaining:
+                item = pages.get()
+                if isinstance(item, tuple):
+                    remaining -= 1
+                    if item[1] is not None:
+                        raise item[1]
+                    self._report(len(user_ids) - remaining, len(user_ids))
+                else:
+                    yield item
+        finally:
+            stop.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def pages(self, scope='latest', environment=None, users=None, start=None, end=None):
+        if scope == 'latest':
+            return self.latest_pages(environment, users)
+        return self.history_pages(self.user_ids(environment, users), start, end)
+
+    def csv(self, scope='latest', environment=None, users=None, start=None, end=None):
+        """CSV text in chunks, header first."""
+        return write_csv(self.pages(scope, environment, users, start, end))
+
+
+def write_csv(pages):
+    """Pages of rows -> CSV text in chunks, header first."""
+    return chunked(_csv(pages))
+
+
+def _csv(pages):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    writer.writerow(COLUMNS)
+    yield flush()
+    try:
+        for rows in pages:
+            writer.writerows(rows)
+            yield flush()
+    except Exception as e:
+        writer.writerow(['__error__', str(e)])
+        yield flush()
+
+
+def gzipped(chunks):
+    """Text chunks -> gzip bytes, compressed as they stream."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def get_exporter(repository, iso_timestamps=False, progress=None):
+    """An Exporter over `repository` with XSCOUT_EXPORT_WORKERS threads."""
+    from django.conf import settings
+
+    return Exporter(repository, workers=getattr(settings, 'XSCOUT_EXPORT_WORKERS', 8), iso_timestamps=iso_timestamps,
+                    progress=progress)
@@ -0,0 +1,213 @@
+"""
+Delta-encoded snapshot history.
+
+Heartbeats are mostly the same snapshot with a few lines changed, so instead
+of a full copy per entry the history subcollection holds:
+
+- keyframes: the full entry, written every XSCOUT_HISTORY_KEYFRAME_INTERVAL
+  entries (and whenever a delta would not be meaningfully smaller);
+- deltas: a patch against the user's current keyframe. Multi-line strings
+  (the code snapshot) are stored as line-level replace ops, other fields only
+  when they differ from the keyframe.
+
+Deltas point at their keyframe by document id rather than at the previous
+entry, so entries written by different workers never break each other's
+chain. decode_entries() rebuilds full entries for the playback APIs.
+
+Everything is stored as Firestore-safe maps and arrays (no nested arrays).
+"""
+import copy
+import difflib
+import json
+import threading
+from collections import OrderedDict
+
+KEYFRAME = 'keyframe'
+DELTA = 'delta'
+
+# Always stored as-is on every entry so ordering, range queries and
+# lightweight projections never need the keyframe.
+INDEX_FIELDS = ('timestamp', 'ai', 'ai_score')
+META_FIELDS = ('encoding', 'keyframe', 'seq', 'patch')
+
+
+def _size(value):
+    return len(json.dumps(value, default=str))
+
+
+def diff_lines(old, new):
+    """Line-level replace ops turning old into new."""
+    a = old.split('\n')
+    b = new.split('\n')
+    ops = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if tag != 'equal':
+            ops.append({'start': i1, 'end': i2, 'lines': b[j1:j2]})
+    return ops
+
+
+def apply_lines(old, ops):
+    a = old.split('\n')
+    out = []
+    pos = 0
+    for op in ops:
+        start = op['start']
+        out.extend(a[pos:start])
+        out.extend(op['lines'])
+        pos = op['end']
+    out.extend(a[pos:])
+    return '\n'.join(out)
+
+
+def diff_doc(base, doc, path=()):
+    """Patch (list of ops) turning base into doc, ignoring INDEX_FIELDS at the top level."""
+    patch = []
+    for key, value in doc.items():
+        if not path and key in INDEX_FIELDS:
+            continue
+        key_path = list(path) + [key]
+        if key not in base:
+            patch.append({'op': 'set', 'path': key_path, 'value': value})
+            continue
+        old = base[key]
+        if old == value:
+            continue
+        if isinstance(old, dict) and isinstance(value, dict):
+            patch.extend(diff_doc(old, value, tuple(key_path)))
+        elif isinstance(old, str) and isinstance(value, str) and '\n' in old + value:
+            patch.append({'op': 'lines', 'path': key_path, 'ops': diff_lines(old, value)})
+        else:
+            patch.append({'op': 'set', 'path': key_path, 'value': value})
+    for key in base:
+        if key not in doc and (path or key not in INDEX_FIELDS):
+            patch.append({'op': 'unset', 'path': list(path) + [key]})
+    return patch
+
+
+def apply_patch(base, patch):
+    doc = copy.deepcopy(base)
+    for op in patch:
+        *parents, leaf = op['path']
+        node = doc
+        for key in parents:
+            node = node.setdefault(key, {})
+        if op['op'] == 'set':
+            node[leaf] = op['value']
+        elif op['op'] == 'unset':
+            node.pop(leaf, None)
+        elif op['op'] == 'lines':
+            node[leaf] = apply_lines(node.get(leaf) or '', op['ops'])
+    return doc
+
+
+class HistoryEncoder:
+    """
+    Per-process keyframe tracker. encode() returns what to store for a new
+    history document; the first entry a worker sees for a user is always a
+    keyframe.
+    """
+
+    def __init__(self, keyframe_interval=20, max_ratio=0.5, max_users=10000):
+        self.keyframe_interval = keyframe_interval
+        self.max_ratio = max_ratio
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._keyframes = OrderedDict()  # user -> (doc_id, entry, deltas_since)
+
+    def encode(self, user_id, doc_id, entry):
+        with self._lock:
+            current = self._keyframes.get(user_id)
+
+        if current is not None and current[2] + 1 < self.keyframe_interval:
+            keyframe_id, keyframe, since = current
+            patch = diff_doc(keyframe, entry)
+            if _size(patch) <= _size(entry) * self.max_ratio:
+                stored = {key: entry[key] for key in INDEX_FIELDS if key in entry}
+                stored.update({'encoding': DELTA, 'keyframe': keyframe_id, 'seq': since + 1, 'patch': patch})
+                with self._lock:
+                    self._keyframes[user_id] = (keyframe_id, keyframe, since + 1)
+                    self._keyframes.move_to_end(user_id)
+                return stored
+
+        with self._lock:
+            self._keyframes[user_id] = (doc_id, entry, 0)
+            self._keyframes.move_to_end(user_id)
+            while len(self._keyframes) > self.max_users:
+                self._keyframes.popitem(last=False)
+        return dict(entry, encoding=KEYFRAME, seq=0)
+
+    def forget(self, user_id):
+        with self._lock:
+            self._keyframes.pop(user_id, None)
+
+
+def decode_entries(entries, fetch_keyframes=None):
+    """
+    entries: [(doc_id, data), ...] in display order. Keyframes referenced by
+    deltas but not present in `entries` are loaded with
+    fetch_keyframes([doc_id, ...]) -> {doc_id: data}. Returns plain dicts in
+    the legacy full-entry shape; deltas whose keyframe is gone are returned
+    with only their index fields and 'missing_keyframe': True.
+    """
+    keyframes = {doc_id: data for doc_id, data in entries if data.get('encoding', KEYFRAME) == KEYFRAME}
+    wanted = {data['keyframe'] for _, data in entries
+              if data.get('encoding') == DELTA and data.get('keyframe') not in keyframes}
+    if wanted and fetch_keyframes is not None:
+        keyframes.update(fetch_keyframes(sorted(wanted)))
+
+    decoded = []
+    for doc_id, data in entries:
+        encoding = data.get('encoding', KEYFRAME)
+        if encoding == DELTA:
+            base = keyframes.get(data.get('keyframe'))
+            if base is None:
+                full = {key: data[key] for key in INDEX_FIELDS if key in data}
+                full['missing_keyframe'] = True
+            else:
+                full = apply_patch({k: v for k, v in base.items() if k not in META_FIELDS}, data.get('patch', []))
+                full.update({key: data[key] for key in INDEX_FIELDS if key in data})
+        else:
+            full = {k: v for k, v in data.items() if k not in META_FIELDS}
+        decoded.append(full)
+    return decoded
+
+
+def keyframe_refs(entries):
+    """Ids of the keyframes that the deltas among [(doc_id, data), ...] are stored against."""
+    return {data.get('keyframe') for _, data in entries if data.get('encoding') == DELTA}
+
+
+def firestore_keyframe_fetcher(db, history_ref):
+    """fetch_keyframes for decode_entries() backed by one batched get_all()."""
+    def fetch(doc_ids):
+        refs = [history_ref.document(doc_id) for doc_id in doc_ids]
+        return {snap.id: snap.to_dict() for snap in db.get_all(refs) if snap.exists}
+    return fetch
+
+
+_encoder = None
+_encoder_lock = threading.Lock()
+
+
+def get_encoder():
+    """Process-wide HistoryEncoder, or None when XSCOUT_HISTORY_ENCODING is 'full'."""
+    global _encoder
+    from django.conf import settings
+    if getattr(settings, 'XSCOUT_HISTORY_ENCODING', DELTA) != DELTA:
+        return None
+    if _encoder is None:
+        with _encoder_lock:
+            if _encoder is None:
+                _encoder = HistoryEncoder(keyframe_interval=getattr(settings, 'XSCOUT_HISTORY_KEYFRAME_INTERVAL', 20))
+    return _encoder
+
+
+def encode(user_id, doc_id, entry):
+    encoder = get_encoder()
+    return entry if encoder is None else encoder.encode(user_id, doc_id, entry)
+
+
+def forget(user_id):
+    """Make the user's next entry a keyframe (after a failed write)."""
+    if _encoder is not None:
+        _encoder.forget(user_id)
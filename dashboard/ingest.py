@@ -0,0 +1,434 @@
+"""
+Telemetry ingest pipeline for POST /api/telemetry/.
+
+XSCOUT_INGEST_MODE selects how heartbeats reach Firestore:
+
+- 'sync':  write inside the request (original behaviour).
+- 'async': validate, enqueue and answer 202 straight away. A background
+  writer coalesces latest-state writes per document (last heartbeat wins),
+  keeps every history append, and flushes them in WriteBatch groups of at
+  most 500 operations.
+
+In both modes LatestStateCoalescer skips the latest-state write when only
+clock fields changed since the last one, and just refreshes the liveness
+fields ('timestamp', 'lastSeen') every XSCOUT_LAST_SEEN_INTERVAL seconds
+instead. Keep that well under the dashboard's live window (45 s).
+"""
+import atexit
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from itertools import islice
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_OPS = 500  # Firestore WriteBatch limit
+MAX_USER_ID_LENGTH = 128
+DICT_FIELDS = ('behavior', 'forensic', 'project', 'tech', 'snapshot')
+
+# Keys that change on every heartbeat without the student doing anything
+# (ISO timestamps, scanner clocks). Ignored at any depth when hashing.
+VOLATILE_FIELDS = ('timestamp', 'lastSeen', 'time', 'changedAt')
+# Top-level clock fields a 'touch' still writes, so readers judging liveness by
+# either one don't see coalesced students go stale
+LIVENESS_FIELDS = ('timestamp', 'lastSeen')
+
+
+class IngestError(ValueError):
+    """Heartbeat payload failed validation."""
+
+
+class QueueFull(RuntimeError):
+    """Writer backlog is over XSCOUT_INGEST_MAX_QUEUE."""
+
+
+def chunks(items, size):
+    """Consecutive lists of at most `size` items, e.g. MAX_BATCH_OPS writes per batch."""
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def validate_heartbeat(body):
+    """Cheap structural checks so bad payloads fail in the request, not the writer."""
+    if not isinstance(body, dict):
+        raise IngestError('Telemetry payload must be a JSON object')
+
+    user_id = body.get('user')
+    if user_id is not None:
+        if not isinstance(user_id, str) or not user_id.strip():
+            raise IngestError("'user' must be a non-empty string")
+        if len(user_id) > MAX_USER_ID_LENGTH or '/' in user_id:
+            raise IngestError("'user' is not a valid document id")
+
+    for field in DICT_FIELDS:
+        if field in body and body[field] is not None and not isinstance(body[field], dict):
+            raise IngestError(f"'{field}' must be an object")
+
+    ai = body.get('ai', 0)
+    if isinstance(ai, bool) or not isinstance(ai, (int, float)):
+        raise IngestError("'ai' must be a number")
+    return body
+
+
+def _strip_volatile(value, ignore):
+    if isinstance(value, dict):
+        return {k: _strip_volatile(v, ignore) for k, v in value.items() if k not in ignore}
+    if isinstance(value, list):
+        return [_strip_volatile(v, ignore) for v in value]
+    return value
+
+
+def content_hash(data, ignore=VOLATILE_FIELDS):
+    """Digest of a document with the `ignore` keys removed at any depth."""
+    payload = json.dumps(_strip_volatile(data, ignore), sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode('utf-8', 'replace'), digest_size=16).hexdigest()
+
+
+class LatestStateCoalescer:
+    """
+    Per-document content hash of the last latest-state write.
+
+    plan() answers 'set' when the content changed (or the document has not
+    been fully rewritten for max_age seconds), 'touch' when only the liveness
+    fields are due for a refresh, and 'skip' otherwise. Each worker keeps its
+    own cache, so max_age bounds how long another worker's write can be
+    shadowed.
+    """
+
+    def __init__(self, last_seen_interval=10.0, max_age=300.0, max_entries=50000, ignore=VOLATILE_FIELDS):
+        self.last_seen_interval = last_seen_interval
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.ignore = frozenset(ignore)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.counters = {'full_writes': 0, 'last_seen_writes': 0, 'skipped': 0}
+
+    def content_hash(self, data):
+        return content_hash(data, self.ignore)
+
+    def plan(self, path, data, now=None):
+        """Returns (action, digest) with action in 'set' / 'touch' / 'skip'."""
+        now = time.monotonic() if now is None else now
+        digest = self.content_hash(data)
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry is None or entry[0] != digest or now - entry[1] >= self.max_age:
+            return 'set', digest
+        if now - entry[2] >= self.last_seen_interval:
+            return 'touch', digest
+        return 'skip', digest
+
+    def record(self, path, action, digest, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if action == 'set':
+                self._entries[path] = (digest, now, now)
+                self.counters['full_writes'] += 1
+            elif action == 'touch':
+                written_at = self._entries[path][1] if path in self._entries else now
+                self._entries[path] = (digest, written_at, now)
+                self.counters['last_seen_writes'] += 1
+            else:
+                self.counters['skipped'] += 1
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def forget(self, path):
+        with self._lock:
+            self._entries.pop(path, None)
+
+    def metrics(self):
+        with self._lock:
+            data = dict(self.counters)
+            data['tracked_documents'] = len(self._entries)
+        return data
+
+
+class TelemetryWriter:
+    """
+    Background Firestore writer.
+
+    submit() never touches the network: latest-state writes are keyed by
+    document path so a student sending five heartbeats before the next flush
+    costs one write, history appends are queued in order. Liveness touches
+    are merge-writes that fold into a pending set for the same document. A
+    daemon thread flushes every flush_interval seconds, or sooner once a full
+    batch is waiting.
+    """
+
+    def __init__(self, db, flush_interval=0.5, max_queue=20000, max_batch=MAX_BATCH_OPS):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.max_batch = min(max_batch, MAX_BATCH_OPS)
+
+        self._cond = threading.Condition()
+        self._latest = {}
+        self._history = deque()
+        self._thread = None
+        self._stopped = False
+
+        self._flush_samples = deque(maxlen=200)
+        self._counters = {
+            'submitted': 0,
+            'coalesced': 0,
+            'written_ops': 0,
+            'batches': 0,
+            'errors': 0,
+            'rejected': 0,
+        }
+
+    # -- producer side --
+
+    def submit(self, latest=None, history=(), touch=None):
+        """
+        latest: (doc_ref, data) full overwrite, or None.
+        history: iterable of (doc_ref, data) appends.
+        touch: (doc_ref, fields) merged into the document, or None.
+        """
+        history = list(history)
+        with self._cond:
+            if self._depth() + len(history) + 1 > self.max_queue:
+                self._counters['rejected'] += 1
+                raise QueueFull(f"Ingest queue is full ({self.max_queue} pending writes)")
+
+            if latest is not None:
+                doc_ref, data = latest
+                if doc_ref.path in self._latest:
+                    self._counters['coalesced'] += 1
+                self._latest[doc_ref.path] = ('set', doc_ref, data)
+            if touch is not None:
+                doc_ref, fields = touch
+                pending = self._latest.get(doc_ref.path)
+                if pending is not None:
+                    self._counters['coalesced'] += 1
+                    self._latest[doc_ref.path] = (pending[0], doc_ref, dict(pending[2], **fields))
+                else:
+                    self._latest[doc_ref.path] = ('merge', doc_ref, fields)
+            self._history.extend(history)
+            self._counters['submitted'] += 1
+
+            if self._depth() >= self.max_batch:
+                self._cond.notify()
+        self._ensure_started()
+
+    # -- consumer side --
+
+    def _depth(self):
+        return len(self._latest) + len(self._history)
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name='xscout-ingest-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._stopped and self._depth() < self.max_batch:
+                    self._cond.wait(self.flush_interval)
+                if self._stopped and not self._depth():
+                    return
+            try:
+                self.flush()
+            except Exception:
+                # Ops were put back by flush(); back off before retrying.
+                time.sleep(self.flush_interval)
+
+    def _drain(self):
+        """Take up to max_batch pending ops (latest-state first)."""
+        ops = []
+        with self._cond:
+            while self._latest and len(ops) < self.max_batch:
+                path = next(iter(self._latest))
+                ops.append(self._latest.pop(path))
+            while self._history and len(ops) < self.max_batch:
+                doc_ref, data = self._history.popleft()
+                ops.append(('history', doc_ref, data))
+        return ops
+
+    def _requeue(self, ops):
+        with self._cond:
+            for kind, doc_ref, data in reversed(ops):
+                if kind == 'history':
+                    self._history.appendleft((doc_ref, data))
+                elif doc_ref.path not in self._latest:
+                    # A newer heartbeat for this document supersedes the failed one.
+                    self._latest[doc_ref.path] = (kind, doc_ref, data)
+
+    def flush(self):
+        """Write everything that is pending. Returns the number of ops written."""
+        written = 0
+        while True:
+            ops = self._drain()
+            if not ops:
+                return written
+
+            started = time.perf_counter()
+            try:
+                batch = self.db.batch()
+                for kind, doc_ref, data in ops:
+                    batch.set(doc_ref, data, merge=(kind == 'merge'))
+                batch.commit()
+            except Exception as e:
+                self._requeue(ops)
+                with self._cond:
+                    self._counters['errors'] += 1
+                logger.warning("Telemetry batch of %d writes failed: %s", len(ops), e)
+                raise
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._cond:
+                self._flush_samples.append((len(ops), elapsed_ms))
+                self._counters['written_ops'] += len(ops)
+                self._counters['batches'] += 1
+            written += len(ops)
+
+    def stop(self, timeout=5.0):
+        """Flush what is left and stop the writer thread."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def metrics(self):
+        with self._cond:
+            samples = [ms for _, ms in self._flush_samples]
+            sizes = [n for n, _ in self._flush_samples]
+            data = dict(self._counters)
+            data.update({
+                'mode': 'async',
+                'queue_depth': self._depth(),
+                'pending_latest': len(self._latest),
+                'pending_history': len(self._history),
+                'writer_alive': bool(self._thread and self._thread.is_alive()),
+            })
+
+        ordered = sorted(samples)
+        data['flush_latency_ms'] = {
+            'last': round(samples[-1], 2) if samples else None,
+            'avg': round(sum(samples) / len(samples), 2) if samples else None,
+            'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2) if ordered else None,
+            'max': round(ordered[-1], 2) if ordered else None,
+        }
+        data['avg_batch_size'] = round(sum(sizes) / len(sizes), 1) if sizes else None
+        return data
+
+
+_writer = None
+_writer_lock = threading.Lock()
+_coalescer = None
+
+
+def is_async():
+    from django.conf import settings
+    return getattr(settings, 'XSCOUT_INGEST_MODE', 'sync') == 'async'
+
+
+def get_writer(db):
+    """Process-wide writer, created on first use (i.e. after gunicorn forks)."""
+    global _writer
+    if _writer is None:
+        from django.conf import settings
+        with _writer_lock:
+            if _writer is None:
+                _writer = TelemetryWriter(
+                    db,
+                    flush_interval=getattr(settings, 'XSCOUT_INGEST_FLUSH_INTERVAL', 0.5),
+                    max_queue=getattr(settings, 'XSCOUT_INGEST_MAX_QUEUE', 20000),
+                )
+                atexit.register(_writer.stop)
+    return _writer
+
+
+def get_coalescer():
+    """Process-wide LatestStateCoalescer, or None when XSCOUT_COALESCE_LATEST_STATE is off."""
+    global _coalescer
+    from django.conf import settings
+    if not getattr(settings, 'XSCOUT_COALESCE_LATEST_STATE', True):
+        return None
+    if _coalescer is None:
+        with _writer_lock:
+            if _coalescer is None:
+                _coalescer = LatestStateCoalescer(
+                    last_seen_interval=getattr(settings, 'XSCOUT_LAST_SEEN_INTERVAL', 10.0),
+                    max_age=getattr(settings, 'XSCOUT_LATEST_STATE_MAX_AGE', 300.0),
+                )
+    return _coalescer
+
+
+def liveness(data):
+    """The LIVENESS_FIELDS of a latest-state document, for a touch."""
+    fields = {field: data[field] for field in LIVENESS_FIELDS if field in data}
+    fields.setdefault('lastSeen', time.time())
+    return fields
+
+
+def write(db, latest=None, history=(), last_seen=None, changed_at=None):
+    """
+    Persist one heartbeat. Returns True when it was queued (async mode) and
+    False when it was written before returning (sync mode).
+
+    last_seen is stamped on full writes as 'lastSeen'. When the latest state
+    is otherwise unchanged only its liveness fields are written. changed_at
+    is stamped as 'changedAt' on full writes only, so a query on it finds
+    the students whose content changed (see dashboard/changes.py).
+    """
+    coalescer = get_coalescer()
+    touch = None
+    plan = None
+    if latest is not None:
+        doc_ref, data = latest
+        if last_seen is not None:
+            data = dict(data, lastSeen=last_seen)
+            latest = (doc_ref, data)
+        if coalescer is not None:
+            action, digest = coalescer.plan(doc_ref.path, data)
+            plan = (doc_ref.path, action, digest)
+            if action != 'set':
+                latest = None
+            if action == 'touch':
+                touch = (doc_ref, liveness(data))
+        if latest is not None and changed_at is not None:
+            latest = (doc_ref, dict(data, changedAt=changed_at))
+
+    if is_async():
+        get_writer(db).submit(latest, history, touch)
+        queued = True
+    else:
+        if latest is not None:
+            latest[0].set(latest[1])
+        elif touch is not None:
+            touch[0].set(touch[1], merge=True)
+        for doc_ref, data in history:
+            doc_ref.set(data)
+        queued = False
+
+    if plan is not None:
+        coalescer.record(*plan)
+    return queued
+
+
+def metrics():
+    if _writer is None:
+        data = {'mode': 'async' if is_async() else 'sync', 'queue_depth': 0}
+    else:
+        data = _writer.metrics()
+    if _coalescer is not None:
+        data['latest_state'] = _coalescer.metrics()
+    return data
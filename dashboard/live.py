@@ -0,0 +1,294 @@
+"""
+Server-push live updates for the dashboards (Server-Sent Events over ASGI).
+
+GET /api/live/?topic=... keeps one response open per viewer and pushes only
+the student records that changed:
+
+- event: snapshot  {"data": [...]}  the full state for the topic, sent first
+  and again after a resync;
+- event: update    {"data": [...]}  changed records, merged by 'id'.
+
+Topics are 'all', 'env:<invite code>' (AdminDashboard environments) and
+'student:<id>'.
+
+Records reach the broker two ways. The ingest POST path publishes what it
+just wrote, which is immediate for viewers attached to the same process.
+While anyone is subscribed, the process also rescans the latest state
+every XSCOUT_LIVE_RESCAN_INTERVAL seconds through the latest-state cache,
+which picks up writes handled by other workers. Firestore reads therefore
+scale with processes, not with viewers.
+
+Backpressure: each viewer holds at most XSCOUT_LIVE_MAX_PENDING undelivered
+records, keyed by student so a newer heartbeat replaces an older one. A
+viewer that falls further behind (slow network, stalled tab) has its
+backlog dropped and gets a fresh snapshot instead, so memory per viewer is
+bounded no matter how far behind it is.
+
+Streaming needs the ASGI server (dashboard/asgi.py). Under WSGI, or with
+XSCOUT_LIVE_UPDATES off, the endpoint answers 503 and static/js/live.js
+keeps polling the existing endpoints.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .cache import resolve_server_timestamps
+
+logger = logging.getLogger(__name__)
+
+TOPIC_ALL = 'all'
+TOPIC_KINDS = ('env', 'student')
+
+# EventSource reconnect delay advertised to browsers
+RETRY_MS = 3000
+
+
+def parse_topic(value):
+    value = (value or TOPIC_ALL).strip()
+    if value == TOPIC_ALL:
+        return value
+    kind, _, name = value.partition(':')
+    if kind in TOPIC_KINDS and name:
+        return value
+    raise ValueError(f"Unknown topic '{value}'. Use 'all', 'env:<code>' or 'student:<id>'")
+
+
+def topics_for(record):
+    topics = {TOPIC_ALL, f"student:{record['id']}"}
+    if record.get('environment'):
+        topics.add(f"env:{record['environment']}")
+    return topics
+
+
+def _digest(record):
+    raw = json.dumps(record, sort_keys=True, cls=DjangoJSONEncoder, default=str)
+    return hashlib.blake2b(raw.encode(), digest_size=12).digest()
+
+
+def format_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, cls=DjangoJSONEncoder)}\n\n"
+
+
+class Subscription:
+    """One viewer. offer() and next() run on the event loop that owns it."""
+
+    def __init__(self, topic, loop, max_pending):
+        self.topic = topic
+        self.loop = loop
+        self.max_pending = max_pending
+        self.pending = OrderedDict()
+        self.overflowed = False
+        self._wakeup = asyncio.Event()
+
+    def offer(self, changes):
+        for topics, record in changes:
+            if self.topic not in topics or self.overflowed:
+                continue
+            self.pending[record['id']] = record
+            self.pending.move_to_end(record['id'])
+            if len(self.pending) > self.max_pending:
+                self.pending.clear()
+                self.overflowed = True
+        if self.pending or self.overflowed:
+            self._wakeup.set()
+
+    async def next(self, timeout):
+        """('update', records), ('resync', None), or None after `timeout` idle seconds."""
+        if not (self.pending or self.overflowed):
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        self._wakeup.clear()
+        if self.overflowed:
+            self.overflowed = False
+            return 'resync', None
+        records = list(self.pending.values())
+        self.pending.clear()
+        return 'update', records
+
+
+class LiveBroker:
+    def __init__(self, max_pending=500, rescan_interval=5.0, keepalive=15.0):
+        self.max_pending = max_pending
+        self.rescan_interval = rescan_interval
+        self.keepalive = keepalive
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+        self._digests = {}
+        self._watchers = {}
+        self._counters = {'published': 0, 'resyncs': 0, 'rescans': 0, 'rescan_errors': 0}
+
+    def subscribe(self, topic, loader):
+        """
+        Register a viewer on the running event loop. loader() -> [record, ...]
+        is the (blocking) latest-state read used for snapshots and rescans.
+        """
+        loop = asyncio.get_running_loop()
+        subscription = Subscription(topic, loop, self.max_pending)
+        with self._lock:
+            self._subscriptions.add(subscription)
+            watcher = self._watchers.get(loop)
+            if watcher is None or watcher.done():
+                self._watchers[loop] = loop.create_task(self._watch(loop, loader))
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+            if not self._subscriptions:
+                # Nobody to diff for; the next viewer starts from a snapshot
+                self._digests.clear()
+
+    def publish(self, records):
+        """
+        Push records (dicts with an 'id') to matching viewers. Thread-safe,
+        callable from sync views; records identical to the last one published
+        for that id are dropped. Returns how many records were new.
+        """
+        with self._lock:
+            if not self._subscriptions:
+                return 0
+            changes = []
+            for record in records:
+                digest = _digest(record)
+                if self._digests.get(record['id']) != digest:
+                    self._digests[record['id']] = digest
+                    changes.append((topics_for(record), record))
+            by_loop = {}
+            for subscription in self._subscriptions:
+                by_loop.setdefault(subscription.loop, []).append(subscription)
+            self._counters['published'] += len(changes)
+        if changes:
+            for loop, subscriptions in by_loop.items():
+                if not loop.is_closed():
+                    loop.call_soon_threadsafe(self._deliver, subscriptions, changes)
+        return len(changes)
+
+    def _seed(self, records):
+        """Remember what a snapshot already showed so rescans only push real changes."""
+        with self._lock:
+            for record in records:
+                if record['id'] not in self._digests:
+                    self._digests[record['id']] = _digest(record)
+
+    @staticmethod
+    def _deliver(subscriptions, changes):
+        for subscription in subscriptions:
+            subscription.offer(changes)
+
+    async def _watch(self, loop, loader):
+        from asgiref.sync import sync_to_async
+
+        # Read and diff in a worker thread, off the event loop
+        rescan = sync_to_async(lambda: self.publish(loader()), thread_sensitive=False)
+        while True:
+            await asyncio.sleep(self.rescan_interval)
+            with self._lock:
+                if not any(s.loop is loop for s in self._subscriptions):
+                    self._watchers.pop(loop, None)
+                    return
+            try:
+                await rescan()
+            except Exception:
+                logger.exception('Live rescan failed')
+                self._count('rescan_errors')
+                continue
+            self._count('rescans')
+
+    async def events(self, topic, loader):
+        """The SSE body for one viewer."""
+        from asgiref.sync import sync_to_async
+
+        load = sync_to_async(loader, thread_sensitive=False)
+        # Subscribe before the snapshot read so nothing written in between is lost
+        subscription = self.subscribe(topic, loader)
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            records = await load()
+            self._seed(records)
+            yield format_event('snapshot', {'data': self._filter(topic, records)})
+            while True:
+                item = await subscription.next(self.keepalive)
+                if item is None:
+                    yield ': keepalive\n\n'
+                    continue
+                kind, records = item
+                if kind == 'resync':
+                    self._count('resyncs')
+                    yield format_event('snapshot', {'data': self._filter(topic, await load())})
+                else:
+                    yield format_event('update', {'data': records})
+        finally:
+            self.unsubscribe(subscription)
+
+    @staticmethod
+    def _filter(topic, records):
+        if topic == TOPIC_ALL:
+            return records
+        return [record for record in records if topic in topics_for(record)]
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def metrics(self):
+        with self._lock:
+            data = dict(self._counters)
+            data['subscribers'] = len(self._subscriptions)
+        return data
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def enabled():
+    from django.conf import settings
+    return getattr(settings, 'XSCOUT_LIVE_UPDATES', True)
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        from django.conf import settings
+        with _broker_lock:
+            if _broker is None:
+                _broker = LiveBroker(
+                    max_pending=getattr(settings, 'XSCOUT_LIVE_MAX_PENDING', 500),
+                    rescan_interval=getattr(settings, 'XSCOUT_LIVE_RESCAN_INTERVAL', 5.0),
+                    keepalive=getattr(settings, 'XSCOUT_LIVE_KEEPALIVE', 15.0),
+                )
+    return _broker
+
+
+def publish(doc_id, data):
+    """Called by the ingest POST path after a heartbeat is written or queued."""
+    if _broker is None or not enabled():
+        return 0
+    return _broker.publish([dict(resolve_server_timestamps(data), id=doc_id)])
+
+
+def is_streamable(request):
+    """Streaming responses only stay open under ASGI; WSGI would buffer forever."""
+    from django.core.handlers.asgi import ASGIRequest
+    return enabled() and isinstance(request, ASGIRequest)
+
+
+def stream(topic, loader):
+    from django.http import StreamingHttpResponse
+
+    response = StreamingHttpResponse(get_broker().events(topic, loader), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def metrics():
+    return get_broker().metrics() if _broker is not None else {'subscribers': 0}
@@ -0,0 +1,39 @@
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard import archive, storage
+
+
+class Command(BaseCommand):
+    help = 'Write latest state and full history to a columnar archive (a directory, or a .tar file).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='New directory, or a path ending in .tar')
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'XSCOUT_EXPORT_WORKERS', 8),
+                            help='Students whose history is read at once')
+
+    def handle(self, *args, output, workers, **options):
+        if os.path.exists(output):
+            raise CommandError(f'{output} already exists')
+        started = time.monotonic()
+        if output.endswith('.tar'):
+            with tempfile.TemporaryDirectory(prefix='xscout-archive-') as directory:
+                manifest = archive.write_archive(storage.get_repository(), directory, workers=workers)
+                with open(output, 'wb') as f:
+                    for chunk in archive.tar_chunks(directory):
+                        f.write(chunk)
+            size = os.path.getsize(output)
+        else:
+            os.makedirs(output)
+            manifest = archive.write_archive(storage.get_repository(), output, workers=workers)
+            size = sum(os.path.getsize(os.path.join(output, name)) for name in manifest['files'])
+        elapsed = time.monotonic() - started
+        rows = manifest['students'] + manifest['history']
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {manifest['students']} students and {manifest['history']} history entries "
+            f"in {len(manifest['files'])} files, {size / 1e6:.1f} MB, {elapsed:.1f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)"
+        ))
@@ -0,0 +1,27 @@
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from dashboard import tiers
+
+
+class Command(BaseCommand):
+    help = ('Roll completed sessions older than XSCOUT_COMPACT_AFTER_HOURS into compressed history archives. '
+            'Meant to run on a schedule before apply_retention, see render.yaml.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be compacted, write nothing')
+        parser.add_argument('--environment', help='Only students in this environment')
+        parser.add_argument('--hours', type=float, help='Override XSCOUT_COMPACT_AFTER_HOURS for this run')
+        parser.add_argument('--json', action='store_true', dest='as_json', help='Print the full report as JSON')
+
+    def handle(self, *args, dry_run, environment, hours, as_json, **options):
+        compactor = tiers.get_compactor()
+        if hours is not None:
+            compactor.compact_after = timedelta(hours=hours)
+        report = compactor.run(dry_run=dry_run, environment=environment)
+        if as_json:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(self.style.SUCCESS(tiers.describe(report)))
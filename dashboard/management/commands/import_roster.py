@@ -0,0 +1,37 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard import roster
+
+
+class Command(BaseCommand):
+    help = ('Authorize the student IDs in a CSV or JSON roster in bulk: new IDs are added, changed ones updated, '
+            'in batched SQL and storage writes (see dashboard/roster.py).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Roster file, or - for stdin')
+        parser.add_argument('--format', choices=('csv', 'json'), help='Default: from the file name, else sniffed')
+        parser.add_argument('--sync', action='store_true', help='Also deactivate active IDs the roster leaves out')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change, write nothing')
+        parser.add_argument('--json', action='store_true', dest='as_json', help='Print the full report as JSON')
+
+    def handle(self, *args, path, format, sync, dry_run, as_json, **options):
+        try:
+            if path == '-':
+                content = sys.stdin.buffer.read()
+            else:
+                with open(path, 'rb') as f:
+                    content = f.read()
+            report = roster.import_roster(content, format=format or roster.format_for(path), sync=sync,
+                                          dry_run=dry_run)
+        except (OSError, roster.RosterError) as e:
+            raise CommandError(str(e))
+        if as_json:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for error in report['errors']:
+            self.stderr.write(f"Row {error['row']}: {error['message']}")
+        style = self.style.WARNING if report['storage_error'] or report['invalid'] else self.style.SUCCESS
+        self.stdout.write(style(roster.describe(report)))
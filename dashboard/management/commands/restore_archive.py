@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard import archive, storage
+
+
+class Command(BaseCommand):
+    help = 'Bulk-load a columnar archive written by backup_archive or a parquet backup job.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Archive directory or .tar file')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Documents per bulk write (Firestore commits them 500 at a time)')
+        parser.add_argument('--workers', type=int, default=4, help='Batches written at once')
+
+    def handle(self, *args, source, batch_size, workers, **options):
+        started = time.monotonic()
+        try:
+            counts = archive.restore(storage.get_repository(), source, batch_size=batch_size, workers=workers)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        elapsed = time.monotonic() - started
+        rows = counts['students'] + counts['history']
+        self.stdout.write(self.style.SUCCESS(
+            f"Restored {counts['students']} students and {counts['history']} history entries "
+            f"in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)"
+        ))
@@ -0,0 +1,30 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard import authorization, authsync
+
+
+class Command(BaseCommand):
+    help = ('Push queued authorized-ID changes to storage and pull the ones made there since the last run. '
+            'With --full, compare both sides in full and bring them together (see dashboard/authsync.py).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Reconcile every ID rather than only changes')
+        parser.add_argument('--dry-run', action='store_true', help='With --full: report what differs, write nothing')
+        parser.add_argument('--json', action='store_true', dest='as_json', help='Print the full report as JSON')
+
+    def handle(self, *args, full, dry_run, as_json, **options):
+        if dry_run and not full:
+            raise CommandError('--dry-run needs --full')
+        engine = authsync.get_engine()
+        try:
+            report = engine.reconcile(dry_run=dry_run) if full else authsync.sync_now()
+        except Exception as e:
+            raise CommandError(f'Sync failed, queued changes will be retried: {e}')
+        if not dry_run:
+            authorization.reload(report['changed_ids'])
+        if as_json:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(self.style.SUCCESS(authsync.describe(report)))
@@ -0,0 +1,145 @@
+"""
+Paginated, windowed reads of a student's history subcollection.
+
+Playback pages are ordered by (timestamp, document id) and continue with an
+opaque cursor that maps onto Firestore start_after(), so a page costs
+`limit` document reads no matter how long the session is. Query params:
+
+- start / end: ISO 8601 time or epoch milliseconds, both inclusive;
+- limit: page size (default DEFAULT_LIMIT, capped at MAX_LIMIT);
+- cursor: the next_cursor of the previous page;
+- fields: comma-separated top-level fields to return. When every field is
+  an index field (timestamp, ai, ai_score) the query is projected server-side
+  and no snapshot is read or decoded, which is what the scrubber timeline
+  uses before it pulls the code for the visible frame.
+"""
+import base64
+import json
+from datetime import datetime, timezone
+
+from . import history
+
+DEFAULT_LIMIT = 200
+MAX_LIMIT = 1000
+
+
+def parse_time(value):
+    """ISO 8601 string or epoch milliseconds -> aware UTC datetime."""
+    value = value.strip()
+    if value.isdigit():
+        return datetime.fromtimestamp(int(value) / 1000, tz=timezone.utc)
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f"Invalid time '{value}': use ISO 8601 or epoch milliseconds")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def iso_z(moment):
+    """Same format as JavaScript's Date.toISOString(), used by the extension."""
+    return moment.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+def encode_cursor(timestamp, doc_id):
+    if isinstance(timestamp, datetime):
+        value = {'t': timestamp.isoformat(), 'dt': True, 'id': doc_id}
+    else:
+        value = {'t': timestamp, 'id': doc_id}
+    raw = json.dumps(value, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Returns (timestamp, doc_id). Raises ValueError on a malformed cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        value = json.loads(raw)
+        timestamp = datetime.fromisoformat(value['t']) if value.get('dt') else value['t']
+        return timestamp, value['id']
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise ValueError('Invalid cursor')
+
+
+def parse_params(params, default_limit=DEFAULT_LIMIT):
+    """Validated fetch_page() kwargs from request.GET. Raises ValueError."""
+    try:
+        limit = int(params.get('limit') or default_limit)
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be positive')
+
+    fields = params.get('fields')
+    return {
+        'start': parse_time(params['start']) if params.get('start') else None,
+        'end': parse_time(params['end']) if params.get('end') else None,
+        'limit': min(limit, MAX_LIMIT),
+        'cursor': decode_cursor(params['cursor']) if params.get('cursor') else None,
+        'fields': [f.strip() for f in fields.split(',') if f.strip()] if fields else None,
+    }
+
+
+def fetch_page(db, history_ref, start=None, end=None, limit=DEFAULT_LIMIT, cursor=None, fields=None,
+               descending=False, iso_timestamps=False):
+    """
+    One page of decoded history entries.
+
+    iso_timestamps: the collection stores timestamps as ISO strings (the
+    AdminDashboard stores the extension's clock) rather than Firestore
+    timestamps, so time bounds are compared as strings.
+
+    Returns {'data': [...], 'next_cursor': str | None, 'has_more': bool};
+    every entry carries its document 'id'.
+    """
+    if iso_timestamps:
+        start = iso_z(start) if start else None
+        end = iso_z(end) if end else None
+
+    direction = 'DESCENDING' if descending else 'ASCENDING'
+    query = history_ref
+    if start is not None:
+        query = query.where('timestamp', '>=', start)
+    if end is not None:
+        query = query.where('timestamp', '<=', end)
+    query = query.order_by('timestamp', direction=direction).order_by('__name__', direction=direction)
+    if cursor is not None:
+        timestamp, doc_id = cursor
+        query = query.start_after({'timestamp': timestamp, '__name__': doc_id})
+
+    # Index fields live on every document, keyframe or delta, so a timeline
+    # request never has to read or rebuild snapshots.
+    index_only = fields is not None and set(fields) <= set(history.INDEX_FIELDS)
+    if index_only:
+        query = query.select(sorted(set(fields) | {'timestamp'}))
+
+    docs = query.limit(limit + 1).stream()
+    return build_page([(doc.id, doc.to_dict()) for doc in docs], limit, fields,
+                      history.firestore_keyframe_fetcher(db, history_ref))
+
+
+def build_page(entries, limit, fields, fetch_keyframes):
+    """
+    The backend-independent half of a page: entries are up to limit + 1
+    stored (doc_id, data) pairs in page order, as read with the projection
+    fetch_page() would use. Decodes deltas, applies `fields` and builds
+    next_cursor from the last entry's 'timestamp'.
+    """
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    if fields is not None and set(fields) <= set(history.INDEX_FIELDS):
+        data = [{key: value for key, value in entry.items() if key in fields} for _, entry in entries]
+    else:
+        data = history.decode_entries(entries, fetch_keyframes)
+        if fields is not None:
+            data = [{key: entry[key] for key in fields if key in entry} for entry in data]
+    for (doc_id, _), entry in zip(entries, data):
+        entry['id'] = doc_id
+
+    next_cursor = None
+    if has_more:
+        last_id, last = entries[-1]
+        next_cursor = encode_cursor(last.get('timestamp'), last_id)
+    return {'data': data, 'next_cursor': next_cursor, 'has_more': has_more}
@@ -57,6 +57,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'authentication',
+    'dashboard',
 ]
 
 MIDDLEWARE = [
@@ -166,3 +167,167 @@ LOGOUT_REDIRECT_URL = '/login/'
 # Session Settings
 SESSION_COOKIE_AGE = 86400  # 24 hours
 SESSION_SAVE_EVERY_REQUEST = True
+
+# Cheating Network Graph
+# 'minhash' (shingles + MinHash/LSH, scales to large classes) or 'difflib' (exact all-pairs)
+XSCOUT_SIMILARITY_ENGINE = os.environ.get('XSCOUT_SIMILARITY_ENGINE', 'minhash')
+XSCOUT_SIMILARITY_THRESHOLD = float(os.environ.get('XSCOUT_SIMILARITY_THRESHOLD', '0.8'))
+
+# Telemetry Ingest
+# 'sync' writes each heartbeat inside the request; 'async' answers 202 and lets a
+# background writer flush coalesced WriteBatch groups (see dashboard/ingest.py)
+XSCOUT_INGEST_MODE = os.environ.get('XSCOUT_INGEST_MODE', 'sync')
+XSCOUT_INGEST_FLUSH_INTERVAL = float(os.environ.get('XSCOUT_INGEST_FLUSH_INTERVAL', '0.5'))
+XSCOUT_INGEST_MAX_QUEUE = int(os.environ.get('XSCOUT_INGEST_MAX_QUEUE', '20000'))
+# Skip latest-state writes when only clock fields changed; refresh 'timestamp' / 'lastSeen' at this
+# cadence instead (keep it well under the dashboard's 45 s live window) and force a full rewrite after
+# XSCOUT_LATEST_STATE_MAX_AGE seconds
+XSCOUT_COALESCE_LATEST_STATE = os.environ.get('XSCOUT_COALESCE_LATEST_STATE', '1') == '1'
+XSCOUT_LAST_SEEN_INTERVAL = float(os.environ.get('XSCOUT_LAST_SEEN_INTERVAL', '10'))
+XSCOUT_LATEST_STATE_MAX_AGE = float(os.environ.get('XSCOUT_LATEST_STATE_MAX_AGE', '300'))
+
+# Snapshot History
+# 'delta' stores a keyframe every XSCOUT_HISTORY_KEYFRAME_INTERVAL entries and line-level
+# patches against it in between (see dashboard/history.py); 'full' stores every entry whole
+XSCOUT_HISTORY_ENCODING = os.environ.get('XSCOUT_HISTORY_ENCODING', 'delta')
+XSCOUT_HISTORY_KEYFRAME_INTERVAL = int(os.environ.get('XSCOUT_HISTORY_KEYFRAME_INTERVAL', '20'))
+
+# Latest-state Cache
+# GET /api/telemetry/ is served from a read-through cache refreshed at most every
+# XSCOUT_LATEST_STATE_CACHE_TTL seconds and written through by ingest POSTs.
+# 'local' (per process), 'django' (CACHES[XSCOUT_LATEST_STATE_CACHE_ALIAS]) or 'off'
+XSCOUT_LATEST_STATE_CACHE = os.environ.get('XSCOUT_LATEST_STATE_CACHE', 'local')
+XSCOUT_LATEST_STATE_CACHE_ALIAS = os.environ.get('XSCOUT_LATEST_STATE_CACHE_ALIAS', 'default')
+XSCOUT_LATEST_STATE_CACHE_TTL = float(os.environ.get('XSCOUT_LATEST_STATE_CACHE_TTL', '5'))
+XSCOUT_LATEST_STATE_CACHE_SIZE = int(os.environ.get('XSCOUT_LATEST_STATE_CACHE_SIZE', '5000'))
+
+# Live Updates
+# Server-Sent Events on /api/live/ (needs the ASGI server, see Procfile). Viewers
+# more than XSCOUT_LIVE_MAX_PENDING records behind get a fresh snapshot instead;
+# writes handled by other workers are picked up every XSCOUT_LIVE_RESCAN_INTERVAL s
+XSCOUT_LIVE_UPDATES = os.environ.get('XSCOUT_LIVE_UPDATES', '1') == '1'
+XSCOUT_LIVE_MAX_PENDING = int(os.environ.get('XSCOUT_LIVE_MAX_PENDING', '500'))
+XSCOUT_LIVE_RESCAN_INTERVAL = float(os.environ.get('XSCOUT_LIVE_RESCAN_INTERVAL', '5'))
+XSCOUT_LIVE_KEEPALIVE = float(os.environ.get('XSCOUT_LIVE_KEEPALIVE', '15'))
+
+# Delta Sync
+# GET /api/telemetry/?since=<watermark> returns only reports whose content changed, liveness
+# refreshes and tombstones, from a per-process change index (see dashboard/changes.py). It queries the
+# reports whose content changed every XSCOUT_CHANGE_INDEX_REFRESH seconds and reconciles with the full
+# latest state every XSCOUT_CHANGE_INDEX_RECONCILE seconds; keep XSCOUT_LAST_SEEN_INTERVAL plus the
+# reconcile interval plus the cache TTL under the dashboard's live window (45 s). Watermarks are
+# wall-clock times, so any worker can answer them
+XSCOUT_CHANGE_INDEX = os.environ.get('XSCOUT_CHANGE_INDEX', '1') == '1'
+XSCOUT_CHANGE_INDEX_REFRESH = float(os.environ.get('XSCOUT_CHANGE_INDEX_REFRESH', '3'))
+XSCOUT_CHANGE_INDEX_RECONCILE = float(os.environ.get('XSCOUT_CHANGE_INDEX_RECONCILE', '20'))
+XSCOUT_CHANGE_INDEX_TOMBSTONES = int(os.environ.get('XSCOUT_CHANGE_INDEX_TOMBSTONES', '1000'))
+
+# Environment Index
+# GET /api/telemetry/?environment=<code> is served from an in-process membership index kept up to date on ingest
+# (see dashboard/environments.py): members older than _MAX_AGE seconds are re-read by id, the where() query runs
+# once per _RECONCILE seconds per environment. XSCOUT_ENVIRONMENT_INDEX=0 queries every poll
+XSCOUT_ENVIRONMENT_INDEX = os.environ.get('XSCOUT_ENVIRONMENT_INDEX', '1') == '1'
+XSCOUT_ENVIRONMENT_INDEX_MAX_AGE = float(os.environ.get('XSCOUT_ENVIRONMENT_INDEX_MAX_AGE', '5'))
+XSCOUT_ENVIRONMENT_INDEX_RECONCILE = float(os.environ.get('XSCOUT_ENVIRONMENT_INDEX_RECONCILE', '60'))
+XSCOUT_ENVIRONMENT_INDEX_MAX_STUDENTS = int(os.environ.get('XSCOUT_ENVIRONMENT_INDEX_MAX_STUDENTS', '50000'))
+
+# Storage
+# 'firestore' (Cloud Firestore) or 'sqlite' (local WAL database at XSCOUT_STORAGE_SQLITE_PATH,
+# ':memory:' for a throwaway store), see dashboard/storage.py
+XSCOUT_STORAGE_BACKEND = os.environ.get('XSCOUT_STORAGE_BACKEND', 'firestore')
+XSCOUT_STORAGE_SQLITE_PATH = os.environ.get('XSCOUT_STORAGE_SQLITE_PATH', str(BASE_DIR / 'telemetry.sqlite3'))
+XSCOUT_TELEMETRY_COLLECTION = 'reports'
+XSCOUT_AUTHORIZED_COLLECTION = 'authorized_students'
+XSCOUT_ROLLUP_COLLECTION = 'report_rollups'
+XSCOUT_FINGERPRINT_COLLECTION = 'snapshot_fingerprints'
+# Counters such as the purge generation behind data_version()
+XSCOUT_META_COLLECTION = 'report_meta'
+
+# Firebase
+# The Firestore client is created per worker on first use (dashboard/firebase.py). With
+# XSCOUT_FIREBASE_WARMUP=1 each gunicorn worker opens it in the background right after
+# boot (gunicorn.conf.py), so the first request doesn't pay for the channel and token
+XSCOUT_FIREBASE_WARMUP = os.environ.get('XSCOUT_FIREBASE_WARMUP', '0') == '1'
+
+# Behavior Rollups
+# Per-student 1-minute and 10-minute buckets of the behavior metrics, flushed by each worker every
+# XSCOUT_ROLLUP_FLUSH_INTERVAL s and served by /api/rollups/ (see dashboard/rollups.py). Retention in hours
+XSCOUT_ROLLUPS = os.environ.get('XSCOUT_ROLLUPS', '1') == '1'
+XSCOUT_ROLLUP_FLUSH_INTERVAL = float(os.environ.get('XSCOUT_ROLLUP_FLUSH_INTERVAL', '15'))
+XSCOUT_ROLLUP_RETENTION_1M = int(os.environ.get('XSCOUT_ROLLUP_RETENTION_1M', '48'))
+XSCOUT_ROLLUP_RETENTION_10M = int(os.environ.get('XSCOUT_ROLLUP_RETENTION_10M', '720'))
+XSCOUT_ROLLUP_SESSION_GAP = int(os.environ.get('XSCOUT_ROLLUP_SESSION_GAP', '1800'))
+XSCOUT_ROLLUP_PASTE_BURST = int(os.environ.get('XSCOUT_ROLLUP_PASTE_BURST', '3'))
+
+# Risk Analytics
+# /api/analytics/ scores the latest state server-side (see dashboard/analytics.py): ai >= XSCOUT_ANALYTICS_HIGH_RISK
+# (0-100) is high risk, |z| >= XSCOUT_ANALYTICS_OUTLIER_Z within the environment is an outlier
+XSCOUT_ANALYTICS_TTL = float(os.environ.get('XSCOUT_ANALYTICS_TTL', '5'))
+XSCOUT_ANALYTICS_HIGH_RISK = float(os.environ.get('XSCOUT_ANALYTICS_HIGH_RISK', '60'))
+XSCOUT_ANALYTICS_OUTLIER_Z = float(os.environ.get('XSCOUT_ANALYTICS_OUTLIER_Z', '2.5'))
+
+# Export
+# Threads reading history subcollections in parallel for /api/export-logs/?scope=history (see dashboard/export.py)
+XSCOUT_EXPORT_WORKERS = int(os.environ.get('XSCOUT_EXPORT_WORKERS', '8'))
+
+# Background Jobs
+# Exports and backups run in XSCOUT_JOBS_WORKERS threads and are written to XSCOUT_JOBS_DIR, which every worker
+# serving /api/jobs/ must share; finished artifacts are deleted after XSCOUT_JOBS_TTL seconds (see dashboard/jobs.py)
+XSCOUT_JOBS_DIR = os.environ.get('XSCOUT_JOBS_DIR', str(BASE_DIR / 'jobs'))
+XSCOUT_JOBS_WORKERS = int(os.environ.get('XSCOUT_JOBS_WORKERS', '2'))
+XSCOUT_JOBS_TTL = float(os.environ.get('XSCOUT_JOBS_TTL', '86400'))
+
+# Retention
+# History entries older than XSCOUT_RETENTION_DAYS are deleted by `manage.py apply_retention` and by the dashboard's
+# purge button. The default, 0, keeps everything. XSCOUT_RETENTION_ENVIRONMENTS sets other ages per environment as
+# "ENV1=7,ENV2=90" (0 keeps everything). The daily cron service in render.yaml only applies retention when
+# XSCOUT_RETENTION_SCHEDULE is 1. Pages of XSCOUT_RETENTION_BATCH entries are deleted in batched writes, at most
+# XSCOUT_RETENTION_RATE documents per second (see dashboard/retention.py)
+XSCOUT_RETENTION_DAYS = float(os.environ.get('XSCOUT_RETENTION_DAYS', '0'))
+XSCOUT_RETENTION_SCHEDULE = os.environ.get('XSCOUT_RETENTION_SCHEDULE', '0') == '1'
+XSCOUT_RETENTION_ENVIRONMENTS = os.environ.get('XSCOUT_RETENTION_ENVIRONMENTS', '')
+XSCOUT_RETENTION_BATCH = int(os.environ.get('XSCOUT_RETENTION_BATCH', '500'))
+XSCOUT_RETENTION_RATE = float(os.environ.get('XSCOUT_RETENTION_RATE', '500'))
+
+# History Tiering
+# `manage.py compact_history` (run daily before retention, see render.yaml) rolls each completed session older than
+# XSCOUT_COMPACT_AFTER_HOURS into compressed archive documents, read back transparently by playback and export. Readers
+# cache a student's archive index for XSCOUT_COLD_INDEX_TTL seconds, which a run waits out before deleting hot
+# documents (see dashboard/tiers.py)
+XSCOUT_COMPACT_AFTER_HOURS = float(os.environ.get('XSCOUT_COMPACT_AFTER_HOURS', '24'))
+XSCOUT_COMPACT_BATCH = int(os.environ.get('XSCOUT_COMPACT_BATCH', '500'))
+XSCOUT_COLD_INDEX_TTL = float(os.environ.get('XSCOUT_COLD_INDEX_TTL', '30'))
+
+# Authorization Cache
+# verify_student_id answers from an in-memory copy of the authorized IDs (see dashboard/authorization.py): local rows
+# are reloaded every XSCOUT_AUTH_CACHE_REFRESH s (Firestore records are pushed by a listener), and IDs found nowhere are
+# remembered for XSCOUT_AUTH_NEGATIVE_TTL s
+XSCOUT_AUTH_CACHE_REFRESH = float(os.environ.get('XSCOUT_AUTH_CACHE_REFRESH', '15'))
+XSCOUT_AUTH_NEGATIVE_TTL = float(os.environ.get('XSCOUT_AUTH_NEGATIVE_TTL', '5'))
+
+# Roster Import
+# api/import-users/ and `manage.py import_roster` apply a CSV/JSON roster of authorized IDs with bulk SQL writes of
+# XSCOUT_ROSTER_BATCH rows, and merge the changes into storage in 500-op batches committed by XSCOUT_ROSTER_WORKERS
+# threads (see dashboard/roster.py)
+XSCOUT_ROSTER_BATCH = int(os.environ.get('XSCOUT_ROSTER_BATCH', '500'))
+XSCOUT_ROSTER_WORKERS = int(os.environ.get('XSCOUT_ROSTER_WORKERS', '8'))
+
+# Authorized ID Sync
+# AuthorizedID rows and the records in XSCOUT_AUTHORIZED_COLLECTION are kept in step by a thread in each process (see
+# dashboard/authsync.py): local changes are pushed from a durable outbox, and storage changes pulled incrementally
+# every XSCOUT_AUTH_SYNC_INTERVAL s. `manage.py sync_authorized --full` reconciles both sides on demand. Records are
+# shaped as XSCOUT_AUTHORIZED_RECORD_STYLE: 'camel' (studentId, isActive, updatedAt) or 'snake'
+XSCOUT_AUTH_SYNC_INTERVAL = float(os.environ.get('XSCOUT_AUTH_SYNC_INTERVAL', '60'))
+XSCOUT_AUTHORIZED_RECORD_STYLE = 'camel'
+
+# Fingerprint Index
+# Ingested snapshots are winnowed into fingerprints of XSCOUT_FINGERPRINT_K-token k-grams (window
+# XSCOUT_FINGERPRINT_WINDOW) and posted to XSCOUT_FINGERPRINT_COLLECTION by a thread in each worker every
+# XSCOUT_FINGERPRINT_FLUSH_INTERVAL s. /api/similarity/sources/<user_id>/ ranks the students whose history shares most
+# fingerprints with a snapshot, ignoring fingerprints more than XSCOUT_FINGERPRINT_MAX_POSTINGS students share.
+# `manage.py index_fingerprints` indexes earlier history (see dashboard/fingerprints.py)
+XSCOUT_FINGERPRINTS = os.environ.get('XSCOUT_FINGERPRINTS', '1') == '1'
+XSCOUT_FINGERPRINT_K = int(os.environ.get('XSCOUT_FINGERPRINT_K', '5'))
+XSCOUT_FINGERPRINT_WINDOW = int(os.environ.get('XSCOUT_FINGERPRINT_WINDOW', '4'))
+XSCOUT_FINGERPRINT_MAX_POSTINGS = int(os.environ.get('XSCOUT_FINGERPRINT_MAX_POSTINGS', '50'))
+XSCOUT_FINGERPRINT_FLUSH_INTERVAL = float(os.environ.get('XSCOUT_FINGERPRINT_FLUSH_INTERVAL', '5'))
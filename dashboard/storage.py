@@ -0,0 +1,1002 @@
+"""
+Telemetry storage behind the views.
+
+Views and the authentication app go through a TelemetryRepository instead of
+calling Firestore directly, which covers:
+
+- latest state: one document per student (XSCOUT_TELEMETRY_COLLECTION);
+- history: per-student snapshot entries, appended on ingest and read one
+  playback page at a time, with completed sessions compacted into archive
+  documents and read back from both tiers (see dashboard/tiers.py);
+- environment queries: latest state filtered on 'environment', and bulk
+  reads by id for the environment index (see dashboard/environments.py);
+- authorized IDs: the student IDs allowed to connect
+  (XSCOUT_AUTHORIZED_COLLECTION);
+- behavior rollups: per-student 1-minute and 10-minute buckets that merge
+  additively, written by every worker (see dashboard/rollups.py);
+- snapshot fingerprints: winnowed k-gram hashes of every snapshot, each
+  with the students and history entries that posted it (see
+  dashboard/fingerprints.py).
+
+XSCOUT_STORAGE_BACKEND picks the implementation:
+
+- 'firestore': Cloud Firestore (the default). The client comes from
+  dashboard/firebase.py and is created on the first request that needs
+  it, not at import, so management commands and the SQLite backend never
+  touch Google credentials.
+- 'sqlite': a local SQLite database at XSCOUT_STORAGE_SQLITE_PATH in WAL
+  mode (':memory:' for a throwaway in-process store), for offline use,
+  tests, benchmarks and load tests. History pages are keyset queries on a
+  (user_id, timestamp, id) index and return the same cursors and shapes
+  as Firestore pages.
+
+Both backends hand back snapshot-like documents (doc.id, doc.to_dict()), so
+code written against Firestore snapshots works unchanged.
+"""
+import json
+import os
+import secrets
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from . import firebase, history, ingest, playback, rollups, tiers
+from .cache import resolve_server_timestamps
+from .history import INDEX_FIELDS
+
+
+class TelemetryRepository:
+    """Interface shared by the storage backends."""
+
+    # -- latest state --
+
+    def stream_latest(self, fields=None, limit=None):
+        """Latest-state documents, optionally projected onto `fields`."""
+        raise NotImplementedError
+
+    def get_latest(self, doc_id):
+        """A student's latest state as a dict, or None."""
+        raise NotImplementedError
+
+    def get_latest_many(self, doc_ids):
+        """{id: latest state} for the ids that exist, in one round-trip where the backend allows."""
+        raise NotImplementedError
+
+    def stream_environment(self, env_code):
+        """Latest-state documents whose 'environment' is env_code."""
+        raise NotImplementedError
+
+    def stream_latest_changed(self, since):
+        """
+        Latest-state documents whose content was written at or after `since`
+        (an aware datetime). write_heartbeat() stamps 'changedAt' on full
+        writes only, so students whose heartbeats only refresh liveness are
+        not returned.
+        """
+        raise NotImplementedError
+
+    def delete_latest(self, doc_ids):
+        raise NotImplementedError
+
+    def data_version(self):
+        """
+        Opaque string that changes whenever latest state or history is
+        written or deleted, used to tell whether a finished export is stale.
+        """
+        raise NotImplementedError
+
+    # -- history --
+
+    def new_history_id(self, user_id):
+        """A fresh id for an auto-named history entry."""
+        raise NotImplementedError
+
+    def write_heartbeat(self, user_id, latest, history=(), last_seen=None):
+        """
+        Store a student's latest state plus [(history_id, entry), ...].
+        last_seen is stamped as 'lastSeen', and 'changedAt' whenever the
+        full document is written (see stream_latest_changed()). Returns True
+        when the write was queued rather than done before returning.
+        """
+        raise NotImplementedError
+
+    def history_page(self, user_id, **params):
+        """One page of decoded history from both tiers, see playback.fetch_page() for params."""
+        return tiers.history_page(self, user_id, **params)
+
+    def hot_history_page(self, user_id, **params):
+        """history_page() over the history subcollection alone."""
+        raise NotImplementedError
+
+    def get_history_many(self, user_id, doc_ids):
+        """{id: stored entry} for the history documents that exist."""
+        raise NotImplementedError
+
+    def stream_history(self, user_id):
+        """A student's history documents as stored (keyframes and deltas, not decoded)."""
+        raise NotImplementedError
+
+    def scan_history(self, user_id, start=None, before=None, limit=playback.MAX_LIMIT, cursor=None, fields=None,
+                     iso_timestamps=False):
+        """
+        [(doc_id, stored entry), ...] with start <= timestamp < before, in
+        (timestamp, id) order after `cursor` (a (timestamp, doc_id) pair).
+        Entries are not decoded; entries without a timestamp never match.
+        """
+        raise NotImplementedError
+
+    def delete_history(self, user_id, doc_ids):
+        """Delete history documents, in batched writes."""
+        raise NotImplementedError
+
+    # -- compacted history (see dashboard/tiers.py) --
+
+    def write_history_archive(self, user_id, archive_id, meta, blob):
+        """Store one archive of compacted history: meta is {'start', 'end', 'count', 'bytes'}."""
+        raise NotImplementedError
+
+    def history_archives(self, user_id):
+        """A student's archive metas (with 'id', without the blob), oldest first."""
+        raise NotImplementedError
+
+    def read_history_archive(self, user_id, archive_id):
+        """An archive's blob, or None."""
+        raise NotImplementedError
+
+    def delete_history_archives(self, user_id, archive_ids):
+        raise NotImplementedError
+
+    # -- bulk load --
+
+    def bulk_write(self, latest=(), history=()):
+        """
+        Store [(id, state), ...] and [(user_id, history_id, entry), ...]
+        exactly as given, in batched writes. Unlike write_heartbeat() this
+        skips ingest (no coalescing, no server timestamps); it is how an
+        archive is restored (see dashboard/archive.py).
+        """
+        raise NotImplementedError
+
+    # -- authorized IDs --
+
+    def get_authorized(self, student_id):
+        """The authorized-ID record as a dict, or None."""
+        raise NotImplementedError
+
+    def set_authorized(self, student_id, data):
+        raise NotImplementedError
+
+    def update_authorized(self, student_id, fields):
+        """Merge `fields` into an existing record; LookupError if there is none."""
+        raise NotImplementedError
+
+    def get_authorized_many(self, student_ids):
+        """{student_id: record} for those of the IDs that have a record."""
+        raise NotImplementedError
+
+    def merge_authorized_many(self, records, workers=1):
+        """
+        Merge [(student_id, fields), ...] into the authorized-ID records,
+        creating the ones that don't exist, in batched writes committed by up
+        to `workers` threads. Returns the number of batches written.
+        """
+        raise NotImplementedError
+
+    def delete_authorized_many(self, student_ids):
+        """Delete the records of these IDs, in batched writes."""
+        raise NotImplementedError
+
+    def stream_authorized_since(self, field, since):
+        """
+        The records whose `field` (a timestamp every writer sets, see
+        dashboard/authsync.py) is at or after `since`, oldest first. Records
+        without the field are never returned.
+        """
+        raise NotImplementedError
+
+    def stream_authorized(self):
+        """Every authorized-ID record, as documents."""
+        raise NotImplementedError
+
+    def watch_authorized(self, callback):
+        """
+        Push changes to the authorized IDs: callback({student_id: record or
+        None when deleted}) with every record first, then with each change.
+        Returns a handle with unsubscribe(), or None when the backend can't
+        push and callers should poll stream_authorized() instead.
+        """
+        return None
+
+    # -- behavior rollups --
+
+    def write_rollups(self, rows):
+        """
+        Merge [(resolution, bucket, user_id, environment, stats, expires), ...]
+        into the stored buckets: counts and sums add, min/max fold. stats is
+        laid out as rollups.FIELDS; bucket and expires are epoch seconds.
+        """
+        raise NotImplementedError
+
+    def read_rollups(self, resolution, start, end, user_id=None):
+        """(bucket, user_id, environment, stats) for the buckets from start to end, inclusive."""
+        raise NotImplementedError
+
+    def prune_rollups(self, now):
+        """Drop buckets that expired before `now` (epoch seconds)."""
+        raise NotImplementedError
+
+    # -- snapshot fingerprints --
+
+    def write_fingerprints(self, postings, max_postings=None):
+        """
+        Post [(hash, user_id, entry_id, timestamp), ...]. One posting is kept
+        per (hash, user_id); whether the first or the latest entry wins is up
+        to the backend. A backend may stop keeping the postings of a hash
+        once more than max_postings students posted it.
+        """
+        raise NotImplementedError
+
+    def read_fingerprints(self, hashes, max_postings=None):
+        """
+        {hash: {user_id: (entry_id, timestamp)}} for the hashes that have
+        postings; None for a hash more than max_postings students posted.
+        """
+        raise NotImplementedError
+
+
+def _slot(resolution, bucket):
+    return f'{resolution}-{bucket:010d}'
+
+
+class FirestoreRepository(TelemetryRepository):
+    def __init__(self, db, collection='reports', authorized_collection='authorized_students',
+                 rollup_collection='report_rollups', fingerprint_collection='snapshot_fingerprints',
+                 meta_collection='report_meta'):
+        self.db = db
+        self.collection = collection
+        self.authorized_collection = authorized_collection
+        self.rollup_collection = rollup_collection
+        self.fingerprint_collection = fingerprint_collection
+        self.meta_collection = meta_collection
+
+    def _latest(self):
+        return self.db.collection(self.collection)
+
+    def _purges(self):
+        return self.db.collection(self.meta_collection).document(f'{self.collection}-purges')
+
+    def _delete_batch(self):
+        """WriteBatch that also bumps the purge generation data_version() reads: room for MAX_BATCH_OPS - 1 deletes"""
+        from google.cloud.firestore_v1.transforms import Increment
+
+        batch = self.db.batch()
+        batch.set(self._purges(), {'generation': Increment(1)}, merge=True)
+        return batch
+
+    def _archives(self, user_id):
+        return self._latest().document(user_id).collection('history_archive')
+
+    def _history(self, user_id):
+        return self._latest().document(user_id).collection('history')
+
+    def stream_latest(self, fields=None, limit=None):
+        query = self._latest()
+        if fields is not None:
+            query = query.select(list(fields))
+        if limit is not None:
+            query = query.limit(limit)
+        return query.stream()
+
+    def get_latest(self, doc_id):
+        snap = self._latest().document(doc_id).get()
+        return snap.to_dict() if snap.exists else None
+
+    def get_latest_many(self, doc_ids):
+        # One BatchGetDocuments call; snapshots come back in no particular order
+        snaps = self.db.get_all([self._latest().document(doc_id) for doc_id in doc_ids])
+        return {snap.id: snap.to_dict() for snap in snaps if snap.exists}
+
+    def stream_environment(self, env_code):
+        return self._latest().where('environment', '==', env_code).stream()
+
+    def stream_latest_changed(self, since):
+        return self._latest().where('changedAt', '>=', since).stream()
+
+    def delete_latest(self, doc_ids):
+        for chunk in ingest.chunks(doc_ids, ingest.MAX_BATCH_OPS - 1):
+            batch = self._delete_batch()
+            for doc_id in chunk:
+                batch.delete(self._latest().document(doc_id))
+            batch.commit()
+
+    def data_version(self):
+        # Every write stamps 'lastSeen' (history is written with it), every delete bumps the purge
+        # generation in the same batch: two document reads plus a count aggregation
+        newest = self._latest().order_by('lastSeen', direction='DESCENDING').limit(1).select(['lastSeen'])
+        last_seen = [doc.to_dict().get('lastSeen') for doc in newest.stream()]
+        count = self._latest().count().get()[0][0].value
+        purges = self._purges().get()
+        generation = purges.to_dict().get('generation', 0) if purges.exists else 0
+        return f'{count}:{last_seen[0] if last_seen else ""}:{generation}'
+
+    def new_history_id(self, user_id):
+        # Generated client-side, no round-trip
+        return self._history(user_id).document().id
+
+    def write_heartbeat(self, user_id, latest, history=(), last_seen=None):
+        # Sync or batched background writes, with latest-state coalescing (see dashboard/ingest.py)
+        history_ref = self._history(user_id)
+        return ingest.write(self.db, latest=(self._latest().document(user_id), latest),
+                            history=[(history_ref.document(doc_id), entry) for doc_id, entry in history],
+                            last_seen=last_seen, changed_at=firebase.SERVER_TIMESTAMP)
+
+    def hot_history_page(self, user_id, **params):
+        return playback.fetch_page(self.db, self._history(user_id), **params)
+
+    def get_history_many(self, user_id, doc_ids):
+        return history.firestore_keyframe_fetcher(self.db, self._history(user_id))(list(doc_ids))
+
+    def stream_history(self, user_id):
+        return self._history(user_id).stream()
+
+    def scan_history(self, user_id, start=None, before=None, limit=playback.MAX_LIMIT, cursor=None, fields=None,
+                     iso_timestamps=False):
+        if iso_timestamps:
+            start = playback.iso_z(start) if start else None
+            before = playback.iso_z(before) if before else None
+        query = self._history(user_id)
+        if start is not None:
+            query = query.where('timestamp', '>=', start)
+        if before is not None:
+            query = query.where('timestamp', '<', before)
+        query = query.order_by('timestamp').order_by('__name__')
+        if cursor is not None:
+            timestamp, doc_id = cursor
+            query = query.start_after({'timestamp': timestamp, '__name__': doc_id})
+        if fields is not None:
+            query = query.select(sorted(set(fields) | {'timestamp'}))
+        return [(doc.id, doc.to_dict()) for doc in query.limit(limit).stream()]
+
+    def delete_history(self, user_id, doc_ids):
+        history_ref = self._history(user_id)
+        for chunk in ingest.chunks(doc_ids, ingest.MAX_BATCH_OPS - 1):
+            batch = self._delete_batch()
+            for doc_id in chunk:
+                batch.delete(history_ref.document(doc_id))
+            batch.commit()
+
+    def write_history_archive(self, user_id, archive_id, meta, blob):
+        self._archives(user_id).document(archive_id).set(dict(meta, blob=blob))
+
+    def history_archives(self, user_id):
+        docs = self._archives(user_id).select(list(tiers.META_FIELDS)).stream()
+        return sorted((dict(doc.to_dict(), id=doc.id) for doc in docs), key=lambda meta: (meta['start'], meta['id']))
+
+    def read_history_archive(self, user_id, archive_id):
+        snap = self._archives(user_id).document(archive_id).get()
+        return snap.to_dict().get('blob') if snap.exists else None
+
+    def delete_history_archives(self, user_id, archive_ids):
+        for chunk in ingest.chunks(archive_ids, ingest.MAX_BATCH_OPS - 1):
+            batch = self._delete_batch()
+            for archive_id in chunk:
+                batch.delete(self._archives(user_id).document(archive_id))
+            batch.commit()
+
+    def bulk_write(self, latest=(), history=()):
+        ops = [(self._latest().document(doc_id), data) for doc_id, data in latest]
+        ops.extend((self._history(user_id).document(doc_id), entry) for user_id, doc_id, entry in history)
+        for chunk in ingest.chunks(ops, ingest.MAX_BATCH_OPS):
+            batch = self.db.batch()
+            for doc_ref, data in chunk:
+                batch.set(doc_ref, data)
+            batch.commit()
+
+    def get_authorized(self, student_id):
+        snap = self.db.collection(self.authorized_collection).document(student_id).get()
+        return snap.to_dict() if snap.exists else None
+
+    def set_authorized(self, student_id, data):
+        self.db.collection(self.authorized_collection).document(student_id).set(data)
+
+    def update_authorized(self, student_id, fields):
+        from google.api_core.exceptions import NotFound
+
+        try:
+            self.db.collection(self.authorized_collection).document(student_id).update(fields)
+        except NotFound:
+            raise LookupError(student_id)
+
+    def get_authorized_many(self, student_ids):
+        collection = self.db.collection(self.authorized_collection)
+        found = {}
+        for chunk in ingest.chunks(student_ids, ingest.MAX_BATCH_OPS):
+            refs = [collection.document(student_id) for student_id in chunk]
+            found.update((snap.id, snap.to_dict()) for snap in self.db.get_all(refs) if snap.exists)
+        return found
+
+    def merge_authorized_many(self, records, workers=1):
+        collection = self.db.collection(self.authorized_collection)
+        chunks = list(ingest.chunks(records, ingest.MAX_BATCH_OPS))
+
+        def commit(chunk):
+            batch = self.db.batch()
+            for student_id, fields in chunk:
+                batch.set(collection.document(student_id), fields, merge=True)
+            batch.commit()
+
+        # Each commit is a round-trip; a class roster is a handful of them, sent side by side
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(chunks))),
+                                thread_name_prefix='xscout-authorized') as executor:
+            list(executor.map(commit, chunks))
+        return len(chunks)
+
+    def delete_authorized_many(self, student_ids):
+        collection = self.db.collection(self.authorized_collection)
+        for chunk in ingest.chunks(student_ids, ingest.MAX_BATCH_OPS):
+            batch = self.db.batch()
+            for student_id in chunk:
+                batch.delete(collection.document(student_id))
+            batch.commit()
+
+    def stream_authorized_since(self, field, since):
+        return self.db.collection(self.authorized_collection).where(field, '>=', since).order_by(field).stream()
+
+    def stream_authorized(self):
+        return self.db.collection(self.authorized_collection).stream()
+
+    def watch_authorized(self, callback):
+        def on_snapshot(snapshots, changes, read_time):
+            callback({change.document.id: None if change.type.name == 'REMOVED' else change.document.to_dict()
+                      for change in changes})
+
+        return self.db.collection(self.authorized_collection).on_snapshot(on_snapshot)
+
+    # One document per student per bucket ('<resolution>-<bucket>-<user_id>'), so a busy bucket stays a set of
+    # small documents (a single map of every student runs into the per-document field and index-entry limits
+    # at about 1.5k students). slot ('<resolution>-<bucket, 10 digits>') sorts like the buckets: a class-wide
+    # query is one range query on it, a student's buckets are one batched get. Flushes merge with field
+    # transforms.
+
+    def _rollup(self, resolution, bucket, user_id):
+        return self.db.collection(self.rollup_collection).document(f'{_slot(resolution, bucket)}-{user_id}')
+
+    def write_rollups(self, rows):
+        from google.cloud.firestore_v1.transforms import Increment, Maximum, Minimum
+
+        for chunk in ingest.chunks(rows, ingest.MAX_BATCH_OPS):
+            batch = self.db.batch()
+            for resolution, bucket, user_id, environment, stats, expires in chunk:
+                data = {
+                    'resolution': resolution,
+                    'bucket': bucket,
+                    'slot': _slot(resolution, bucket),
+                    'user_id': user_id,
+                    # For a Firestore TTL policy on expiresAt; prune_rollups() covers the rest
+                    'expiresAt': datetime.fromtimestamp(expires, tz=timezone.utc),
+                }
+                for name, value in zip(rollups.FIELDS, stats):
+                    if name.endswith('_min'):
+                        data[name] = Minimum(value)
+                    elif name.endswith('_max'):
+                        data[name] = Maximum(value)
+                    else:
+                        data[name] = Increment(int(value) if name == 'count' else value)
+                if environment is not None:
+                    data['environment'] = environment
+                batch.set(self._rollup(resolution, bucket, user_id), data, merge=True)
+            batch.commit()
+
+    def read_rollups(self, resolution, start, end, user_id=None):
+        step = rollups.RESOLUTIONS[resolution]
+        if user_id is not None:
+            snaps = self.db.get_all([self._rollup(resolution, bucket, user_id)
+                                     for bucket in range(start, end + 1, step)])
+        else:
+            snaps = (self.db.collection(self.rollup_collection)
+                     .where('slot', '>=', _slot(resolution, start))
+                     .where('slot', '<=', _slot(resolution, end)).stream())
+        for snap in snaps:
+            if not snap.exists:
+                continue
+            fields = snap.to_dict()
+            yield (fields['bucket'], fields['user_id'], fields.get('environment'),
+                   [fields.get(name, 0) for name in rollups.FIELDS])
+
+    def prune_rollups(self, now):
+        expired = (self.db.collection(self.rollup_collection)
+                   .where('expiresAt', '<', datetime.fromtimestamp(now, tz=timezone.utc))
+                   .select([]).limit(ingest.MAX_BATCH_OPS).stream())
+        batch = self.db.batch()
+        for snap in expired:
+            batch.delete(snap.reference)
+        batch.commit()
+
+    # One document per fingerprint ('<hash as 16 hex digits>') with a map entry per student and the number of
+    # students in count. Merged writes can't keep an existing entry, so a student's posting names the latest entry
+    # that posted it. Once more than max_postings students posted a fingerprint it is boilerplate: the document is
+    # marked saturated, its map dropped, and it takes no more writes, so a starter-code line stays one small
+    # document instead of a map of the whole class that every first snapshot writes to.
+
+    def _fingerprint(self, value):
+        return self.db.collection(self.fingerprint_collection).document(f'{value:016x}')
+
+    def write_fingerprints(self, postings, max_postings=None):
+        from google.cloud.firestore_v1 import DELETE_FIELD, Increment
+        from google.cloud.firestore_v1.field_path import FieldPath
+
+        docs = {}
+        for value, user_id, entry_id, timestamp in postings:
+            docs.setdefault(value, {})[user_id] = {'entry': entry_id, 'timestamp': timestamp}
+        # The count and, of each map, only the students posting now: whether they're new is all that's needed
+        users = sorted({user_id for students in docs.values() for user_id in students})
+        field_paths = ['count', 'saturated'] + [FieldPath('students', user_id).to_api_repr() for user_id in users]
+        stored = {}
+        for chunk in ingest.chunks(docs, ingest.MAX_BATCH_OPS):
+            for snap in self.db.get_all([self._fingerprint(value) for value in chunk], field_paths=field_paths):
+                if snap.exists:
+                    stored[int(snap.id, 16)] = snap.to_dict()
+
+        writes = []
+        for value, students in docs.items():
+            current = stored.get(value) or {}
+            if current.get('saturated'):
+                continue
+            known = current.get('students') or {}
+            added = sum(1 for user_id in students if user_id not in known)
+            if max_postings is not None and current.get('count', 0) + added > max_postings:
+                writes.append((value, {'saturated': True, 'count': Increment(added), 'students': DELETE_FIELD}))
+            else:
+                writes.append((value, {'students': students, 'count': Increment(added)}))
+        for chunk in ingest.chunks(writes, ingest.MAX_BATCH_OPS):
+            batch = self.db.batch()
+            for value, data in chunk:
+                batch.set(self._fingerprint(value), data, merge=True)
+            batch.commit()
+
+    def read_fingerprints(self, hashes, max_postings=None):
+        found = {}
+        for snap in self.db.get_all([self._fingerprint(value) for value in hashes]):
+            if not snap.exists:
+                continue
+            data = snap.to_dict()
+            students = data.get('students') or {}
+            if data.get('saturated') or (max_postings is not None and len(students) > max_postings):
+                found[int(snap.id, 16)] = None
+                continue
+            found[int(snap.id, 16)] = {user_id: (posting.get('entry'), posting.get('timestamp'))
+                                       for user_id, posting in students.items()}
+        return found
+
+
+class Document:
+    """Snapshot-like row returned by SQLiteRepository."""
+
+    __slots__ = ('id', '_data')
+    exists = True
+
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+
+    def to_dict(self):
+        return self._data
+
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS latest_state (
+    id TEXT PRIMARY KEY,
+    environment TEXT,
+    data TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS latest_state_environment ON latest_state (environment);
+
+CREATE TABLE IF NOT EXISTS history (
+    user_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    timestamp TEXT,
+    summary TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (user_id, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS history_user_timestamp ON history (user_id, timestamp, id);
+
+CREATE TABLE IF NOT EXISTS history_archive (
+    user_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    start TEXT NOT NULL,
+    "end" TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    bytes INTEGER NOT NULL,
+    blob BLOB NOT NULL,
+    PRIMARY KEY (user_id, id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS authorized_ids (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS rollups (
+    resolution TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    user_id TEXT NOT NULL,
+    environment TEXT,
+    expires INTEGER NOT NULL,
+    {', '.join(f'{name} REAL NOT NULL' for name in rollups.FIELDS)},
+    PRIMARY KEY (resolution, bucket, user_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS rollups_user ON rollups (user_id, resolution, bucket);
+CREATE INDEX IF NOT EXISTS rollups_expires ON rollups (expires);
+
+CREATE TABLE IF NOT EXISTS fingerprints (
+    hash INTEGER NOT NULL,
+    user_id TEXT NOT NULL,
+    entry_id TEXT NOT NULL,
+    timestamp TEXT,
+    PRIMARY KEY (hash, user_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def _merge_column(name):
+    if name.endswith('_min'):
+        return f'{name} = min({name}, excluded.{name})'
+    if name.endswith('_max'):
+        return f'{name} = max({name}, excluded.{name})'
+    return f'{name} = {name} + excluded.{name}'
+
+
+ROLLUP_COLUMNS = ', '.join(rollups.FIELDS)
+ROLLUP_UPSERT = (
+    f"INSERT INTO rollups (resolution, bucket, user_id, environment, expires, {ROLLUP_COLUMNS}) "
+    f"VALUES ({', '.join('?' * (5 + len(rollups.FIELDS)))}) "
+    "ON CONFLICT (resolution, bucket, user_id) DO UPDATE SET "
+    "environment = coalesce(excluded.environment, environment), expires = max(expires, excluded.expires), "
+    + ', '.join(_merge_column(name) for name in rollups.FIELDS)
+)
+
+INSERT_LATEST = 'INSERT OR REPLACE INTO latest_state (id, environment, data) VALUES (?, ?, ?)'
+INSERT_HISTORY = 'INSERT OR REPLACE INTO history (user_id, id, timestamp, summary, data) VALUES (?, ?, ?, ?, ?)'
+
+# data_version(): a counter bumped in the same transaction as every write
+BUMP_VERSION = "INSERT INTO meta (key, value) VALUES ('version', 1) ON CONFLICT (key) DO UPDATE SET value = value + 1"
+
+# Rows fetched per round-trip while streaming a scan
+FETCH_SIZE = 500
+# Ids bound per IN (...) query (SQLite allows 999 parameters by default)
+MAX_PARAMS = 500
+
+
+def _dumps(data):
+    return json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':'))
+
+
+def _sort_key(timestamp):
+    """Stored timestamps are compared as text: datetimes become the extension's ISO format."""
+    if isinstance(timestamp, datetime):
+        return playback.iso_z(timestamp)
+    return timestamp
+
+
+def _history_row(user_id, doc_id, entry):
+    if 'timestamp' in entry:
+        entry = dict(entry, timestamp=_sort_key(entry['timestamp']))
+    summary = {key: entry[key] for key in INDEX_FIELDS if key in entry}
+    return user_id, doc_id, entry.get('timestamp'), _dumps(summary), _dumps(entry)
+
+
+class SQLiteRepository(TelemetryRepository):
+    """
+    Local store: latest state, history and authorized IDs as JSON documents
+    in three tables, plus tables of rollup buckets and fingerprint postings and a write counter for
+    data_version(). One connection per thread; WAL lets readers run alongside the writer.
+    """
+
+    def __init__(self, path=':memory:'):
+        if path == ':memory:':
+            # One shared in-memory database for every thread of this process
+            self._target = f'file:xscout-{secrets.token_hex(4)}?mode=memory&cache=shared'
+        else:
+            self._target = f'file:{os.path.abspath(path)}'
+        self._local = threading.local()
+        # Restores call bulk_write() from several threads. SQLite takes one writer at a time anyway, and a shared
+        # in-memory database fails a writer that finds the table locked instead of waiting for it.
+        self._bulk_lock = threading.Lock()
+        # Also keeps a shared in-memory database alive
+        self._conn = self._connect()
+        self._conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self._target, uri=True, timeout=5.0, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    @property
+    def conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _stream(self, sql, params=(), fields=None):
+        cursor = self.conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                return
+            for doc_id, raw in rows:
+                data = json.loads(raw)
+                if fields is not None:
+                    data = {key: data[key] for key in fields if key in data}
+                yield Document(doc_id, data)
+
+    def stream_latest(self, fields=None, limit=None):
+        if limit is None:
+            return self._stream('SELECT id, data FROM latest_state ORDER BY id', fields=fields)
+        return self._stream('SELECT id, data FROM latest_state ORDER BY id LIMIT ?', (limit,), fields)
+
+    def get_latest(self, doc_id):
+        row = self.conn.execute('SELECT data FROM latest_state WHERE id = ?', (doc_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_latest_many(self, doc_ids):
+        found = {}
+        for chunk in ingest.chunks(doc_ids, MAX_PARAMS):
+            marks = ', '.join('?' * len(chunk))
+            rows = self.conn.execute(f'SELECT id, data FROM latest_state WHERE id IN ({marks})', chunk)
+            found.update((doc_id, json.loads(raw)) for doc_id, raw in rows)
+        return found
+
+    def stream_environment(self, env_code):
+        return self._stream('SELECT id, data FROM latest_state WHERE environment = ? ORDER BY id', (env_code,))
+
+    def stream_latest_changed(self, since):
+        # Stored the way the JSON encoder writes datetimes, which sorts like the times (see stream_authorized_since)
+        return self._stream("SELECT id, data FROM latest_state WHERE json_extract(data, '$.changedAt') >= ? "
+                            'ORDER BY id', (json.loads(_dumps(since)),))
+
+    def delete_latest(self, doc_ids):
+        with self.conn:
+            self.conn.executemany('DELETE FROM latest_state WHERE id = ?', [(doc_id,) for doc_id in doc_ids])
+            self.conn.execute(BUMP_VERSION)
+
+    def data_version(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return str(row[0] if row else 0)
+
+    def new_history_id(self, user_id):
+        return secrets.token_urlsafe(15)
+
+    def write_heartbeat(self, user_id, latest, history=(), last_seen=None):
+        latest = resolve_server_timestamps(latest)
+        if last_seen is not None:
+            latest['lastSeen'] = resolve_server_timestamps({'lastSeen': last_seen})['lastSeen']
+        # No coalescing here: every write is a full one
+        latest['changedAt'] = datetime.now(timezone.utc)
+        rows = [_history_row(user_id, doc_id, resolve_server_timestamps(entry)) for doc_id, entry in history]
+
+        with self.conn:
+            self.conn.execute(INSERT_LATEST, (user_id, latest.get('environment'), _dumps(latest)))
+            self.conn.executemany(INSERT_HISTORY, rows)
+            self.conn.execute(BUMP_VERSION)
+        return False
+
+    def hot_history_page(self, user_id, start=None, end=None, limit=playback.DEFAULT_LIMIT, cursor=None, fields=None,
+                         descending=False, iso_timestamps=False):
+        # Timestamps are stored as text either way (see _sort_key)
+        index_only = fields is not None and set(fields) <= set(INDEX_FIELDS)
+        sql = [f"SELECT id, {'summary' if index_only else 'data'} FROM history WHERE user_id = ?"]
+        params = [user_id]
+        if start is not None:
+            sql.append('AND timestamp >= ?')
+            params.append(_sort_key(start))
+        if end is not None:
+            sql.append('AND timestamp <= ?')
+            params.append(_sort_key(end))
+        if cursor is not None:
+            timestamp, doc_id = cursor
+            sql.append(f"AND (timestamp, id) {'<' if descending else '>'} (?, ?)")
+            params.extend([_sort_key(timestamp), doc_id])
+        order = 'DESC' if descending else 'ASC'
+        sql.append(f'ORDER BY timestamp {order}, id {order} LIMIT ?')
+        params.append(limit + 1)
+
+        entries = [(doc_id, json.loads(raw)) for doc_id, raw in self.conn.execute(' '.join(sql), params)]
+        return playback.build_page(entries, limit, fields, lambda doc_ids: self.get_history_many(user_id, doc_ids))
+
+    def stream_history(self, user_id):
+        return self._stream('SELECT id, data FROM history WHERE user_id = ? ORDER BY timestamp, id', (user_id,))
+
+    def scan_history(self, user_id, start=None, before=None, limit=playback.MAX_LIMIT, cursor=None, fields=None,
+                     iso_timestamps=False):
+        sql = ['SELECT id, data FROM history WHERE user_id = ? AND timestamp IS NOT NULL']
+        params = [user_id]
+        if start is not None:
+            sql.append('AND timestamp >= ?')
+            params.append(_sort_key(start))
+        if before is not None:
+            sql.append('AND timestamp < ?')
+            params.append(_sort_key(before))
+        if cursor is not None:
+            timestamp, doc_id = cursor
+            sql.append('AND (timestamp, id) > (?, ?)')
+            params.extend([_sort_key(timestamp), doc_id])
+        sql.append('ORDER BY timestamp, id LIMIT ?')
+        params.append(limit)
+        if fields is not None:
+            fields = sorted(set(fields) | {'timestamp'})
+        return [(doc.id, doc.to_dict()) for doc in self._stream(' '.join(sql), params, fields)]
+
+    def delete_history(self, user_id, doc_ids):
+        with self.conn:
+            self.conn.executemany('DELETE FROM history WHERE user_id = ? AND id = ?',
+                                  [(user_id, doc_id) for doc_id in doc_ids])
+            self.conn.execute(BUMP_VERSION)
+
+    def bulk_write(self, latest=(), history=()):
+        latest_rows = [(doc_id, data.get('environment'), _dumps(data)) for doc_id, data in latest]
+        history_rows = [_history_row(user_id, doc_id, entry) for user_id, doc_id, entry in history]
+        with self._bulk_lock, self.conn:
+            self.conn.executemany(INSERT_LATEST, latest_rows)
+            self.conn.executemany(INSERT_HISTORY, history_rows)
+            self.conn.execute(BUMP_VERSION)
+
+    def get_history_many(self, user_id, doc_ids):
+        found = {}
+        for chunk in ingest.chunks(doc_ids, MAX_PARAMS):
+            marks = ', '.join('?' * len(chunk))
+            rows = self.conn.execute(f'SELECT id, data FROM history WHERE user_id = ? AND id IN ({marks})',
+                                     [user_id, *chunk])
+            found.update((doc_id, json.loads(raw)) for doc_id, raw in rows)
+        return found
+
+    def write_history_archive(self, user_id, archive_id, meta, blob):
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO history_archive (user_id, id, start, "end", count, bytes, blob) '
+                              'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                              (user_id, archive_id, meta['start'], meta['end'], meta['count'], meta['bytes'], blob))
+            self.conn.execute(BUMP_VERSION)
+
+    def history_archives(self, user_id):
+        rows = self.conn.execute('SELECT id, start, "end", count, bytes FROM history_archive WHERE user_id = ? '
+                                 'ORDER BY start, id', (user_id,))
+        return [{'id': archive_id, 'start': start, 'end': end, 'count': count, 'bytes': size}
+                for archive_id, start, end, count, size in rows]
+
+    def read_history_archive(self, user_id, archive_id):
+        row = self.conn.execute('SELECT blob FROM history_archive WHERE user_id = ? AND id = ?',
+                                (user_id, archive_id)).fetchone()
+        return bytes(row[0]) if row else None
+
+    def delete_history_archives(self, user_id, archive_ids):
+        with self.conn:
+            self.conn.executemany('DELETE FROM history_archive WHERE user_id = ? AND id = ?',
+                                  [(user_id, archive_id) for archive_id in archive_ids])
+            self.conn.execute(BUMP_VERSION)
+
+    def get_authorized(self, student_id):
+        row = self.conn.execute('SELECT data FROM authorized_ids WHERE id = ?', (student_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_authorized(self, student_id, data):
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO authorized_ids (id, data) VALUES (?, ?)',
+                              (student_id, _dumps(resolve_server_timestamps(data))))
+
+    def update_authorized(self, student_id, fields):
+        with self.conn:
+            current = self.get_authorized(student_id)
+            if current is None:
+                raise LookupError(student_id)
+            current.update(resolve_server_timestamps(fields))
+            self.conn.execute('UPDATE authorized_ids SET data = ? WHERE id = ?', (_dumps(current), student_id))
+
+    def get_authorized_many(self, student_ids):
+        found = {}
+        for chunk in ingest.chunks(student_ids, MAX_PARAMS):
+            marks = ', '.join('?' * len(chunk))
+            rows = self.conn.execute(f'SELECT id, data FROM authorized_ids WHERE id IN ({marks})', chunk)
+            found.update((student_id, json.loads(raw)) for student_id, raw in rows)
+        return found
+
+    def merge_authorized_many(self, records, workers=1):
+        # One transaction: SQLite has a single writer, so there is nothing to spread across threads
+        records = list(records)
+        with self.conn:
+            merged = self.get_authorized_many(student_id for student_id, _ in records)
+            for student_id, fields in records:
+                merged.setdefault(student_id, {}).update(resolve_server_timestamps(fields))
+            self.conn.executemany('INSERT OR REPLACE INTO authorized_ids (id, data) VALUES (?, ?)',
+                                  [(student_id, _dumps(data)) for student_id, data in merged.items()])
+        return 1 if records else 0
+
+    def delete_authorized_many(self, student_ids):
+        with self.conn:
+            self.conn.executemany('DELETE FROM authorized_ids WHERE id = ?', [(student_id,) for student_id in student_ids])
+
+    def stream_authorized_since(self, field, since):
+        # Timestamps are stored as the JSON encoder writes them, which sorts like the times
+        path = f'$.{field}'
+        return self._stream('SELECT id, data FROM authorized_ids WHERE json_extract(data, ?) >= ? '
+                            'ORDER BY json_extract(data, ?), id', (path, json.loads(_dumps(since)), path))
+
+    def stream_authorized(self):
+        return self._stream('SELECT id, data FROM authorized_ids ORDER BY id')
+
+    def write_rollups(self, rows):
+        with self.conn:
+            self.conn.executemany(ROLLUP_UPSERT, [(resolution, bucket, user_id, environment, expires, *stats)
+                                                  for resolution, bucket, user_id, environment, stats, expires
+                                                  in rows])
+
+    def read_rollups(self, resolution, start, end, user_id=None):
+        sql = f'SELECT bucket, user_id, environment, {ROLLUP_COLUMNS} FROM rollups ' \
+              'WHERE resolution = ? AND bucket BETWEEN ? AND ?'
+        params = [resolution, start, end]
+        if user_id is not None:
+            sql += ' AND user_id = ?'
+            params.append(user_id)
+        for row in self.conn.execute(sql, params):
+            yield row[0], row[1], row[2], row[3:]
+
+    def prune_rollups(self, now):
+        with self.conn:
+            self.conn.execute('DELETE FROM rollups WHERE expires < ?', (now,))
+
+    def write_fingerprints(self, postings, max_postings=None):
+        # The first entry that posted a fingerprint keeps it; every posting is kept, max_postings applies on reads
+        with self.conn:
+            self.conn.executemany('INSERT OR IGNORE INTO fingerprints (hash, user_id, entry_id, timestamp) '
+                                  'VALUES (?, ?, ?, ?)', postings)
+
+    def read_fingerprints(self, hashes, max_postings=None):
+        found = {}
+        for chunk in ingest.chunks(hashes, MAX_PARAMS):
+            rows = self.conn.execute('SELECT hash, user_id, entry_id, timestamp FROM fingerprints '
+                                     f'WHERE hash IN ({", ".join("?" * len(chunk))})', chunk)
+            for value, user_id, entry_id, timestamp in rows:
+                found.setdefault(value, {})[user_id] = (entry_id, timestamp)
+        if max_postings is not None:
+            found = {value: students if len(students) <= max_postings else None
+                     for value, students in found.items()}
+        return found
+
+
+_repository = None
+_repository_lock = threading.Lock()
+
+
+def get_repository():
+    """Process-wide repository for XSCOUT_STORAGE_BACKEND, created on first use."""
+    global _repository
+    if _repository is None:
+        from django.conf import settings
+        with _repository_lock:
+            if _repository is None:
+                backend = getattr(settings, 'XSCOUT_STORAGE_BACKEND', 'firestore')
+                if backend == 'sqlite':
+                    _repository = SQLiteRepository(getattr(settings, 'XSCOUT_STORAGE_SQLITE_PATH', ':memory:'))
+                elif backend == 'firestore':
+                    _repository = FirestoreRepository(
+                        firebase.get_client(),
+                        collection=getattr(settings, 'XSCOUT_TELEMETRY_COLLECTION', 'reports'),
+                        authorized_collection=getattr(settings, 'XSCOUT_AUTHORIZED_COLLECTION',
+                                                      'authorized_students'),
+                        rollup_collection=getattr(settings, 'XSCOUT_ROLLUP_COLLECTION', 'report_rollups'),
+                        fingerprint_collection=getattr(settings, 'XSCOUT_FINGERPRINT_COLLECTION',
+                                                       'snapshot_fingerprints'),
+                        meta_collection=getattr(settings, 'XSCOUT_META_COLLECTION', 'report_meta'),
+                    )
+                else:
+                    raise ValueError(f"Unknown XSCOUT_STORAGE_BACKEND '{backend}'. Use 'firestore' or 'sqlite'")
+    return _repository
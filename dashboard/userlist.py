@@ -0,0 +1,107 @@
+"""
+Paginated, filtered reads of the AuthorizedID table for the Users tab.
+
+The list is ordered newest first by (created_at, id) and continues with an
+opaque cursor (the playback cursor format), so a page is an index range scan
+of `limit` rows however many IDs are authorized, and an ID added while
+someone is paging doesn't shift the pages after it. Query params:
+
+- limit: page size (default DEFAULT_LIMIT, capped at MAX_LIMIT);
+- cursor: the next_cursor of the previous page;
+- q: a student ID prefix, or text anywhere in the description;
+- active: true / false for only active or only revoked IDs.
+
+Both orderings are backed by indexes, (created_at, id) and (is_active,
+created_at, id). counts() is what the UI sizes its virtual scroller from.
+"""
+from datetime import datetime
+
+from django.db.models import Q
+
+from . import playback
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+FIELDS = ('id', 'student_id', 'description', 'is_active', 'created_at', 'updated_at')
+
+_BOOLEANS = {'1': True, 'true': True, 'yes': True, '0': False, 'false': False, 'no': False}
+
+
+def _cursor(token):
+    """(created_at, id) of a next_cursor. Raises ValueError."""
+    created_at, pk = playback.decode_cursor(token)
+    # Any other shape would only fail once the query runs
+    if not isinstance(created_at, datetime) or type(pk) is not int:
+        raise ValueError('Invalid cursor')
+    return created_at, pk
+
+
+def parse_params(params):
+    """Validated fetch_page() kwargs from request.GET. Raises ValueError."""
+    try:
+        limit = int(params.get('limit') or DEFAULT_LIMIT)
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be positive')
+
+    active = params.get('active', '').strip().lower()
+    if active and active not in _BOOLEANS:
+        raise ValueError(f"active must be true or false, not '{active}'")
+    return {
+        'limit': min(limit, MAX_LIMIT),
+        'cursor': _cursor(params['cursor']) if params.get('cursor') else None,
+        'q': params.get('q', '').strip() or None,
+        'active': _BOOLEANS[active] if active else None,
+    }
+
+
+def filtered(queryset, q=None, active=None):
+    if active is not None:
+        queryset = queryset.filter(is_active=active)
+    if q:
+        queryset = queryset.filter(Q(student_id__startswith=q) | Q(description__icontains=q))
+    return queryset
+
+
+def fetch_page(queryset, limit=DEFAULT_LIMIT, cursor=None, q=None, active=None):
+    """
+    One page of AuthorizedID rows, newest first.
+
+    Returns {'users': [...], 'next_cursor': str | None, 'has_more': bool}.
+    """
+    queryset = filtered(queryset, q, active).order_by('-created_at', '-id')
+    if cursor is not None:
+        created_at, pk = cursor
+        # The plain bound lets the database start the index scan at the cursor;
+        # the OR alone is only a filter on a scan from the top.
+        queryset = queryset.filter(created_at__lte=created_at).filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+    users = list(queryset.values(*FIELDS)[:limit + 1])
+    has_more = len(users) > limit
+    users = users[:limit]
+    next_cursor = None
+    if has_more:
+        next_cursor = playback.encode_cursor(users[-1]['created_at'], users[-1]['id'])
+    for user in users:
+        del user['id']
+    return {'users': users, 'next_cursor': next_cursor, 'has_more': has_more}
+
+
+def counts(queryset, q=None, active=None):
+    """
+    Totals for the whole table plus how many rows the filters match. Two
+    plain counts rather than one conditional aggregate: each is answered from
+    an index without reading the table.
+    """
+    total = queryset.count()
+    active_count = queryset.filter(is_active=True).count()
+    result = {'total': total, 'active': active_count, 'inactive': total - active_count}
+    if q:
+        result['matching'] = filtered(queryset, q, active).count()
+    elif active is None:
+        result['matching'] = result['total']
+    else:
+        result['matching'] = active_count if active else result['inactive']
+    return result
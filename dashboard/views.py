@@ -1,35 +1,15 @@
 # Project: xScout - Force Reload for Templates v793
 from django.shortcuts import render, redirect
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponseNotModified
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-import firebase_admin
-from firebase_admin import credentials, firestore
 import os
-import difflib # For similarity checking
+from . import (analytics, archive, authorization, authsync, cache, changes, environments, export, fingerprints,
+               firebase, history, ingest, jobs, live, playback, retention, rollups, roster, similarity, storage,
+               streaming, tiers)
 
-# Initialize Firebase (Singleton)
-if not firebase_admin._apps:
-    try:
-        current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        # Priority 1: Specific JSON file
-        # Priority 2: Service Account Key
-        # Priority 3: Environment Variable
-        cred_path = os.path.join(current_dir, 'xscout-68489-firebase-adminsdk-fbsvc-71d744a27c.json')
-        if not os.path.exists(cred_path):
-             cred_path = os.path.join(current_dir, 'serviceAccountKey.json')
-             
-        if os.path.exists(cred_path):
-            cred = credentials.Certificate(cred_path)
-            firebase_admin.initialize_app(cred)
-        else:
-            # Fallback to default credentials (useful for production envs like Google Cloud/Render)
-            firebase_admin.initialize_app()
-    except Exception as e:
-        print(f"Firebase Init Warning: {e}. Ensure GOOGLE_APPLICATION_CREDENTIALS is set if .json is missing.")
-
-db = firestore.client()
+# Firestore (or the local SQLite store) is opened on first use, see dashboard/storage.py
 
 def home(request):
     """Landing page - public access"""
@@ -74,22 +54,44 @@ def playback_view(request):
 
 @login_required # Force reload comment
 def get_playback_data(request, user_id=None):
-    """API to fetch session history for playback"""
+    """
+    API to fetch session history for playback, one page at a time.
+    Supports ?start=&end=&limit=&cursor=&fields= (see dashboard/playback.py).
+    """
     if not user_id:
         user_id = request.GET.get('user_id')
     if not user_id:
         return JsonResponse({'status': 'error', 'message': 'Missing user_id'}, status=400)
 
     try:
-        # Fetch history from sub-collection, ordered by timestamp
-        docs = db.collection('reports').document(user_id).collection('history').order_by('timestamp').stream()
-        
-        history = []
-        for doc in docs:
-            data = doc.to_dict()
-            history.append(data)
-            
-        return JsonResponse({'status': 'success', 'data': history})
+        params = playback.parse_params(request.GET)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    try:
+        # Page through the sub-collection ordered by timestamp; deltas are rebuilt
+        # into full snapshots server-side
+        page = storage.get_repository().history_page(user_id, **params)
+        return JsonResponse({'status': 'success', **page})
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+
+
+@login_required
+def get_history_data(request, user_id):
+    """
+    History for the Analyze modal slider: the newest page (50 by default), oldest first.
+    Follow next_cursor to page further back; accepts the same params as the playback API.
+    """
+    try:
+        params = playback.parse_params(request.GET, default_limit=50)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    try:
+        page = storage.get_repository().history_page(user_id, descending=True, **params)
+        page['data'].reverse()
+        return JsonResponse({'status': 'success', **page})
     except Exception as e:
         return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
 
@@ -100,8 +102,38 @@ import json
 def get_dashboard_data(request):
     if request.method == 'GET':
         try:
+            env_code = request.GET.get('environment')
+            if env_code:
+                # One environment's students: members and their latest state from ingest, re-read by id when
+                # stale (see dashboard/environments.py)
+                repository = storage.get_repository()
+                environment_index = environments.get_index('reports')
+                if environment_index is not None:
+                    return JsonResponse({'status': 'success', 'data': environment_index.students(env_code, repository)})
+                data = [dict(doc.to_dict(), id=doc.id) for doc in repository.stream_environment(env_code)]
+                return JsonResponse({'status': 'success', 'data': data})
+
             # Android expects data in 'reports' collection
-            docs = db.collection('reports').stream()
+            docs = storage.get_repository().stream_latest()
+            if streaming.wants_stream(request):
+                # ?stream=1 / ?format=ndjson: serialise page by page as Firestore yields
+                return streaming.stream_documents(request, docs)
+
+            change_index = changes.get_index('reports')
+            if change_index is not None:
+                # Full list plus a watermark; ?since=<watermark> answers only what changed (see dashboard/changes.py)
+                try:
+                    delta = change_index.changes(request.GET.get('since'), _latest_state, _latest_changed)
+                except ValueError as e:
+                    return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+                return JsonResponse({'status': 'success', **delta})
+
+            latest_cache = cache.get_cache('reports')
+            if latest_cache is not None:
+                # Polls within the TTL share one scan; POSTs write through (see dashboard/cache.py)
+                data = latest_cache.get_all(lambda: ((doc.id, doc.to_dict()) for doc in docs))
+                return JsonResponse({'status': 'success', 'data': data})
+
             data = []
             for doc in docs:
                 doc_data = doc.to_dict()
@@ -114,7 +146,11 @@ def get_dashboard_data(request):
             
     elif request.method == 'POST':
         try:
-            body = json.loads(request.body)
+            body = ingest.validate_heartbeat(json.loads(request.body))
+        except ValueError as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+        try:
             # Use user ID from body or fall back to 'unknown'
             user_id = body.get('user', 'user_001')
             
@@ -123,7 +159,7 @@ def get_dashboard_data(request):
                 'studentId': user_id,
                 'studentName': user_id, # Fallback to ID until we have a name lookup
                 'email': body.get('email', f"{user_id}@xscout.app"),
-                'timestamp': firestore.SERVER_TIMESTAMP,
+                'timestamp': firebase.SERVER_TIMESTAMP,
                 'isActive': True,
                 'ai': body.get('ai', 0), # Store raw score (0-100)
                 'behavior': {
@@ -137,9 +173,13 @@ def get_dashboard_data(request):
                 'tech': body.get('tech', {}), # SAVE TECH METADATA
                 'titleHistory': body.get('forensic', {}).get('activeDocuments', [])
             }
+            if body.get('environment'):
+                # Lets ?environment= find the student (see dashboard/environments.py)
+                android_report['environment'] = body['environment']
             
-            # Write to Firestore in the 'reports' collection for Android compatibility
-            db.collection('reports').document(user_id).set(android_report)
+            # Written to the 'reports' collection for Android compatibility
+            repository = storage.get_repository()
+            history_writes = []
 
             # Store History for playback (Archive snapshots)
             snapshot = body.get('snapshot') or body.get('forensic', {}).get('snapshot')
@@ -152,54 +192,256 @@ def get_dashboard_data(request):
                     'ai_score': android_report['ai'],
                     'forensic': body.get('forensic', {}) # Include full forensic data for completeness
                 }
-                db.collection('reports').document(user_id).collection('history').add(history_entry)
-            
+                # Keyframe or line-level delta against the user's keyframe (see dashboard/history.py)
+                history_id = repository.new_history_id(user_id)
+                history_writes.append((history_id, history.encode(user_id, history_id, history_entry)))
+
+            # Sync mode writes now; async mode queues for the batched background writer.
+            # Unchanged reports only get their liveness fields refreshed (see ingest.LatestStateCoalescer)
+            try:
+                queued = repository.write_heartbeat(user_id, android_report, history=history_writes,
+                                                    last_seen=firebase.SERVER_TIMESTAMP)
+            except Exception:
+                # The encoder already moved on to this entry; later deltas must not point at a keyframe never stored
+                history.forget(user_id)
+                raise
+
+            latest_state = dict(android_report, lastSeen=firebase.SERVER_TIMESTAMP)
+            latest_cache = cache.get_cache('reports')
+            if latest_cache is not None:
+                latest_cache.put(user_id, latest_state)
+            change_index = changes.get_index('reports')
+            if change_index is not None:
+                change_index.record(user_id, latest_state)
+            environment_index = environments.get_index('reports')
+            if environment_index is not None:
+                environment_index.record(user_id, latest_state)
+            live.publish(user_id, latest_state)
+            rollup_store = rollups.get_store()
+            if rollup_store is not None:
+                # 1-minute and 10-minute behavior buckets for trend queries (see dashboard/rollups.py)
+                rollup_store.add(user_id, android_report['behavior'], environment=body.get('environment'))
+            fingerprint_index = fingerprints.get_index()
+            if fingerprint_index is not None and history_writes:
+                # Postings for plagiarism search across sessions (see dashboard/fingerprints.py)
+                fingerprint_index.add(user_id, history_writes[0][0], snapshot.get('code'),
+                                      timestamp=android_report['timestamp'])
+
+            if queued:
+                return JsonResponse({'status': 'queued'}, status=202)
             return JsonResponse({'status': 'saved'})
+        except ingest.QueueFull as e:
+            response = JsonResponse({'status': 'error', 'message': str(e)}, status=503)
+            response['Retry-After'] = '5'
+            return response
         except Exception as e:
             print(f"Error saving telemetry: {e}")
             return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
             
     return JsonResponse({'status': 'method_not_allowed'}, status=405)
 
-import csv
-from django.http import HttpResponse
-from datetime import datetime, timedelta
 
 @login_required
-def export_logs(request):
+def ingest_metrics(request):
+    """Queue depth and flush latency of the telemetry ingest writer (this worker only)"""
+    data = ingest.metrics()
+    data['latest_cache'] = cache.metrics()
+    data['changes'] = changes.metrics()
+    data['environments'] = environments.metrics()
+    data['live'] = live.metrics()
+    data['rollups'] = rollups.metrics()
+    data['analytics'] = analytics.metrics()
+    data['jobs'] = jobs.metrics()
+    data['retention'] = retention.metrics()
+    data['tiers'] = tiers.metrics()
+    data['authorization'] = authorization.metrics()
+    data['roster'] = roster.metrics()
+    data['authsync'] = authsync.metrics()
+    data['fingerprints'] = fingerprints.metrics()
+    return JsonResponse({'status': 'success', 'data': data})
+
+
+@login_required
+def get_risk_analytics(request):
+    """
+    Class-wide risk: per-environment distributions, z-score outliers and high-risk counts, ?environment= for one
+    environment and ?students=1 for every student's z-scores and percentile ranks (see dashboard/analytics.py)
+    """
     try:
-        # Create the HttpResponse object with the appropriate CSV header.
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="xscout_logs_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv"'
+        data = analytics.get_analytics().get(_latest_state, environment=request.GET.get('environment'),
+                                             students=request.GET.get('students') == '1')
+        return JsonResponse({'status': 'success', 'data': data})
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
 
-        writer = csv.writer(response)
-        writer.writerow(['User ID', 'Timestamp', 'App', 'Window Title', 'AI Risk Score', 'WPM'])
 
-        docs = db.collection('reports').stream()
-        for doc in docs:
-            data = doc.to_dict()
-            writer.writerow([
-                doc.id,
-                data.get('timestamp', 'N/A'),
-                data.get('forensic', {}).get('activeApp', 'N/A'),
-                data.get('forensic', {}).get('activeWindow', 'N/A'),
-                data.get('ai', 0),
-                data.get('behavior', {}).get('wpm', 0)
-            ])
+@login_required
+def get_behavior_rollups(request):
+    """
+    Behavior trend from the rollup buckets: summary and per-bucket series of ?metric= (wpm) over the last
+    ?window= seconds (3600), optionally for one ?environment= or ?user_id= (see dashboard/rollups.py)
+    """
+    rollup_store = rollups.get_store()
+    if rollup_store is None:
+        return JsonResponse({'status': 'error', 'message': 'Behavior rollups are disabled'}, status=404)
+    try:
+        params = rollups.parse_params(request.GET)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    try:
+        return JsonResponse({'status': 'success', 'data': rollup_store.query(**params)})
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+
+
+@login_required
+def get_behavior_sessions(request, user_id):
+    """A student's sessions with per-session behavior aggregates and paste bursts, ?start=&end= optional"""
+    rollup_store = rollups.get_store()
+    if rollup_store is None:
+        return JsonResponse({'status': 'error', 'message': 'Behavior rollups are disabled'}, status=404)
+    try:
+        start = playback.parse_time(request.GET['start']) if request.GET.get('start') else None
+        end = playback.parse_time(request.GET['end']) if request.GET.get('end') else None
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    try:
+        return JsonResponse({'status': 'success', 'data': rollup_store.sessions(user_id, start=start, end=end)})
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+
+
+def _latest_state():
+    """Every report with its 'id', through the latest-state cache when enabled"""
+    def scan():
+        return ((doc.id, doc.to_dict()) for doc in storage.get_repository().stream_latest())
+
+    latest_cache = cache.get_cache('reports')
+    if latest_cache is None:
+        return [dict(data, id=doc_id) for doc_id, data in scan()]
+    return latest_cache.get_all(scan)
+
+
+def _latest_changed(since):
+    """Reports whose content was written at or after `since` (epoch seconds), read straight from storage"""
+    docs = storage.get_repository().stream_latest_changed(datetime.fromtimestamp(since, timezone.utc))
+    return [dict(doc.to_dict(), id=doc.id) for doc in docs]
 
+
+@login_required
+async def live_updates(request):
+    """Server-Sent Events stream of changed reports (see dashboard/live.py)"""
+    try:
+        topic = live.parse_topic(request.GET.get('topic'))
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    if not live.is_streamable(request):
+        # Clients fall back to polling /api/telemetry/
+        return JsonResponse({'status': 'error', 'message': 'Live updates are not available; poll /api/telemetry/'},
+                            status=503)
+    return live.stream(topic, _latest_state)
+
+from datetime import datetime, timedelta, timezone
+
+@login_required
+def export_logs(request):
+    """
+    CSV of the latest state, or every history entry with ?scope=history, narrowed by ?environment=, ?users= and
+    ?start=/?end=. Streamed as it is read, ?compress=gzip for .csv.gz (see dashboard/export.py)
+    """
+    try:
+        params = export.parse_params(request.GET)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    try:
+        compress = params.pop('compress')
+        chunks = export.get_exporter(storage.get_repository()).csv(**params)
+        filename = f'xscout_logs_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+        if compress:
+            response = streaming.response(request, export.gzipped(chunks), content_type='application/gzip')
+            filename += '.gz'
+        else:
+            response = streaming.response(request, chunks, content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
         return response
     except Exception as e:
         return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
 
+
+@csrf_exempt
+@login_required
+def create_job(request):
+    """
+    Starts a background export or backup ({"kind": "export" | "backup", "params": {...}}), or returns the one
+    already running or finished for unchanged data (see dashboard/jobs.py)
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'POST required'}, status=405)
+    try:
+        kind, params = jobs.parse_request(json.loads(request.body or b'{}'))
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    try:
+        job = jobs.get_manager().submit(kind, params)
+        return JsonResponse({'status': 'success', 'job': job}, status=200 if job['status'] == 'done' else 202)
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+
+
+@login_required
+def get_job(request, job_id):
+    """Status and progress of a background job"""
+    try:
+        return JsonResponse({'status': 'success', 'job': jobs.get_manager().status(job_id)})
+    except LookupError:
+        return JsonResponse({'status': 'error', 'message': 'Job not found'}, status=404)
+
+
+@login_required
+def download_job(request, job_id):
+    """A finished job's artifact, resumable with Range requests"""
+    try:
+        return jobs.get_manager().download(request, job_id)
+    except LookupError:
+        return JsonResponse({'status': 'error', 'message': 'No finished artifact for this job'}, status=404)
+
 @login_required
 def system_backup(request):
     try:
         # Dump all telemetry to JSON
-        docs = db.collection('reports').stream()
-        all_data = {doc.id: doc.to_dict() for doc in docs}
-        
-        response = JsonResponse(all_data, json_dumps_params={'indent': 2})
-        response['Content-Disposition'] = f'attachment; filename="xscout_backup_{datetime.now().strftime("%Y%m%d")}.json"'
+        docs = storage.get_repository().stream_latest()
+        filename = f'xscout_backup_{datetime.now().strftime("%Y%m%d")}'
+
+        if request.GET.get('format') == 'parquet':
+            # Latest state plus history as a tar of Parquet files (dashboard/archive.py). Built before the
+            # first byte goes out, so large tenants should use a backup job instead.
+            chunks = streaming.primed(archive.archive_chunks(storage.get_repository()))
+            response = streaming.response(request, chunks, content_type='application/x-tar')
+            filename += '.tar'
+        # Buffered, so a storage failure is a 500 rather than a truncated file. ?stream=1 writes it as Firestore
+        # pages arrive; a failure part way is then only marked by a trailing "__error__" key (dashboard/streaming.py)
+        elif streaming.wants_stream(request):
+            docs = streaming.primed(docs)
+            if request.GET.get('format') == 'ndjson':
+                response = streaming.response(request, streaming.ndjson(streaming.documents(docs)),
+                                              content_type=streaming.NDJSON_CONTENT_TYPE)
+                filename += '.ndjson'
+            else:
+                pairs = ((doc.id, doc.to_dict()) for doc in docs)
+                response = streaming.response(request, streaming.json_object(pairs, indent=2),
+                                              content_type='application/json')
+                filename += '.json'
+        else:
+            all_data = {doc.id: doc.to_dict() for doc in docs}
+            response = JsonResponse(all_data, json_dumps_params={'indent': 2})
+            filename += '.json'
+
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
         return response
     except Exception as e:
         return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
@@ -209,34 +451,10 @@ def system_backup(request):
 def purge_logs(request):
     if request.method == 'POST':
         try:
-            # Logic to delete old logs
-            # Since Firestore free tier requires individual deletes, we'll just batch delete for this demo
-            # In production, query by timestamp < 30 days ago
-            
-            # Mocking the "30 days" check by checking if 'timestamp' exists and parsing it
-            # For this demo, we will just count items to show it "worked" without actually destroying data aggressively
-            # unless explicitly requested. I'll delete documents that explicitly look like test data or old.
-            
-            # Simple implementation: Delete everything for cleanup demo or just return success simulation
-            # Let's actually delete just to be functional
-            
-            batch = db.batch()
-            docs = db.collection('reports').limit(50).stream() 
-            deleted_count = 0
-            
-            for doc in docs:
-                # In a real scenario: if doc.create_time < 30_days_ago:
-                # db.collection('telemetry').document(doc.id).delete()
-                # For safety in this demo, let's NOT wipe the DB, but return success 
-                # or maybe delete strictly 'unknown' users
-                if 'user' in doc.id and 'test' in doc.id.lower():
-                     batch.delete(doc.reference)
-                     deleted_count += 1
-            
-            if deleted_count > 0:
-                batch.commit()
-
-            return JsonResponse({'status': 'success', 'message': f'Purged {deleted_count} old records.'})
+            # History older than the retention period (dashboard/retention.py); ?dry_run=1 only reports it
+            dry_run = request.GET.get('dry_run') == '1'
+            report = retention.get_engine().run(dry_run=dry_run, budget=retention.REQUEST_BUDGET)
+            return JsonResponse({'status': 'success', 'message': retention.describe(report), 'report': report})
         except Exception as e:
             return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
     return JsonResponse({'status': 'error', 'message': 'POST required'}, status=405)
@@ -339,11 +557,13 @@ def network_view(request):
 def get_network_data(request):
     """
     API to calculate code similarity and return graph data.
-    O(N^2) complexity - Suitable for standard classrooms (< 100 students).
+    Uses the engine from XSCOUT_SIMILARITY_ENGINE (override with ?engine=).
+    Scores are cached between polls; only changed snapshots are re-scored and
+    an unchanged graph answers 304 to ?since=<meta.version> / If-None-Match.
     """
     try:
-        # 1. Fetch all active users
-        docs = db.collection('reports').stream()
+        # 1. Fetch all active users (only the fields the graph needs)
+        docs = storage.get_repository().stream_latest(fields=['snapshot', 'timestamp'])
         users = []
         
         for doc in docs:
@@ -365,48 +585,53 @@ def get_network_data(request):
                 'last_seen': data.get('timestamp', 'Unknown')
             })
 
-        # 2. Pairwise Comparison
-        edges = []
-        risky_users = set()
-
-        for i in range(len(users)):
-            for j in range(i + 1, len(users)):
-                user_a = users[i]
-                user_b = users[j]
-
-                # Similarity Check
-                matcher = difflib.SequenceMatcher(None, user_a['code'], user_b['code'])
-                ratio = matcher.ratio() # 0.0 to 1.0
-
-                # Threshold: 80% similarity
-                if ratio > 0.8:
-                    percentage = int(ratio * 100)
-                    edges.append({
-                        'from': user_a['id'],
-                        'to': user_b['id'],
-                        'label': f"{percentage}%",
-                        'title': f"{percentage}% Match detected"
-                    })
-                    risky_users.add(user_a['id'])
-                    risky_users.add(user_b['id'])
-
-        # 3. Format Nodes with Status
-        nodes_response = []
-        for user in users:
-            nodes_response.append({
-                'id': user['id'],
-                'label': user['label'],
-                'last_seen': user['last_seen'],
-                'risky': user['id'] in risky_users
-            })
-
-        return JsonResponse({
+        # 2. Similarity Engine (MinHash/LSH by default, see dashboard/similarity.py)
+        try:
+            engine = similarity.get_engine(request.GET.get('engine'))
+        except ValueError as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+        state = similarity.get_state(engine)
+        state.update(users)
+        # Covers each node's last_seen too, so a 304 never keeps a stale online status
+        version = similarity.graph_version(users, state)
+        since = request.GET.get('since') or request.headers.get('If-None-Match', '').strip('"')
+        if since and since == version:
+            response = HttpResponseNotModified()
+            response['ETag'] = f'"{version}"'
+            return response
+
+        response = JsonResponse({
             'status': 'success', 
-            'data': {
-                'nodes': nodes_response, 
-                'edges': edges,
-                'meta': {'algorithm': 'difflib.SequenceMatcher', 'threshold': 0.8}
-            }
+            'data': similarity.build_graph(users, engine, state)
         })
+        response['ETag'] = f'"{version}"'
+        return response
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+
+
+@login_required
+def get_similarity_sources(request, user_id):
+    """
+    Where a snapshot's code was seen before: the students whose history shares the most fingerprints with it,
+    including past sessions and students no longer active. The student's latest snapshot, or their last one at
+    ?at= (ISO 8601 or epoch ms); ?limit= sources (see dashboard/fingerprints.py)
+    """
+    fingerprint_index = fingerprints.get_index()
+    if fingerprint_index is None:
+        return JsonResponse({'status': 'error', 'message': 'The fingerprint index is disabled'}, status=404)
+    try:
+        params = fingerprints.parse_params(request.GET)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    try:
+        found = fingerprints.snapshot_at(storage.get_repository(), user_id, params['at'])
+        if found is None:
+            return JsonResponse({'status': 'error', 'message': 'No snapshot found'}, status=404)
+        entry_id, code = found
+        data = fingerprint_index.sources(code, exclude=user_id, limit=params['limit'])
+        return JsonResponse({'status': 'success', 'data': dict(data, user_id=user_id, entry=entry_id)})
     except Exception as e:
         return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
@@ -0,0 +1,43 @@
+"""
+gunicorn settings, read from the working directory (Procfile, render.yaml).
+
+The app is not preloaded, so every worker imports Django and creates its own
+Firestore client after the fork (dashboard/firebase.py). With
+XSCOUT_FIREBASE_WARMUP=1 each worker also opens that client in a background
+thread as soon as it boots, instead of on its first request. Every worker
+loads its authorized-ID cache (dashboard/authorization.py) the same way,
+then starts its authorized-ID sync thread (dashboard/authsync.py).
+"""
+import threading
+
+
+def post_worker_init(worker):
+    from django.conf import settings
+
+    def load_authorized():
+        from dashboard import authorization, authsync
+
+        try:
+            seconds = authorization.warm_up()
+        except Exception as e:
+            worker.log.warning('Loading authorized IDs failed: %s', e)
+        else:
+            worker.log.info('Authorized IDs loaded in %.0f ms', seconds * 1000)
+        authsync.start()
+
+    threading.Thread(target=load_authorized, name='authorization-warmup', daemon=True).start()
+
+    if not settings.XSCOUT_FIREBASE_WARMUP or settings.XSCOUT_STORAGE_BACKEND != 'firestore':
+        return
+
+    def warm_up():
+        from dashboard import firebase
+
+        try:
+            seconds = firebase.warm_up()
+        except Exception as e:
+            worker.log.warning('Firestore warm-up failed: %s', e)
+        else:
+            worker.log.info('Firestore client ready in %.0f ms', seconds * 1000)
+
+    threading.Thread(target=warm_up, name='firebase-warmup', daemon=True).start()
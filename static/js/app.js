@@ -3,43 +3,62 @@
 console.log("🚀 xScout Master Dashboard: BOOTING... 🚀");
 
 const POLLING_INTERVAL = 3000;
+// Idle students only refresh 'timestamp' / 'lastSeen' every XSCOUT_LAST_SEEN_INTERVAL (10s) server-side
+const LIVE_WINDOW_MS = 45000;
 let lastTelemetryData = [];
+// Polls after the first only ask for what changed since this (see dashboard/changes.py)
+let telemetryWatermark = null;
+// High-risk counts are scored server-side over the whole class (see dashboard/analytics.py)
+const RISK_INTERVAL = 10000;
 
 function initDashboard() {
     console.log("🛸 xScout Master Dashboard: I AM ALIVE! (True Master Mode)");
-    fetchData();
-    setInterval(fetchData, POLLING_INTERVAL);
+    // Pushed over /api/live/ when available, polled otherwise (see live.js)
+    xscoutLive('all', {
+        snapshot: renderTelemetry,
+        update: rows => renderTelemetry(mergeLiveRows(lastTelemetryData, rows)),
+        poll: fetchData,
+        interval: POLLING_INTERVAL
+    });
+    fetchRiskSummary();
+    setInterval(fetchRiskSummary, RISK_INTERVAL);
+}
+
+async function fetchRiskSummary() {
+    try {
+        const response = await fetch('/api/analytics/');
+        const json = await response.json();
+        const threatsEl = document.querySelector('.stat-value.error'); // Unique selector
+
+        if (json.status === 'success' && threatsEl) {
+            threatsEl.innerText = json.data.high_risk;
+            threatsEl.style.color = json.data.high_risk > 0 ? '#ff4d4d' : '#888';
+        }
+    } catch (error) {
+        console.error("[ANALYTICS] Network Error:", error);
+    }
 }
 
 async function fetchData() {
     try {
         console.log("[POLLING] Fetching latest telemetry...");
-        const response = await fetch('/api/telemetry/');
+        const url = telemetryWatermark
+            ? `/api/telemetry/?since=${encodeURIComponent(telemetryWatermark)}`
+            : '/api/telemetry/';
+        const response = await fetch(url);
         const json = await response.json();
 
         if (json.status === 'success') {
-            lastTelemetryData = json.data;
-            console.log(`[POLLING] Received ${json.data.length} students.`, json.data);
-            
-            // Update Stats (Hub Header)
-            const monitoredEl = document.getElementById('total-monitored');
-            const activeThreadsEl = document.getElementById('active-threads');
-            const threatsEl = document.querySelector('.stat-value.error'); // Unique selector
-            
-            if (monitoredEl) monitoredEl.innerText = json.data.length;
-
-            const liveStudents = json.data.filter(d => (Date.now() - new Date(d.timestamp).getTime() < 60000));
-            if (activeThreadsEl) activeThreadsEl.innerText = liveStudents.length;
-
-            const highRiskCount = json.data.filter(d => (d.ai > 0.6)).length;
-            if (threatsEl) {
-                threatsEl.innerText = highRiskCount;
-                threatsEl.style.color = highRiskCount > 0 ? '#ff4d4d' : '#888';
+            telemetryWatermark = json.watermark || null;
+            if (json.reset === false) {
+                console.log(`[POLLING] ${json.data.length} changed, ${json.touched.length} seen, ${json.removed.length} removed.`);
+                renderTelemetry(mergeLiveRows(lastTelemetryData, json.data, json.removed, json.touched));
+            } else {
+                console.log(`[POLLING] Received ${json.data.length} students.`, json.data);
+                renderTelemetry(json.data);
             }
-            
-            // Update Table
-            updateTable(json.data);
         } else {
+            telemetryWatermark = null;
             console.error("[POLLING] Server returned failure:", json.message);
         }
     } catch (error) {
@@ -47,6 +66,22 @@ async function fetchData() {
     }
 }
 
+function renderTelemetry(data) {
+    lastTelemetryData = data;
+
+    // Update Stats (Hub Header)
+    const monitoredEl = document.getElementById('total-monitored');
+    const activeThreadsEl = document.getElementById('active-threads');
+
+    if (monitoredEl) monitoredEl.innerText = data.length;
+
+    const liveStudents = data.filter(d => (Date.now() - new Date(d.lastSeen || d.timestamp).getTime() < 60000));
+    if (activeThreadsEl) activeThreadsEl.innerText = liveStudents.length;
+
+    // Update Table
+    updateTable(data);
+}
+
 function updateTable(dataList) {
     const tableBody = document.getElementById('student-table');
     if (!tableBody) {
@@ -79,8 +114,9 @@ function updateTable(dataList) {
             const activity = data.stack || (data.forensic && data.forensic.activeApp) || 'Web Browser';
             
             // Status Logic
-            const lastSeen = data.timestamp ? new Date(data.timestamp).getTime() : 0;
-            const isLive = (Date.now() - lastSeen < 20000); // 20-second active window
+            const lastSeenAt = data.lastSeen || data.timestamp;
+            const lastSeen = lastSeenAt ? new Date(lastSeenAt).getTime() : 0;
+            const isLive = (Date.now() - lastSeen < LIVE_WINDOW_MS);
             const statusClass = isLive ? 'online' : 'offline';
             const statusText = isLive ? 'Live' : 'Recent';
 
@@ -98,7 +134,7 @@ function updateTable(dataList) {
                 </td>
                 <td style="color:#aaa;">${activity}</td>
                 <td><span style="color:${riskColor}; font-family:monospace; font-weight:bold;">${risk.toFixed(0)}%</span></td>
-                <td>${data.timestamp ? new Date(data.timestamp).toLocaleTimeString() : '--:--'}</td>
+                <td>${lastSeenAt ? new Date(lastSeenAt).toLocaleTimeString() : '--:--'}</td>
                 <td><span class="status-dot ${statusClass}" style="display:inline-block; width:8px; height:8px; border-radius:50%; background:${isLive ? '#00ff88' : '#666'}; margin-right:5px;"></span> ${statusText}</td>
                 <td><button onclick="openForensicModal(lastTelemetryData.find(d => (d.studentId || d.id || d.user) === '${userId}'))" 
                         class="analyze-btn" style="background:#B026FF; color:white; border:none; padding:6px 16px; border-radius:20px; cursor:pointer; font-weight:600; transition:0.3s;"
@@ -0,0 +1,81 @@
+import statistics
+
+import pytest
+
+from dashboard import analytics
+from dashboard.analytics import RiskAnalytics
+
+np = pytest.importorskip('numpy')
+
+
+def student(i, environment, ai, wpm, pastes=0):
+    return {'id': f"s{i:03d}", 'environment': environment, 'ai': ai,
+            'behavior': {'wpm': wpm, 'backspaceCount': 2, 'pasteCount': pastes, 'idleTime': 0}}
+
+
+def classroom():
+    rows = [student(i, 'ENV1', ai=10 + i % 5, wpm=40 + i % 7) for i in range(40)]
+    rows += [student(100 + i, 'ENV2', ai=0.2, wpm=60) for i in range(5)]
+    rows.append(student(200, None, ai=90, wpm=20))
+    # One student pastes the whole assignment and types nothing
+    rows[3] = student(3, 'ENV1', ai=95, wpm=2, pastes=30)
+    return rows
+
+
+def test_distributions_match_a_plain_python_reference():
+    rows = classroom()
+    result = analytics.score(rows, high_risk=60, outlier_z=2.5)
+    assert result['students'] == 46
+    assert (result['high_risk'], sorted(result['high_risk_ids'])) == (2, ['s003', 's200'])
+
+    env1 = next(e for e in result['environments'] if e['environment'] == 'ENV1')
+    wpm = [row['behavior']['wpm'] for row in rows if row['environment'] == 'ENV1']
+    assert env1['students'] == 40
+    assert env1['metrics']['wpm']['mean'] == round(statistics.fmean(wpm), 2)
+    assert env1['metrics']['wpm']['std'] == round(statistics.pstdev(wpm), 2)
+    assert env1['metrics']['wpm']['p50'] == statistics.median(wpm)
+    assert env1['metrics']['wpm']['p90'] == round(float(np.percentile(wpm, 90)), 2)
+    assert (env1['metrics']['wpm']['min'], env1['metrics']['wpm']['max']) == (2, 46)
+
+    # ai between 0 and 1 is a fraction of the 0-100 scale, missing environment is ''
+    env2 = next(e for e in result['environments'] if e['environment'] == 'ENV2')
+    assert env2['metrics']['ai']['mean'] == 20 and env2['metrics']['wpm']['std'] == 0
+    assert [e['environment'] for e in result['environments']] == ['', 'ENV1', 'ENV2']
+
+
+def test_outliers_and_percentile_ranks_are_per_environment():
+    result = analytics.score(classroom(), students=True)
+    [outlier] = result['outliers']
+    assert (outlier['id'], outlier['environment']) == ('s003', 'ENV1')
+    assert set(outlier['flags']) == {'ai', 'wpm', 'pasteEvents'}
+    assert outlier['metrics']['ai']['percentile'] == 98.8
+    assert outlier['metrics']['pasteEvents']['value'] == 30
+
+    scores = {row['id']: row for row in result['scores']}
+    assert scores['s003']['wpm']['percentile'] == 1.2
+    # Identical students share the mid rank and a zero z-score
+    assert scores['s100']['wpm'] == {'value': 60, 'z': 0, 'percentile': 50}
+    assert scores['s200']['ai'] == {'value': 90, 'z': 0, 'percentile': 50}
+    assert analytics.score([])['environments'] == []
+
+
+def test_results_are_cached_per_environment():
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return classroom()
+
+    risk = RiskAnalytics(ttl=60)
+    env2 = risk.get(loader, environment='ENV2')
+    assert (env2['students'], env2['high_risk']) == (5, 0)
+    assert risk.get(loader, environment='ENV2') is env2
+    assert risk.get(loader, environment='')['high_risk_ids'] == ['s200']
+    assert 'scores' in risk.get(loader, environment='ENV2', students=True)
+    assert len(calls) == 3
+    assert risk.metrics()['hits'] == 1 and risk.metrics()['cached'] == 3
+
+    risk.ttl = 0
+    risk.get(loader)
+    risk.get(loader)
+    assert len(calls) == 5
@@ -0,0 +1,91 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+import pyarrow.dataset as ds
+import pytest
+
+from dashboard import archive
+from dashboard.history import HistoryEncoder
+from dashboard.storage import Document, SQLiteRepository
+
+T0 = datetime(2024, 5, 1, 23, 58, tzinfo=timezone.utc)
+
+
+def classroom():
+    repo = SQLiteRepository()
+    encoder = HistoryEncoder(keyframe_interval=3)
+    for i, (user_id, environment) in enumerate([('alice', 'ENV 1'), ('bob', 'ENV 1'), ('carol', None)]):
+        history = []
+        for n in range(4):
+            doc_id = f'{user_id}-{n}'
+            entry = {'timestamp': T0 + timedelta(minutes=n), 'ai_score': 10 * i + n, 'code': 'x = 1\n' * 20 + f'{n}\n'}
+            history.append((doc_id, encoder.encode(user_id, doc_id, entry)))
+        repo.write_heartbeat(user_id, {'environment': environment, 'ai': i}, history=history, last_seen=T0)
+    return repo
+
+
+def dump(repo):
+    return ({doc.id: doc.to_dict() for doc in repo.stream_latest()},
+            {(user_id, doc.id): doc.to_dict() for user_id in ('alice', 'bob', 'carol')
+             for doc in repo.stream_history(user_id)})
+
+
+def test_archive_round_trip_through_partitions(tmp_path):
+    repo = classroom()
+    manifest = archive.write_archive(repo, str(tmp_path), workers=2)
+    assert (manifest['students'], manifest['history']) == (3, 12)
+    assert sorted(os.path.dirname(name) for name in manifest['files'] if name.startswith('history/')) == [
+        'history/environment=ENV%201/date=2024-05-01', 'history/environment=ENV%201/date=2024-05-02',
+        'history/environment=__HIVE_DEFAULT_PARTITION__/date=2024-05-01',
+        'history/environment=__HIVE_DEFAULT_PARTITION__/date=2024-05-02',
+    ]
+
+    # Readable as one Hive-partitioned dataset, typed columns included
+    table = ds.dataset(str(tmp_path / 'history'), partitioning='hive').to_table()
+    rows = sorted(zip(table['id'].to_pylist(), table['environment'].to_pylist(), table['encoding'].to_pylist(),
+                      table['ai_score'].to_pylist()))
+    assert rows[:4] == [('alice-0', 'ENV 1', 'keyframe', 0.0), ('alice-1', 'ENV 1', 'delta', 1.0),
+                        ('alice-2', 'ENV 1', 'delta', 2.0), ('alice-3', 'ENV 1', 'keyframe', 3.0)]
+    assert rows[-1][1] is None
+
+    restored = SQLiteRepository()
+    counts = archive.restore(restored, str(tmp_path), batch_size=5, workers=2)
+    assert counts == {'students': 3, 'history': 12}
+    assert dump(restored) == dump(repo)
+    assert restored.history_page('alice', limit=10)['data'] == repo.history_page('alice', limit=10)['data']
+
+
+def test_tar_restore_keeps_datetimes_and_bulk_writes_in_batches(tmp_path):
+    class Remote(SQLiteRepository):
+        """Stored datetimes come back as datetimes, like Firestore."""
+
+        def __init__(self):
+            super().__init__()
+            self.batches = []
+            self.written = []
+
+        def stream_latest(self, fields=None, limit=None):
+            for doc in super().stream_latest(fields, limit):
+                yield Document(doc.id, dict(doc.to_dict(), lastSeen=T0, changedAt=T0))
+
+        def bulk_write(self, latest=(), history=()):
+            self.batches.append((len(latest), len(history)))
+            self.written.extend(data for _, data in latest)
+            super().bulk_write(latest, history)
+
+    source = Remote()
+    source.write_heartbeat('alice', {'ai': 1, 'nested': {'at': T0}})
+    source.write_heartbeat('bob', {'ai': 2})
+    path = str(tmp_path / 'backup.tar')
+    with open(path, 'wb') as f:
+        for chunk in archive.archive_chunks(source):
+            f.write(chunk)
+
+    target = Remote()
+    assert archive.restore(target, path, batch_size=1, workers=1) == {'students': 2, 'history': 0}
+    assert target.batches == [(1, 0), (1, 0)]
+    assert target.written[0] == {'ai': 1, 'nested': {'at': '2024-05-01T23:58:00Z'}, 'lastSeen': T0, 'changedAt': T0}
+
+    (tmp_path / 'empty').mkdir()
+    with pytest.raises(ValueError):
+        archive.restore(target, str(tmp_path / 'empty'))
@@ -0,0 +1,144 @@
+import threading
+import time
+
+import pytest
+
+from dashboard.authorization import AuthorizationCache, StorageUnavailable
+from dashboard.storage import SQLiteRepository
+
+
+class Sources:
+    """The local AuthorizedID table and storage, counting round-trips."""
+
+    def __init__(self, local=None, delay=0.0):
+        self.local = dict(local or {})
+        self.repo = SQLiteRepository()
+        self.delay = delay
+        self.calls = {'load': 0, 'get_local': 0, 'get_remote': 0}
+        self.down = False
+        repo_get = self.repo.get_authorized
+
+        def get_authorized(student_id):
+            self.calls['get_remote'] += 1
+            if self.down:
+                raise ConnectionError('storage unreachable')
+            time.sleep(self.delay)
+            return repo_get(student_id)
+
+        self.repo.get_authorized = get_authorized
+
+    def load_local(self):
+        self.calls['load'] += 1
+        return dict(self.local)
+
+    def get_local(self, student_id):
+        self.calls['get_local'] += 1
+        return self.local.get(student_id)
+
+    def cache(self, **options):
+        return AuthorizationCache(self.load_local, self.get_local, lambda: self.repo, **options)
+
+
+def test_lookups_come_from_memory_with_short_negative_caching():
+    sources = Sources({'s1': True, 's2': False})
+    sources.repo.set_authorized('s3', {'studentId': 's3', 'isActive': True})
+    now = [0.0]
+    cache = sources.cache(negative_ttl=5.0, clock=lambda: now[0])
+    cache.refresh()
+
+    assert cache.lookup('s1') == (True, None)
+    assert cache.lookup('s2') == (False, None)
+    assert cache.lookup('s3') == (None, {'studentId': 's3', 'isActive': True})
+    assert sources.calls == {'load': 1, 'get_local': 0, 'get_remote': 0}
+
+    # Unknown: checked once, then remembered until the TTL runs out
+    assert cache.lookup('nobody') == (None, None)
+    assert cache.lookup('nobody') == (None, None)
+    assert sources.calls['get_remote'] == 1
+    now[0] = 6.0
+    assert cache.lookup('nobody') == (None, None)
+    assert sources.calls['get_remote'] == 2
+
+    # Added after the last reload: found by the miss check, then served from memory
+    sources.local['s4'] = True
+    cache.invalidate('s4')
+    assert cache.lookup('s4') == (True, None) and cache.lookup('s4') == (True, None)
+    assert sources.calls['get_local'] == 3
+
+    # Toggled: the view invalidates, the next lookup sees the new state
+    sources.local['s1'] = False
+    assert cache.lookup('s1') == (True, None)
+    cache.invalidate('s1')
+    assert cache.lookup('s1') == (False, None)
+    metrics = cache.metrics()
+    assert (metrics['hits'], metrics['negative_hits'], metrics['checks']) == (5, 1, 4)
+
+
+def test_concurrent_misses_share_one_check():
+    sources = Sources(delay=0.2)
+    sources.repo.set_authorized('late', {'isActive': True})
+    cache = sources.cache()
+    results = []
+
+    def connect():
+        results.append(cache.lookup('late'))
+
+    threads = [threading.Thread(target=connect) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [(None, {'isActive': True})] * 20
+    assert sources.calls['get_remote'] == 1
+    assert cache.metrics()['coalesced'] == 19
+
+
+def test_storage_failures_and_pushed_changes():
+    sources = Sources({'local-only': True})
+    cache = sources.cache()
+    sources.down = True
+    assert cache.lookup('local-only') == (True, None)
+    with pytest.raises(StorageUnavailable):
+        cache.lookup('unknown')
+    # Failures aren't cached as unknown
+    sources.down = False
+    assert cache.lookup('unknown') == (None, None)
+
+    class Watch:
+        def unsubscribe(self):
+            pushed.append('unsubscribed')
+
+    pushed = []
+    sources.repo.watch_authorized = lambda callback: pushed.append(callback) or Watch()
+    sources.repo.set_authorized('stale', {'isActive': True})
+    cache.refresh()
+    assert cache.lookup('stale')[1] == {'isActive': True}
+
+    cache = sources.cache(refresh_interval=60.0)
+    cache.refresh()
+    cache.start()
+    while not pushed:
+        time.sleep(0.01)
+    # The listener's first delivery replaces what was polled
+    pushed[0]({'s1': {'isActive': True}})
+    assert cache.lookup('s1') == (None, {'isActive': True}) and cache.metrics()['remote_ids'] == 1
+    pushed[0]({'s1': {'isActive': False}, 's2': {'isActive': True}})
+    assert cache.lookup('s1') == (None, {'isActive': False})
+    pushed[0]({'s2': None})
+    assert cache.metrics()['watching'] and cache.metrics()['remote_ids'] == 1
+    cache.stop()
+    assert pushed[-1] == 'unsubscribed'
+
+
+def test_only_the_reload_thread_closes_the_local_connection():
+    closed = []
+    sources = Sources({'s1': True})
+    cache = sources.cache(refresh_interval=0.05, close_local=lambda: closed.append(threading.current_thread().name))
+    # A reload on the request path (authorization.reload() after a roster import) leaves the connection to Django
+    cache.refresh()
+    assert closed == []
+    cache.start()
+    while not closed:
+        time.sleep(0.01)
+    cache.stop()
+    assert set(closed) == {'xscout-authorization'}
@@ -0,0 +1,170 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from dashboard.authsync import CHECKPOINT, AuthorizedSync
+from dashboard.storage import SQLiteRepository
+
+T0 = datetime(2024, 6, 1, 12, 0, tzinfo=timezone.utc)
+
+
+class Local:
+    """The AuthorizedID table, outbox and checkpoints, in memory."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.table = {}  # student_id -> [is_active, description, created_at, updated_at]
+        self.outbox = {}  # student_id -> {'extra', 'queued_at', 'attempts', 'next_attempt_at', 'last_error'}
+        self.checkpoints = {}
+        self.queries = 0
+
+    # What the views and signals do
+    def save(self, sync, student_id, active=True, description=''):
+        created = self.table.get(student_id, [None, None, self.clock()])[2]
+        self.table[student_id] = [active, description, created, self.clock()]
+        sync.enqueue([student_id])
+
+    def delete(self, sync, student_id):
+        del self.table[student_id]
+        sync.enqueue([student_id])
+
+    # AuthorizedSync's interface
+    def rows(self, student_ids=None):
+        self.queries += 1
+        ids = self.table if student_ids is None else [i for i in student_ids if i in self.table]
+        return {student_id: tuple(self.table[student_id]) for student_id in ids}
+
+    def apply(self, changes):
+        for student_id, active, description, updated in changes:
+            created = self.table.get(student_id, [None, None, self.clock()])[2]
+            self.table[student_id] = [active, description, created, updated or self.clock()]
+
+    def enqueue(self, student_ids, now, extra=None):
+        for student_id in student_ids:
+            entry = self.outbox.setdefault(student_id, {'extra': {}, 'last_error': ''})
+            entry['extra'] = dict(entry['extra'], **(extra or {}))
+            entry.update(queued_at=now, next_attempt_at=now, attempts=0)
+
+    def due(self, now, limit):
+        entries = sorted((e['queued_at'], i) for i, e in self.outbox.items() if e['next_attempt_at'] <= now)
+        return [(i, self.outbox[i]['extra'], self.outbox[i]['attempts']) for _, i in entries[:limit]]
+
+    def done(self, student_ids, before):
+        for student_id in student_ids:
+            if self.outbox[student_id]['queued_at'] <= before:
+                del self.outbox[student_id]
+
+    def failed(self, retries, error):
+        for student_id, next_attempt in retries.items():
+            entry = self.outbox[student_id]
+            entry.update(attempts=entry['attempts'] + 1, next_attempt_at=next_attempt, last_error=error)
+
+    def pending(self):
+        return len(self.outbox)
+
+    def checkpoint(self, name):
+        return self.checkpoints.get(name)
+
+    def set_checkpoint(self, name, value):
+        self.checkpoints[name] = value
+
+    def close(self):
+        pass
+
+
+class Clock:
+    def __init__(self):
+        self.now = T0
+
+    def __call__(self):
+        self.now += timedelta(milliseconds=1)
+        return self.now
+
+    def advance(self, seconds):
+        self.now += timedelta(seconds=seconds)
+
+
+def setup(record_style='camel'):
+    clock = Clock()
+    local = Local(clock)
+    repo = SQLiteRepository()
+    return clock, local, repo, AuthorizedSync(local, lambda: repo, record_style=record_style, clock=clock)
+
+
+def test_local_changes_push_from_the_outbox_and_failures_retry_with_backoff():
+    clock, local, repo, sync = setup()
+    local.save(sync, 's1', description='Ada')
+    local.save(sync, 's2')
+    sync.enqueue(['s1'], extra={'studentName': 'Ada Lovelace'})
+    assert sync.push() == (2, 0) and local.outbox == {}
+    record = repo.get_authorized('s1')
+    assert (record['studentId'], record['studentName'], record['description'], record['isActive']) == \
+        ('s1', 'Ada Lovelace', 'Ada', True)
+    assert record['updatedAt'] == '2024-06-01T12:00:00.002Z'
+
+    # Storage down: the entry stays queued and waits longer after each failure
+    def down(*args, **kwargs):
+        raise ConnectionError('storage unreachable')
+
+    merge, repo.merge_authorized_many = repo.merge_authorized_many, down
+    local.save(sync, 's1', active=False, description='Ada')
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            sync.push()
+        clock.advance(5)
+    assert local.outbox['s1']['attempts'] == 2 and local.outbox['s1']['last_error'] == 'storage unreachable'
+    assert sync.push() == (0, 0)  # not due yet: 10s after the second failure
+    repo.merge_authorized_many = merge
+    clock.advance(5)
+    assert sync.push() == (1, 0)
+    assert repo.get_authorized('s1')['isActive'] is False and sync.metrics()['push_failures'] == 2
+
+    # A local delete removes the record
+    local.delete(sync, 's2')
+    assert sync.push() == (0, 1) and repo.get_authorized('s2') is None
+
+
+def test_pull_applies_newer_records_since_the_checkpoint_only():
+    clock, local, repo, sync = setup(record_style='snake')
+    local.save(sync, 's1', description='Ada')
+    sync.push()
+    # Our own write comes back from the pull and is skipped
+    assert sync.pull() == []
+
+    clock.advance(10)
+    later = clock().isoformat(timespec='microseconds')
+    repo.update_authorized('s1', {'is_active': False, 'updated_at': later})
+    repo.set_authorized('s9', {'student_id': 's9', 'description': 'Remote', 'is_active': True, 'updated_at': later})
+    # Older than the row: the row wins
+    repo.set_authorized('old', {'student_id': 'old', 'is_active': True, 'updated_at': later})
+    local.table['old'] = [False, '', clock(), clock()]
+    # No timestamp: only a full reconciliation sees it
+    repo.set_authorized('legacy', {'student_id': 'legacy', 'is_active': True})
+
+    assert sorted(sync.pull()) == ['s1', 's9']
+    assert local.table['s1'][:2] == [False, 'Ada'] and local.table['s9'][:2] == [True, 'Remote']
+    assert local.table['old'][0] is False and 'legacy' not in local.table
+    assert local.checkpoints[CHECKPOINT] == later
+    # Pulled changes aren't queued back
+    assert local.outbox == {}
+    assert sync.pull() == []
+
+
+def test_full_reconciliation_on_demand():
+    clock, local, repo, sync = setup()
+    local.table = {'both': [True, 'same', T0, T0], 'local-only': [True, '', T0, T0], 'stale-remote': [False, '', T0, T0]}
+    repo.set_authorized('both', {'isActive': True, 'description': 'same'})
+    repo.set_authorized('stale-remote', {'isActive': True})
+    repo.set_authorized('remote-only', {'isActive': True, 'description': 'from Firestore'})
+
+    preview = sync.reconcile(dry_run=True)
+    assert (preview['pushed'], preview['pulled'], preview['in_sync']) == (2, 1, 1)
+    assert 'remote-only' not in local.table and local.outbox == {}
+
+    report = sync.reconcile()
+    assert report['changed_ids'] == ['local-only', 'remote-only', 'stale-remote']
+    assert local.table['remote-only'][:2] == [True, 'from Firestore']
+    assert repo.get_authorized('local-only')['isActive'] is True
+    assert repo.get_authorized('stale-remote')['isActive'] is False
+    again = sync.reconcile(dry_run=True)
+    assert (again['pushed'], again['pulled'], again['in_sync']) == (0, 0, 4)
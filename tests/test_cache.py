@@ -0,0 +1,74 @@
+import threading
+import time
+
+from dashboard.cache import DjangoCacheStore, LatestStateCache
+
+
+class Loader:
+    def __init__(self, docs, delay=0.0):
+        self.docs = docs
+        self.delay = delay
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        return list(self.docs.items())
+
+
+def test_read_through_write_through_and_eviction():
+    loader = Loader({'alice': {'ai': 1}, 'bob': {'ai': 2}})
+    latest = LatestStateCache(ttl=60)
+
+    assert latest.get_all(loader) == [{'ai': 1, 'id': 'alice'}, {'ai': 2, 'id': 'bob'}]
+    latest.put('alice', {'ai': 9})
+    latest.evict('bob')
+    assert latest.get_all(loader) == [{'ai': 9, 'id': 'alice'}]
+    assert loader.calls == 1
+
+    metrics = latest.metrics()
+    assert (metrics['hits'], metrics['misses'], metrics['loads']) == (1, 1, 1)
+
+
+def test_ttl_expiry_and_size_bound():
+    loader = Loader({'alice': {}, 'bob': {}, 'carol': {}})
+
+    latest = LatestStateCache(ttl=0.01)
+    latest.get_all(loader)
+    time.sleep(0.02)
+    latest.get_all(loader)
+    assert loader.calls == 2
+
+    # Too large to hold completely: always read through, never partial
+    latest = LatestStateCache(ttl=60, max_entries=2)
+    assert len(latest.get_all(loader)) == 3
+    assert len(latest.get_all(loader)) == 3
+    assert loader.calls == 4
+    assert latest.metrics()['oversize'] == 2
+
+
+def test_concurrent_misses_share_one_scan():
+    loader = Loader({'alice': {}}, delay=0.05)
+    latest = LatestStateCache(ttl=60)
+    threads = [threading.Thread(target=latest.get_all, args=(loader,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert loader.calls == 1
+
+
+def test_django_cache_store():
+    loader = Loader({'alice': {'ai': 1}})
+    latest = LatestStateCache(DjangoCacheStore(namespace='test'), ttl=60)
+
+    latest.get_all(loader)
+    latest.put('alice', {'ai': 5})
+    assert latest.get_all(loader) == [{'ai': 5, 'id': 'alice'}]
+    assert loader.calls == 1
+
+    # A student the index does not know about forces a rescan
+    latest.put('dave', {'ai': 3})
+    loader.docs['dave'] = {'ai': 3}
+    assert [row['id'] for row in latest.get_all(loader)] == ['alice', 'dave']
+    assert loader.calls == 2
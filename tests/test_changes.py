@@ -0,0 +1,157 @@
+import pytest
+
+from dashboard.changes import ChangeIndex
+
+
+class Loader:
+    def __init__(self, docs):
+        self.docs = docs
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return [dict(data, id=doc_id) for doc_id, data in self.docs.items()]
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_only_content_changes_are_records_and_heartbeats_are_touches():
+    loader = Loader({'bob': {'ai': 1, 'timestamp': 1}, 'alice': {'ai': 1, 'timestamp': 1}})
+    clock = Clock()
+    index = ChangeIndex(reconcile_interval=60, liveness_interval=10, clock=clock)
+
+    full = index.changes(None, loader)
+    assert full['reset'] and [row['id'] for row in full['data']] == ['alice', 'bob']
+
+    # Idle: heartbeats that only move the clock send nothing until the liveness cadence
+    clock.now += 1
+    index.record('bob', {'ai': 1, 'timestamp': 2})
+    idle = index.changes(full['watermark'], loader)
+    assert (idle['data'], idle['removed'], idle['touched'], idle['reset']) == ([], [], [], False)
+    assert loader.calls == 1
+
+    clock.now += 10
+    index.record('bob', {'ai': 1, 'timestamp': 12})
+    index.record('alice', {'ai': 2, 'timestamp': 12})
+    index.record('alice', {'ai': 3, 'timestamp': 13})
+    index.remove('carol')
+    delta = index.changes(idle['watermark'], loader)
+    assert delta['data'] == [{'ai': 3, 'timestamp': 13, 'id': 'alice'}]
+    assert delta['touched'] == [{'timestamp': 12, 'id': 'bob'}]
+    assert delta['removed'] == []
+
+    clock.now += 1
+    index.remove('bob')
+    last = index.changes(delta['watermark'], loader)
+    assert (last['data'], last['touched'], last['removed']) == ([], [], ['bob'])
+    assert index.metrics()['unchanged'] == 1
+
+
+def test_reconcile_picks_up_other_workers_without_regressing():
+    loader = Loader({'alice': {'timestamp': 5}, 'bob': {'timestamp': 1}})
+    clock = Clock()
+    index = ChangeIndex(reconcile_interval=0, clock=clock)
+    watermark = index.changes(None, loader)['watermark']
+
+    # Written here but not visible to the scan yet: neither regressed nor removed
+    clock.now += 1
+    index.record('carol', {'timestamp': 2})
+    index.record('alice', {'timestamp': 9, 'ai': 1})
+    # Written by other workers
+    loader.docs['bob'] = {'timestamp': 4, 'ai': 1}
+    loader.docs['dave'] = {'timestamp': 1}
+
+    delta = index.changes(watermark, loader)
+    assert {row['id']: row['timestamp'] for row in delta['data']} == {'alice': 9, 'bob': 4, 'carol': 2, 'dave': 1}
+    assert delta['removed'] == []
+
+    # Once recorded writes have had a reconcile to show up, missing ids are tombstoned
+    clock.now += 1
+    delta = index.changes(delta['watermark'], loader)
+    assert delta['removed'] == ['carol']
+
+
+def test_any_worker_answers_a_watermark_incrementally():
+    docs = {'alice': {'ai': 1}, 'bob': {'ai': 1}}
+    clock = Clock()
+    first = ChangeIndex(reconcile_interval=0, lag=5, clock=clock)
+    second = ChangeIndex(reconcile_interval=0, lag=5, clock=clock)
+    second.changes(None, Loader(docs))
+
+    clock.now += 10
+    watermark = first.changes(None, Loader(docs))['watermark']
+    # Written through the second worker just before the first issued its watermark
+    clock.now -= 2
+    docs['bob'] = {'ai': 2}
+    second.record('bob', docs['bob'])
+    clock.now += 3
+    docs['alice'] = {'ai': 2}
+
+    delta = second.changes(watermark, Loader(docs))
+    assert not delta['reset']
+    assert {row['id']: row['ai'] for row in delta['data']} == {'alice': 2, 'bob': 2}
+
+
+def test_unservable_watermarks_reset():
+    loader = Loader({'alice': {'timestamp': 1}})
+    clock = Clock()
+    index = ChangeIndex(reconcile_interval=60, max_tombstones=1, lag=5, clock=clock)
+    watermark = index.changes(None, loader)['watermark']
+
+    with pytest.raises(ValueError):
+        index.changes('garbage', loader)
+    # A worker (or restart) whose index starts after the watermark may not know of removals before it
+    restarted = ChangeIndex(lag=5, clock=clock)
+    assert restarted.changes(watermark, loader)['reset']
+    assert index.changes(f'{int((clock.now + 60) * 1000)}-{index.worker}', loader)['reset']
+
+    clock.now += 1
+    index.record('bob', {})
+    index.record('carol', {})
+    index.remove('bob')
+    clock.now += 1
+    index.remove('carol')
+    # bob's tombstone was dropped, so this watermark can't be served incrementally
+    reset = index.changes(watermark, loader)
+    assert reset['reset'] and [row['id'] for row in reset['data']] == ['alice']
+    assert index.metrics()['resets'] == 2
+
+
+def test_refresh_queries_only_what_changed_since_the_last_one():
+    loader = Loader({'alice': {'ai': 1}, 'bob': {'ai': 1}})
+    clock = Clock()
+    index = ChangeIndex(reconcile_interval=60, refresh_interval=0, lag=2, full_lag=5, clock=clock)
+    queries = []
+
+    def changed(since):
+        queries.append(since)
+        return [dict(loader.docs['bob'], id='bob')] if len(queries) == 2 else []
+
+    watermark = index.changes(None, loader)['watermark']
+    clock.now += 3
+    idle = index.changes(watermark, loader, changed)
+    assert idle['data'] == [] and loader.calls == 1
+    # The first query covers what the (cached) first scan may have missed
+    assert queries == [1000 - 5 - 1]
+
+    # Written by another worker: found by the next query, which starts where the last one did
+    loader.docs['bob'] = {'ai': 2}
+    clock.now += 3
+    delta = index.changes(idle['watermark'], loader, changed)
+    assert delta['data'] == [{'ai': 2, 'id': 'bob'}] and delta['removed'] == []
+    assert queries[1] == 1003 - 1 and loader.calls == 1
+    assert index.metrics()['refreshes'] == 2
+
+    # Another worker's watermark: records go back `lag`, touches and removals `full_lag`
+    clock.now += 3
+    index.remove('alice')
+    clock.now += 1
+    other = f'{int((clock.now - 0.5) * 1000)}-ffffffff'
+    delta = index.changes(other, loader, changed)
+    assert (delta['data'], delta['removed'], delta['reset']) == ([], ['alice'], False)
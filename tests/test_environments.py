@@ -0,0 +1,84 @@
+from dashboard.environments import EnvironmentIndex
+from dashboard.storage import SQLiteRepository
+
+
+class CountingRepository(SQLiteRepository):
+    """Records what each environment poll read from the store."""
+
+    def __init__(self):
+        super().__init__()
+        self.scans = []
+        self.gets = []
+
+    def stream_environment(self, env_code):
+        self.scans.append(env_code)
+        return super().stream_environment(env_code)
+
+    def get_latest_many(self, doc_ids):
+        self.gets.append(sorted(doc_ids))
+        return super().get_latest_many(doc_ids)
+
+
+def heartbeat(repo, index, user_id, environment, ai, now, record=True):
+    state = {'environment': environment, 'ai': ai}
+    repo.write_heartbeat(user_id, state)
+    if record:
+        index.record(user_id, state, now=now)
+
+
+def test_polls_are_served_from_ingest_and_reads_by_id():
+    repo = CountingRepository()
+    index = EnvironmentIndex(max_age=5, reconcile_interval=60)
+    heartbeat(repo, index, 'bob', 'ENV1', 1, now=0)
+    heartbeat(repo, index, 'alice', 'ENV1', 2, now=0)
+    heartbeat(repo, index, 'carol', 'ENV2', 3, now=0)
+    # Written by another worker, so only the where() scan knows about it
+    heartbeat(repo, index, 'dave', 'ENV1', 4, now=0, record=False)
+
+    assert [s['id'] for s in index.students('ENV1', repo, now=1)] == ['alice', 'bob', 'dave']
+    assert repo.scans == ['ENV1']
+
+    # Fresh from ingest: no reads at all
+    heartbeat(repo, index, 'alice', 'ENV1', 7, now=2)
+    assert [s['ai'] for s in index.students('ENV1', repo, now=3)] == [7, 1, 4]
+    assert (repo.scans, repo.gets) == (['ENV1'], [])
+
+    # Stale members are re-read by id; another worker moved bob and deleted dave
+    heartbeat(repo, index, 'bob', 'ENV2', 5, now=0, record=False)
+    repo.delete_latest(['dave'])
+    assert [s['id'] for s in index.students('ENV1', repo, now=6)] == ['alice']
+    assert repo.gets == [['bob', 'dave']]
+    assert [s['id'] for s in index.students('ENV2', repo, now=8)] == ['bob', 'carol']
+
+    metrics = index.metrics()
+    assert (metrics['moved'], metrics['dropped'], metrics['environments'], metrics['students']) == (1, 1, 2, 3)
+
+
+def test_reconcile_picks_up_joins_and_keeps_recent_ingest():
+    repo = CountingRepository()
+    index = EnvironmentIndex(max_age=5, reconcile_interval=60)
+    heartbeat(repo, index, 'alice', 'ENV1', 1, now=0)
+    assert [s['id'] for s in index.students('ENV1', repo, now=0)] == ['alice']
+
+    heartbeat(repo, index, 'erin', 'ENV1', 2, now=10, record=False)
+    assert [s['id'] for s in index.students('ENV1', repo, now=30)] == ['alice']
+    # Recorded here but not visible to the scan yet (queued write)
+    index.record('frank', {'environment': 'ENV1', 'ai': 3}, now=50)
+    assert [s['id'] for s in index.students('ENV1', repo, now=61)] == ['alice', 'erin', 'frank']
+    assert repo.scans == ['ENV1', 'ENV1']
+
+    # Once stale, a member is only kept if its write landed
+    repo.write_heartbeat('frank', {'environment': 'ENV1', 'ai': 3})
+    index.remove('alice')
+    assert [s['id'] for s in index.students('ENV1', repo, now=62)] == ['erin', 'frank']
+
+
+def test_index_is_dropped_rather_than_grown_past_max_students():
+    repo = CountingRepository()
+    index = EnvironmentIndex(max_students=3)
+    for i in range(5):
+        heartbeat(repo, index, f's{i}', 'ENV1', i, now=0)
+    assert index.metrics()['students'] <= 3
+    # The scan can't fit either, so every poll scans instead of serving part of the class
+    assert len(index.students('ENV1', repo, now=1)) < 5
+    assert len(repo.get_latest_many([f's{i}' for i in range(5)])) == 5
@@ -0,0 +1,67 @@
+import csv
+import gzip
+import io
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from dashboard import export
+from dashboard.export import Exporter
+from dashboard.storage import SQLiteRepository
+
+T0 = datetime(2024, 5, 1, 9, 0, tzinfo=timezone.utc)
+
+
+def classroom():
+    repo = SQLiteRepository()
+    for i, (user_id, environment) in enumerate([('alice', 'ENV1'), ('bob', 'ENV1'), ('carol', 'ENV2')]):
+        entries = [(f'{user_id}-{n:02d}',
+                    {'timestamp': T0 + timedelta(minutes=n), 'ai_score': 10 * i + n, 'forensic': {'activeApp': 'VS Code'}})
+                   for n in range(10)]
+        repo.write_heartbeat(user_id, {'environment': environment, 'ai': i, 'behavior': {'wpm': 40 + i}},
+                             history=entries)
+    return repo
+
+
+def read(chunks):
+    return list(csv.reader(io.StringIO(''.join(chunks))))
+
+
+def test_history_export_fans_out_and_filters():
+    exporter = Exporter(classroom(), workers=3, page_size=3)
+    header, *rows = read(exporter.csv(scope='history'))
+    assert header == export.COLUMNS
+    assert len(rows) == 30
+    # Pages of different students interleave, each student's pages stay in time order
+    alice = [row for row in rows if row[0] == 'alice']
+    assert [row[4] for row in alice] == [str(n) for n in range(10)]
+    assert alice[0][1:4] == ['2024-05-01T09:00:00.000Z', 'VS Code', 'N/A']
+
+    rows = read(exporter.csv(scope='history', environment='ENV1', users=['bob', 'carol'],
+                             start=T0 + timedelta(minutes=2), end=T0 + timedelta(minutes=4)))[1:]
+    assert [(row[0], row[4]) for row in rows] == [('bob', '12'), ('bob', '13'), ('bob', '14')]
+
+
+def test_latest_export_gzip_and_failures():
+    repo = classroom()
+    rows = read(Exporter(repo).csv(environment='ENV1'))[1:]
+    assert rows == [['alice', 'N/A', 'N/A', 'N/A', '0', '40'], ['bob', 'N/A', 'N/A', 'N/A', '1', '41']]
+    text = gzip.decompress(b''.join(export.gzipped(Exporter(repo).csv(users=['carol', 'dave']))))
+    assert text.decode().splitlines()[1:] == ['carol,N/A,N/A,N/A,2,42']
+
+    class Broken(SQLiteRepository):
+        def history_page(self, user_id, **params):
+            if user_id == 'bob':
+                raise RuntimeError('deadline exceeded')
+            return super().history_page(user_id, **params)
+
+    broken = Broken()
+    for user_id in ('alice', 'bob'):
+        broken.write_heartbeat(user_id, {}, history=[('h', {'timestamp': T0})])
+    rows = read(Exporter(broken, workers=1).csv(scope='history'))
+    assert rows[-1] == ['__error__', 'deadline exceeded']
+
+    assert export.parse_params({'scope': 'history', 'start': '1714554000000'})['start'] == T0
+    for bad in ({'scope': 'all'}, {'compress': 'zip'}, {'start': '1714554000000'}, {'scope': 'history', 'end': 'x'}):
+        with pytest.raises(ValueError):
+            export.parse_params(bad)
@@ -0,0 +1,103 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from dashboard import fingerprints
+from dashboard.fingerprints import FingerprintIndex
+from dashboard.storage import SQLiteRepository
+
+
+def program(name, body_lines=12, variant=0):
+    lines = [f'def {name}_{i}(items, limit):\n    total = {i + variant}\n'
+             f'    for item in items:\n        total += item * {i} - limit\n    return total\n'
+             for i in range(body_lines)]
+    return '\n'.join(lines)
+
+
+SHARED = program('solve')
+OTHER = '\n'.join(f'class Shape{i}:\n    sides = {i}\n    def area(self, width, height):\n'
+                  f'        return width * height / {i + 2}\n    def label(self):\n        return "shape-{i}".upper()\n'
+                  for i in range(10))
+
+
+def test_winnowing_is_stable_and_survives_formatting():
+    assert fingerprints.kgram_hashes(['a', 'b', 'c', 'd', 'e']) == [97713831949687987]
+    assert fingerprints.winnow([5, 3, 9, 3, 7, 8, 1], window=3) == {3, 1}
+    original = fingerprints.fingerprint(SHARED)
+    reformatted = fingerprints.fingerprint(SHARED.replace('    ', '\t').replace(' * ', '*'))
+    assert original == reformatted and 0 < len(original) < len(fingerprints.kgram_hashes(
+        fingerprints.similarity.tokenize(SHARED)))
+    # Any run of k + window - 1 shared tokens shares a fingerprint
+    assert original & fingerprints.fingerprint('x = 1\n' + SHARED.splitlines()[1] + ' ' + SHARED.splitlines()[3])
+    assert not original & fingerprints.fingerprint(OTHER)
+
+
+def test_only_new_fingerprints_are_posted_and_the_first_entry_keeps_them():
+    repo = SQLiteRepository()
+    index = FingerprintIndex(repo)
+    first = index.index([('bob', 'e1', SHARED, '2024-01-10T09:00:00.000Z')])
+    assert first == len(fingerprints.fingerprint(SHARED))
+    # Unchanged heartbeat: nothing; a few lines changed: a few postings
+    assert index.index([('bob', 'e2', SHARED, '2024-01-10T09:00:05.000Z')]) == 0
+    edited = SHARED + '\nprint(solve_0([1, 2, 3], 4))\n'
+    assert 0 < index.index([('bob', 'e3', edited, '2024-01-10T09:01:00.000Z')]) < 10
+    # Another worker (or a restart) posts everything again; the first entry stays
+    assert FingerprintIndex(repo).index([('bob', 'e4', edited, '2024-01-10T09:02:00.000Z')]) > first
+    posted = repo.read_fingerprints(fingerprints.fingerprint(SHARED))
+    assert {entry for students in posted.values() for entry, _ in students.values()} == {'e1'}
+    assert index.metrics()['unchanged'] == 1
+
+
+def test_sources_find_copies_of_old_snapshots():
+    repo = SQLiteRepository()
+    index = FingerprintIndex(repo, max_postings=3)
+    # Last semester bob wrote SHARED, then replaced it; carol wrote half of it
+    index.index([('bob', 'b1', SHARED, '2024-01-10T09:00:00.000Z'),
+                 ('bob', 'b2', OTHER, '2024-01-11T09:00:00.000Z'),
+                 ('carol', 'c1', program('solve', body_lines=6), '2024-02-01T09:00:00.000Z'),
+                 ('dave', 'd1', OTHER, '2024-02-02T09:00:00.000Z')])
+    index.index([('alice', 'a1', SHARED, '2024-09-01T09:00:00.000Z')])
+
+    found = index.sources(SHARED, exclude='alice')
+    ranked = found['sources']
+    assert [source['user_id'] for source in ranked] == ['bob', 'carol']
+    assert ranked[0]['containment'] == 1.0 and ranked[0]['entries'][0]['id'] == 'b1'
+    assert ranked[0]['first_seen'] == '2024-01-10T09:00:00.000Z'
+    assert 0.3 < ranked[1]['containment'] < 0.7
+    assert found['fingerprints'] == len(fingerprints.fingerprint(SHARED)) and found['boilerplate'] == 0
+
+    # Fingerprints more than max_postings students share are boilerplate
+    index.index([('erin', 'x1', OTHER, None), ('frank', 'y1', OTHER, None)])
+    other = index.sources(OTHER, exclude='bob')
+    assert other['boilerplate'] == other['fingerprints'] and other['sources'] == []
+
+
+def test_ingest_queue_flush_and_backfill():
+    repo = SQLiteRepository()
+    now = datetime(2024, 9, 1, 9, 0, tzinfo=timezone.utc)
+    index = FingerprintIndex(repo, clock=lambda: now)
+    assert not index.add('alice', 'a0', '   ')
+
+    def down(postings, max_postings=None):
+        raise ConnectionError('storage unreachable')
+
+    write, repo.write_fingerprints = repo.write_fingerprints, down
+    index._pending.append(('alice', 'a1', SHARED, '2024-09-01T09:00:00.000Z'))
+    with pytest.raises(ConnectionError):
+        index.flush()
+    assert index.metrics()['pending'] == 1 and index.metrics()['errors'] == 1
+    repo.write_fingerprints = write
+    assert index.flush() == len(fingerprints.fingerprint(SHARED))
+
+    # History written before the index existed, in the root app's entry shape
+    repo.write_heartbeat('bob', {'studentId': 'bob'}, history=[
+        ('h1', {'timestamp': '2024-01-10T09:00:00.000Z', 'code': SHARED}),
+        ('h2', {'timestamp': '2024-01-10T09:00:05.000Z', 'code': SHARED}),
+        ('h3', {'timestamp': '2024-01-11T09:00:00.000Z', 'code': OTHER}),
+    ])
+    report = fingerprints.backfill(FingerprintIndex(repo), repo, ['bob'], page_size=2)
+    assert (report['students'], report['entries']) == (1, 3)
+    assert fingerprints.snapshot_at(repo, 'bob') == ('h3', OTHER)
+    assert fingerprints.snapshot_at(repo, 'bob', datetime(2024, 1, 10, 12, tzinfo=timezone.utc)) == ('h2', SHARED)
+    source = index.sources(SHARED, exclude='alice')['sources'][0]
+    assert (source['user_id'], source['entries'][0]['id']) == ('bob', 'h1')
@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+import threading
+
+from dashboard import firebase
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_views_import_without_firebase():
+    code = ("import os, sys, django; os.environ['DJANGO_SETTINGS_MODULE'] = 'dashboard.settings'; django.setup(); "
+            "import dashboard.views, authentication.views; "
+            "print('firebase_admin' in sys.modules, 'grpc' in sys.modules)")
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.split() == ['False', 'False']
+
+
+def test_one_client_per_process(monkeypatch):
+    from google.cloud import firestore
+
+    assert firebase.SERVER_TIMESTAMP is firestore.SERVER_TIMESTAMP
+
+    class App:
+        project_id = 'xscout-test'
+        credential = type('Credential', (), {'get_credential': lambda self: None})()
+
+    created = []
+    barrier = threading.Barrier(8)
+    monkeypatch.setattr(firebase, '_default_app', App)
+    monkeypatch.setattr(firestore, 'Client', lambda **kwargs: created.append(kwargs) or object())
+    firebase._forget_client()
+
+    def first_request():
+        barrier.wait()
+        firebase.get_client()
+
+    threads = [threading.Thread(target=first_request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert created == [{'credentials': None, 'project': 'xscout-test'}]
+
+    # What a forked worker does: the parent's client is dropped, the child makes its own
+    client = firebase.get_client()
+    firebase._forget_client()
+    assert firebase.get_client() is not client and len(created) == 2
+    firebase._forget_client()
@@ -0,0 +1,37 @@
+from dashboard.history import DELTA, KEYFRAME, HistoryEncoder, decode_entries
+
+
+def _beat(n, code):
+    return {
+        'timestamp': f"2026-01-01T10:00:{n:02d}",
+        'ai': 0.1,
+        'behavior': {'wpm': 40 + n},
+        'project': {'files': ['main.py', 'utils.py'] * 50},
+        'forensic': {'snapshot': {'code': code, 'language': 'python'}, 'activeDocuments': ['main.py']},
+    }
+
+
+def test_deltas_round_trip_through_keyframes():
+    encoder = HistoryEncoder(keyframe_interval=4)
+    code = "\n".join(f"line {i}" for i in range(50))
+    beats = []
+    for n in range(9):
+        code = code.replace(f"line {n}", f"edited {n}")
+        beats.append((f"doc{n}", _beat(n, code)))
+
+    stored = [(doc_id, encoder.encode('alice', doc_id, beat)) for doc_id, beat in beats]
+
+    assert [data['encoding'] for _, data in stored] == [KEYFRAME, DELTA, DELTA, DELTA] * 2 + [KEYFRAME]
+    assert stored[2][1]['keyframe'] == 'doc0'
+    assert decode_entries(stored) == [beat for _, beat in beats]
+
+
+def test_missing_keyframes_are_fetched_or_flagged():
+    encoder = HistoryEncoder()
+    first = _beat(0, "a\nb\nc")
+    second = _beat(1, "a\nB\nc")
+    encoder.encode('bob', 'k1', first)
+    delta = encoder.encode('bob', 'd1', second)
+
+    assert decode_entries([('d1', delta)], lambda ids: {'k1': dict(first, encoding=KEYFRAME)}) == [second]
+    assert decode_entries([('d1', delta)], lambda ids: {})[0]['missing_keyframe'] is True
@@ -0,0 +1,91 @@
+import pytest
+
+from dashboard.ingest import IngestError, LatestStateCoalescer, QueueFull, TelemetryWriter, liveness, validate_heartbeat
+
+
+class FakeRef:
+    def __init__(self, path):
+        self.path = path
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.ops = []
+
+    def set(self, ref, data, merge=False):
+        self.ops.append((ref.path, data))
+
+    def commit(self):
+        self.db.commits.append(self.ops)
+
+
+class FakeDB:
+    def __init__(self):
+        self.commits = []
+
+    def batch(self):
+        return FakeBatch(self)
+
+
+def test_latest_state_is_coalesced_and_history_kept():
+    db = FakeDB()
+    writer = TelemetryWriter(db, max_batch=3)
+    for n in range(4):
+        writer.submit(latest=(FakeRef('reports/alice'), {'n': n}),
+                      history=[(FakeRef(f'reports/alice/history/{n}'), {'n': n})])
+    writer.stop()
+    writer.flush()
+
+    ops = [op for batch in db.commits for op in batch]
+    assert all(len(batch) <= 3 for batch in db.commits)
+    assert [data for path, data in ops if path == 'reports/alice'][-1] == {'n': 3}
+    assert sorted(path for path, _ in ops if 'history' in path) == [f'reports/alice/history/{n}' for n in range(4)]
+    assert writer.metrics()['queue_depth'] == 0
+
+
+def test_full_queue_rejects_submissions():
+    writer = TelemetryWriter(FakeDB(), max_queue=2, flush_interval=60)
+    writer.submit(latest=(FakeRef('reports/a'), {}))
+    with pytest.raises(QueueFull):
+        writer.submit(latest=(FakeRef('reports/b'), {}), history=[(FakeRef('reports/b/history/1'), {})])
+    writer.stop(timeout=0)
+
+
+def test_coalescer_ignores_clock_fields():
+    coalescer = LatestStateCoalescer(last_seen_interval=30, max_age=300)
+    beat = {'behavior': {'wpm': 0}, 'timestamp': '10:00:00', 'forensic': {'appHistory': [{'app': 'Code', 'time': '10:00'}]}}
+    later = {'behavior': {'wpm': 0}, 'timestamp': '10:00:05', 'forensic': {'appHistory': [{'app': 'Code', 'time': '10:05'}]}}
+
+    action, digest = coalescer.plan('reports/a', beat, now=0)
+    assert action == 'set'
+    coalescer.record('reports/a', action, digest, now=0)
+
+    assert coalescer.plan('reports/a', later, now=5)[0] == 'skip'
+    assert coalescer.plan('reports/a', later, now=31)[0] == 'touch'
+    assert coalescer.plan('reports/a', later, now=301)[0] == 'set'
+    assert coalescer.plan('reports/a', dict(later, behavior={'wpm': 40}), now=5)[0] == 'set'
+
+
+def test_touch_folds_into_pending_set():
+    db = FakeDB()
+    writer = TelemetryWriter(db, flush_interval=60)
+    writer.submit(latest=(FakeRef('reports/a'), {'ai': 1}))
+    writer.submit(touch=(FakeRef('reports/a'), {'lastSeen': 't2'}))
+    writer.flush()
+    writer.stop(timeout=0)
+
+    assert db.commits == [[('reports/a', {'ai': 1, 'lastSeen': 't2'})]]
+
+
+def test_touch_keeps_liveness_fields_fresh():
+    beat = {'behavior': {'wpm': 0}, 'timestamp': '10:00:35', 'lastSeen': 't35', 'forensic': {'time': '10:35'}}
+
+    assert liveness(beat) == {'timestamp': '10:00:35', 'lastSeen': 't35'}
+    assert set(liveness({'ai': 1})) == {'lastSeen'}
+
+
+@pytest.mark.parametrize('body', [[], {'user': ''}, {'user': 'a/b'}, {'behavior': 'fast'}, {'ai': 'high'}])
+def test_invalid_heartbeats_are_rejected(body):
+    with pytest.raises(IngestError):
+        validate_heartbeat(body)
@@ -0,0 +1,111 @@
+import csv
+import io
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+import pytest
+from django.test import RequestFactory
+
+from dashboard import jobs
+from dashboard.jobs import JobManager
+from dashboard.storage import SQLiteRepository
+
+T0 = datetime(2024, 5, 1, 9, 0, tzinfo=timezone.utc)
+
+
+def finished(manager, job):
+    deadline = time.monotonic() + 10
+    while job['status'] in ('queued', 'running'):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+        job = manager.status(job['id'])
+    return job
+
+
+def download(manager, job_id, **headers):
+    response = manager.download(RequestFactory().get('/', **headers), job_id)
+    return response, b''.join(response.streaming_content) if response.streaming else response.content
+
+
+def test_export_job_is_reused_until_the_data_changes(tmp_path):
+    repo = SQLiteRepository()
+    for i in range(20):
+        entries = [(f'h{n}', {'timestamp': T0, 'ai_score': n}) for n in range(5)]
+        repo.write_heartbeat(f'student_{i:02d}', {'ai': i}, history=entries)
+    manager = JobManager(repo, str(tmp_path))
+
+    job = finished(manager, manager.submit('export', {'scope': 'history'}))
+    assert (job['status'], job['done'], job['total']) == ('done', 20, 20)
+    assert job['download_url'] == f"/api/jobs/{job['id']}/download/"
+    response, body = download(manager, job['id'])
+    assert response.status_code == 200 and response['Accept-Ranges'] == 'bytes'
+    assert len(list(csv.reader(io.StringIO(body.decode())))) == 101 and job['bytes'] == len(body)
+
+    again = manager.submit('export', {'scope': 'history'})
+    assert (again['id'], again['reused']) == (job['id'], True)
+
+    repo.write_heartbeat('student_00', {'ai': 99})
+    newer = finished(manager, manager.submit('export', {'scope': 'history'}))
+    assert newer['id'] != job['id'] and newer['id'][:12] == job['id'][:12]
+    # The older artifact of the same export is gone
+    with pytest.raises(LookupError):
+        manager.status(job['id'])
+    assert manager.metrics() == {'started': 2, 'reused': 1, 'finished': 2, 'failed': 0}
+
+
+def test_downloads_resume_with_range_requests(tmp_path):
+    repo = SQLiteRepository()
+    for i in range(50):
+        repo.write_heartbeat(f'student_{i:02d}', {'ai': i, 'code': 'x = 1\n' * 50})
+    manager = JobManager(repo, str(tmp_path))
+    job = finished(manager, manager.submit('backup', {'format': 'ndjson'}))
+    _, whole = download(manager, job['id'])
+
+    response, tail = download(manager, job['id'], HTTP_RANGE='bytes=1000-')
+    assert response.status_code == 206 and tail == whole[1000:]
+    assert response['Content-Range'] == f'bytes 1000-{len(whole) - 1}/{len(whole)}'
+    _, suffix = download(manager, job['id'], HTTP_RANGE='bytes=-10')
+    assert suffix == whole[-10:]
+    response, _ = download(manager, job['id'], HTTP_RANGE=f'bytes={len(whole)}-')
+    assert response.status_code == 416 and response['Content-Range'] == f'bytes */{len(whole)}'
+    # A different artifact behind the same URL: the whole file, not a slice of it
+    response, body = download(manager, job['id'], HTTP_RANGE='bytes=1000-', HTTP_IF_RANGE='"other"')
+    assert response.status_code == 200 and body == whole
+
+    assert jobs.parse_range('bytes=0-9,20-29', 100) is None
+    assert jobs.parse_range('bytes=5-500', 100) == (5, 99)
+    assert jobs.parse_range('lines=1-2', 100) is None
+
+
+def test_failed_and_abandoned_jobs_restart(tmp_path):
+    class Broken(SQLiteRepository):
+        def stream_latest(self, fields=None, limit=None):
+            raise RuntimeError('deadline exceeded')
+
+    manager = JobManager(Broken(), str(tmp_path), ttl=3600)
+    job = finished(manager, manager.submit('backup', {}))
+    assert (job['status'], job['error']) == ('failed', 'deadline exceeded')
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.part')]
+
+    # A worker that died mid-job leaves a record that stops updating
+    record = manager._load(job['id'])
+    record.update(status='running', error=None)
+    manager._save(record)
+    assert manager.status(job['id'])['status'] == 'running'
+    record['updated'] -= jobs.STALE_AFTER + 1
+    with open(os.path.join(tmp_path, job['id'] + '.json'), 'w') as f:
+        json.dump(record, f)
+    assert manager.status(job['id'])['status'] == 'failed'
+    retried = manager.submit('backup', {})
+    assert retried['reused'] is False and finished(manager, retried)['status'] == 'failed'
+
+    manager.sweep(now=time.time() + 7200)
+    assert os.listdir(tmp_path) == []
+    with pytest.raises(LookupError):
+        manager.status('../../etc/passwd')
+    for bad in ({'kind': 'restore'}, {'kind': 'backup', 'params': {'format': 'xml'}},
+                {'kind': 'export', 'params': {'scope': 'all'}}, {'kind': 'export', 'params': {'users': ['a']}}):
+        with pytest.raises(ValueError):
+            jobs.parse_request(bad)
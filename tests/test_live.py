@@ -0,0 +1,61 @@
+import asyncio
+import json
+
+import pytest
+
+from dashboard import live
+
+
+def _parse(chunk):
+    event, data = chunk.strip().split('\n')
+    return event.split(': ', 1)[1], json.loads(data.split(': ', 1)[1])['data']
+
+
+def test_topics():
+    assert live.parse_topic(None) == 'all'
+    assert live.parse_topic('env:ABC123') == 'env:ABC123'
+    with pytest.raises(ValueError):
+        live.parse_topic('room:1')
+    assert live.topics_for({'id': 'u1', 'environment': 'ABC'}) == {'all', 'student:u1', 'env:ABC'}
+
+
+def test_stream_sends_snapshot_then_only_changed_records():
+    broker = live.LiveBroker(rescan_interval=60, keepalive=60)
+    state = [{'id': 'u1', 'environment': 'A', 'ai': 1}, {'id': 'u2', 'environment': 'B', 'ai': 2}]
+
+    async def scenario():
+        stream = broker.events('env:A', lambda: state)
+        assert (await stream.__anext__()).startswith('retry:')
+        assert _parse(await stream.__anext__()) == ('snapshot', [state[0]])
+
+        assert broker.publish([{'id': 'u1', 'environment': 'A', 'ai': 5}, {'id': 'u2', 'environment': 'B', 'ai': 9}]) == 2
+        assert broker.publish([{'id': 'u1', 'environment': 'A', 'ai': 5}]) == 0
+        assert _parse(await stream.__anext__()) == ('update', [{'id': 'u1', 'environment': 'A', 'ai': 5}])
+        await stream.aclose()
+
+    asyncio.run(scenario())
+    assert broker.metrics()['subscribers'] == 0
+
+
+def test_slow_viewer_is_bounded_and_resynced():
+    broker = live.LiveBroker(max_pending=3, rescan_interval=60, keepalive=60)
+
+    async def scenario():
+        stream = broker.events('all', lambda: [{'id': 'u0'}])
+        await stream.__anext__()
+        await stream.__anext__()
+
+        # Repeated heartbeats from one student collapse into one pending record
+        for ai in range(10):
+            broker.publish([{'id': 'u1', 'ai': ai}])
+        await asyncio.sleep(0)
+        assert _parse(await stream.__anext__()) == ('update', [{'id': 'u1', 'ai': 9}])
+
+        # More distinct students than max_pending: backlog dropped, snapshot resent
+        broker.publish([{'id': f"s{i}"} for i in range(5)])
+        await asyncio.sleep(0)
+        assert _parse(await stream.__anext__()) == ('snapshot', [{'id': 'u0'}])
+        await stream.aclose()
+
+    asyncio.run(scenario())
+    assert broker.metrics()['resyncs'] == 1
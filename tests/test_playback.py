@@ -0,0 +1,125 @@
+import operator
+
+import pytest
+
+from dashboard import history, playback
+
+OPS = {'>=': operator.ge, '<=': operator.le}
+
+
+class FakeSnap:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class FakeQuery:
+    """Just enough of the Firestore query chain used by playback.fetch_page."""
+
+    def __init__(self, docs, filters=(), descending=False, after=None, fields=None, limit=None):
+        self.docs = docs
+        self.filters = filters
+        self.descending = descending
+        self.after = after
+        self.fields = fields
+        self._limit = limit
+
+    def _copy(self, **changes):
+        state = dict(filters=self.filters, descending=self.descending, after=self.after,
+                     fields=self.fields, limit=self._limit)
+        state.update(changes)
+        return FakeQuery(self.docs, **state)
+
+    def where(self, field, op, value):
+        return self._copy(filters=self.filters + ((field, op, value),))
+
+    def order_by(self, field, direction='ASCENDING'):
+        return self._copy(descending=direction == 'DESCENDING')
+
+    def start_after(self, values):
+        return self._copy(after=(values['timestamp'], values['__name__']))
+
+    def select(self, fields):
+        return self._copy(fields=fields)
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def document(self, doc_id):
+        return doc_id
+
+    def stream(self):
+        rows = sorted(self.docs.items(), key=lambda item: (item[1]['timestamp'], item[0]), reverse=self.descending)
+        for field, op, value in self.filters:
+            rows = [row for row in rows if OPS[op](row[1][field], value)]
+        if self.after is not None:
+            if self.descending:
+                rows = [row for row in rows if (row[1]['timestamp'], row[0]) < self.after]
+            else:
+                rows = [row for row in rows if (row[1]['timestamp'], row[0]) > self.after]
+        for doc_id, data in rows[:self._limit]:
+            if self.fields is not None:
+                data = {key: value for key, value in data.items() if key in self.fields}
+            yield FakeSnap(doc_id, data)
+
+
+class FakeDB:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def get_all(self, doc_ids):
+        return [FakeSnap(doc_id, self.docs.get(doc_id)) for doc_id in doc_ids]
+
+
+def _session(count):
+    encoder = history.HistoryEncoder(keyframe_interval=4)
+    docs = {}
+    for i in range(count):
+        doc_id = f"h{i:03d}"
+        code = '\n'.join(f"line {n}" for n in range(i + 1))
+        entry = {'timestamp': f"2026-01-01T00:00:{i:02d}.000Z", 'ai_score': i / 100,
+                 'forensic': {'snapshot': {'code': code}}}
+        docs[doc_id] = encoder.encode('u1', doc_id, entry)
+    return docs
+
+
+def test_cursor_pages_cover_session_once():
+    docs = _session(25)
+    ref, db = FakeQuery(docs), FakeDB(docs)
+
+    seen, cursor = [], None
+    while True:
+        page = playback.fetch_page(db, ref, limit=10, cursor=cursor, iso_timestamps=True)
+        seen.extend(page['data'])
+        cursor = page['next_cursor'] and playback.decode_cursor(page['next_cursor'])
+        if not page['has_more']:
+            break
+
+    assert [entry['id'] for entry in seen] == sorted(docs)
+    assert seen[-1]['forensic']['snapshot']['code'].count('\n') == 24
+
+
+def test_window_and_index_projection():
+    docs = _session(25)
+    params = playback.parse_params({'start': '2026-01-01T00:00:05Z', 'end': '2026-01-01T00:00:09Z',
+                                    'fields': 'timestamp,ai_score'})
+    page = playback.fetch_page(FakeDB(docs), FakeQuery(docs), iso_timestamps=True, **params)
+
+    assert [entry['id'] for entry in page['data']] == [f"h{i:03d}" for i in range(5, 10)]
+    assert set(page['data'][0]) == {'id', 'timestamp', 'ai_score'}
+    assert page['next_cursor'] is None
+
+
+def test_descending_page_and_bad_params():
+    docs = _session(8)
+    page = playback.fetch_page(FakeDB(docs), FakeQuery(docs), limit=3, descending=True, iso_timestamps=True)
+    assert [entry['id'] for entry in page['data']] == ['h007', 'h006', 'h005']
+    assert page['has_more']
+
+    for bad in ({'limit': 'ten'}, {'limit': '0'}, {'cursor': 'nope'}, {'start': 'yesterday'}):
+        with pytest.raises(ValueError):
+            playback.parse_params(bad)
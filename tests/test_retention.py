@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from dashboard import retention
+from dashboard.history import HistoryEncoder
+from dashboard.retention import RetentionEngine
+from dashboard.storage import SQLiteRepository
+
+NOW = datetime(2024, 6, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def ids(repo, user_id):
+    return [doc.id for doc in repo.stream_history(user_id)]
+
+
+def daily(repo, user_id, environment, days):
+    """One history entry per day for the last `days` days, oldest first."""
+    history = [(f'{user_id}-{n:03d}', {'timestamp': NOW - timedelta(days=n, hours=1), 'ai_score': n})
+               for n in reversed(range(days))]
+    repo.write_heartbeat(user_id, {'environment': environment, 'ai': 1}, history=history)
+
+
+def test_per_environment_ages_dry_run_and_paging():
+    repo = SQLiteRepository()
+    daily(repo, 'alice', 'ENV1', 40)
+    daily(repo, 'bob', 'SHORT', 40)
+    daily(repo, 'carol', 'FOREVER', 40)
+    repo.write_heartbeat('dave', {'ai': 1}, history=[('undated', {'ai_score': 1})])
+    engine = RetentionEngine(repo, days=30, environments=retention.parse_environments('SHORT=7, FOREVER=0'),
+                             batch_size=4, rate=None)
+
+    preview = engine.run(now=NOW, dry_run=True)
+    assert (preview['documents'], preview['affected_students'], preview['batches']) == (10 + 33, 2, 0)
+    assert len(ids(repo, 'alice')) == 40
+    assert preview['environments']['SHORT']['cutoff'] == '2024-05-25T12:00:00.000Z'
+    assert 'FOREVER' not in preview['environments']
+
+    report = engine.run(now=NOW)
+    assert {key: report[key] for key in ('documents', 'bytes', 'students', 'complete')} == \
+        {key: preview[key] for key in ('documents', 'bytes', 'students', 'complete')}
+    # Pages of 4: 10 entries in 3 batches, 33 in 9
+    assert report['batches'] == 12 and report['bytes'] > 43 * 100
+    assert ids(repo, 'alice')[0] == 'alice-029' and len(ids(repo, 'bob')) == 7
+    assert len(ids(repo, 'carol')) == 40 and ids(repo, 'dave') == ['undated']
+    latest = repo.get_latest('bob')
+    assert latest.pop('changedAt') and latest == {'environment': 'SHORT', 'ai': 1}
+
+    assert engine.run(now=NOW)['documents'] == 0
+    assert retention.metrics()['documents'] == 0
+    # Without a configured age nothing expires
+    assert RetentionEngine(repo, rate=None).run(now=NOW)['documents'] == 0
+    assert len(ids(repo, 'carol')) == 40
+    for bad in ('ENV1', 'ENV1=x', '=3', 'ENV1=-1'):
+        with pytest.raises(ValueError):
+            retention.parse_environments(bad)
+
+
+def test_keyframes_of_retained_deltas_are_kept():
+    repo = SQLiteRepository()
+    encoder = HistoryEncoder(keyframe_interval=5)
+    for n in reversed(range(12)):
+        doc_id = f'h{11 - n:02d}'
+        entry = {'timestamp': NOW - timedelta(days=n), 'ai_score': n, 'code': 'x = 1\n' * 20 + f'{n}\n'}
+        repo.write_heartbeat('alice', {'environment': 'ENV1'}, history=[(doc_id, encoder.encode('alice', doc_id, entry))])
+    # Keyframes h00, h05, h10; the cutoff falls between h05 and h06
+    report = RetentionEngine(repo, days=5.5, rate=None).run(now=NOW)
+    assert (report['documents'], report['kept_keyframes']) == (5, 1)
+    assert ids(repo, 'alice') == ['h05', 'h06', 'h07', 'h08', 'h09', 'h10', 'h11']
+    page = repo.history_page('alice', start=NOW - timedelta(days=5.5), limit=10)
+    assert [entry['id'] for entry in page['data']] == ['h06', 'h07', 'h08', 'h09', 'h10', 'h11']
+    assert not any(entry.get('missing_keyframe') for entry in page['data'])
+
+    # h08 and h09 still decode against h05; once nothing retained points at it, it goes too
+    assert RetentionEngine(repo, days=3.5, rate=None).run(now=NOW)['documents'] == 2
+    assert ids(repo, 'alice') == ['h05', 'h08', 'h09', 'h10', 'h11']
+    assert RetentionEngine(repo, days=1.5, rate=None).run(now=NOW)['documents'] == 3
+    assert ids(repo, 'alice') == ['h10', 'h11']
+
+
+def test_deletes_are_rate_limited_and_runs_respect_a_budget():
+    repo = SQLiteRepository()
+    for i in range(3):
+        daily(repo, f'student_{i}', 'ENV1', 30)
+    now = [0.0]
+    slept = []
+
+    def sleep(seconds):
+        slept.append(seconds)
+        now[0] += seconds
+
+    engine = RetentionEngine(repo, days=10, batch_size=10, rate=20, clock=lambda: now[0], sleep=sleep)
+    report = engine.run(now=NOW)
+    # 60 deletes at 20/s take 3 s
+    assert report['documents'] == 60 and sum(slept) == pytest.approx(3.0) and report['runtime'] == pytest.approx(3.0)
+
+    for i in range(3):
+        daily(repo, f'student_{i}', 'ENV1', 30)
+    report = engine.run(now=NOW, budget=1.0)
+    assert not report['complete'] and report['documents'] == 20
+    assert 'Stopped early' in retention.describe(report)
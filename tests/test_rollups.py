@@ -0,0 +1,67 @@
+import pytest
+
+from dashboard import rollups
+from dashboard.rollups import RollupStore
+from dashboard.storage import SQLiteRepository
+
+T0 = 1714554000  # 2024-05-01T09:00:00Z
+
+
+def behavior(wpm, pastes=0):
+    return {'wpm': wpm, 'backspaceRate': 1, 'pasteEvents': pastes, 'idleTime': 0}
+
+
+def test_workers_merge_into_shared_buckets():
+    repo = SQLiteRepository()
+    # Two workers, each seeing part of every student's heartbeats
+    workers = [RollupStore(repo), RollupStore(repo)]
+    for minute in range(60):
+        for i, student in enumerate(['alice', 'bob', 'carol']):
+            environment = 'ENV2' if student == 'carol' else 'ENV1'
+            workers[minute % 2].add(student, behavior(10 * (i + 1) + minute % 3), environment, now=T0 + minute * 60)
+    for worker in workers:
+        worker.flush(now=T0)
+
+    now = T0 + 3599
+    summary = workers[0].query('wpm', window=3600, now=now)['summary']
+    assert (summary['resolution'], summary['students'], summary['count']) == ('10m', 3, 180)
+    assert (summary['min'], summary['max'], summary['mean']) == (10, 32, 21)
+
+    assert workers[1].class_average('wpm', window=3600, environment='ENV1', now=now) == 16
+    assert workers[1].class_average('wpm', window=3600, environment='ENV3', now=now) is None
+
+    series = workers[0].query('wpm', window=600, resolution='1m', user_id='bob', now=now)['series']
+    assert len(series) == 10 and all(point['count'] == 1 and point['students'] == 1 for point in series)
+    assert series[-1] == {'count': 1, 'mean': 22.0, 'min': 22.0, 'max': 22.0, 't': '2024-05-01T09:59:00.000Z',
+                          'students': 1, 'pastes': 0}
+
+
+def test_sessions_and_paste_bursts_from_minute_buckets():
+    repo = SQLiteRepository()
+    store = RollupStore(repo, session_gap=1800, paste_burst=3)
+    # Raw extension payload: cumulative pasteCount, then a restart resets it
+    beats = [(0, 0), (1, 4), (2, 5), (3, 5), (120, 1), (121, 2)]
+    for minute, pastes in beats:
+        store.add('alice', {'wpm': 30 + minute % 2, 'pasteCount': pastes}, now=T0 + minute * 60 + 5)
+    store.flush(now=T0)
+
+    first, second = store.sessions('alice', start=T0, end=T0 + 3 * 3600, now=T0 + 3 * 3600)
+    assert (first['start'], first['end']) == ('2024-05-01T09:00:00.000Z', '2024-05-01T09:04:00.000Z')
+    assert (first['active_minutes'], first['heartbeats'], first['pastes'], first['paste_bursts']) == (4, 4, 5, 1)
+    assert first['metrics']['wpm'] == {'min': 30, 'max': 31, 'mean': 30.5}
+    assert (second['active_minutes'], second['pastes'], second['paste_bursts']) == (2, 1, 0)
+
+
+def test_expired_buckets_are_pruned_and_params_are_validated():
+    repo = SQLiteRepository()
+    store = RollupStore(repo, retention={'1m': 3600})
+    store.add('alice', behavior(40), now=T0)
+    store.flush(now=T0)
+    store.flush(now=T0 + 2 * 3600)
+    assert [row[0] for row in repo.read_rollups('1m', T0 - 3600, T0 + 3600)] == []
+    assert [row[0] for row in repo.read_rollups('10m', T0 - 3600, T0 + 3600)] == [T0]
+
+    assert rollups.parse_params({'window': '600'})['metric'] == 'wpm'
+    for bad in ({'metric': 'ai'}, {'window': '-1'}, {'window': 'hour'}, {'resolution': '5m'}):
+        with pytest.raises(ValueError):
+            rollups.parse_params(bad)
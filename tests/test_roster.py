@@ -0,0 +1,138 @@
+import pytest
+
+from dashboard import roster
+from dashboard.roster import RosterError, RosterImporter
+from dashboard.storage import SQLiteRepository
+
+
+class Local:
+    """The AuthorizedID table, counting queries."""
+
+    def __init__(self, rows=None):
+        self.rows = {}
+        self.queries = 0
+        for student_id, (active, description) in (rows or {}).items():
+            self.rows[student_id] = (len(self.rows) + 1, active, description)
+
+    def load(self, student_ids):
+        self.queries += 1
+        if student_ids is None:
+            return dict(self.rows)
+        return {student_id: self.rows[student_id] for student_id in student_ids if student_id in self.rows}
+
+    def save(self, created, updated, batch_size, now):
+        self.queries += 1
+        for pk, student_id, active, description in created + updated:
+            self.rows[student_id] = (pk or len(self.rows) + 1, active, description)
+
+    def state(self):
+        return {student_id: (active, description) for student_id, (pk, active, description) in self.rows.items()}
+
+
+def importer(local, repo, **options):
+    return RosterImporter(local.load, local.save, lambda: repo, **options)
+
+
+def test_parse_csv_and_json_rosters():
+    rows, errors, duplicates = roster.parse(
+        b'\xef\xbb\xbfStudent ID,Name,Active\n'
+        b's1,Ada Lovelace,yes\n'
+        b'\n'
+        b's2,,\n'
+        b',Nobody,yes\n'
+        b's3,Grace,maybe\n'
+        b's1,Ada L.,no\n')
+    assert [(row['student_id'], row['description'], row['is_active']) for row in rows] == [
+        ('s1', 'Ada L.', False), ('s2', None, None)]
+    assert errors == [{'row': 5, 'message': 'missing student ID'},
+                      {'row': 6, 'message': "active must be true or false, not 'maybe'"}]
+    assert duplicates == 1
+
+    # No header: id, description, active
+    rows, errors, _ = roster.parse('s1,Lab 3\ns2\n')
+    assert [(row['student_id'], row['description']) for row in rows] == [('s1', 'Lab 3'), ('s2', None)]
+
+    rows, errors, _ = roster.parse('{"students": ["s1", {"studentId": "s2", "isActive": false}, {"id": "a/b"}, 7]}')
+    assert [(row['student_id'], row['is_active']) for row in rows] == [('s1', None), ('s2', False), ('7', None)]
+    assert errors == [{'row': 3, 'message': "student ID can't contain '/'"}]
+
+    with pytest.raises(RosterError):
+        roster.parse('{"students": 3}')
+    with pytest.raises(RosterError):
+        roster.parse('[1,', format='json')
+    assert roster.format_for('cohort.JSON') == 'json' and roster.format_for('', 'text/csv') == 'csv'
+
+
+def test_import_diffs_against_the_table_and_storage_and_batches_writes():
+    local = Local({'s1': (True, 'Ada'), 's2': (False, 'Bob'), 's3': (True, 'Cy')})
+    repo = SQLiteRepository()
+    repo.set_authorized('s1', {'studentId': 's1', 'description': 'Ada', 'isActive': True, 'authorizedAt': 1})
+    repo.set_authorized('s2', {'studentId': 's2', 'description': 'Bob', 'isActive': False, 'authorizedAt': 2})
+    calls = []
+    merge = repo.merge_authorized_many
+    repo.merge_authorized_many = lambda records, workers: calls.append(len(records)) or merge(records, workers)
+    rows, errors, duplicates = roster.parse('student_id,description,is_active\n'
+                                            's1,Ada,true\ns2,Bob,true\ns3,Cyrus,\ns4,Dee,\n')
+
+    preview = importer(local, repo).run(rows, dry_run=True)
+    assert (preview['created'], preview['updated'], preview['unchanged'], preview['storage_writes']) == (1, 2, 1, 3)
+    assert calls == [] and local.state()['s2'] == (False, 'Bob') and repo.get_authorized('s4') is None
+
+    report = importer(local, repo).run(rows, errors, duplicates)
+    assert (report['created'], report['updated'], report['unchanged'], report['deactivated']) == (1, 2, 1, 0)
+    # One query to diff and one transaction to write (after the preview's query), however long the roster
+    assert local.queries == 3 and calls == [3]
+    assert local.state() == {'s1': (True, 'Ada'), 's2': (True, 'Bob'), 's3': (True, 'Cyrus'), 's4': (True, 'Dee')}
+    # Changes merge into existing records; IDs storage lacks get the whole record
+    s2 = repo.get_authorized('s2')
+    assert (s2['isActive'], s2['authorizedAt']) == (True, 2) and s2['updatedAt'] > '2024'
+    for student_id, description in (('s3', 'Cyrus'), ('s4', 'Dee')):
+        record = repo.get_authorized(student_id)
+        assert (record['studentId'], record['description'], record['isActive']) == (student_id, description, True)
+        assert record['authorizedAt']
+    assert report['changed_ids'] == ['s2', 's3', 's4']
+
+    # Imported again: nothing to write
+    again = importer(local, repo).run(rows)
+    assert (again['unchanged'], again['storage_writes'], again['storage_batches']) == (4, 0, 0)
+    assert report['rows_per_second'] and 'Imported 4 IDs' in roster.describe(report)
+
+
+def test_sync_deactivates_missing_ids_and_failed_storage_writes_are_retried():
+    local = Local({'s1': (True, ''), 's2': (True, ''), 'gone': (True, ''), 'off': (False, '')})
+    repo = SQLiteRepository()
+    repo.set_authorized('gone', {'student_id': 'gone', 'is_active': True})
+    rows, errors, _ = roster.parse('s1\ns2\n')
+    report = importer(local, repo, record_style='snake').run(rows, sync=True)
+    assert (report['created'], report['deactivated'], report['unchanged'], report['storage_writes']) == (0, 1, 2, 3)
+    assert local.state()['gone'] == (False, '') and repo.get_authorized('gone')['is_active'] is False
+    assert repo.get_authorized('s1')['is_active'] is True and repo.get_authorized('off') is None
+
+    rows, errors, _ = roster.parse('s1\n,x\n')
+    with pytest.raises(RosterError):
+        importer(local, repo).run(rows, errors, sync=True)
+    assert local.state()['s2'] == (True, '')
+
+    def down(records, workers):
+        raise ConnectionError('storage unreachable')
+
+    merge, repo.merge_authorized_many = repo.merge_authorized_many, down
+    rows, errors, _ = roster.parse('s5\n')
+    report = importer(local, repo, record_style='snake').run(rows)
+    assert report['created'] == 1 and report['storage_error'] == 'storage unreachable'
+    assert local.state()['s5'] == (True, '') and 'Storage sync failed' in roster.describe(report)
+
+    # The table already has s5; importing again still finds storage without it
+    repo.merge_authorized_many = merge
+    report = importer(local, repo, record_style='snake').run(rows)
+    assert (report['created'], report['unchanged'], report['storage_writes']) == (0, 1, 1)
+    assert repo.get_authorized('s5')['is_active'] is True
+
+
+def test_batched_storage_reads_and_writes():
+    repo = SQLiteRepository()
+    records = [(f's{n:04d}', {'isActive': n % 2 == 0}) for n in range(1200)]
+    assert repo.merge_authorized_many(records, workers=4) == 1
+    found = repo.get_authorized_many([f's{n:04d}' for n in range(0, 1300, 100)])
+    assert sorted(found) == [f's{n:04d}' for n in range(0, 1200, 100)]
+    assert found['s0100'] == {'isActive': True}
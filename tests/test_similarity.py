@@ -0,0 +1,70 @@
+from dashboard.similarity import DifflibEngine, MinHashLSHEngine, SimilarityState, build_graph, graph_version
+
+BASE = "\n".join(
+    f"def step_{i}(items):\n    total_{i} = sum(x * {i} for x in items if x % {i + 2})\n    return total_{i}"
+    for i in range(40)
+)
+COPY = BASE.replace("total_3 ", "acc_3 ").replace("step_7", "phase_7")
+OTHER = "\n".join(
+    f"class Node{i}:\n    def __init__(self, left, right):\n        self.left, self.right = right, left + {i}"
+    for i in range(40)
+)
+
+
+def _users(**codes):
+    return [{'id': uid, 'label': uid, 'code': code, 'last_seen': 'now'} for uid, code in codes.items()]
+
+
+def test_minhash_links_copied_code_only():
+    graph = build_graph(_users(alice=BASE, bob=COPY, carol=OTHER), MinHashLSHEngine())
+
+    assert [(e['from'], e['to']) for e in graph['edges']] == [('alice', 'bob')]
+    assert {n['id']: n['risky'] for n in graph['nodes']} == {'alice': True, 'bob': True, 'carol': False}
+    assert graph['meta']['algorithm'] == 'minhash-lsh'
+
+
+def test_difflib_engine_keeps_response_shape():
+    graph = build_graph(_users(alice=BASE, bob=BASE), DifflibEngine())
+
+    assert graph['edges'][0]['label'] == '100%'
+    assert graph['meta']['algorithm'] == 'difflib.SequenceMatcher'
+    assert graph['meta']['threshold'] == 0.8
+
+
+def test_state_rescores_only_changed_users():
+    engine = MinHashLSHEngine()
+    state = SimilarityState(engine)
+    users = _users(alice=BASE, bob=OTHER, carol=OTHER + "\n# v2")
+
+    assert state.update(users) == ['alice', 'bob', 'carol']
+    version = state.etag
+    assert state.update(users) == []
+    assert state.etag == version
+
+    users = _users(alice=BASE, bob=COPY, carol=OTHER + "\n# v2")
+    assert state.update(users) == ['bob']
+    assert state.etag != version
+    assert sorted((a, b) for a, b, _ in state.matches()) == [('alice', 'bob')]
+
+    state.update(_users(alice=BASE, carol=OTHER))
+    assert state.matches() == []
+
+
+def test_graph_from_updated_state_reports_its_stats():
+    state = SimilarityState(MinHashLSHEngine())
+    users = _users(alice=BASE, bob=COPY, carol=OTHER)
+    state.update(users)
+
+    meta = build_graph(users, state.engine, state)['meta']
+    assert meta['rescored'] == 3 and meta['candidates'] >= 1 and meta['comparisons'] >= 1
+
+
+def test_graph_version_moves_with_last_seen_without_rescoring():
+    state = SimilarityState(MinHashLSHEngine())
+    users = _users(alice=BASE, bob=COPY)
+    state.update(users)
+    version, etag = graph_version(users, state), state.etag
+
+    users[1]['last_seen'] = 'later'
+    assert state.update(users) == [] and state.etag == etag
+    assert build_graph(users, state.engine, state)['meta']['version'] == graph_version(users, state) != version
@@ -0,0 +1,169 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from dashboard import ingest, playback
+from dashboard.history import HistoryEncoder
+from dashboard.storage import FirestoreRepository, SQLiteRepository
+
+T0 = datetime(2024, 5, 1, 9, 0, tzinfo=timezone.utc)
+
+
+def test_latest_state_environment_and_delete(tmp_path):
+    repo = SQLiteRepository(str(tmp_path / 'telemetry.sqlite3'))
+    repo.write_heartbeat('bob', {'environment': 'ENV1', 'ai': 2}, last_seen=T0)
+    repo.write_heartbeat('alice', {'environment': 'ENV1', 'ai': 1})
+    repo.write_heartbeat('carol', {'environment': 'ENV2', 'ai': 3})
+    # Stored at millisecond precision
+    time.sleep(0.002)
+    since = datetime.now(timezone.utc)
+    repo.write_heartbeat('alice', {'environment': 'ENV2', 'ai': 9})
+
+    assert [doc.id for doc in repo.stream_latest()] == ['alice', 'bob', 'carol']
+    assert [doc.to_dict() for doc in repo.stream_latest(fields=['ai'], limit=2)] == [{'ai': 9}, {'ai': 2}]
+    assert repo.get_latest('bob')['lastSeen'] == '2024-05-01T09:00:00Z'
+    assert [doc.id for doc in repo.stream_environment('ENV2')] == ['alice', 'carol']
+    assert [doc.id for doc in repo.stream_latest_changed(since)] == ['alice']
+
+    # Visible from other threads (one connection per thread)
+    repo.delete_latest(['carol'])
+    seen = []
+    thread = threading.Thread(target=lambda: seen.extend(doc.id for doc in repo.stream_latest()))
+    thread.start()
+    thread.join()
+    assert seen == ['alice', 'bob']
+
+
+def test_history_pages_match_the_firestore_shape():
+    repo = SQLiteRepository()
+    encoder = HistoryEncoder(keyframe_interval=3)
+    for i in range(7):
+        doc_id = repo.new_history_id('alice')
+        entry = {'timestamp': T0 + timedelta(minutes=i), 'ai_score': i, 'code': 'x = 1\n' * 20 + f'y = {i}\n'}
+        repo.write_heartbeat('alice', {'ai': i}, history=[(doc_id, encoder.encode('alice', doc_id, entry))])
+
+    first = repo.history_page('alice', limit=4)
+    rest = repo.history_page('alice', limit=4, cursor=playback.decode_cursor(first['next_cursor']))
+    entries = first['data'] + rest['data']
+    assert [entry['ai_score'] for entry in entries] == list(range(7))
+    assert entries[5]['code'].endswith('y = 5\n')
+    assert (first['has_more'], rest['has_more']) == (True, False)
+
+    newest = repo.history_page('alice', limit=2, descending=True, fields=['ai_score'])
+    assert newest['data'] == [{'ai_score': 6, 'id': entries[6]['id']}, {'ai_score': 5, 'id': entries[5]['id']}]
+
+    window = repo.history_page('alice', start=T0 + timedelta(minutes=2), end=T0 + timedelta(minutes=3))
+    assert [entry['ai_score'] for entry in window['data']] == [2, 3]
+
+
+def test_authorized_ids():
+    repo = SQLiteRepository()
+    assert repo.get_authorized('s1') is None
+    repo.set_authorized('s1', {'studentId': 's1', 'isActive': True})
+    repo.update_authorized('s1', {'isActive': False})
+    assert repo.get_authorized('s1') == {'studentId': 's1', 'isActive': False}
+    with pytest.raises(LookupError):
+        repo.update_authorized('s2', {'isActive': False})
+
+
+class FakeFirestore:
+    """Documents by path, with just the reads data_version() makes and write batches."""
+
+    def __init__(self):
+        self.docs = {}
+        self.batches = []
+
+    def collection(self, path):
+        return FakeRef(self, path)
+
+    def batch(self):
+        return FakeBatch(self)
+
+
+class FakeRef:
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+
+    def document(self, doc_id):
+        return FakeRef(self.db, f'{self.path}/{doc_id}')
+
+    collection = document
+
+    def get(self):
+        data = self.db.docs.get(self.path)
+        return SimpleNamespace(exists=data is not None, to_dict=lambda: dict(data))
+
+    def _children(self):
+        return [(path, data) for path, data in self.db.docs.items() if path.rpartition('/')[0] == self.path]
+
+    def order_by(self, field, direction=None):
+        return FakeNewest(sorted(self._children(), key=lambda item: item[1][field], reverse=True))
+
+    def count(self):
+        return FakeNewest([[SimpleNamespace(value=len(self._children()))]])
+
+
+class FakeNewest:
+    def __init__(self, items):
+        self.items = items
+
+    def limit(self, limit):
+        return FakeNewest(self.items[:limit])
+
+    def select(self, fields):
+        return self
+
+    def stream(self):
+        return [SimpleNamespace(to_dict=lambda data=data: data) for _, data in self.items]
+
+    def get(self):
+        return self.items
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.ops = []
+
+    def set(self, ref, data, merge=False):
+        self.ops.append(('set', ref.path, data))
+
+    def delete(self, ref):
+        self.ops.append(('delete', ref.path, None))
+
+    def commit(self):
+        assert len(self.ops) <= ingest.MAX_BATCH_OPS
+        self.db.batches.append(self.ops)
+        for op, path, data in self.ops:
+            if op == 'delete':
+                self.db.docs.pop(path, None)
+                continue
+            current = self.db.docs.setdefault(path, {})
+            for key, value in data.items():
+                current[key] = current.get(key, 0) + value.value if hasattr(value, 'value') else value
+
+
+def test_firestore_deletes_bump_the_purge_generation():
+    db = FakeFirestore()
+    repo = FirestoreRepository(db)
+    db.docs.update({'reports/alice': {'lastSeen': T0}, 'reports/bob': {'lastSeen': T0 + timedelta(minutes=1)}})
+    db.docs.update({f'reports/alice/history/{n:04d}': {'ai_score': n} for n in range(600)})
+    db.docs['reports/alice/history_archive/a1'] = {'count': 1}
+    version = repo.data_version()
+
+    # Retention: history and archives go, latest state (count and newest lastSeen) is untouched
+    repo.delete_history('alice', [f'{n:04d}' for n in range(600)])
+    assert [len(batch) for batch in db.batches] == [500, 102]
+    assert all(batch[0][:2] == ('set', 'report_meta/reports-purges') for batch in db.batches)
+    after_history = repo.data_version()
+    assert after_history != version
+
+    repo.delete_history_archives('alice', ['a1'])
+    after_archives = repo.data_version()
+    assert after_archives != after_history and after_archives.endswith(':3')
+    repo.delete_latest(['alice'])
+    assert repo.data_version() not in (version, after_history, after_archives)
@@ -0,0 +1,75 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+
+from django.test import AsyncRequestFactory, RequestFactory
+
+from dashboard import streaming
+
+DOCS = {f"user_{i}": {'ai': i, 'timestamp': datetime(2026, 1, 1, i, tzinfo=timezone.utc), 'tags': ['a\nb']}
+        for i in range(5)}
+
+
+def _failing(items, after):
+    for i, item in enumerate(items):
+        if i == after:
+            raise RuntimeError('deadline exceeded')
+        yield item
+
+
+def test_streamed_bodies_match_buffered_documents():
+    rows = [dict(data, id=doc_id) for doc_id, data in DOCS.items()]
+    envelope = json.loads(''.join(streaming.json_envelope(iter(rows))))
+    assert envelope['status'] == 'success'
+    assert [row['id'] for row in envelope['data']] == list(DOCS)
+    assert envelope['data'][2]['timestamp'] == '2026-01-01T02:00:00Z'
+
+    lines = ''.join(streaming.ndjson(iter(rows))).splitlines()
+    assert [json.loads(line)['id'] for line in lines] == list(DOCS)
+
+    plain = {doc_id: {'ai': data['ai'], 'tags': data['tags']} for doc_id, data in DOCS.items()}
+    assert ''.join(streaming.json_object(iter(plain.items()), indent=2)) == json.dumps(plain, indent=2)
+    assert ''.join(streaming.json_object(iter([]), indent=2)) == '{}'
+
+
+def test_failure_mid_stream_still_produces_valid_json():
+    rows = [dict(data, id=doc_id) for doc_id, data in DOCS.items()]
+
+    envelope = json.loads(''.join(streaming.json_envelope(_failing(rows, 3))))
+    assert envelope['status'] == 'error' and len(envelope['data']) == 3
+
+    backup = json.loads(''.join(streaming.json_object(_failing(DOCS.items(), 2), indent=2)))
+    assert list(backup) == ['user_0', 'user_1', '__error__']
+
+    last = ''.join(streaming.ndjson(_failing(rows, 1))).splitlines()[-1]
+    assert json.loads(last) == {'status': 'error', 'message': 'deadline exceeded'}
+
+
+def test_chunks_are_batched():
+    pieces = ['x' * 1000] * 200
+    chunks = list(streaming.chunked(pieces, size=64 * 1000))
+    assert [len(chunk) for chunk in chunks] == [64000, 64000, 64000, 8000]
+
+
+def test_asgi_responses_are_streamed_not_buffered():
+    produced = []
+
+    def body():
+        try:
+            for i in range(3):
+                produced.append(i)
+                yield f'chunk {i}'
+        finally:
+            produced.append('closed')
+
+    response = streaming.response(AsyncRequestFactory().get('/'), body(), content_type='text/plain')
+    assert response.is_async
+
+    async def first_chunk():
+        async for chunk in response:
+            return chunk
+
+    # Django reads a synchronous iterator into a list here; only one chunk is produced
+    assert asyncio.run(first_chunk()) == b'chunk 0'
+    assert produced == [0, 'closed']
+    assert not streaming.response(RequestFactory().get('/'), body()).is_async
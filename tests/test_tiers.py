@@ -0,0 +1,116 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from dashboard import archive, playback, tiers
+from dashboard.history import HistoryEncoder
+from dashboard.retention import RetentionEngine
+from dashboard.storage import SQLiteRepository
+from dashboard.tiers import Compactor
+
+NOW = datetime(2024, 6, 1, 12, 0, tzinfo=timezone.utc)
+# Three sessions: two compactable, one from the last hour
+SESSIONS = [(NOW - timedelta(days=3), 6), (NOW - timedelta(days=2), 7), (NOW - timedelta(hours=1), 3)]
+
+
+@pytest.fixture(autouse=True)
+def cold_cache(monkeypatch):
+    """A fresh process cache per test: archive indexes are cached by student id, and every test has an 'alice'."""
+    monkeypatch.setattr(tiers, '_cache', None)
+
+
+def classroom():
+    repo = SQLiteRepository()
+    encoder = HistoryEncoder(keyframe_interval=5)
+    n = 0
+    for started, count in SESSIONS:
+        for i in range(count):
+            doc_id = f'h{n:02d}'
+            entry = {'timestamp': started + timedelta(minutes=i), 'ai_score': n, 'code': 'x = 1\n' * 20 + f'{n}\n'}
+            stored = encoder.encode('alice', doc_id, entry)
+            repo.write_heartbeat('alice', {'environment': 'ENV1'}, history=[(doc_id, stored)])
+            n += 1
+    return repo
+
+
+def read_all(repo, limit=4, **params):
+    entries, cursor = [], None
+    while True:
+        page = repo.history_page('alice', limit=limit, cursor=cursor, **params)
+        entries.extend(page['data'])
+        if not page['has_more']:
+            return entries
+        cursor = playback.decode_cursor(page['next_cursor'])
+
+
+def views(repo):
+    window = {'start': NOW - timedelta(days=2, minutes=-3), 'end': NOW - timedelta(minutes=59)}
+    return [read_all(repo), read_all(repo, descending=True), read_all(repo, limit=3, fields=['ai_score']),
+            read_all(repo, fields=['code', 'timestamp']), read_all(repo, **window)]
+
+
+def hot_ids(repo):
+    return [doc.id for doc in repo.stream_history('alice')]
+
+
+def test_compacted_sessions_read_back_the_same():
+    repo = classroom()
+    before = views(repo)
+    slept = []
+    report = Compactor(repo, session_gap=1800, batch_size=4, sleep=slept.append).run(now=NOW)
+    # h13 and h14 in the last hour are deltas against h10, which stays hot for now
+    assert {key: report[key] for key in ('sessions', 'archives', 'documents', 'kept_keyframes')} == \
+        {'sessions': 2, 'archives': 2, 'documents': 12, 'kept_keyframes': 1}
+    assert slept == [tiers.get_cache().index_ttl]
+    assert hot_ids(repo) == ['h10', 'h13', 'h14', 'h15']
+    assert [(meta['start'], meta['count']) for meta in repo.history_archives('alice')] == [
+        ('2024-05-29T12:00:00.000Z', 6), ('2024-05-30T12:00:00.000Z', 7)]
+
+    after = views(repo)
+    assert after == before
+    assert [entry['id'] for entry in after[1][:4]] == ['h15', 'h14', 'h13', 'h12']
+    assert not any(entry.get('missing_keyframe') for entry in after[0])
+    assert tiers.metrics()['last_compaction']['archives'] == 2
+
+
+def test_interrupted_runs_finish_and_retention_drops_whole_archives():
+    repo = classroom()
+    before = read_all(repo)
+
+    def killed(seconds):
+        raise RuntimeError('worker restarted')
+
+    with pytest.raises(RuntimeError):
+        Compactor(repo, sleep=killed).run(now=NOW)
+    assert len(hot_ids(repo)) == 16 and len(repo.history_archives('alice')) == 2
+    assert read_all(repo) == before
+
+    # The hot copies are found in their archives rather than archived again
+    report = Compactor(repo, sleep=lambda seconds: None).run(now=NOW)
+    assert (report['archives'], report['documents']) == (0, 12)
+    assert hot_ids(repo) == ['h10', 'h13', 'h14', 'h15'] and read_all(repo) == before
+    assert Compactor(repo, sleep=lambda seconds: None).run(now=NOW)['documents'] == 0
+
+    report = RetentionEngine(repo, days=2.5, rate=None).run(now=NOW)
+    assert (report['archives'], report['documents']) == (1, 1)
+    assert [entry['id'] for entry in read_all(repo)] == [f'h{n:02d}' for n in range(6, 16)]
+
+
+def test_large_sessions_split_and_backups_include_cold_history(tmp_path, monkeypatch):
+    repo = classroom()
+    before = read_all(repo)
+    preview = Compactor(repo, sleep=lambda seconds: None).run(now=NOW, dry_run=True)
+    assert (preview['archives'], preview['documents']) == (2, 12) and len(hot_ids(repo)) == 16
+    assert repo.history_archives('alice') == []
+
+    monkeypatch.setattr(tiers, 'MAX_BLOB_BYTES', 120)
+    report = Compactor(repo, sleep=lambda seconds: None).run(now=NOW)
+    assert report['sessions'] == 2 and report['archives'] == 13
+    assert read_all(repo) == before
+
+    manifest = archive.write_archive(repo, str(tmp_path), workers=1)
+    # h10 is both archived and hot
+    assert manifest['history'] == 16
+    restored = SQLiteRepository()
+    archive.restore(restored, str(tmp_path))
+    assert read_all(restored) == before
@@ -0,0 +1,73 @@
+import json
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from django.db import connection
+from django.test import RequestFactory
+
+from authentication import views
+from authentication.models import AuthorizedID
+from dashboard import playback, userlist
+
+
+def walk(**filters):
+    ids, cursor, pages = [], None, 0
+    while True:
+        page = userlist.fetch_page(AuthorizedID.objects.all(), limit=4, cursor=cursor, **filters)
+        ids += [user['student_id'] for user in page['users']]
+        pages += 1
+        if not page['has_more']:
+            return ids, pages
+        cursor = playback.decode_cursor(page['next_cursor'])
+
+
+def test_parse_params():
+    cursor = playback.encode_cursor(playback.parse_time('2024-06-01T00:00:00Z'), 7)
+    params = userlist.parse_params({'limit': '9999', 'cursor': cursor, 'q': ' s1 ', 'active': 'False'})
+    assert params == {'limit': userlist.MAX_LIMIT, 'cursor': playback.decode_cursor(cursor), 'q': 's1', 'active': False}
+    assert userlist.parse_params({}) == {'limit': userlist.DEFAULT_LIMIT, 'cursor': None, 'q': None, 'active': None}
+    for bad in ({'limit': 'x'}, {'limit': '0'}, {'active': 'maybe'}, {'cursor': 'nope'}):
+        with pytest.raises(ValueError):
+            userlist.parse_params(bad)
+
+
+def test_garbage_cursors_are_a_400():
+    t0 = playback.parse_time('2024-06-01T00:00:00Z')
+    # Not base64, not JSON ('é'), a JSON list and number, then well-formed cursors with the wrong field types
+    shapes = ['%%%', '6Q', 'W10', 'MQ', playback.encode_cursor('2024-06-01', 7), playback.encode_cursor(t0, 'x')]
+    for cursor in shapes:
+        with pytest.raises(ValueError, match='Invalid cursor'):
+            userlist.parse_params({'cursor': cursor})
+
+    request = RequestFactory().get('/auth/api/users/', {'cursor': 'W10'})
+    request.user = SimpleNamespace(is_authenticated=True)
+    response = views.get_authorized_users(request)
+    assert response.status_code == 400
+    assert json.loads(response.content) == {'success': False, 'message': 'Invalid cursor'}
+
+
+@pytest.mark.django_db
+def test_keyset_pages_filters_and_counts():
+    t0 = datetime(2024, 6, 1, tzinfo=timezone.utc)
+    AuthorizedID.objects.bulk_create(
+        AuthorizedID(student_id=f's{n:02d}', description='lab 3' if n % 5 == 0 else '', is_active=n % 3 != 0)
+        for n in range(25))
+    for n in range(25):
+        # Pairs share a timestamp, so the id breaks ties
+        AuthorizedID.objects.filter(student_id=f's{n:02d}').update(created_at=t0 + timedelta(minutes=n // 2))
+
+    ids, pages = walk()
+    assert ids == [f's{n:02d}' for n in reversed(range(25))] and pages == 7
+    assert walk(active=False)[0] == [f's{n:02d}' for n in reversed(range(25)) if n % 3 == 0]
+    assert walk(q='lab')[0] == ['s20', 's15', 's10', 's05', 's00']
+    assert walk(q='s1')[0] == [f's{n}' for n in reversed(range(10, 20))]
+    assert userlist.counts(AuthorizedID.objects.all()) == {'total': 25, 'active': 16, 'inactive': 9, 'matching': 25}
+    assert userlist.counts(AuthorizedID.objects.all(), q='lab', active=True)['matching'] == 3  # s05, s10, s20
+
+    # Read in index order: no sort of the whole table per page
+    with connection.cursor() as c:
+        sql, params = AuthorizedID.objects.filter(is_active=True).order_by('-created_at', '-id')[:5].query.sql_with_params()
+        c.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        plan = ' '.join(str(row[-1]) for row in c.fetchall())
+    assert 'USING INDEX authorizedid_' in plan and 'TEMP B-TREE' not in plan